@@ -28,12 +28,14 @@ from auth.routes import auth_bp
 from recipes.routes import recipes_bp
 from nutrition.routes import nutrition_bp
 from social.routes import social_bp
+from uploads.routes import uploads_bp
 
 # Import utilities
 from utils.error_handlers import register_error_handlers
 from utils.logging import configure_logging, log_api_call, logger
 from utils.background_tasks import get_task_status
 from utils.monitoring import track_api_performance, get_performance_stats
+from utils.cache import cache
 from utils.health_check import check_health
 from utils.rate_limit import standard_rate_limit
 from utils.api_docs import register_api_docs, create_swagger_blueprint
@@ -101,6 +103,7 @@ def create_app():
     app.register_blueprint(recipes_bp, url_prefix='/api/recipes')
     app.register_blueprint(nutrition_bp, url_prefix='/api/nutrition')
     app.register_blueprint(social_bp, url_prefix='/api/social')
+    app.register_blueprint(uploads_bp, url_prefix='/api/uploads')
 
     # Register error handlers
     register_error_handlers(app)
@@ -150,6 +153,7 @@ def create_app():
                 
         # Get performance stats
         stats = get_performance_stats()
+        stats['cache'] = cache.stats()
         
         return jsonify(stats)
 
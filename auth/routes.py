@@ -7,6 +7,8 @@ from datetime import datetime
 import uuid
 import base64
 from io import BytesIO
+from utils import images
+from social.models import schedule_summary_refresh
 
 @auth_bp.route('/profile', methods=['POST'])
 @auth_required
@@ -18,20 +20,32 @@ def create_profile(user_id):
     name = data.get('name')
     image_base64 = data.get('profile_image_base64')
     image_url = None
+    thumbnail_url = None
+    image_path = None
     if image_base64:
-        image_data = base64.b64decode(image_base64)
-        image_path = f"profiles/{user_id}/{uuid.uuid4()}.jpg"
-        blob = bucket.blob(image_path)
-        blob.upload_from_string(image_data, content_type='image/jpeg')
-        image_url = blob.public_url
+        try:
+            image_data = images.read_base64_image(image_base64)
+            stored = images.store_image(bucket, image_data, f"profiles/{user_id}/{uuid.uuid4()}.jpg")
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        image_url = stored['url']
+        thumbnail_url = stored['variants'].get('thumbnail')
+        image_path = stored['path']
     user = {
         'id': user_id,
         'name': name or 'User',
         'profile_image_url': image_url,
+        'profile_image_thumbnail_url': thumbnail_url,
+        'profile_image_path': image_path,
         'created_at': datetime.utcnow(),
         'updated_at': datetime.utcnow()
     }
-    db.collection('users').document(user_id).set(user)
+    user_ref = db.collection('users').document(user_id)
+    existing = user_ref.get()
+    user_ref.set(user)
+    
+    # Keep the name and picture shown in follower lists current
+    schedule_summary_refresh(user_id, existing.to_dict() if existing.exists else None, user)
     return jsonify(user), 201
 
 @auth_bp.route('/profile', methods=['GET'])
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -20,6 +21,90 @@ class Config:
     # External API settings
     USDA_API_KEY = os.environ.get('USDA_API_KEY')
     USDA_API_BASE_URL = 'https://api.nal.usda.gov/fdc/v1'
+    USDA_CONNECT_TIMEOUT = float(os.environ.get('USDA_CONNECT_TIMEOUT', 3.05))
+    USDA_READ_TIMEOUT = float(os.environ.get('USDA_READ_TIMEOUT', 10))
+    USDA_MAX_CONNECTIONS = int(os.environ.get('USDA_MAX_CONNECTIONS', 10))
+    USDA_MAX_RETRIES = int(os.environ.get('USDA_MAX_RETRIES', 3))
+    
+    # USDA response cache (set USDA_CACHE_PATH to an empty string for memory only)
+    USDA_CACHE_ENABLED = os.environ.get('USDA_CACHE_ENABLED', 'True').lower() == 'true'
+    USDA_CACHE_PATH = os.environ.get('USDA_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'usda_cache.sqlite3'))
+    USDA_CACHE_MEMORY_ENTRIES = int(os.environ.get('USDA_CACHE_MEMORY_ENTRIES', 1024))
+    USDA_CACHE_TTL = int(os.environ.get('USDA_CACHE_TTL', 7 * 24 * 3600))
+    USDA_CACHE_NEGATIVE_TTL = int(os.environ.get('USDA_CACHE_NEGATIVE_TTL', 3600))
+    
+    # In-process response cache limits
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    CACHE_SWEEP_INTERVAL = float(os.environ.get('CACHE_SWEEP_INTERVAL', 30))
+    
+    # Shared cache backend ('memory' or 'redis'); with Redis the in-process
+    # cache serves as a short-lived L1 in front of it
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory').lower()
+    CACHE_REDIS_NAMESPACE = os.environ.get('CACHE_REDIS_NAMESPACE', 'cache')
+    CACHE_L1_TIMEOUT = float(os.environ.get('CACHE_L1_TIMEOUT', 5))
+    REDIS_URL = os.environ.get('REDIS_URL')
+    
+    # Verified Firebase ID tokens kept per process (each until the token expires)
+    AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+    
+    # Rate limiting algorithm: 'sliding_window' or 'token_bucket'
+    RATE_LIMIT_ALGORITHM = os.environ.get('RATE_LIMIT_ALGORITHM', 'sliding_window')
+    
+    # Home timelines: authors with at least this many followers aren't fanned
+    # out on write, their posts are pulled when feeds are read instead
+    TIMELINE_FANOUT_LIMIT = int(os.environ.get('TIMELINE_FANOUT_LIMIT', 5000))
+    # Recent posts copied into a timeline when following someone
+    TIMELINE_BACKFILL_SIZE = int(os.environ.get('TIMELINE_BACKFILL_SIZE', 20))
+    # Timeline jobs (fan-out, follow changes, deleted posts): worker threads,
+    # jobs queued per process before the rest wait for repair, and seconds
+    # between repair passes over unfinished jobs
+    TIMELINE_WORKERS = int(os.environ.get('TIMELINE_WORKERS', 2))
+    TIMELINE_QUEUE_SIZE = int(os.environ.get('TIMELINE_QUEUE_SIZE', 1000))
+    TIMELINE_REPAIR_INTERVAL = float(os.environ.get('TIMELINE_REPAIR_INTERVAL', 300))
+    
+    # Sharded counters (likes, comments, follower counts): shards per document,
+    # seconds totals are cached for, and seconds between rolling totals into
+    # parent documents. Shards may be added but never removed.
+    COUNTER_SHARDS = int(os.environ.get('COUNTER_SHARDS', 10))
+    COUNTER_CACHE_TIMEOUT = float(os.environ.get('COUNTER_CACHE_TIMEOUT', 5))
+    COUNTER_RECONCILE_INTERVAL = float(os.environ.get('COUNTER_RECONCILE_INTERVAL', 30))
+    
+    # Trending tags: hours of buckets scored, hours for a bucket's weight to
+    # halve, tags kept, seconds before the top tags are rescored and seconds
+    # they are cached for
+    TRENDING_WINDOW_HOURS = int(os.environ.get('TRENDING_WINDOW_HOURS', 48))
+    TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 6))
+    TRENDING_TOP_K = int(os.environ.get('TRENDING_TOP_K', 100))
+    TRENDING_REFRESH_INTERVAL = float(os.environ.get('TRENDING_REFRESH_INTERVAL', 60))
+    TRENDING_CACHE_TIMEOUT = float(os.environ.get('TRENDING_CACHE_TIMEOUT', 60))
+    
+    # Days a scraped recipe is reused for later imports of the same canonical URL
+    RECIPE_SCRAPE_CACHE_DAYS = float(os.environ.get('RECIPE_SCRAPE_CACHE_DAYS', 7))
+    
+    # Recipe and profile images: largest accepted file in bytes, longest side
+    # of the stored image in pixels, and resize worker processes (0 resizes
+    # in the request thread)
+    IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+    IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 2048))
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    
+    # Seconds a signed image upload URL stays valid, and the Storage emulator
+    # to send uploads to instead (e.g. localhost:9199) in local development
+    UPLOAD_URL_EXPIRY = int(os.environ.get('UPLOAD_URL_EXPIRY', 900))
+    STORAGE_EMULATOR_HOST = os.environ.get('STORAGE_EMULATOR_HOST')
+    
+    # Batch recipe import: most URLs per request, scrapes per site at once
+    # and seconds between requests to the same site
+    RECIPE_IMPORT_BATCH_LIMIT = int(os.environ.get('RECIPE_IMPORT_BATCH_LIMIT', 50))
+    RECIPE_IMPORT_PER_DOMAIN = int(os.environ.get('RECIPE_IMPORT_PER_DOMAIN', 2))
+    RECIPE_IMPORT_DOMAIN_INTERVAL = float(os.environ.get('RECIPE_IMPORT_DOMAIN_INTERVAL', 1.0))
+    
+    # Offline FoodData Central store built with `manage.py import-usda`; used when the file exists
+    USDA_LOCAL_STORE_PATH = os.environ.get('USDA_LOCAL_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'usda_foods.sqlite3'))
+    
+    # Seconds to wait for each ingredient lookup in recipe nutrition analysis
+    INGREDIENT_LOOKUP_TIMEOUT = float(os.environ.get('INGREDIENT_LOOKUP_TIMEOUT', 8))
     
     # CORS settings
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
@@ -294,6 +294,121 @@ def cleanup_database(args):
     logger.info("Cleanup completed")
     return 0
 
+def benchmark_stats(args):
+    """Benchmark the nutrition aggregation kernel on synthetic meals"""
+    import random
+    import time
+    import datetime
+    
+    # Only the pure aggregation code is used, so no Firebase connection is needed
+    from nutrition.aggregation import NutritionMatrix, HAS_NUMPY, NUTRIENTS
+    from nutrition.services import DailyRollup
+    
+    meal_count = args.meals or 10000
+    day_count = args.days or 90
+    repeat = args.repeat or 5
+    
+    # Generate synthetic meals spread over the requested number of days
+    rng = random.Random(42)
+    start = datetime.datetime(2024, 1, 1)
+    meals = [
+        {
+            'meal_type': rng.choice(['breakfast', 'lunch', 'dinner', 'snack']),
+            'meal_time': start + datetime.timedelta(minutes=rng.randrange(day_count * 24 * 60)),
+            'nutrition_totals': {key: rng.uniform(0, 500) for key in NUTRIENTS}
+        }
+        for _ in range(meal_count)
+    ]
+    
+    def best_of(func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+        
+    def reference_totals():
+        # Per-meal, per-key accumulation the kernel replaced
+        totals = {key: 0 for key in NUTRIENTS}
+        for meal in meals:
+            nutrition = meal.get('nutrition_totals', {})
+            for key in totals:
+                if key in nutrition:
+                    totals[key] += float(nutrition[key])
+        return {key: round(value, 1) for key, value in totals.items()}
+        
+    def reference_rollups():
+        rollups = {}
+        for meal in meals:
+            for day, delta in DailyRollup.contribution(meal).items():
+                rollup = rollups.setdefault(day, {'meal_count': 0, 'totals': {}, 'by_meal_type': {}})
+                rollup['meal_count'] += delta['meal_count']
+                for key, value in delta['totals'].items():
+                    rollup['totals'][key] = rollup['totals'].get(key, 0) + value
+                for meal_type, values in delta['by_meal_type'].items():
+                    type_totals = rollup['by_meal_type'].setdefault(meal_type, {})
+                    for key, value in values.items():
+                        type_totals[key] = type_totals.get(key, 0) + value
+        return rollups
+        
+    # Totals always run in plain Python; rollups group with NumPy when it's installed
+    rollup_kernels = {'kernel (python)': lambda: DailyRollup.build('benchmark', meals, vectorized=False)}
+    if HAS_NUMPY:
+        rollup_kernels['kernel (numpy)'] = lambda: DailyRollup.build('benchmark', meals, vectorized=True)
+    cases = {
+        'totals': (reference_totals, {
+            'kernel': lambda: NutritionMatrix(meals, field='nutrition_totals').totals(ndigits=1)
+        }),
+        'rollups': (reference_rollups, rollup_kernels)
+    }
+    
+    logger.info(f"Benchmarking {meal_count} meals over {day_count} days (best of {repeat})")
+    for name, (reference, kernels) in cases.items():
+        reference_time = best_of(reference)
+        timings = {label: best_of(kernel) for label, kernel in kernels.items()}
+        logger.info(
+            f"{name}: dict loops {reference_time * 1000:.1f} ms, "
+            + ", ".join(f"{label} {timing * 1000:.1f} ms" for label, timing in timings.items())
+            + f", speedup {reference_time / min(timings.values()):.1f}x"
+        )
+        
+    return 0
+
+def import_usda(args):
+    """Build the offline USDA FoodData Central store from a bulk download"""
+    import time
+    from utils.usda_local import import_bulk_export, LocalFoodStore
+    
+    path = args.store or Config.USDA_LOCAL_STORE_PATH
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+    logger.info(f"Importing {args.source} into {path}")
+    started = time.perf_counter()
+    
+    try:
+        count = import_bulk_export(args.source, path, batch_size=args.batch_size or 1000)
+    except (OSError, ValueError) as e:
+        logger.error(f"Import failed: {str(e)}")
+        return 1
+        
+    logger.info(f"Imported {count} foods in {time.perf_counter() - started:.1f}s")
+    
+    # Time a few lookups against the finished store
+    store = LocalFoodStore(path)
+    try:
+        for label, lookup in [('search', lambda: store.search('cheese', page_size=10)),
+                              ('details', lambda: store.get(1))]:
+            started = time.perf_counter()
+            for _ in range(100):
+                lookup()
+            logger.info(f"{label}: {(time.perf_counter() - started) * 10:.3f}ms per lookup")
+    finally:
+        store.close()
+        
+    return 0
+
 def main():
     """Main entry point for management script"""
     parser = argparse.ArgumentParser(description='Management script for the application')
@@ -338,6 +453,18 @@ def main():
     cleanup_parser.add_argument('--temp-files', action='store_true', help='Clean up temporary files')
     cleanup_parser.add_argument('--force', action='store_true', help='Skip confirmation')
     
+    # Benchmark command
+    benchmark_parser = subparsers.add_parser('benchmark-stats', help='Benchmark nutrition stats aggregation')
+    benchmark_parser.add_argument('--meals', type=int, help='Number of synthetic meals (default: 10000)')
+    benchmark_parser.add_argument('--days', type=int, help='Number of days the meals span (default: 90)')
+    benchmark_parser.add_argument('--repeat', type=int, help='Runs per measurement (default: 5)')
+    
+    # USDA import command
+    import_usda_parser = subparsers.add_parser('import-usda', help='Import a FoodData Central bulk download for offline lookups')
+    import_usda_parser.add_argument('source', help='JSON export, directory of CSV files, or downloaded .zip')
+    import_usda_parser.add_argument('--store', help='Path of the store to build (default: USDA_LOCAL_STORE_PATH)')
+    import_usda_parser.add_argument('--batch-size', type=int, help='Foods written per transaction (default: 1000)')
+    
     args = parser.parse_args()
     
     # Run appropriate command
@@ -355,6 +482,10 @@ def main():
         return restore_database(args)
     elif args.command == 'cleanup':
         return cleanup_database(args)
+    elif args.command == 'benchmark-stats':
+        return benchmark_stats(args)
+    elif args.command == 'import-usda':
+        return import_usda(args)
     else:
         parser.print_help()
         return 0
@@ -0,0 +1,58 @@
+"""Migration to add search index tokens to food_items collection"""
+import logging
+from utils.migrations import migration
+from utils.search_index import SEARCH_TOKENS_FIELD, build_search_tokens
+
+logger = logging.getLogger('migrations')
+
+@migration('002')
+def add_search_tokens_to_food_items(db, dry_run=False):
+    """Backfill search tokens on existing food items
+
+    Args:
+        db: Firestore client
+        dry_run: Whether to perform a dry run (no changes)
+    """
+    # Get food items collection
+    food_items_ref = db.collection('food_items')
+    batch_size = 500
+    batches_processed = 0
+    docs_updated = 0
+
+    # Process in batches to avoid memory issues with large collections
+    query = food_items_ref.limit(batch_size)
+    all_docs = list(query.stream())
+
+    while all_docs:
+        batch = db.batch()
+        batch_updates = 0
+
+        for doc in all_docs:
+            item_data = doc.to_dict()
+            tokens = build_search_tokens(item_data.get('name'))
+
+            # Skip if tokens are already up to date
+            if item_data.get(SEARCH_TOKENS_FIELD) == tokens:
+                continue
+
+            # Apply updates
+            if not dry_run:
+                batch.update(doc.reference, {SEARCH_TOKENS_FIELD: tokens})
+                batch_updates += 1
+
+            docs_updated += 1
+
+        # Commit batch if not dry run and has updates
+        if not dry_run and batch_updates > 0:
+            batch.commit()
+
+        batches_processed += 1
+        logger.info(f"Processed batch {batches_processed} ({len(all_docs)} docs)")
+
+        # Get next batch
+        last_doc = all_docs[-1]
+        query = food_items_ref.limit(batch_size).start_after(last_doc)
+        all_docs = list(query.stream())
+
+    # Log summary
+    logger.info(f"Migration complete: processed {batches_processed} batches, updated {docs_updated} documents")
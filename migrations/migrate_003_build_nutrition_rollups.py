@@ -0,0 +1,72 @@
+"""Migration to build daily nutrition rollups from existing meals"""
+import logging
+from utils.migrations import migration
+from nutrition.services import DailyRollup
+
+logger = logging.getLogger('migrations')
+
+@migration('003')
+def build_nutrition_rollups(db, dry_run=False):
+    """Build daily nutrition rollups from existing meals
+
+    Rollup documents are rebuilt from scratch, so the migration can be
+    re-run to repair drift.
+
+    Args:
+        db: Firestore client
+        dry_run: Whether to perform a dry run (no changes)
+    """
+    # Get meals collection
+    meals_ref = db.collection('meals')
+    batch_size = 500
+    batches_processed = 0
+    meals_by_user = {}
+
+    # Process in batches to avoid memory issues with large collections
+    query = meals_ref.limit(batch_size)
+    all_docs = list(query.stream())
+
+    while all_docs:
+        for doc in all_docs:
+            meal = doc.to_dict()
+            if meal.get('userId'):
+                meals_by_user.setdefault(meal['userId'], []).append({
+                    'meal_type': meal.get('meal_type'),
+                    'meal_time': meal.get('meal_time'),
+                    'nutrition_totals': meal.get('nutrition_totals', {})
+                })
+
+        batches_processed += 1
+        logger.info(f"Processed batch {batches_processed} ({len(all_docs)} docs)")
+
+        # Get next batch
+        last_doc = all_docs[-1]
+        query = meals_ref.limit(batch_size).start_after(last_doc)
+        all_docs = list(query.stream())
+
+    # Write rollups in batches
+    rollup_service = DailyRollup(db)
+    batch = db.batch()
+    pending = 0
+    rollups_written = 0
+
+    for user_id, meals in meals_by_user.items():
+        for day, rollup in DailyRollup.build(user_id, meals).items():
+            if not dry_run:
+                ref = db.collection(rollup_service.collection).document(DailyRollup.doc_id(user_id, day))
+                batch.set(ref, rollup)
+                pending += 1
+
+                if pending >= batch_size:
+                    batch.commit()
+                    batch = db.batch()
+                    pending = 0
+
+            rollups_written += 1
+
+    # Commit final batch
+    if not dry_run and pending > 0:
+        batch.commit()
+
+    # Log summary
+    logger.info(f"Migration complete: built {rollups_written} rollups for {len(meals_by_user)} users")
@@ -0,0 +1,78 @@
+"""Migration to denormalize user summaries onto follows collection"""
+import logging
+from utils.migrations import migration
+from social.models import build_user_summary
+
+logger = logging.getLogger('migrations')
+
+@migration('004')
+def add_user_summaries_to_follows(db, dry_run=False):
+    """Backfill follower and following summaries on existing follows
+
+    Summaries are rebuilt from the current user profiles, so the migration
+    can be re-run to refresh names and images that have changed.
+
+    Args:
+        db: Firestore client
+        dry_run: Whether to perform a dry run (no changes)
+    """
+    # Get follows collection
+    follows_ref = db.collection('follows')
+    batch_size = 250
+    batches_processed = 0
+    docs_updated = 0
+
+    # Process in batches to avoid memory issues with large collections
+    query = follows_ref.limit(batch_size)
+    all_docs = list(query.stream())
+
+    while all_docs:
+        follows = [(doc, doc.to_dict()) for doc in all_docs]
+
+        # Fetch every profile referenced by this batch in one read
+        user_ids = set()
+        for _, follow_data in follows:
+            user_ids.update((follow_data['followerId'], follow_data['followingId']))
+        user_refs = [db.collection('users').document(user_id) for user_id in user_ids]
+        summaries = {
+            user_doc.id: build_user_summary(user_doc.to_dict())
+            for user_doc in db.get_all(user_refs)
+            if user_doc.exists
+        }
+
+        batch = db.batch()
+        batch_updates = 0
+
+        for doc, follow_data in follows:
+            updates = {}
+            for id_field, summary_field in (('followerId', 'followerSummary'),
+                                            ('followingId', 'followingSummary')):
+                summary = summaries.get(follow_data[id_field])
+                if summary is not None and follow_data.get(summary_field) != summary:
+                    updates[summary_field] = summary
+
+            # Skip if summaries are already up to date
+            if not updates:
+                continue
+
+            # Apply updates
+            if not dry_run:
+                batch.update(doc.reference, updates)
+                batch_updates += 1
+
+            docs_updated += 1
+
+        # Commit batch if not dry run and has updates
+        if not dry_run and batch_updates > 0:
+            batch.commit()
+
+        batches_processed += 1
+        logger.info(f"Processed batch {batches_processed} ({len(all_docs)} docs)")
+
+        # Get next batch
+        last_doc = all_docs[-1]
+        query = follows_ref.limit(batch_size).start_after(last_doc)
+        all_docs = list(query.stream())
+
+    # Log summary
+    logger.info(f"Migration complete: processed {batches_processed} batches, updated {docs_updated} documents")
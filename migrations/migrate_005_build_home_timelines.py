@@ -0,0 +1,69 @@
+"""Migration to build home timelines from existing posts and follows"""
+import logging
+from utils.migrations import migration
+from social.services import Timeline
+
+logger = logging.getLogger('migrations')
+
+@migration('005')
+def build_home_timelines(db, dry_run=False):
+    """Build home timelines for posts written before fan-out existed
+
+    Every post goes into its author's timeline, and each follow gets the
+    followed user's recent posts, as a new follow would.
+
+    Args:
+        db: Firestore client
+        dry_run: Whether to perform a dry run (no changes)
+    """
+    timeline = Timeline(db)
+    batch_size = 500
+    entries_written = 0
+
+    # Add every post to its author's own timeline
+    posts_ref = db.collection('posts')
+    query = posts_ref.limit(batch_size)
+    all_docs = list(query.stream())
+
+    while all_docs:
+        batch = db.batch()
+
+        for doc in all_docs:
+            entry = timeline.build_entry(doc)
+            if not dry_run:
+                batch.set(timeline.entries(entry['authorId']).document(doc.id), entry)
+            entries_written += 1
+
+        # Commit batch if not dry run
+        if not dry_run:
+            batch.commit()
+
+        logger.info(f"Added {len(all_docs)} posts to author timelines")
+
+        # Get next batch
+        last_doc = all_docs[-1]
+        query = posts_ref.limit(batch_size).start_after(last_doc)
+        all_docs = list(query.stream())
+
+    # Backfill followed users' recent posts
+    follows_ref = db.collection('follows')
+    query = follows_ref.limit(batch_size)
+    all_docs = list(query.stream())
+    follows_processed = 0
+
+    while all_docs:
+        for doc in all_docs:
+            follow_data = doc.to_dict()
+            if not dry_run:
+                entries_written += timeline.add_author(follow_data['followerId'], follow_data['followingId'])
+
+        follows_processed += len(all_docs)
+        logger.info(f"Backfilled timelines for {follows_processed} follows")
+
+        # Get next batch
+        last_doc = all_docs[-1]
+        query = follows_ref.limit(batch_size).start_after(last_doc)
+        all_docs = list(query.stream())
+
+    # Log summary
+    logger.info(f"Migration complete: processed {follows_processed} follows, wrote {entries_written} timeline entries")
@@ -0,0 +1,53 @@
+"""Migration to move post and user counters onto sharded counters"""
+import logging
+from utils.migrations import migration
+from utils.counters import ShardedCounter
+from social.models import POST_COUNTERS, USER_COUNTERS
+
+logger = logging.getLogger('migrations')
+
+@migration('006')
+def seed_counter_shards(db, dry_run=False):
+    """Seed counter shards from the counts stored on posts and users
+
+    Likes, comments and follower counts are now incremented on shards and
+    the document fields are only refreshed by the reconciler, so each
+    document's stored totals are added onto its shards. Each document is
+    seeded in its own transaction, so increments made while the migration
+    runs are kept, and documents the reconciler has already seeded are
+    skipped.
+
+    Args:
+        db: Firestore client
+        dry_run: Whether to perform a dry run (no changes)
+    """
+    counter = ShardedCounter(db)
+    batch_size = 500
+
+    for collection, fields in (('posts', POST_COUNTERS), ('users', USER_COUNTERS)):
+        collection_ref = db.collection(collection)
+        batches_processed = 0
+        docs_seeded = 0
+
+        # Process in batches to avoid memory issues with large collections
+        query = collection_ref.limit(batch_size)
+        all_docs = list(query.stream())
+
+        while all_docs:
+            for doc in all_docs:
+                # Apply updates
+                if not dry_run:
+                    if counter.seed(doc.reference, fields):
+                        docs_seeded += 1
+                else:
+                    docs_seeded += 1
+
+            batches_processed += 1
+            logger.info(f"Processed {collection} batch {batches_processed} ({len(all_docs)} docs)")
+
+            # Get next batch
+            last_doc = all_docs[-1]
+            query = collection_ref.limit(batch_size).start_after(last_doc)
+            all_docs = list(query.stream())
+
+        logger.info(f"Seeded counter shards for {docs_seeded} {collection}")
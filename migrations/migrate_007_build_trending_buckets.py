@@ -0,0 +1,48 @@
+"""Migration to build trending tag buckets from recent posts"""
+import logging
+from datetime import datetime, timedelta, timezone
+from utils.migrations import migration
+from social.services import TrendingTags, normalize_tag
+
+logger = logging.getLogger('migrations')
+
+@migration('007')
+def build_trending_buckets(db, dry_run=False):
+    """Build hourly trending tag buckets from posts inside the window
+
+    Bucket counts are recomputed from the posts themselves, so the
+    migration can be re-run to repair drift.
+
+    Args:
+        db: Firestore client
+        dry_run: Whether to perform a dry run (no changes)
+    """
+    trending = TrendingTags(db)
+    since = datetime.now(timezone.utc) - timedelta(hours=trending.window_hours)
+
+    # Count tags per hour bucket
+    buckets = {}
+    posts_processed = 0
+    for doc in db.collection('posts').where('createdAt', '>=', since).stream():
+        post = doc.to_dict()
+        bucket = trending.bucket_for(post.get('createdAt'))
+        counts = buckets.setdefault(bucket, {})
+        for tag in set(filter(None, map(normalize_tag, post.get('tags') or []))):
+            counts[tag] = counts.get(tag, 0) + 1
+        posts_processed += 1
+
+    logger.info(f"Counted tags on {posts_processed} posts into {len(buckets)} buckets")
+
+    if dry_run:
+        return
+
+    # Replace bucket counts, then score them
+    batch = db.batch()
+    for bucket, counts in buckets.items():
+        batch.set(db.collection('trending_buckets').document(bucket), {'counts': counts})
+    batch.commit()
+
+    tags = trending.refresh()
+
+    # Log summary
+    logger.info(f"Migration complete: wrote {len(buckets)} buckets, {len(tags)} trending tags")
@@ -1,4 +1,3 @@
 # nutrition/__init__.py
-from flask import Blueprint
-nutrition_bp = Blueprint('nutrition', __name__)
-from nutrition import routes
\ No newline at end of file
+# Routes are imported by the app (nutrition.routes), not here, so the
+# aggregation and rollup code can be used without a Firebase connection
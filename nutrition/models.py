@@ -1,8 +1,12 @@
 # nutrition/models.py
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
 import firebase_admin
 from firebase_admin import firestore
+from utils.pagination import paginate_query
+from utils.search_index import SEARCH_TOKENS_FIELD, build_search_tokens, plan_search, matches
+from nutrition.aggregation import NutritionMatrix
+from nutrition.services import DailyRollup, ROLLUP_NUTRIENTS, MEAL_TYPE_NUTRIENTS
 
 class NutritionModel:
     """Base class for nutrition models with common methods"""
@@ -48,20 +52,7 @@ class NutritionModel:
         Returns:
             Dict containing totals for each nutrient
         """
-        totals = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 
-                  'fiber': 0, 'sugar': 0, 'sodium': 0, 'cholesterol': 0}
-        
-        for item in items:
-            nutrition = item.get('nutrition', {})
-            for key in totals:
-                if key in nutrition:
-                    totals[key] += float(nutrition[key])
-        
-        # Round values for display
-        for key in totals:
-            totals[key] = round(totals[key], 1)
-            
-        return totals
+        return NutritionMatrix(items).totals(ndigits=1)
 
 class FoodItem(NutritionModel):
     """Model for food items in the nutrition database"""
@@ -75,6 +66,23 @@ class FoodItem(NutritionModel):
         self.db = db or firebase_admin.firestore.client()
         self.collection = "food_items"
     
+    @staticmethod
+    def serialize(item: Dict[str, Any], item_id: str) -> Dict[str, Any]:
+        """Shape a stored food item for API responses
+        
+        Args:
+            item: Food item data as stored
+            item_id: ID of the food item
+            
+        Returns:
+            Dict containing the food item data with its ID and without
+            internal index fields
+        """
+        item = dict(item)
+        item.pop(SEARCH_TOKENS_FIELD, None)
+        item['id'] = item_id
+        return item
+    
     def create(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new food item
         
@@ -111,6 +119,7 @@ class FoodItem(NutritionModel):
             'nutrition': nutrition,
             'is_custom': data.get('is_custom', True),
             'is_favorite': data.get('is_favorite', False),
+            SEARCH_TOKENS_FIELD: build_search_tokens(data['name']),
             'created_at': firestore.SERVER_TIMESTAMP,
             'updated_at': firestore.SERVER_TIMESTAMP
         }
@@ -119,9 +128,7 @@ class FoodItem(NutritionModel):
         doc_ref = self.db.collection(self.collection).document()
         doc_ref.set(food_item)
         
-        # Return with ID
-        food_item['id'] = doc_ref.id
-        return food_item
+        return self.serialize(food_item, doc_ref.id)
     
     def get(self, item_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
         """Get a food item by ID
@@ -147,8 +154,39 @@ class FoodItem(NutritionModel):
         if user_id and item.get('userId') != user_id and not item.get('is_public', False):
             raise ValueError("Unauthorized access to food item")
             
-        item['id'] = doc.id
-        return item
+        return self.serialize(item, doc.id)
+    
+    def get_many(self, item_ids: List[str], user_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Get several food items in a single batched read
+        
+        Args:
+            item_ids: IDs of the food items to retrieve (duplicates allowed)
+            user_id: ID of the requesting user (for authorization, optional)
+            
+        Returns:
+            Dict mapping item ID to food item data. Items that don't exist or
+            that the user is not authorized to access are left out.
+        """
+        unique_ids = list(dict.fromkeys(item_id for item_id in item_ids if item_id))
+        if not unique_ids:
+            return {}
+            
+        refs = [self.db.collection(self.collection).document(item_id) for item_id in unique_ids]
+        
+        items = {}
+        for doc in self.db.get_all(refs):
+            if not doc.exists:
+                continue
+                
+            item = doc.to_dict()
+            
+            # Same authorization rule as get()
+            if user_id and item.get('userId') != user_id and not item.get('is_public', False):
+                continue
+                
+            items[doc.id] = self.serialize(item, doc.id)
+            
+        return items
     
     def list(self, user_id: str, query_params: Dict[str, Any]) -> Dict[str, Any]:
         """List food items with filtering and pagination
@@ -156,9 +194,13 @@ class FoodItem(NutritionModel):
         Args:
             user_id: ID of the user
             query_params: Dict containing filter and pagination parameters
+                (either 'offset' or an opaque 'cursor' from a previous page)
             
         Returns:
             Dict containing items and pagination info
+            
+        Raises:
+            ValueError: If the pagination cursor is invalid
         """
         # Start with base query for user's items and public items
         query = self.db.collection(self.collection).where(
@@ -176,43 +218,28 @@ class FoodItem(NutritionModel):
                 filter=firestore.FieldFilter("is_custom", "==", True)
             )
             
-        # Search by name (will be filtered in memory)
-        search_term = query_params.get('q', '').lower()
+        # Search by name using the prefix index
+        query, residual_term = plan_search(query, query_params.get('q', ''))
             
         # Apply sorting
         sort_by = query_params.get('sort_by', 'created_at')
         sort_dir = query_params.get('sort_dir', 'desc')
         direction = firestore.Query.DESCENDING if sort_dir == 'desc' else firestore.Query.ASCENDING
-        query = query.order_by(sort_by, direction=direction)
         
-        # Pagination
-        limit = int(query_params.get('limit', 20))
-        offset = int(query_params.get('offset', 0))
+        # Terms longer than the indexed prefixes are re-checked while paging,
+        # so pages stay full (and the total is left out)
+        keep = None
+        if residual_term:
+            keep = lambda doc: matches((doc.to_dict() or {}).get('name'), residual_term)
         
-        # Execute query
-        items = []
-        # Get all items for pagination and filtering
-        all_items = [doc for doc in query.stream()]
-        total = len(all_items)
+        # Execute query for the requested page only
+        docs, pagination = paginate_query(query, query_params, sort_by, direction, keep=keep)
         
-        # Apply pagination and search filter in memory
-        for doc in all_items[offset:offset+limit]:
-            item = doc.to_dict()
-            item['id'] = doc.id
-            
-            # Apply search filter in memory if provided
-            if search_term and search_term not in item.get('name', '').lower():
-                continue
-                
-            items.append(item)
+        items = [self.serialize(doc.to_dict(), doc.id) for doc in docs]
             
         return {
             'items': items,
-            'pagination': {
-                'total': total,
-                'limit': limit,
-                'offset': offset
-            }
+            'pagination': pagination
         }
     
     def update(self, item_id: str, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -251,6 +278,10 @@ class FoodItem(NutritionModel):
                 if key in nutrition:
                     data[key] = nutrition[key]
         
+        # Keep search index in sync with the name
+        if 'name' in data:
+            data[SEARCH_TOKENS_FIELD] = build_search_tokens(data['name'])
+        
         # Update timestamp
         data['updated_at'] = firestore.SERVER_TIMESTAMP
         
@@ -261,9 +292,8 @@ class FoodItem(NutritionModel):
         # Return updated item
         updated_item = item.copy()
         updated_item.update(update_data)
-        updated_item['id'] = item_id
         
-        return updated_item
+        return self.serialize(updated_item, item_id)
     
     def delete(self, item_id: str, user_id: str) -> bool:
         """Delete a food item
@@ -309,9 +339,7 @@ class FoodItem(NutritionModel):
         
         items = query.stream()
         for doc in items:
-            item = doc.to_dict()
-            item['id'] = doc.id
-            return item
+            return self.serialize(doc.to_dict(), doc.id)
             
         return None
 
@@ -327,6 +355,7 @@ class MealLog(NutritionModel):
         self.db = db or firebase_admin.firestore.client()
         self.collection = "meals"
         self.food_item = FoodItem(db)
+        self.rollups = DailyRollup(db)
     
     def create(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new meal log
@@ -347,56 +376,8 @@ class MealLog(NutritionModel):
         if not data.get('meal_type'):
             raise ValueError("Meal type is required")
             
-        # Process food items
-        food_items = []
-        nutrition_totals = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 
-                           'fiber': 0, 'sugar': 0, 'sodium': 0, 'cholesterol': 0}
-        
-        for item in data.get('food_items', []):
-            # If just an ID is provided, fetch the complete item
-            if isinstance(item, str):
-                try:
-                    food_item = self.food_item.get(item, user_id)
-                    # Calculate nutrition based on default serving
-                    food_items.append({
-                        'food_item_id': item,
-                        'food_item_name': food_item.get('name', 'Unknown Food'),
-                        'servings': 1,
-                        'nutrition': food_item.get('nutrition', {})
-                    })
-                    # Add to totals
-                    for key in nutrition_totals:
-                        if key in food_item.get('nutrition', {}):
-                            nutrition_totals[key] += float(food_item['nutrition'][key])
-                except ValueError:
-                    # Skip invalid items
-                    continue
-            else:
-                # If full item with serving info is provided
-                item_id = item.get('food_item_id')
-                servings = float(item.get('servings', 1))
-                
-                try:
-                    food_item = self.food_item.get(item_id, user_id)
-                    # Calculate nutrition based on servings
-                    item_nutrition = {}
-                    for key, value in food_item.get('nutrition', {}).items():
-                        item_nutrition[key] = float(value) * servings
-                        
-                    food_items.append({
-                        'food_item_id': item_id,
-                        'food_item_name': food_item.get('name', 'Unknown Food'),
-                        'servings': servings,
-                        'nutrition': item_nutrition
-                    })
-                    
-                    # Add to totals
-                    for key in nutrition_totals:
-                        if key in food_item.get('nutrition', {}):
-                            nutrition_totals[key] += float(food_item['nutrition'][key]) * servings
-                except ValueError:
-                    # Skip invalid items
-                    continue
+        # Resolve food items and calculate totals
+        food_items, nutrition_totals = self._build_food_items(data.get('food_items', []), user_id)
         
         # Create meal document
         meal = {
@@ -412,14 +393,75 @@ class MealLog(NutritionModel):
             'updated_at': firestore.SERVER_TIMESTAMP
         }
         
-        # Save to database
+        # Save meal and daily rollup together
         doc_ref = self.db.collection(self.collection).document()
-        doc_ref.set(meal)
+        batch = self.db.batch()
+        batch.set(doc_ref, meal)
+        self.rollups.record(batch, user_id, new_meal=meal)
+        batch.commit()
         
         # Return with ID
         meal['id'] = doc_ref.id
         return meal
     
+    def _build_food_items(self, raw_items: List[Any], user_id: str) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        """Resolve meal food items and calculate nutrition totals
+        
+        All referenced food items are fetched with one batched read. Items
+        that don't exist or aren't accessible to the user are skipped.
+        
+        Args:
+            raw_items: Food item IDs or dicts with 'food_item_id' and 'servings'
+            user_id: ID of the user owning the meal (for authorization)
+            
+        Returns:
+            Tuple of (meal food item entries, nutrition totals)
+            
+        Raises:
+            ValueError: If a servings value is not a number
+        """
+        # Normalize entries to (item ID, servings) before fetching
+        entries = []
+        for item in raw_items:
+            if isinstance(item, str):
+                entries.append((item, None))
+            else:
+                entries.append((item.get('food_item_id'), float(item.get('servings', 1))))
+                
+        resolved = self.food_item.get_many([item_id for item_id, _ in entries], user_id)
+        
+        food_items = []
+        
+        for item_id, servings in entries:
+            food_item = resolved.get(item_id)
+            if food_item is None:
+                # Skip invalid items
+                continue
+                
+            nutrition = food_item.get('nutrition', {})
+            
+            if servings is None:
+                # Just an ID was provided, use the default serving
+                food_items.append({
+                    'food_item_id': item_id,
+                    'food_item_name': food_item.get('name', 'Unknown Food'),
+                    'servings': 1,
+                    'nutrition': nutrition
+                })
+            else:
+                # Calculate nutrition based on servings
+                food_items.append({
+                    'food_item_id': item_id,
+                    'food_item_name': food_item.get('name', 'Unknown Food'),
+                    'servings': servings,
+                    'nutrition': {key: float(value) * servings for key, value in nutrition.items()}
+                })
+                
+        # Entry nutrition is already scaled by servings
+        nutrition_totals = NutritionMatrix(food_items).totals()
+        
+        return food_items, nutrition_totals
+    
     def get(self, meal_id: str, user_id: str) -> Dict[str, Any]:
         """Get a meal by ID
         
@@ -453,9 +495,13 @@ class MealLog(NutritionModel):
         Args:
             user_id: ID of the user
             query_params: Dict containing filter and pagination parameters
+                (either 'offset' or an opaque 'cursor' from a previous page)
             
         Returns:
             Dict containing meals and pagination info
+            
+        Raises:
+            ValueError: If the pagination cursor is invalid
         """
         # Start with base query for user's meals
         query = self.db.collection(self.collection).where(
@@ -465,8 +511,8 @@ class MealLog(NutritionModel):
         # Apply date filter if provided
         if query_params.get('date'):
             try:
-                date = datetime.strptime(query_params['date'], '%Y-%m-%d')
-                next_day = datetime(date.year, date.month, date.day, 23, 59, 59)
+                date = datetime.strptime(query_params['date'], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+                next_day = date.replace(hour=23, minute=59, second=59)
                 
                 # Use Firebase timestamp filtering
                 query = query.where(
@@ -494,31 +540,19 @@ class MealLog(NutritionModel):
         sort_by = query_params.get('sort_by', 'meal_time')
         sort_dir = query_params.get('sort_dir', 'desc')
         direction = firestore.Query.DESCENDING if sort_dir == 'desc' else firestore.Query.ASCENDING
-        query = query.order_by(sort_by, direction=direction)
         
-        # Pagination
-        limit = int(query_params.get('limit', 20))
-        offset = int(query_params.get('offset', 0))
+        # Execute query for the requested page only
+        docs, pagination = paginate_query(query, query_params, sort_by, direction)
         
-        # Execute query
         meals = []
-        # Get all meals for accurate pagination
-        all_meals = [doc for doc in query.stream()]
-        total = len(all_meals)
-        
-        # Apply pagination in memory
-        for doc in all_meals[offset:offset+limit]:
+        for doc in docs:
             meal = doc.to_dict()
             meal['id'] = doc.id
             meals.append(meal)
             
         return {
             'meals': meals,
-            'pagination': {
-                'total': total,
-                'limit': limit,
-                'offset': offset
-            }
+            'pagination': pagination
         }
     
     def update(self, meal_id: str, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -549,62 +583,24 @@ class MealLog(NutritionModel):
             
         # Handle food items updates
         if 'food_items' in data:
-            food_items = []
-            nutrition_totals = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 
-                               'fiber': 0, 'sugar': 0, 'sodium': 0, 'cholesterol': 0}
-            
-            for item in data['food_items']:
-                # Process each food item similar to create method
-                if isinstance(item, str):
-                    try:
-                        food_item = self.food_item.get(item, user_id)
-                        food_items.append({
-                            'food_item_id': item,
-                            'food_item_name': food_item.get('name', 'Unknown Food'),
-                            'servings': 1,
-                            'nutrition': food_item.get('nutrition', {})
-                        })
-                        for key in nutrition_totals:
-                            if key in food_item.get('nutrition', {}):
-                                nutrition_totals[key] += float(food_item['nutrition'][key])
-                    except ValueError:
-                        continue
-                else:
-                    item_id = item.get('food_item_id')
-                    servings = float(item.get('servings', 1))
-                    
-                    try:
-                        food_item = self.food_item.get(item_id, user_id)
-                        item_nutrition = {}
-                        for key, value in food_item.get('nutrition', {}).items():
-                            item_nutrition[key] = float(value) * servings
-                            
-                        food_items.append({
-                            'food_item_id': item_id,
-                            'food_item_name': food_item.get('name', 'Unknown Food'),
-                            'servings': servings,
-                            'nutrition': item_nutrition
-                        })
-                        
-                        for key in nutrition_totals:
-                            if key in food_item.get('nutrition', {}):
-                                nutrition_totals[key] += float(food_item['nutrition'][key]) * servings
-                    except ValueError:
-                        continue
-            
-            data['food_items'] = food_items
-            data['nutrition_totals'] = nutrition_totals
+            data['food_items'], data['nutrition_totals'] = self._build_food_items(data['food_items'], user_id)
         
         # Update timestamp
         data['updated_at'] = firestore.SERVER_TIMESTAMP
         
-        # Update the document
+        # Build updated meal
         update_data = {k: v for k, v in data.items() if k != 'id' and k != 'userId'}
-        doc_ref.update(update_data)
-        
-        # Return updated meal
         updated_meal = meal.copy()
         updated_meal.update(update_data)
+        
+        # Update the document and daily rollups together, failing if the
+        # meal changed since it was read so rollups never double count
+        batch = self.db.batch()
+        batch.update(doc_ref, update_data, option=self.db.write_option(last_update_time=doc.update_time))
+        self.rollups.record(batch, user_id, old_meal=meal, new_meal=updated_meal)
+        batch.commit()
+        
+        # Return updated meal
         updated_meal['id'] = meal_id
         
         return updated_meal
@@ -634,8 +630,11 @@ class MealLog(NutritionModel):
         if meal.get('userId') != user_id:
             raise ValueError("Unauthorized to delete this meal")
             
-        # Delete the document
-        doc_ref.delete()
+        # Delete the document and remove it from daily rollups together
+        batch = self.db.batch()
+        batch.delete(doc_ref, option=self.db.write_option(last_update_time=doc.update_time))
+        self.rollups.record(batch, user_id, old_meal=meal)
+        batch.commit()
         return True
     
     def get_stats(self, user_id: str, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
@@ -649,105 +648,40 @@ class MealLog(NutritionModel):
         Returns:
             Dict containing nutrition statistics
         """
-        # Query meals within date range
-        query = self.db.collection(self.collection).where(
-            filter=firestore.FieldFilter("userId", "==", user_id)
-        ).where(
-            filter=firestore.FieldFilter("meal_time", ">=", start_date)
-        ).where(
-            filter=firestore.FieldFilter("meal_time", "<=", end_date)
+        # Read one rollup per day instead of every meal in the range
+        rollups = self.rollups.get_range(user_id, start_date, end_date)
+        days = sorted(rollups)
+        
+        # Aggregate day totals and meal type breakdowns in bulk
+        day_matrix = NutritionMatrix([rollups[day] for day in days], field='totals', nutrients=ROLLUP_NUTRIENTS)
+        macros = day_matrix.select(MEAL_TYPE_NUTRIENTS)
+        
+        type_entries = [
+            (meal_type, type_totals)
+            for day in days
+            for meal_type, type_totals in rollups[day].get('by_meal_type', {}).items()
+            if type_totals.get('count')
+        ]
+        type_matrix = NutritionMatrix(
+            [type_totals for _, type_totals in type_entries],
+            field=None,
+            nutrients=['count'] + MEAL_TYPE_NUTRIENTS
         )
+        by_meal_type = type_matrix.group([meal_type for meal_type, _ in type_entries], ndigits=1)
+        for type_stats in by_meal_type.values():
+            type_stats['count'] = int(type_stats['count'])
         
-        meals = [doc.to_dict() for doc in query.stream()]
+        daily_totals = {}
+        for day, totals in zip(days, macros.columns(ndigits=1)):
+            totals['meal_count'] = rollups[day].get('meal_count', 0)
+            daily_totals[day] = totals
         
-        # Initialize stats
         stats = {
-            'total_meals': len(meals),
-            'by_meal_type': {},
-            'daily_totals': {},
-            'average_daily': {
-                'calories': 0,
-                'protein': 0,
-                'carbs': 0,
-                'fat': 0
-            },
-            'nutrition_totals': {
-                'calories': 0,
-                'protein': 0,
-                'carbs': 0,
-                'fat': 0,
-                'fiber': 0,
-                'sugar': 0,
-                'sodium': 0,
-                'cholesterol': 0
-            }
+            'total_meals': sum(rollups[day].get('meal_count', 0) for day in days),
+            'by_meal_type': by_meal_type,
+            'daily_totals': daily_totals,
+            'average_daily': macros.mean(ndigits=1),
+            'nutrition_totals': day_matrix.totals(ndigits=1)
         }
         
-        # Calculate meal type breakdown
-        for meal in meals:
-            meal_type = meal.get('meal_type', 'other')
-            if meal_type not in stats['by_meal_type']:
-                stats['by_meal_type'][meal_type] = {
-                    'count': 0,
-                    'calories': 0,
-                    'protein': 0,
-                    'carbs': 0,
-                    'fat': 0
-                }
-                
-            stats['by_meal_type'][meal_type]['count'] += 1
-            
-            nutrition = meal.get('nutrition_totals', {})
-            for key in ['calories', 'protein', 'carbs', 'fat']:
-                if key in nutrition:
-                    stats['by_meal_type'][meal_type][key] += float(nutrition[key])
-                    stats['nutrition_totals'][key] += float(nutrition[key])
-                    
-            # Additional nutrients for total only
-            for key in ['fiber', 'sugar', 'sodium', 'cholesterol']:
-                if key in nutrition:
-                    stats['nutrition_totals'][key] += float(nutrition[key])
-                    
-            # Calculate daily totals
-            meal_time = meal.get('meal_time')
-            if hasattr(meal_time, 'strftime'):
-                day_str = meal_time.strftime('%Y-%m-%d')
-            else:
-                # Handle Firestore timestamps
-                day_str = datetime.fromtimestamp(meal_time.seconds).strftime('%Y-%m-%d')
-                
-            if day_str not in stats['daily_totals']:
-                stats['daily_totals'][day_str] = {
-                    'calories': 0,
-                    'protein': 0,
-                    'carbs': 0,
-                    'fat': 0,
-                    'meal_count': 0
-                }
-                
-            stats['daily_totals'][day_str]['meal_count'] += 1
-            for key in ['calories', 'protein', 'carbs', 'fat']:
-                if key in nutrition:
-                    stats['daily_totals'][day_str][key] += float(nutrition[key])
-        
-        # Calculate daily averages
-        days_with_data = len(stats['daily_totals'])
-        if days_with_data > 0:
-            for key in ['calories', 'protein', 'carbs', 'fat']:
-                stats['average_daily'][key] = round(stats['nutrition_totals'][key] / days_with_data, 1)
-                
-        # Round all values for better display
-        for key in stats['nutrition_totals']:
-            stats['nutrition_totals'][key] = round(stats['nutrition_totals'][key], 1)
-            
-        for meal_type in stats['by_meal_type']:
-            for key in stats['by_meal_type'][meal_type]:
-                if key != 'count':
-                    stats['by_meal_type'][meal_type][key] = round(stats['by_meal_type'][meal_type][key], 1)
-                    
-        for day in stats['daily_totals']:
-            for key in stats['daily_totals'][day]:
-                if key != 'meal_count':
-                    stats['daily_totals'][day][key] = round(stats['daily_totals'][day][key], 1)
-        
         return stats
\ No newline at end of file
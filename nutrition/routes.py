@@ -2,11 +2,13 @@ from flask import Blueprint, jsonify, request
 from utils.firebase_admin import auth_required
 import firebase_admin
 from firebase_admin import firestore
-from datetime import datetime
+from datetime import datetime, timezone
 import uuid
-import requests
 from nutrition.models import FoodItem, MealLog
-from config import Config
+from nutrition.aggregation import NutritionMatrix
+from nutrition.services import DailyRollup, date_range, MEAL_TYPE_NUTRIENTS
+from utils.api_clients import get_usda_client
+from utils.singleflight import SingleFlight
 
 # Create blueprint
 nutrition_bp = Blueprint('nutrition', __name__)
@@ -15,6 +17,10 @@ nutrition_bp = Blueprint('nutrition', __name__)
 db = firebase_admin.firestore.client()
 food_item_model = FoodItem(db)
 meal_log_model = MealLog(db)
+daily_rollup = DailyRollup(db)
+
+# Coalesces concurrent barcode lookups
+_barcode_flights = SingleFlight('barcode_lookup')
 
 
 @nutrition_bp.route('/foods', methods=['POST'])
@@ -41,6 +47,8 @@ def get_food_items(user_id):
         query_params = {
             'limit': request.args.get('limit', 20),
             'offset': request.args.get('offset', 0),
+            'cursor': request.args.get('cursor'),
+            'include_total': request.args.get('include_total'),
             'is_favorite': request.args.get('is_favorite') == 'true',
             'is_custom': request.args.get('is_custom') == 'true',
             'q': request.args.get('q', ''),
@@ -52,6 +60,8 @@ def get_food_items(user_id):
         result = food_item_model.list(user_id, query_params)
         return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f"Failed to get food items: {str(e)}"}), 500
 
@@ -130,20 +140,11 @@ def search_food_database(user_id):
         if not query:
             return jsonify({'error': 'Search query is required'}), 400
             
-        # Make request to USDA API
-        response = requests.get(
-            f"{Config.USDA_API_BASE_URL}/foods/search",
-            params={
-                'api_key': Config.USDA_API_KEY,
-                'query': query,
-                'pageSize': 25
-            }
-        )
+        # Search USDA over the shared connection pool
+        results = get_usda_client().search_foods(query, page_size=25)
         
-        if response.status_code != 200:
+        if 'error' in results:
             return jsonify({'error': 'Failed to search USDA database'}), 500
-            
-        results = response.json()
         
         # Format results
         foods = []
@@ -190,17 +191,10 @@ def get_food_details(user_id, fdc_id):
     """Get detailed information about a food from USDA database"""
     try:
         # Make request to USDA API
-        response = requests.get(
-            f"{Config.USDA_API_BASE_URL}/food/{fdc_id}",
-            params={
-                'api_key': Config.USDA_API_KEY
-            }
-        )
+        food_data = get_usda_client().get_food_details(fdc_id)
         
-        if response.status_code != 200:
+        if 'error' in food_data:
             return jsonify({'error': 'Failed to get food details from USDA database'}), 500
-            
-        food_data = response.json()
         
         # Format detailed food data
         food_details = {
@@ -264,17 +258,10 @@ def import_food_from_usda(user_id):
             return jsonify({'error': 'FDC ID is required'}), 400
             
         # Get food details from USDA
-        response = requests.get(
-            f"{Config.USDA_API_BASE_URL}/food/{fdc_id}",
-            params={
-                'api_key': Config.USDA_API_KEY
-            }
-        )
+        food_data = get_usda_client().get_food_details(fdc_id)
         
-        if response.status_code != 200:
+        if 'error' in food_data:
             return jsonify({'error': 'Failed to get food details from USDA database'}), 500
-            
-        food_data = response.json()
         
         # Prepare food item data
         food_item_data = {
@@ -352,6 +339,8 @@ def get_meals(user_id):
         query_params = {
             'limit': request.args.get('limit', 20),
             'offset': request.args.get('offset', 0),
+            'cursor': request.args.get('cursor'),
+            'include_total': request.args.get('include_total'),
             'date': request.args.get('date'),
             'meal_type': request.args.get('meal_type'),
             'sort_by': request.args.get('sort_by', 'meal_time'),
@@ -362,6 +351,8 @@ def get_meals(user_id):
         result = meal_log_model.list(user_id, query_params)
         return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f"Failed to get meals: {str(e)}"}), 500
 
@@ -420,70 +411,34 @@ def get_daily_nutrition_stats(user_id):
             return jsonify({'error': 'Date parameter is required'}), 400
             
         try:
-            date = datetime.strptime(date_str, '%Y-%m-%d')
+            date = datetime.strptime(date_str, '%Y-%m-%d').replace(tzinfo=timezone.utc)
         except ValueError:
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
             
-        # Get all meals for the day
-        query_params = {
-            'date': date_str,
-            'limit': 100,  # High limit to get all meals for the day
-            'offset': 0
-        }
+        # Read the day's rollup instead of every meal
+        rollup = daily_rollup.get_days(user_id, [date_str]).get(date_str, {})
+        
+        # Round totals and meal type breakdowns in bulk
+        type_entries = [
+            (meal_type, type_totals)
+            for meal_type, type_totals in rollup.get('by_meal_type', {}).items()
+            if type_totals.get('count')
+        ]
+        by_meal_type = NutritionMatrix(
+            [type_totals for _, type_totals in type_entries],
+            field=None,
+            nutrients=MEAL_TYPE_NUTRIENTS + ['count']
+        ).group([meal_type for meal_type, _ in type_entries], ndigits=1)
+        for type_stats in by_meal_type.values():
+            type_stats['meal_count'] = int(type_stats.pop('count'))
         
-        meals_result = meal_log_model.list(user_id, query_params)
-        meals = meals_result['meals']
-        
-        # Initialize stats
         stats = {
             'date': date_str,
-            'total': {
-                'calories': 0,
-                'protein': 0,
-                'carbs': 0,
-                'fat': 0,
-                'fiber': 0,
-                'sugar': 0,
-                'sodium': 0,
-                'cholesterol': 0
-            },
-            'by_meal_type': {},
-            'meal_count': len(meals)
+            'total': NutritionMatrix([rollup], field='totals').totals(ndigits=1),
+            'by_meal_type': by_meal_type,
+            'meal_count': rollup.get('meal_count', 0)
         }
         
-        # Calculate totals
-        for meal in meals:
-            # Add to total
-            nutrition = meal.get('nutrition_totals', {})
-            for key in stats['total']:
-                if key in nutrition:
-                    stats['total'][key] += float(nutrition[key])
-            
-            # Add to meal type breakdown
-            meal_type = meal.get('meal_type', 'other')
-            if meal_type not in stats['by_meal_type']:
-                stats['by_meal_type'][meal_type] = {
-                    'calories': 0,
-                    'protein': 0,
-                    'carbs': 0,
-                    'fat': 0,
-                    'meal_count': 0
-                }
-                
-            stats['by_meal_type'][meal_type]['meal_count'] += 1
-            for key in ['calories', 'protein', 'carbs', 'fat']:
-                if key in nutrition:
-                    stats['by_meal_type'][meal_type][key] += float(nutrition[key])
-        
-        # Round values for better display
-        for key in stats['total']:
-            stats['total'][key] = round(stats['total'][key], 1)
-            
-        for meal_type in stats['by_meal_type']:
-            for key in stats['by_meal_type'][meal_type]:
-                if key != 'meal_count':
-                    stats['by_meal_type'][meal_type][key] = round(stats['by_meal_type'][meal_type][key], 1)
-        
         # Calculate macronutrient percentages
         total_calories = stats['total']['calories']
         if total_calories > 0:
@@ -514,79 +469,51 @@ def get_weekly_nutrition_stats(user_id):
             return jsonify({'error': 'Both start_date and end_date parameters are required'}), 400
             
         try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(tzinfo=timezone.utc)
         except ValueError:
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
             
-        # Create Firestore reference
-        db = firebase_admin.firestore.client()
-        
-        # Get all meals within date range
-        meals_ref = db.collection('meals').where('userId', '==', user_id)
-        meals_ref = meals_ref.where('meal_time', '>=', start_date)
-        meals_ref = meals_ref.where('meal_time', '<=', end_date)
-        
-        # Execute query
-        meal_docs = meals_ref.stream()
-        meals = []
-        for doc in meal_docs:
-            meal = doc.to_dict()
-            meal['id'] = doc.id
-            meals.append(meal)
-            
-        # Group by day
-        daily_stats = {}
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            daily_stats[date_str] = {
+        # Read one rollup per day instead of every meal in the range
+        rollups = daily_rollup.get_range(user_id, start_date, end_date)
+        days = date_range(start_date, end_date)
+        
+        # Aggregate the days in bulk
+        day_matrix = NutritionMatrix(
+            [rollups.get(date_str, {}) for date_str in days],
+            field='totals',
+            nutrients=MEAL_TYPE_NUTRIENTS
+        )
+        
+        daily_breakdown = []
+        for date_str, totals in zip(days, day_matrix.columns(ndigits=1)):
+            daily_breakdown.append({
                 'date': date_str,
-                'calories': 0,
-                'protein': 0,
-                'carbs': 0,
-                'fat': 0,
-                'meal_count': 0
-            }
-            current_date = current_date.replace(day=current_date.day + 1)
-            
-        # Calculate daily totals
-        for meal in meals:
-            meal_time = meal.get('meal_time')
-            if hasattr(meal_time, 'strftime'):
-                day_str = meal_time.strftime('%Y-%m-%d')
-            else:
-                # Handle Firestore timestamps
-                day_str = datetime.fromtimestamp(meal_time.seconds).strftime('%Y-%m-%d')
-                
-            if day_str in daily_stats:
-                daily_stats[day_str]['meal_count'] += 1
-                nutrition = meal.get('nutrition_totals', {})
-                for key in ['calories', 'protein', 'carbs', 'fat']:
-                    if key in nutrition:
-                        daily_stats[day_str][key] += float(nutrition[key])
+                **totals,
+                'meal_count': rollups.get(date_str, {}).get('meal_count', 0)
+            })
                         
-        # Calculate weekly averages
-        days_with_data = sum(1 for day in daily_stats.values() if day['meal_count'] > 0)
+        # Calculate weekly averages over days with meals
+        days_with_data = len(rollups)
         
         weekly_summary = {
             'start_date': start_date_str,
             'end_date': end_date_str,
             'days_with_data': days_with_data,
-            'total_meals': sum(day['meal_count'] for day in daily_stats.values()),
+            'total_meals': sum(day['meal_count'] for day in daily_breakdown),
             'daily_average': {
                 'calories': 0,
                 'protein': 0,
                 'carbs': 0,
                 'fat': 0
             },
-            'daily_breakdown': [daily_stats[date] for date in sorted(daily_stats.keys())]
+            'daily_breakdown': daily_breakdown
         }
         
         if days_with_data > 0:
-            for key in ['calories', 'protein', 'carbs', 'fat']:
-                total = sum(day[key] for day in daily_stats.values())
-                weekly_summary['daily_average'][key] = round(total / days_with_data, 1)
+            totals = day_matrix.totals()
+            for key in weekly_summary['daily_average']:
+                weekly_summary['daily_average'][key] = round(totals[key] / days_with_data, 1)
         
         return jsonify(weekly_summary)
         
@@ -594,6 +521,29 @@ def get_weekly_nutrition_stats(user_id):
         return jsonify({'error': f"Failed to get weekly nutrition stats: {str(e)}"}), 500
 
 
+def _find_food_by_barcode(barcode):
+    """Find a food by barcode in our database, then in the local USDA store
+    
+    Args:
+        barcode: Product barcode
+        
+    Returns:
+        Tuple of (food item, source), or (None, None) if not found
+    """
+    # First check if it exists in our database
+    food_item = food_item_model.search_by_barcode(barcode)
+    if food_item:
+        return food_item, 'database'
+        
+    # Then the local copy of the USDA branded foods database, if imported
+    usda = get_usda_client()
+    usda_food = usda.get_food_by_gtin(barcode)
+    if usda_food:
+        return usda.format_food_item(usda_food, is_detailed=True), 'usda'
+        
+    return None, None
+
+
 @nutrition_bp.route('/barcode/lookup', methods=['GET'])
 @auth_required
 def lookup_barcode(user_id):
@@ -604,24 +554,11 @@ def lookup_barcode(user_id):
         if not barcode:
             return jsonify({'error': 'Barcode is required'}), 400
             
-        # First check if it exists in our database
-        db = firebase_admin.firestore.client()
-        food_items = db.collection('food_items').where('barcode', '==', barcode).limit(1).stream()
-        
-        food_item = None
-        for doc in food_items:
-            food_item = doc.to_dict()
-            food_item['id'] = doc.id
-            break
-            
+        # Concurrent scans of the same product share one lookup
+        food_item, source = _barcode_flights.do(barcode, _find_food_by_barcode, barcode)
         if food_item:
-            return jsonify({'food': food_item, 'source': 'database'})
+            return jsonify({'food': food_item, 'source': source})
             
-        # If not found, use an external service
-        # This is a placeholder - in production, you'd implement a real barcode lookup API
-        # like Open Food Facts or USDA Global Branded Food Products Database
-        
-        # Simulate response from external API
         return jsonify({
             'error': 'Barcode lookup not implemented',
             'message': 'Please add this item manually'
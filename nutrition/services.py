@@ -0,0 +1,276 @@
+# nutrition/services.py
+from datetime import datetime, date, timedelta, timezone
+from typing import List, Dict, Any, Optional, Iterable
+import firebase_admin
+from firebase_admin import firestore
+from nutrition.aggregation import NutritionMatrix, NUTRIENTS
+
+# Nutrients tracked in rollup totals
+ROLLUP_NUTRIENTS = NUTRIENTS
+
+# Nutrients tracked per meal type
+MEAL_TYPE_NUTRIENTS = ['calories', 'protein', 'carbs', 'fat']
+
+
+def to_utc(value: datetime) -> datetime:
+    """Express a datetime in UTC
+
+    Naive datetimes are taken to already be in UTC, matching how Firestore
+    stores them.
+
+    Args:
+        value: Naive or timezone-aware datetime
+
+    Returns:
+        Timezone-aware datetime in UTC
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def meal_day(meal_time: Any) -> str:
+    """Get the UTC day key (YYYY-MM-DD) a meal belongs to
+
+    Args:
+        meal_time: Meal time as a datetime, Firestore timestamp, ISO string
+            or server timestamp sentinel
+
+    Returns:
+        Day string in YYYY-MM-DD format
+    """
+    if isinstance(meal_time, datetime):
+        return to_utc(meal_time).strftime('%Y-%m-%d')
+
+    if hasattr(meal_time, 'strftime'):
+        # Plain dates carry no time of day to convert
+        return meal_time.strftime('%Y-%m-%d')
+
+    if hasattr(meal_time, 'seconds'):
+        # Handle Firestore timestamps
+        return datetime.fromtimestamp(meal_time.seconds, tz=timezone.utc).strftime('%Y-%m-%d')
+
+    if isinstance(meal_time, str):
+        try:
+            parsed = datetime.fromisoformat(meal_time.replace('Z', '+00:00'))
+            return to_utc(parsed).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+
+    # Server timestamps resolve to the time of the write
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+def date_range(start_date: datetime, end_date: datetime) -> List[str]:
+    """List the UTC day keys between two dates, inclusive
+
+    Args:
+        start_date: First day of the range
+        end_date: Last day of the range
+
+    Returns:
+        List of day strings in YYYY-MM-DD format
+    """
+    days = []
+    current = to_utc(start_date).date()
+    last = to_utc(end_date).date()
+
+    while current <= last:
+        days.append(current.strftime('%Y-%m-%d'))
+        current += timedelta(days=1)
+
+    return days
+
+
+class DailyRollup:
+    """Per-user, per-day nutrition aggregates maintained on every meal write
+
+    Each rollup document holds the meal count, nutrient totals and a
+    breakdown by meal type for one user and day, so stats views read one
+    small document per day instead of every meal.
+    """
+
+    def __init__(self, db=None):
+        """Initialize the DailyRollup service with database reference
+
+        Args:
+            db: Firestore database reference (optional)
+        """
+        self.db = db or firebase_admin.firestore.client()
+        self.collection = "nutrition_rollups"
+
+    @staticmethod
+    def doc_id(user_id: str, day: str) -> str:
+        """Get the rollup document ID for a user and day"""
+        return f"{user_id}_{day}"
+
+    @staticmethod
+    def contribution(meal: Dict[str, Any], sign: int = 1) -> Dict[str, Dict[str, Any]]:
+        """Calculate what a meal adds to (or removes from) its day's rollup
+
+        Args:
+            meal: Meal data
+            sign: 1 to add the meal, -1 to remove it
+
+        Returns:
+            Dict mapping day key to rollup delta
+        """
+        nutrition = meal.get('nutrition_totals', {})
+        meal_type = meal.get('meal_type', 'other')
+
+        totals = {key: sign * float(nutrition.get(key, 0)) for key in ROLLUP_NUTRIENTS}
+        by_type = {'count': sign}
+        by_type.update({key: totals[key] for key in MEAL_TYPE_NUTRIENTS})
+
+        return {
+            meal_day(meal.get('meal_time')): {
+                'meal_count': sign,
+                'totals': totals,
+                'by_meal_type': {meal_type: by_type}
+            }
+        }
+
+    @classmethod
+    def diff(cls, old_meal: Optional[Dict[str, Any]], new_meal: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Calculate the rollup deltas for replacing one version of a meal with another
+
+        Args:
+            old_meal: Meal data before the write (None for creates)
+            new_meal: Meal data after the write (None for deletes)
+
+        Returns:
+            Dict mapping day key to rollup delta, without no-op entries
+        """
+        deltas = {}
+        parts = []
+        if old_meal is not None:
+            parts.append(cls.contribution(old_meal, -1))
+        if new_meal is not None:
+            parts.append(cls.contribution(new_meal, 1))
+
+        for part in parts:
+            for day, delta in part.items():
+                merged = deltas.setdefault(day, {'meal_count': 0, 'totals': {}, 'by_meal_type': {}})
+                merged['meal_count'] += delta['meal_count']
+                for key, value in delta['totals'].items():
+                    merged['totals'][key] = merged['totals'].get(key, 0) + value
+                for meal_type, values in delta['by_meal_type'].items():
+                    type_delta = merged['by_meal_type'].setdefault(meal_type, {})
+                    for key, value in values.items():
+                        type_delta[key] = type_delta.get(key, 0) + value
+
+        # Drop meal types and days that net out to nothing
+        for day in list(deltas):
+            delta = deltas[day]
+            delta['by_meal_type'] = {
+                meal_type: values for meal_type, values in delta['by_meal_type'].items()
+                if any(values.values())
+            }
+            if not delta['meal_count'] and not any(delta['totals'].values()) and not delta['by_meal_type']:
+                del deltas[day]
+
+        return deltas
+
+    def record(self, batch, user_id: str, old_meal: Optional[Dict[str, Any]] = None,
+               new_meal: Optional[Dict[str, Any]] = None):
+        """Add rollup updates for a meal write to a write batch
+
+        The caller commits the batch together with the meal write, so the
+        meal and its rollups change atomically.
+
+        Args:
+            batch: Firestore write batch
+            user_id: ID of the user owning the meal
+            old_meal: Meal data before the write (None for creates)
+            new_meal: Meal data after the write (None for deletes)
+        """
+        for day, delta in self.diff(old_meal, new_meal).items():
+            update = {
+                'userId': user_id,
+                'date': day,
+                'meal_count': firestore.Increment(delta['meal_count']),
+                'totals': {key: firestore.Increment(value) for key, value in delta['totals'].items()},
+                'by_meal_type': {
+                    meal_type: {key: firestore.Increment(value) for key, value in values.items()}
+                    for meal_type, values in delta['by_meal_type'].items()
+                },
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }
+
+            ref = self.db.collection(self.collection).document(self.doc_id(user_id, day))
+            batch.set(ref, update, merge=True)
+
+    def get_days(self, user_id: str, days: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get rollups for specific days in a single batched read
+
+        Args:
+            user_id: ID of the user
+            days: Day keys in YYYY-MM-DD format
+
+        Returns:
+            Dict mapping day key to rollup data for days with meals
+        """
+        refs = [self.db.collection(self.collection).document(self.doc_id(user_id, day)) for day in days]
+        if not refs:
+            return {}
+
+        rollups = {}
+        for doc in self.db.get_all(refs):
+            if not doc.exists:
+                continue
+
+            rollup = doc.to_dict()
+            if rollup.get('meal_count', 0) > 0:
+                rollups[rollup.get('date')] = rollup
+
+        return rollups
+
+    def get_range(self, user_id: str, start_date: datetime, end_date: datetime) -> Dict[str, Dict[str, Any]]:
+        """Get rollups for every day in a date range
+
+        Args:
+            user_id: ID of the user
+            start_date: First day of the range
+            end_date: Last day of the range
+
+        Returns:
+            Dict mapping day key to rollup data for days with meals
+        """
+        return self.get_days(user_id, date_range(start_date, end_date))
+
+    @classmethod
+    def build(cls, user_id: str, meals: Iterable[Dict[str, Any]],
+              vectorized: Optional[bool] = None) -> Dict[str, Dict[str, Any]]:
+        """Build complete rollup documents from a set of meals
+
+        Args:
+            user_id: ID of the user owning the meals
+            meals: Meal data
+            vectorized: Force the aggregation backend (see NutritionMatrix)
+
+        Returns:
+            Dict mapping day key to rollup document data
+        """
+        meals = list(meals)
+        days = [meal_day(meal.get('meal_time')) for meal in meals]
+        meal_types = [meal.get('meal_type', 'other') for meal in meals]
+
+        matrix = NutritionMatrix(meals, field='nutrition_totals', nutrients=ROLLUP_NUTRIENTS,
+                                 vectorized=vectorized)
+        day_totals = matrix.group(days, count_key='meal_count')
+        type_totals = matrix.select(MEAL_TYPE_NUTRIENTS).group(zip(days, meal_types), count_key='count')
+
+        rollups = {}
+        for day, totals in day_totals.items():
+            rollups[day] = {
+                'userId': user_id,
+                'date': day,
+                'meal_count': totals.pop('meal_count'),
+                'totals': totals,
+                'by_meal_type': {}
+            }
+
+        for (day, meal_type), totals in type_totals.items():
+            rollups[day]['by_meal_type'][meal_type] = totals
+
+        return rollups
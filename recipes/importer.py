@@ -0,0 +1,514 @@
+# recipes/importer.py
+"""Recipe import from web pages and Instagram posts
+
+Scraping a recipe site, copying its hero image into Storage and saving the
+recipe can take many seconds. POST /recipes/import runs import_recipe in
+the request by default; with async=true it hands the URL to the
+recipe_import background task and returns the task ID right away.
+
+Popular recipes are imported by many users, so scrapes are cached in the
+recipe_scrapes collection under their canonical URL (tracking parameters
+stripped, redirects resolved). The hero image is stored once under its
+SHA-256 in recipe_images/, and each import gets a server-side copy of it.
+
+POST /recipes/import/batch queues one recipe_import task per URL, so each
+recipe is saved and its task finishes as soon as its own scrape does, and a
+long batch doesn't hold a background worker. The tasks share one limiter:
+at most RECIPE_IMPORT_PER_DOMAIN scrapes per site at once, started
+RECIPE_IMPORT_DOMAIN_INTERVAL seconds apart.
+"""
+import re
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from bs4 import BeautifulSoup
+import firebase_admin
+from firebase_admin import firestore
+from recipe_scrapers import scrape_me, WebsiteNotImplementedError
+from utils.background_tasks import register_task
+from utils import images
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Browser User-Agent for sites that reject scripted requests
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Seconds to wait for recipe pages and images
+FETCH_TIMEOUT = 15
+
+# Query parameters that only track where a link was shared
+TRACKING_PARAMS = frozenset({
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'igsh', 'igshid', 'mc_cid', 'mc_eid',
+    'ref', 'ref_src', 'si', 'share', 'cmpid', '_ga', 'yclid'
+})
+TRACKING_PREFIXES = ('utm_',)
+
+# Cached scrapes, keyed by the SHA-256 of the canonical URL
+SCRAPE_CACHE_COLLECTION = 'recipe_scrapes'
+
+# Storage prefix for content-addressed recipe images shared between imports
+IMAGE_BLOB_PREFIX = 'recipe_images'
+
+
+def is_instagram_url(url: str) -> bool:
+    """Check whether a URL points at Instagram
+
+    Args:
+        url: Recipe URL
+
+    Returns:
+        True for Instagram links
+    """
+    return 'instagram.com' in url or 'instagram.' in url
+
+
+def extract_instagram_url(url: str) -> str:
+    """Extract clean Instagram URL from potential app links or other formats
+
+    Args:
+        url: Instagram link as shared
+
+    Returns:
+        Canonical post URL, or the input if it doesn't look like a post
+    """
+    instagram_pattern = r'(https?://(?:www\.)?instagram\.com/[^/]+/[^/]+/[^/?]+)'
+    match = re.search(instagram_pattern, url)
+    if match:
+        return match.group(1)
+    return url
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a recipe URL so equivalent links compare equal
+
+    Lowercases the scheme and host, drops the fragment, tracking
+    parameters and a trailing slash, and sorts the remaining parameters.
+
+    Args:
+        url: Recipe URL
+
+    Returns:
+        Canonical URL
+    """
+    if is_instagram_url(url):
+        url = extract_instagram_url(url)
+
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    )
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ''))
+
+
+def resolve_url(url: str) -> str:
+    """Follow redirects (short links, http to https) and canonicalize the result
+
+    Instagram links aren't followed, since anonymous requests are redirected
+    to the login page. If the request fails the URL is canonicalized as given.
+
+    Args:
+        url: Recipe URL as shared
+
+    Returns:
+        Canonical URL of the final page
+    """
+    if not is_instagram_url(url):
+        try:
+            response = requests.head(url, headers=BROWSER_HEADERS, allow_redirects=True,
+                                     timeout=FETCH_TIMEOUT)
+            if response.status_code < 400 and response.url:
+                url = response.url
+        except requests.RequestException as e:
+            logger.info(f"Couldn't resolve {url}: {str(e)}")
+    return canonicalize_url(url)
+
+
+def scrape_web_recipe(url: str) -> Dict[str, Any]:
+    """Scrape a recipe from a supported recipe website
+
+    Args:
+        url: Recipe page URL
+
+    Returns:
+        Dict containing the scraped recipe fields
+
+    Raises:
+        ValueError: If the website is not supported
+    """
+    try:
+        scraper = scrape_me(url)
+    except WebsiteNotImplementedError:
+        raise ValueError("This website is not supported for recipe scraping")
+
+    return {
+        'url': url,
+        'title': scraper.title(),
+        'image': scraper.image(),
+        'total_time': scraper.total_time(),
+        'yields': scraper.yields(),
+        'ingredients': scraper.ingredients(),
+        'instructions': scraper.instructions_list(),
+        'nutrients': scraper.nutrients(),
+        'source': 'web',
+        'sourceUrl': url
+    }
+
+
+def scrape_instagram_recipe(url: str) -> Dict[str, Any]:
+    """Scrape a recipe from an Instagram post caption
+
+    Args:
+        url: Instagram post URL
+
+    Returns:
+        Dict containing the scraped recipe fields
+
+    Raises:
+        ValueError: If the post can't be retrieved
+    """
+    cleaned_url = extract_instagram_url(url)
+
+    response = requests.get(cleaned_url, headers=BROWSER_HEADERS, timeout=FETCH_TIMEOUT)
+    if response.status_code != 200:
+        raise ValueError("Failed to retrieve content from Instagram")
+
+    soup = BeautifulSoup(response.text, 'html.parser')
+
+    # Extract metadata from Instagram
+    # This is a simplified approach and may need adjustments based on Instagram's structure
+    title = None
+    description = None
+    image_url = None
+
+    for tag in soup.find_all('meta'):
+        if tag.get('property') == 'og:title':
+            title = tag.get('content')
+        elif tag.get('property') == 'og:description':
+            description = tag.get('content')
+        elif tag.get('property') == 'og:image':
+            image_url = tag.get('content')
+
+    # Parse caption for ingredients and instructions
+    ingredients = []
+    instructions = []
+
+    if description:
+        # Simple heuristic: lines that start with numbers or bullets are likely ingredients
+        for line in description.split('\n'):
+            line = line.strip()
+            if re.match(r'^[\d\-\*\•\◾\▪\-]\s', line) or 'ingredient' in line.lower():
+                ingredients.append(line)
+            elif len(line) > 20:  # Longer lines might be instructions
+                instructions.append(line)
+
+    return {
+        'url': cleaned_url,
+        'title': title or "Instagram Recipe",
+        'image': image_url,
+        'ingredients': ingredients,
+        'instructions': instructions,
+        'description': description,
+        'source': 'instagram',
+        'sourceUrl': cleaned_url,
+        'needsReview': True  # Flag for user to review and edit
+    }
+
+
+def scrape_recipe(url: str) -> Dict[str, Any]:
+    """Scrape a recipe from any supported URL
+
+    Args:
+        url: Recipe page or Instagram post URL
+
+    Returns:
+        Dict containing the scraped recipe fields
+
+    Raises:
+        ValueError: If the recipe can't be scraped from this URL
+    """
+    if is_instagram_url(url):
+        return scrape_instagram_recipe(url)
+    return scrape_web_recipe(url)
+
+
+class ScrapeCache:
+    """Scraped recipes and their images, shared between users' imports"""
+
+    def __init__(self, db, bucket, max_age_days: Optional[float] = None):
+        """Initialize the cache with database and storage references
+
+        Args:
+            db: Firestore client
+            bucket: Storage bucket
+            max_age_days: Days a scrape is reused for (defaults to
+                RECIPE_SCRAPE_CACHE_DAYS)
+        """
+        self.db = db
+        self.bucket = bucket
+        self.max_age = timedelta(days=max_age_days if max_age_days is not None else Config.RECIPE_SCRAPE_CACHE_DAYS)
+
+    def _doc_ref(self, canonical_url: str):
+        """Get the cache document of a canonical URL"""
+        key = hashlib.sha256(canonical_url.encode('utf-8')).hexdigest()
+        return self.db.collection(SCRAPE_CACHE_COLLECTION).document(key)
+
+    def get(self, canonical_url: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached scrape
+
+        Args:
+            canonical_url: Canonical recipe URL
+
+        Returns:
+            Dict with 'recipe' and 'imagePath', or None if missing or expired
+        """
+        doc = self._doc_ref(canonical_url).get()
+        if not doc.exists:
+            return None
+
+        entry = doc.to_dict() or {}
+        expires_at = entry.get('expiresAt')
+        if not entry.get('recipe') or not isinstance(expires_at, datetime) or expires_at <= datetime.now(timezone.utc):
+            return None
+        return entry
+
+    def put(self, canonical_url: str, recipe: Dict[str, Any], image_path: Optional[str]):
+        """Cache a scrape
+
+        Args:
+            canonical_url: Canonical recipe URL
+            recipe: Scraped recipe fields
+            image_path: Content-addressed image path, if the image was stored
+        """
+        self._doc_ref(canonical_url).set({
+            'url': canonical_url,
+            'recipe': recipe,
+            'imagePath': image_path,
+            'scrapedAt': firestore.SERVER_TIMESTAMP,
+            'expiresAt': datetime.now(timezone.utc) + self.max_age
+        })
+
+    def store_image(self, image_url: Optional[str]) -> Optional[str]:
+        """Download an image and store it under its content hash
+
+        Identical images from different URLs share one stored image, and an
+        image that is already stored isn't processed or uploaded again.
+        Failures are logged and leave the recipe without an image.
+
+        Args:
+            image_url: Source image URL
+
+        Returns:
+            Storage path of the image, or None
+        """
+        if not image_url:
+            return None
+
+        try:
+            data = images.download_image(image_url)
+            digest = hashlib.sha256(data).hexdigest()
+            image_path = f"{IMAGE_BLOB_PREFIX}/{digest}.jpg"
+            if not self.bucket.blob(image_path).exists():
+                images.store_image(self.bucket, data, image_path)
+            return image_path
+        except Exception as e:
+            # Continue even if image saving fails
+            logger.warning(f"Error saving recipe image: {str(e)}")
+            return None
+
+
+def copy_recipe_image(bucket, user_id: str, image_path: Optional[str], recipe: Dict[str, Any]):
+    """Give an imported recipe its own copy of a stored image
+
+    The copy happens inside Storage, so no image bytes pass through this
+    process. Each recipe owns its copy and can delete it with the recipe.
+    Failures are logged and leave the recipe without a stored image.
+
+    Args:
+        bucket: Storage bucket
+        user_id: The ID of the importing user
+        image_path: Content-addressed image path, or None
+        recipe: Recipe dict; updated with 'imageStoragePath', 'imageUrl' and
+            'imageVariants' on success
+    """
+    if not image_path:
+        return
+
+    try:
+        stored = images.copy_image(bucket, image_path, f"recipes/{user_id}/{uuid.uuid4()}.jpg")
+        recipe['imageStoragePath'] = stored['path']
+        recipe['imageUrl'] = stored['url']
+        recipe['imageVariants'] = stored['variants']
+    except Exception as e:
+        logger.warning(f"Error copying recipe image: {str(e)}")
+
+
+class DomainLimiter:
+    """Politeness limits for requests to each recipe site
+
+    Caps the requests in flight to a site and spaces out their starts, so a
+    batch of URLs from one site doesn't hammer it.
+    """
+
+    def __init__(self, per_domain: Optional[int] = None, interval: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """Initialize the limiter
+
+        Args:
+            per_domain: Concurrent requests per site (defaults to
+                RECIPE_IMPORT_PER_DOMAIN)
+            interval: Seconds between starting requests to the same site
+                (defaults to RECIPE_IMPORT_DOMAIN_INTERVAL)
+            clock: Monotonic clock returning seconds
+            sleep: Function that waits a number of seconds
+        """
+        self.per_domain = per_domain or Config.RECIPE_IMPORT_PER_DOMAIN
+        self.interval = interval if interval is not None else Config.RECIPE_IMPORT_DOMAIN_INTERVAL
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @contextmanager
+    def limit(self, url: str):
+        """Wait for a turn to request a URL's site
+
+        Args:
+            url: URL about to be requested
+        """
+        domain = urlsplit(url).netloc.lower()
+        with self._lock:
+            semaphore = self._semaphores.setdefault(domain, threading.Semaphore(self.per_domain))
+
+        with semaphore:
+            with self._lock:
+                now = self.clock()
+                start = max(now, self._next_start.get(domain, now))
+                self._next_start[domain] = start + self.interval
+            if start > now:
+                self.sleep(start - now)
+            yield
+
+
+# Shared by all background imports in this process, so the URLs of a batch
+# are spaced out even though each runs as its own task
+domain_limiter = DomainLimiter()
+
+
+def prepare_recipe(url: str, user_id: str, scrape_cache: ScrapeCache, bucket,
+                   limiter: Optional[DomainLimiter] = None,
+                   report: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """Scrape a recipe (or reuse a cached scrape) and copy its image for a user
+
+    The recipe isn't saved.
+
+    Args:
+        url: Recipe page or Instagram post URL
+        user_id: The ID of the importing user
+        scrape_cache: Scrape cache to read and fill
+        bucket: Storage bucket
+        limiter: Politeness limits for requests to recipe sites
+        report: Function to report progress percentage
+
+    Returns:
+        Dict containing the recipe fields
+
+    Raises:
+        ValueError: If the recipe can't be scraped from this URL
+    """
+    limit = limiter.limit if limiter else (lambda url: nullcontext())
+    report = report or (lambda percent: None)
+
+    with limit(url):
+        canonical_url = resolve_url(url)
+    cached = scrape_cache.get(canonical_url)
+    if cached:
+        scraped = cached['recipe']
+        image_path = cached.get('imagePath')
+    else:
+        with limit(canonical_url):
+            scraped = scrape_recipe(canonical_url)
+        image_path = scrape_cache.store_image(scraped.get('image'))
+        scrape_cache.put(canonical_url, scraped, image_path)
+    report(60)
+
+    recipe = {'userId': user_id}
+    recipe.update(scraped)
+    copy_recipe_image(bucket, user_id, image_path, recipe)
+    report(85)
+
+    recipe['createdAt'] = firestore.SERVER_TIMESTAMP
+    recipe['updatedAt'] = firestore.SERVER_TIMESTAMP
+    return recipe
+
+
+def import_recipe(url: str, user_id: str, db=None, bucket=None,
+                  progress_callback: Optional[Callable[[int], None]] = None,
+                  limiter: Optional[DomainLimiter] = None) -> Dict[str, Any]:
+    """Scrape a recipe, store its image and save it for a user
+
+    Scrapes of the same canonical URL are reused until they expire.
+
+    Args:
+        url: Recipe page or Instagram post URL
+        user_id: The ID of the importing user
+        db: Firestore client
+        bucket: Storage bucket
+        progress_callback: Function to report progress percentage
+        limiter: Politeness limits for requests to recipe sites
+
+    Returns:
+        Dict containing the saved recipe with ID
+
+    Raises:
+        ValueError: If the recipe can't be scraped from this URL
+    """
+    db = db or firebase_admin.firestore.client()
+    bucket = bucket or firebase_admin.storage.bucket()
+    report = progress_callback or (lambda percent: None)
+    scrape_cache = ScrapeCache(db, bucket)
+
+    report(10)
+    recipe = prepare_recipe(url, user_id, scrape_cache, bucket, limiter, report)
+
+    # Save recipe to Firestore
+    doc_ref = db.collection('recipes').document()
+    doc_ref.set(recipe)
+
+    # Return with ID
+    recipe['id'] = doc_ref.id
+    return recipe
+
+
+@register_task('recipe_import')
+def handle_recipe_import(data, progress_callback):
+    """Import a recipe in the background
+
+    Args:
+        data: Dict containing 'url' and 'userId'
+        progress_callback: Function to report progress percentage
+
+    Returns:
+        Task result with the new recipe's ID and title
+    """
+    recipe = import_recipe(data['url'], data['userId'], progress_callback=progress_callback,
+                           limiter=domain_limiter)
+    return {
+        'recipeId': recipe['id'],
+        'title': recipe.get('title'),
+        'imageUrl': recipe.get('imageUrl')
+    }
+
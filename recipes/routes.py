@@ -12,6 +12,12 @@ import re
 from bs4 import BeautifulSoup
 import json
 import urllib.parse
+from utils.api_clients import get_usda_client
+from utils.pagination import page_total
+from utils.background_tasks import enqueue_task
+from utils import images
+from recipes import importer
+from recipes.services import analyze_ingredients, STATUS_MATCHED, STATUS_ERROR, STATUS_TIMEOUT
 from config import Config
 
 # Create blueprint
@@ -19,15 +25,6 @@ recipes_bp = Blueprint('recipes', __name__)
 db = firebase_admin.firestore.client()
 bucket = firebase_admin.storage.bucket()
 
-# Helper function to extract Instagram URLs
-def extract_instagram_url(url):
-    """Extract clean Instagram URL from potential app links or other formats"""
-    instagram_pattern = r'(https?://(?:www\.)?instagram\.com/[^/]+/[^/]+/[^/?]+)'
-    match = re.search(instagram_pattern, url)
-    if match:
-        return match.group(1)
-    return url
-
 @recipes_bp.route('/import', methods=['POST'])
 @auth_required
 def import_recipe(user_id):
@@ -37,144 +34,56 @@ def import_recipe(user_id):
     if not url:
         return jsonify({'error': 'URL is required'}), 400
         
-    try:
-        # Handle Instagram URLs differently
-        if 'instagram.com' in url or 'instagram.' in url:
-            return handle_instagram_recipe(url, user_id)
-        
-        # For all other URLs, use recipe_scrapers
-        scraper = scrape_me(url)
-        
-        recipe = {
-            'userId': user_id,
-            'url': url,
-            'title': scraper.title(),
-            'image': scraper.image(),
-            'total_time': scraper.total_time(),
-            'yields': scraper.yields(),
-            'ingredients': scraper.ingredients(),
-            'instructions': scraper.instructions_list(),
-            'nutrients': scraper.nutrients(),
-            'createdAt': firestore.SERVER_TIMESTAMP,
-            'updatedAt': firestore.SERVER_TIMESTAMP,
-            'source': 'web',
-            'sourceUrl': url
-        }
-        
-        # Save recipe image to Firebase Storage
-        if recipe['image']:
-            try:
-                image_response = requests.get(recipe['image'])
-                if image_response.status_code == 200:
-                    image_path = f"recipes/{user_id}/{uuid.uuid4()}.jpg"
-                    blob = bucket.blob(image_path)
-                    blob.upload_from_string(image_response.content, content_type='image/jpeg')
-                    recipe['imageStoragePath'] = image_path
-                    recipe['imageUrl'] = blob.public_url
-            except Exception as img_error:
-                # Continue even if image saving fails
-                print(f"Error saving recipe image: {str(img_error)}")
-                
-        # Save recipe to Firestore
-        doc_ref = db.collection('recipes').document()
-        doc_ref.set(recipe)
-        
-        # Return with ID
-        recipe['id'] = doc_ref.id
+    # Async mode: scrape in the background and let the client poll the task
+    run_async = data.get('async') is True or request.args.get('async', '').lower() == 'true'
+    if run_async:
+        task_id = enqueue_task('recipe_import', {'url': url, 'userId': user_id}, user_id=user_id)
+        return jsonify({
+            'task_id': task_id,
+            'status': 'queued',
+            'status_url': f"/api/tasks/{task_id}"
+        }), 202
         
+    try:
+        recipe = importer.import_recipe(url, user_id, db=db, bucket=bucket)
         return jsonify(recipe), 201
         
-    except WebsiteNotImplementedError:
-        return jsonify({'error': 'This website is not supported for recipe scraping'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def handle_instagram_recipe(url, user_id):
-    """Custom handler for scraping recipes from Instagram posts"""
-    cleaned_url = extract_instagram_url(url)
+@recipes_bp.route('/import/batch', methods=['POST'])
+@auth_required
+def import_recipes_batch(user_id):
+    data = request.get_json() or {}
+    urls = data.get('urls')
     
-    try:
-        # For Instagram, we need to use a different approach
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(cleaned_url, headers=headers)
-        
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to retrieve content from Instagram'}), 500
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Extract metadata from Instagram
-        # This is a simplified approach and may need adjustments based on Instagram's structure
-        meta_tags = soup.find_all('meta')
-        
-        title = None
-        description = None
-        image_url = None
-        
-        for tag in meta_tags:
-            if tag.get('property') == 'og:title':
-                title = tag.get('content')
-            elif tag.get('property') == 'og:description':
-                description = tag.get('content')
-            elif tag.get('property') == 'og:image':
-                image_url = tag.get('content')
-        
-        # Parse caption for ingredients and instructions
-        ingredients = []
-        instructions = []
-        
-        if description:
-            # Simple heuristic: lines that start with numbers or bullets are likely ingredients
-            lines = description.split('\n')
-            for line in lines:
-                line = line.strip()
-                if re.match(r'^[\d\-\*\•\◾\▪\-]\s', line) or 'ingredient' in line.lower():
-                    ingredients.append(line)
-                elif len(line) > 20:  # Longer lines might be instructions
-                    instructions.append(line)
-        
-        recipe = {
-            'userId': user_id,
-            'url': cleaned_url,
-            'title': title or "Instagram Recipe",
-            'image': image_url,
-            'ingredients': ingredients,
-            'instructions': instructions,
-            'description': description,
-            'createdAt': firestore.SERVER_TIMESTAMP,
-            'updatedAt': firestore.SERVER_TIMESTAMP,
-            'source': 'instagram',
-            'sourceUrl': cleaned_url,
-            'needsReview': True  # Flag for user to review and edit
-        }
-        
-        # Save recipe image to Firebase Storage
-        if image_url:
-            try:
-                image_response = requests.get(image_url)
-                if image_response.status_code == 200:
-                    image_path = f"recipes/{user_id}/{uuid.uuid4()}.jpg"
-                    blob = bucket.blob(image_path)
-                    blob.upload_from_string(image_response.content, content_type='image/jpeg')
-                    recipe['imageStoragePath'] = image_path
-                    recipe['imageUrl'] = blob.public_url
-            except Exception as img_error:
-                # Continue even if image saving fails
-                print(f"Error saving Instagram image: {str(img_error)}")
-        
-        # Save recipe to Firestore
-        doc_ref = db.collection('recipes').document()
-        doc_ref.set(recipe)
-        
-        # Return with ID
-        recipe['id'] = doc_ref.id
-        
-        return jsonify(recipe), 201
-        
-    except Exception as e:
-        return jsonify({'error': f"Failed to import Instagram recipe: {str(e)}"}), 500
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'urls must be a non-empty list'}), 400
+        
+    # Drop blanks and repeats, keeping the given order
+    urls = list(dict.fromkeys(url.strip() for url in urls if isinstance(url, str) and url.strip()))
+    if not urls:
+        return jsonify({'error': 'urls must be a non-empty list'}), 400
+    if len(urls) > Config.RECIPE_IMPORT_BATCH_LIMIT:
+        return jsonify({'error': f"At most {Config.RECIPE_IMPORT_BATCH_LIMIT} URLs can be imported at once"}), 400
+        
+    # One background task per URL, so each recipe's outcome shows up as soon
+    # as it's done and no worker is tied up for the whole batch
+    tasks = []
+    for url in urls:
+        task_id = enqueue_task('recipe_import', {'url': url, 'userId': user_id}, user_id=user_id)
+        tasks.append({
+            'url': url,
+            'task_id': task_id,
+            'status_url': f"/api/tasks/{task_id}"
+        })
+    return jsonify({
+        'status': 'queued',
+        'tasks': tasks,
+        'count': len(tasks)
+    }), 202
 
 @recipes_bp.route('/supported-sites', methods=['GET'])
 def get_supported_sites():
@@ -189,11 +98,11 @@ def get_recipes(user_id):
         limit = int(request.args.get('limit', 20))
         offset = int(request.args.get('offset', 0))
         
-        query = db.collection('recipes').where('userId', '==', user_id).order_by('createdAt', direction=firestore.Query.DESCENDING)
+        user_recipes = db.collection('recipes').where('userId', '==', user_id)
+        query = user_recipes.order_by('createdAt', direction=firestore.Query.DESCENDING)
         
-        # Get total count (for pagination)
-        total_query = query.stream()
-        total = sum(1 for _ in total_query)
+        # Get total count with an aggregation query (skipped with include_total=false)
+        total = page_total(user_recipes, request.args)
         
         # Get current page
         recipes_docs = query.offset(offset).limit(limit).stream()
@@ -270,12 +179,11 @@ def create_recipe(user_id):
         # Handle recipe image if provided as base64
         image_base64 = data.get('imageBase64')
         if image_base64:
-            image_data = base64.b64decode(image_base64)
-            image_path = f"recipes/{user_id}/{uuid.uuid4()}.jpg"
-            blob = bucket.blob(image_path)
-            blob.upload_from_string(image_data, content_type='image/jpeg')
-            recipe['imageStoragePath'] = image_path
-            recipe['imageUrl'] = blob.public_url
+            image_data = images.read_base64_image(image_base64)
+            stored = images.store_image(bucket, image_data, f"recipes/{user_id}/{uuid.uuid4()}.jpg")
+            recipe['imageStoragePath'] = stored['path']
+            recipe['imageUrl'] = stored['url']
+            recipe['imageVariants'] = stored['variants']
             
         # Save to Firestore
         doc_ref = db.collection('recipes').document()
@@ -286,6 +194,8 @@ def create_recipe(user_id):
         
         return jsonify(recipe), 201
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -327,22 +237,15 @@ def update_recipe(user_id, recipe_id):
         # Handle recipe image if provided as base64
         image_base64 = data.get('imageBase64')
         if image_base64:
+            # Upload new image before removing the old one, so a bad upload keeps it
+            image_data = images.read_base64_image(image_base64)
+            stored = images.store_image(bucket, image_data, f"recipes/{user_id}/{uuid.uuid4()}.jpg")
+            update_data['imageStoragePath'] = stored['path']
+            update_data['imageUrl'] = stored['url']
+            update_data['imageVariants'] = stored['variants']
+            
             # Delete old image if exists
-            old_path = recipe.get('imageStoragePath')
-            if old_path:
-                try:
-                    old_blob = bucket.blob(old_path)
-                    old_blob.delete()
-                except Exception:
-                    pass  # Continue even if deletion fails
-                    
-            # Upload new image
-            image_data = base64.b64decode(image_base64)
-            image_path = f"recipes/{user_id}/{uuid.uuid4()}.jpg"
-            blob = bucket.blob(image_path)
-            blob.upload_from_string(image_data, content_type='image/jpeg')
-            update_data['imageStoragePath'] = image_path
-            update_data['imageUrl'] = blob.public_url
+            images.delete_image(bucket, recipe.get('imageStoragePath'))
             
         # Update in Firestore
         doc_ref.update(update_data)
@@ -354,6 +257,8 @@ def update_recipe(user_id, recipe_id):
         
         return jsonify(updated_recipe)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -372,14 +277,8 @@ def delete_recipe(user_id, recipe_id):
         if recipe.get('userId') != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
             
-        # Delete image if exists
-        image_path = recipe.get('imageStoragePath')
-        if image_path:
-            try:
-                blob = bucket.blob(image_path)
-                blob.delete()
-            except Exception:
-                pass  # Continue even if image deletion fails
+        # Delete image and its variants if they exist
+        images.delete_image(bucket, recipe.get('imageStoragePath'))
                 
         # Delete recipe
         doc_ref.delete()
@@ -549,65 +448,16 @@ def analyze_recipe_nutrition(user_id):
         # This is a simplified approach
         # In a production environment, you'd likely use a more robust nutrition API
         
-        # For each ingredient, make a call to the USDA API
-        estimated_nutrition = {
-            'calories': 0,
-            'protein': 0,
-            'fat': 0,
-            'carbs': 0,
-            'fiber': 0,
-            'sugar': 0
-        }
-        
-        breakdown = []
+        # Look up all ingredients in USDA concurrently
+        estimated_nutrition, results = analyze_ingredients(
+            ingredients, get_usda_client(), timeout=Config.INGREDIENT_LOOKUP_TIMEOUT
+        )
         
-        for ingredient in ingredients:
-            # Clean up ingredient text for better search results
-            search_term = re.sub(r'^\d+\s+\w+\s+', '', ingredient)  # Remove amount and unit
-            search_term = re.sub(r'\(.*?\)', '', search_term)  # Remove content in parentheses
-            
-            # Search USDA for this ingredient
-            response = requests.get(
-                f"{Config.USDA_API_BASE_URL}/foods/search",
-                params={
-                    'api_key': Config.USDA_API_KEY,
-                    'query': search_term,
-                    'pageSize': 1
-                }
-            )
-            
-            if response.status_code == 200:
-                results = response.json()
-                if results.get('foods') and len(results['foods']) > 0:
-                    food = results['foods'][0]
-                    
-                    item_nutrition = {
-                        'ingredient': ingredient,
-                        'fdcId': food.get('fdcId'),
-                        'description': food.get('description'),
-                        'calories': next((n.get('value', 0) for n in food.get('foodNutrients', []) 
-                                        if n.get('nutrientName', '').lower() == 'energy' and n.get('unitName', '').lower() == 'kcal'), 0),
-                        'protein': next((n.get('value', 0) for n in food.get('foodNutrients', []) 
-                                      if n.get('nutrientName', '').lower() == 'protein'), 0),
-                        'fat': next((n.get('value', 0) for n in food.get('foodNutrients', []) 
-                                   if n.get('nutrientName', '').lower() == 'total lipid (fat)'), 0),
-                        'carbs': next((n.get('value', 0) for n in food.get('foodNutrients', []) 
-                                     if n.get('nutrientName', '').lower() == 'carbohydrate, by difference'), 0),
-                        'fiber': next((n.get('value', 0) for n in food.get('foodNutrients', []) 
-                                     if n.get('nutrientName', '').lower() == 'fiber, total dietary'), 0),
-                        'sugar': next((n.get('value', 0) for n in food.get('foodNutrients', []) 
-                                     if n.get('nutrientName', '').lower() == 'sugars, total including nlea'), 0)
-                    }
-                    
-                    # Add to totals
-                    estimated_nutrition['calories'] += item_nutrition['calories']
-                    estimated_nutrition['protein'] += item_nutrition['protein']
-                    estimated_nutrition['fat'] += item_nutrition['fat']
-                    estimated_nutrition['carbs'] += item_nutrition['carbs']
-                    estimated_nutrition['fiber'] += item_nutrition['fiber']
-                    estimated_nutrition['sugar'] += item_nutrition['sugar']
-                    
-                    breakdown.append(item_nutrition)
+        breakdown = [result for result in results if result['status'] == STATUS_MATCHED]
+        ingredient_status = [
+            {'ingredient': result['ingredient'], 'status': result['status']}
+            for result in results
+        ]
         
         # Divide by number of servings if provided
         servings = data.get('servings', 1)
@@ -619,7 +469,9 @@ def analyze_recipe_nutrition(user_id):
             'totalNutrition': estimated_nutrition,
             'perServing': estimated_nutrition,
             'servings': servings,
-            'ingredientBreakdown': breakdown
+            'ingredientBreakdown': breakdown,
+            'ingredientStatus': ingredient_status,
+            'partial': any(result['status'] in (STATUS_ERROR, STATUS_TIMEOUT) for result in results)
         })
         
     except Exception as e:
@@ -0,0 +1,148 @@
+# recipes/services.py
+import re
+import time
+import logging
+from concurrent.futures import wait
+from typing import List, Dict, Any, Optional, Tuple
+from utils.search_index import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Nutrients estimated for recipes, mapped to USDA search result nutrient names
+ANALYSIS_NUTRIENTS = {
+    'calories': 'energy',
+    'protein': 'protein',
+    'fat': 'total lipid (fat)',
+    'carbs': 'carbohydrate, by difference',
+    'fiber': 'fiber, total dietary',
+    'sugar': 'sugars, total including nlea'
+}
+
+# Lookup outcomes reported per ingredient
+STATUS_MATCHED = 'matched'
+STATUS_NOT_FOUND = 'not_found'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+STATUS_SKIPPED = 'skipped'
+
+
+def ingredient_search_term(ingredient: str) -> str:
+    """Clean up ingredient text for better search results
+
+    Args:
+        ingredient: Raw ingredient line (e.g. "2 cups flour (sifted)")
+
+    Returns:
+        Search term with the leading amount, unit and parenthesized notes removed
+    """
+    search_term = re.sub(r'^\d+\s+\w+\s+', '', ingredient)  # Remove amount and unit
+    search_term = re.sub(r'\(.*?\)', '', search_term)  # Remove content in parentheses
+    return search_term.strip()
+
+
+def extract_search_nutrition(food: Dict[str, Any]) -> Dict[str, float]:
+    """Extract the analysis nutrients from a USDA search result
+
+    Args:
+        food: Food entry from a USDA search response
+
+    Returns:
+        Dict mapping nutrient to value
+    """
+    nutrition = {}
+
+    for nutrient in food.get('foodNutrients', []):
+        name = nutrient.get('nutrientName', '').lower()
+        for key, usda_name in ANALYSIS_NUTRIENTS.items():
+            # Keep the first matching entry; energy must be in kcal
+            if name != usda_name or key in nutrition:
+                continue
+            if key == 'calories' and nutrient.get('unitName', '').lower() != 'kcal':
+                continue
+            nutrition[key] = nutrient.get('value', 0)
+
+    return {key: nutrition.get(key, 0) for key in ANALYSIS_NUTRIENTS}
+
+
+def analyze_ingredients(ingredients: List[str], usda_client,
+                        timeout: Optional[float] = None) -> Tuple[Dict[str, float], List[Dict[str, Any]]]:
+    """Estimate nutrition for recipe ingredients with concurrent USDA lookups
+
+    Ingredients with the same normalized search term share one lookup. All
+    lookups run on the USDA client's bounded worker pool and must finish
+    within the timeout; ingredients whose lookup fails or runs late are
+    reported with their status instead of failing the whole analysis.
+    Lookups still queued at the timeout are cancelled, and running ones
+    stop retrying and have their request timeouts cut at the same
+    deadline, so late work doesn't hold the shared pool.
+
+    Args:
+        ingredients: Ingredient lines
+        usda_client: USDAClient used for the searches
+        timeout: Seconds to wait for the lookups (optional)
+
+    Returns:
+        Tuple of (nutrition totals, per-ingredient results in input order).
+        Each result has 'ingredient' and 'status'; matched results also
+        carry the food and its nutrition.
+    """
+    # Deduplicate lookups by normalized search term
+    terms = []
+    lookups = {}
+    for ingredient in ingredients:
+        search_term = ingredient_search_term(str(ingredient))
+        key = normalize_text(search_term)
+        terms.append(key)
+        if key and key not in lookups:
+            lookups[key] = search_term
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    futures = {
+        key: usda_client.submit(usda_client.search_foods, term, page_size=1, deadline=deadline)
+        for key, term in lookups.items()
+    }
+    _, pending = wait(futures.values(), timeout=timeout)
+
+    # Free the pool of lookups that haven't started
+    for future in pending:
+        future.cancel()
+
+    outcomes = {}
+    for key, future in futures.items():
+        if future in pending:
+            outcomes[key] = (STATUS_TIMEOUT, None)
+            continue
+
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.error(f"Ingredient lookup failed for '{lookups[key]}': {str(e)}")
+            outcomes[key] = (STATUS_ERROR, None)
+            continue
+
+        if 'error' in results:
+            outcomes[key] = (STATUS_ERROR, None)
+        elif results.get('foods'):
+            outcomes[key] = (STATUS_MATCHED, results['foods'][0])
+        else:
+            outcomes[key] = (STATUS_NOT_FOUND, None)
+
+    totals = {key: 0 for key in ANALYSIS_NUTRIENTS}
+    breakdown = []
+
+    for ingredient, key in zip(ingredients, terms):
+        status, food = outcomes.get(key, (STATUS_SKIPPED, None))
+        result = {'ingredient': ingredient, 'status': status}
+
+        if food is not None:
+            result['fdcId'] = food.get('fdcId')
+            result['description'] = food.get('description')
+            result.update(extract_search_nutrition(food))
+
+            # Add to totals
+            for nutrient in totals:
+                totals[nutrient] += result[nutrient]
+
+        breakdown.append(result)
+
+    return totals, breakdown
@@ -3,6 +3,65 @@ from datetime import datetime
 from typing import List, Dict, Any, Optional
 import firebase_admin
 from firebase_admin import firestore
+from social.services import Timeline, TrendingTags, PULLED_FIELD
+from utils.counters import ShardedCounter
+from utils.pagination import page_total
+from utils.background_tasks import register_task, enqueue_task
+
+# Sharded counter fields on posts and users
+POST_COUNTERS = ['likes', 'comments']
+USER_COUNTERS = ['follower_count', 'following_count']
+
+# Follow documents rewritten per batch when a user's summary changes
+SUMMARY_BATCH_SIZE = 500
+
+def profile_image(user: Dict[str, Any]) -> Optional[str]:
+    """Get the profile image to show next to a user's posts and in lists
+    
+    Args:
+        user: User profile data
+        
+    Returns:
+        The thumbnail URL, or the full image URL for profiles stored before
+        thumbnails existed
+    """
+    return user.get('profile_image_thumbnail_url') or user.get('profile_image_url')
+
+
+def build_user_summary(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the profile summary denormalized onto follow documents
+    
+    Args:
+        user: User profile data
+        
+    Returns:
+        Dict containing the user's name and profile image
+    """
+    return {
+        'name': user.get('name', 'User'),
+        'profile_image_url': profile_image(user)
+    }
+
+
+def schedule_summary_refresh(user_id: str, before: Optional[Dict[str, Any]],
+                             after: Dict[str, Any]) -> Optional[str]:
+    """Queue a rewrite of a user's follow summaries if their profile changed
+    
+    Call after writing a user's profile. New profiles have no follow
+    documents yet, so only changes to an existing profile are queued.
+    
+    Args:
+        user_id: ID of the user
+        before: Profile data before the write, or None for a new profile
+        after: Profile data after the write
+        
+    Returns:
+        Background task ID, or None if the summary didn't change
+    """
+    if before is None or build_user_summary(before) == build_user_summary(after):
+        return None
+    return enqueue_task('follow_summary_refresh', {'userId': user_id}, user_id=user_id)
+
 
 class Post:
     """Model for social posts in the application"""
@@ -11,6 +70,9 @@ class Post:
         """Initialize the Post model with database reference"""
         self.db = db or firebase_admin.firestore.client()
         self.collection = "posts"
+        self.timeline = Timeline(db)
+        self.counters = ShardedCounter(db)
+        self.trending = TrendingTags(db)
     
     def create(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new social post
@@ -36,11 +98,14 @@ class Post:
         
         user = user_doc.to_dict()
         
+        # Posts by authors over the fan-out limit are pulled by readers
+        pulled = self.timeline.is_pull_author(user)
+        
         # Create post document
         post = {
             'userId': user_id,
             'userName': user.get('name', 'User'),
-            'userProfileImage': user.get('profile_image_url'),
+            'userProfileImage': profile_image(user),
             'content': data['content'],
             'imageUrl': data.get('imageUrl'),
             'recipeId': data.get('recipeId'),
@@ -48,13 +113,20 @@ class Post:
             'tags': data.get('tags', []),
             'likes': 0,
             'comments': 0,
+            PULLED_FIELD: pulled,
             'createdAt': firestore.SERVER_TIMESTAMP,
             'updatedAt': firestore.SERVER_TIMESTAMP
         }
         
-        # Save to database
+        # Save to database, with the trending counts for its tags
         doc_ref = self.db.collection(self.collection).document()
-        doc_ref.set(post)
+        batch = self.db.batch()
+        batch.set(doc_ref, post)
+        self.trending.record(added=post['tags'], batch=batch)
+        batch.commit()
+        
+        # Fan the post out to followers' home timelines in the background
+        self.timeline.publish(dict(user, id=user_id), doc_ref.id, pulled)
         
         # Return with ID
         post['id'] = doc_ref.id
@@ -72,15 +144,42 @@ class Post:
         Raises:
             ValueError: If post not found
         """
-        doc = self.db.collection(self.collection).document(post_id).get()
+        doc_ref = self.db.collection(self.collection).document(post_id)
+        doc = doc_ref.get()
         
         if not doc.exists:
             raise ValueError("Post not found")
             
         post = doc.to_dict()
         post['id'] = doc.id
+        
+        # Counts on the document lag behind their shards until reconciled
+        post.update(self.counters.get(doc_ref, POST_COUNTERS, fallback=post))
         return post
     
+    def get_many(self, post_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several posts in one batched read
+        
+        Args:
+            post_ids: The IDs of the posts to retrieve
+            
+        Returns:
+            Dict mapping post ID to post data; missing posts are left out
+        """
+        post_ids = list(dict.fromkeys(post_ids))
+        if not post_ids:
+            return {}
+            
+        refs = [self.db.collection(self.collection).document(post_id) for post_id in post_ids]
+        
+        posts = {}
+        for doc in self.db.get_all(refs):
+            if doc.exists:
+                post = doc.to_dict()
+                post['id'] = doc.id
+                posts[doc.id] = post
+        return posts
+    
     def list(self, query_params: Dict[str, Any]) -> Dict[str, Any]:
         """List posts with filtering and pagination
         
@@ -109,6 +208,9 @@ class Post:
         if query_params.get('mealId'):
             query = query.where('mealId', '==', query_params['mealId'])
             
+        # Get total count with an aggregation over the filtered posts
+        total = page_total(query, query_params)
+        
         # Apply sorting - newest first by default
         query = query.order_by('createdAt', direction=firestore.Query.DESCENDING)
         
@@ -125,12 +227,6 @@ class Post:
             post['id'] = doc.id
             posts.append(post)
             
-        # Get total count (for pagination)
-        # Note: This is not efficient for large collections
-        # In production, consider using a counter or alternative approach
-        total_query = query.stream()
-        total = sum(1 for _ in total_query)
-            
         return {
             'posts': posts,
             'pagination': {
@@ -174,8 +270,14 @@ class Post:
             'updatedAt': firestore.SERVER_TIMESTAMP
         }
         
-        # Update document
-        doc_ref.update(update_data)
+        # Update document, moving trending counts for changed tags
+        old_tags = set(post.get('tags') or [])
+        new_tags = set(update_data['tags'] or [])
+        batch = self.db.batch()
+        batch.update(doc_ref, update_data)
+        self.trending.record(added=new_tags - old_tags, removed=old_tags - new_tags,
+                             at=post.get('createdAt'), batch=batch)
+        batch.commit()
         
         # Return updated post
         updated_post = post.copy()
@@ -209,8 +311,15 @@ class Post:
         if post.get('userId') != user_id:
             raise ValueError("Unauthorized to delete this post")
             
-        # Delete the document
-        doc_ref.delete()
+        # Delete the document with its trending counts, then its counter shards
+        batch = self.db.batch()
+        batch.delete(doc_ref)
+        self.trending.record(removed=post.get('tags') or [], at=post.get('createdAt'), batch=batch)
+        batch.commit()
+        self.counters.delete(doc_ref)
+        
+        # Remove the post from home timelines in the background
+        self.timeline.unpublish(user_id, post_id, bool(post.get(PULLED_FIELD)))
         
         # Also delete associated comments
         comments_query = self.db.collection('comments').where('postId', '==', post_id)
@@ -227,6 +336,7 @@ class Comment:
         """Initialize the Comment model with database reference"""
         self.db = db or firebase_admin.firestore.client()
         self.collection = "comments"
+        self.counters = ShardedCounter(db)
         self.post_model = Post(db)
     
     def create(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -266,7 +376,7 @@ class Comment:
         comment = {
             'userId': user_id,
             'userName': user.get('name', 'User'),
-            'userProfileImage': user.get('profile_image_url'),
+            'userProfileImage': profile_image(user),
             'postId': data['postId'],
             'content': data['content'],
             'createdAt': firestore.SERVER_TIMESTAMP,
@@ -278,9 +388,7 @@ class Comment:
         doc_ref.set(comment)
         
         # Increment comment count on post
-        self.db.collection('posts').document(data['postId']).update({
-            'comments': firestore.Increment(1)
-        })
+        self.counters.increment(self.db.collection('posts').document(data['postId']), 'comments', 1)
         
         # Return with ID
         comment['id'] = doc_ref.id
@@ -318,9 +426,12 @@ class Comment:
             comment['id'] = doc.id
             comments.append(comment)
             
-        # Get total count
-        total_query = self.db.collection(self.collection).where('postId', '==', post_id).stream()
-        total = sum(1 for _ in total_query)
+        # Get total count from the post's comment counter
+        post_ref = self.db.collection('posts').document(post_id)
+        total = page_total(
+            self.db.collection(self.collection).where('postId', '==', post_id), query_params,
+            counter=lambda: self.counters.get(post_ref, ['comments'])['comments']
+        )
             
         return {
             'comments': comments,
@@ -364,9 +475,7 @@ class Comment:
         
         # Decrement comment count on post
         if post_id:
-            self.db.collection('posts').document(post_id).update({
-                'comments': firestore.Increment(-1)
-            })
+            self.counters.increment(self.db.collection('posts').document(post_id), 'comments', -1)
             
         return True
 
@@ -379,6 +488,7 @@ class Like:
         self.db = db or firebase_admin.firestore.client()
         self.collection = "likes"
         self.post_model = Post(db)
+        self.counters = ShardedCounter(db)
     
     def toggle(self, user_id: str, post_id: str) -> Dict[str, Any]:
         """Toggle like status for a post
@@ -409,9 +519,7 @@ class Like:
             like_ref.delete()
             
             # Decrement like count on post
-            self.db.collection('posts').document(post_id).update({
-                'likes': firestore.Increment(-1)
-            })
+            self.counters.increment(self.db.collection('posts').document(post_id), 'likes', -1)
             
             return {
                 'liked': False,
@@ -429,9 +537,7 @@ class Like:
             like_ref.set(like_data)
             
             # Increment like count on post
-            self.db.collection('posts').document(post_id).update({
-                'likes': firestore.Increment(1)
-            })
+            self.counters.increment(self.db.collection('posts').document(post_id), 'likes', 1)
             
             return {
                 'liked': True,
@@ -453,6 +559,34 @@ class Like:
         like_doc = self.db.collection(self.collection).document(like_id).get()
         return like_doc.exists
     
+    def bulk_status(self, user_id: str, post_ids: List[str]) -> Dict[str, bool]:
+        """Check which of several posts a user has liked
+        
+        Like documents have deterministic IDs, so every status is fetched
+        in a single batched read.
+        
+        Args:
+            user_id: The ID of the user
+            post_ids: The IDs of the posts
+            
+        Returns:
+            Dict mapping each post ID to whether the user has liked it
+        """
+        statuses = {post_id: False for post_id in post_ids}
+        if not statuses:
+            return statuses
+            
+        refs = [
+            self.db.collection(self.collection).document(f"{user_id}_{post_id}")
+            for post_id in statuses
+        ]
+        
+        prefix_length = len(user_id) + 1
+        for doc in self.db.get_all(refs):
+            if doc.exists:
+                statuses[doc.id[prefix_length:]] = True
+        return statuses
+    
     def get_user_likes(self, user_id: str, query_params: Dict[str, Any]) -> Dict[str, Any]:
         """Get posts liked by a user
         
@@ -477,19 +611,12 @@ class Like:
         like_docs = query.limit(limit).offset(offset).stream()
         post_ids = [doc.to_dict()['postId'] for doc in like_docs]
         
-        # Fetch the actual posts
-        posts = []
-        for post_id in post_ids:
-            try:
-                post = self.post_model.get(post_id)
-                posts.append(post)
-            except ValueError:
-                # Skip posts that no longer exist
-                continue
+        # Fetch the actual posts in one batch, skipping posts that no longer exist
+        found = self.post_model.get_many(post_ids)
+        posts = [found[post_id] for post_id in post_ids if post_id in found]
                 
-        # Get total count
-        total_query = self.db.collection(self.collection).where('userId', '==', user_id).stream()
-        total = sum(1 for _ in total_query)
+        # Get total count with an aggregation over the user's likes
+        total = page_total(self.db.collection(self.collection).where('userId', '==', user_id), query_params)
             
         return {
             'posts': posts,
@@ -508,6 +635,8 @@ class Follow:
         """Initialize the Follow model with database reference"""
         self.db = db or firebase_admin.firestore.client()
         self.collection = "follows"
+        self.timeline = Timeline(db)
+        self.counters = ShardedCounter(db)
     
     def toggle(self, follower_id: str, following_id: str) -> Dict[str, Any]:
         """Toggle follow status between two users
@@ -546,42 +675,77 @@ class Follow:
             follow_ref.delete()
             
             # Update follower counts
-            self.db.collection('users').document(follower_id).update({
-                'following_count': firestore.Increment(-1)
-            })
+            self.counters.increment(self.db.collection('users').document(follower_id), 'following_count', -1)
+            self.counters.increment(self.db.collection('users').document(following_id), 'follower_count', -1)
             
-            self.db.collection('users').document(following_id).update({
-                'follower_count': firestore.Increment(-1)
-            })
+            # Drop the user's posts from the follower's home timeline
+            self.timeline.follow_changed(follower_id, following_id, False)
             
             return {
                 'following': False,
                 'followingId': following_id
             }
         else:
-            # Follow: Create follow document
+            # Follow: Create follow document with both profiles denormalized
+            # so follower/following lists can skip reading user documents
             follow_data = {
                 'followerId': follower_id,
                 'followingId': following_id,
+                'followerSummary': build_user_summary(follower_doc.to_dict()),
+                'followingSummary': build_user_summary(following_doc.to_dict()),
                 'createdAt': firestore.SERVER_TIMESTAMP
             }
             
             follow_ref.set(follow_data)
             
             # Update follower counts
-            self.db.collection('users').document(follower_id).update({
-                'following_count': firestore.Increment(1)
-            })
+            self.counters.increment(self.db.collection('users').document(follower_id), 'following_count', 1)
+            self.counters.increment(self.db.collection('users').document(following_id), 'follower_count', 1)
             
-            self.db.collection('users').document(following_id).update({
-                'follower_count': firestore.Increment(1)
-            })
+            # Backfill the user's recent posts into the follower's home timeline
+            self.timeline.follow_changed(follower_id, following_id, True)
             
             return {
                 'following': True,
                 'followingId': following_id
             }
     
+    def refresh_summaries(self, user_id: str) -> int:
+        """Rewrite a user's profile summary on all of their follow documents
+        
+        Documents that already hold the current summary aren't rewritten,
+        so a refresh can be retried safely.
+        
+        Args:
+            user_id: The ID of the user whose profile changed
+            
+        Returns:
+            Number of follow documents updated
+        """
+        user_doc = self.db.collection('users').document(user_id).get()
+        if not user_doc.exists:
+            return 0
+        summary = build_user_summary(user_doc.to_dict())
+        
+        updated = 0
+        for id_field, summary_field in (('followerId', 'followerSummary'), ('followingId', 'followingSummary')):
+            query = self.db.collection(self.collection).where(id_field, '==', user_id).limit(SUMMARY_BATCH_SIZE)
+            last = None
+            while True:
+                page = list((query.start_after(last) if last is not None else query).stream())
+                stale = [doc for doc in page if (doc.to_dict() or {}).get(summary_field) != summary]
+                if stale:
+                    batch = self.db.batch()
+                    for doc in stale:
+                        batch.update(doc.reference, {summary_field: summary})
+                    batch.commit()
+                    updated += len(stale)
+                if len(page) < SUMMARY_BATCH_SIZE:
+                    break
+                last = page[-1]
+                
+        return updated
+    
     def check_status(self, follower_id: str, following_id: str) -> bool:
         """Check if one user follows another
         
@@ -596,52 +760,53 @@ class Follow:
         follow_doc = self.db.collection(self.collection).document(follow_id).get()
         return follow_doc.exists
     
+    def bulk_status(self, follower_id: str, following_ids: List[str]) -> Dict[str, bool]:
+        """Check which of several users a user follows
+        
+        Follow documents have deterministic IDs, so every status is fetched
+        in a single batched read.
+        
+        Args:
+            follower_id: The ID of the potential follower
+            following_ids: The IDs of the potentially followed users
+            
+        Returns:
+            Dict mapping each user ID to whether the follower follows them
+        """
+        statuses = {following_id: False for following_id in following_ids}
+        if not statuses:
+            return statuses
+            
+        refs = [
+            self.db.collection(self.collection).document(f"{follower_id}_{following_id}")
+            for following_id in statuses
+        ]
+        
+        prefix_length = len(follower_id) + 1
+        for doc in self.db.get_all(refs):
+            if doc.exists:
+                statuses[doc.id[prefix_length:]] = True
+        return statuses
+    
     def get_followers(self, user_id: str, query_params: Dict[str, Any]) -> Dict[str, Any]:
         """Get users who follow a specific user
         
         Args:
             user_id: The ID of the user whose followers to get
-            query_params: Dict containing pagination parameters
+            query_params: Dict containing pagination parameters, and
+                'summary' to return the profile summaries stored on follow
+                documents instead of full user profiles
             
         Returns:
             Dict containing followers and pagination info
         """
-        # Start with base query
-        query = self.db.collection(self.collection).where('followingId', '==', user_id)
+        followers, pagination = self._list_users(
+            'followingId', 'followerId', 'followerSummary', 'follower_count', user_id, query_params
+        )
         
-        # Apply sorting
-        query = query.order_by('createdAt', direction=firestore.Query.DESCENDING)
-        
-        # Pagination
-        limit = int(query_params.get('limit', 20))
-        offset = int(query_params.get('offset', 0))
-        
-        # Execute query
-        follow_docs = query.limit(limit).offset(offset).stream()
-        
-        # Get the follower user profiles
-        followers = []
-        for doc in follow_docs:
-            follow_data = doc.to_dict()
-            follower_id = follow_data['followerId']
-            
-            user_doc = self.db.collection('users').document(follower_id).get()
-            if user_doc.exists:
-                user = user_doc.to_dict()
-                user['id'] = user_doc.id
-                followers.append(user)
-                
-        # Get total count
-        total_query = self.db.collection(self.collection).where('followingId', '==', user_id).stream()
-        total = sum(1 for _ in total_query)
-            
         return {
             'followers': followers,
-            'pagination': {
-                'total': total,
-                'limit': limit,
-                'offset': offset
-            }
+            'pagination': pagination
         }
     
     def get_following(self, user_id: str, query_params: Dict[str, Any]) -> Dict[str, Any]:
@@ -649,13 +814,40 @@ class Follow:
         
         Args:
             user_id: The ID of the user whose followings to get
-            query_params: Dict containing pagination parameters
+            query_params: Dict containing pagination parameters, and
+                'summary' to return the profile summaries stored on follow
+                documents instead of full user profiles
             
         Returns:
             Dict containing followed users and pagination info
         """
+        following, pagination = self._list_users(
+            'followerId', 'followingId', 'followingSummary', 'following_count', user_id, query_params
+        )
+        
+        return {
+            'following': following,
+            'pagination': pagination
+        }
+    
+    def _list_users(self, match_field: str, user_field: str, summary_field: str,
+                    count_field: str, user_id: str, query_params: Dict[str, Any]) -> tuple:
+        """List the users on the other side of a user's follow documents
+        
+        Args:
+            match_field: Follow document field holding user_id
+            user_field: Follow document field holding the listed user's ID
+            summary_field: Follow document field holding the listed user's summary
+            count_field: User counter holding the total number of relationships
+            user_id: The ID of the user whose relationships to list
+            query_params: Dict containing pagination, summary and
+                include_total parameters
+            
+        Returns:
+            Tuple of the user list and pagination info
+        """
         # Start with base query
-        query = self.db.collection(self.collection).where('followerId', '==', user_id)
+        query = self.db.collection(self.collection).where(match_field, '==', user_id)
         
         # Apply sorting
         query = query.order_by('createdAt', direction=firestore.Query.DESCENDING)
@@ -663,31 +855,72 @@ class Follow:
         # Pagination
         limit = int(query_params.get('limit', 20))
         offset = int(query_params.get('offset', 0))
+        use_summary = str(query_params.get('summary', '')).lower() in ('1', 'true', 'yes')
         
         # Execute query
-        follow_docs = query.limit(limit).offset(offset).stream()
-        
-        # Get the following user profiles
-        following = []
-        for doc in follow_docs:
-            follow_data = doc.to_dict()
-            following_id = follow_data['followingId']
-            
-            user_doc = self.db.collection('users').document(following_id).get()
-            if user_doc.exists:
-                user = user_doc.to_dict()
-                user['id'] = user_doc.id
-                following.append(user)
-                
-        # Get total count
-        total_query = self.db.collection(self.collection).where('followerId', '==', user_id).stream()
-        total = sum(1 for _ in total_query)
+        follows = [doc.to_dict() for doc in query.limit(limit).offset(offset).stream()]
+        
+        # Use the stored summaries where asked for and available; follow
+        # documents written before summaries existed fall back to a lookup
+        users = {}
+        if use_summary:
+            for follow_data in follows:
+                summary = follow_data.get(summary_field)
+                if summary is not None:
+                    users[follow_data[user_field]] = dict(summary, id=follow_data[user_field])
+                    
+        missing = [follow_data[user_field] for follow_data in follows if follow_data[user_field] not in users]
+        users.update(self._get_users(missing))
+        
+        # Keep the follow order, skipping users that no longer exist
+        listed = [users[follow_data[user_field]] for follow_data in follows if follow_data[user_field] in users]
+        
+        # Get total count from the user's follower or following counter
+        user_ref = self.db.collection('users').document(user_id)
+        total = page_total(
+            self.db.collection(self.collection).where(match_field, '==', user_id), query_params,
+            counter=lambda: self.counters.get(user_ref, [count_field])[count_field]
+        )
+        
+        return listed, {
+            'total': total,
+            'limit': limit,
+            'offset': offset
+        }
+    
+    def _get_users(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several user profiles in one batched read
+        
+        Args:
+            user_ids: The IDs of the users to retrieve
             
-        return {
-            'following': following,
-            'pagination': {
-                'total': total,
-                'limit': limit,
-                'offset': offset
-            }
-        }
\ No newline at end of file
+        Returns:
+            Dict mapping user ID to profile data; missing users are left out
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return {}
+            
+        refs = [self.db.collection('users').document(user_id) for user_id in user_ids]
+        
+        users = {}
+        for doc in self.db.get_all(refs):
+            if doc.exists:
+                user = doc.to_dict()
+                user['id'] = doc.id
+                users[doc.id] = user
+        return users
+
+
+@register_task('follow_summary_refresh')
+def handle_follow_summary_refresh(data, progress_callback):
+    """Rewrite a user's follow summaries in the background
+    
+    Args:
+        data: Dict containing 'userId'
+        progress_callback: Function to report progress percentage
+        
+    Returns:
+        Task result with the number of follow documents updated
+    """
+    return {'updated': Follow().refresh_summaries(data['userId'])}
@@ -56,6 +56,7 @@ def get_posts(user_id):
         query_params = {
             'limit': request.args.get('limit', 20),
             'offset': request.args.get('offset', 0),
+            'include_total': request.args.get('include_total'),
             'userId': request.args.get('userId'),
             'tag': request.args.get('tag'),
             'recipeId': request.args.get('recipeId'),
@@ -69,31 +70,23 @@ def get_posts(user_id):
         if feed_type == 'profile' and not query_params['userId']:
             query_params['userId'] = user_id
             
-        # If looking for following feed, we need to get followed users
+        # The following feed reads the user's home timeline, which new
+        # posts are fanned out to
         if feed_type == 'following':
-            # This requires custom handling since we need posts from followed users
-            # Get users that the current user follows
-            following_result = follow_model.get_following(
-                user_id, {'limit': 100, 'offset': 0}
-            )
-            following_users = following_result['following']
-            following_ids = [user['id'] for user in following_users]
-            
-            # Include the user's own posts
-            following_ids.append(user_id)
-            
-            # Will be handled in the model's list method
-            query_params['userIds'] = following_ids
-            
-        # Get posts using model
-        result = post_model.list(query_params)
+            query_params['cursor'] = request.args.get('cursor')
+            result = post_model.timeline.read(user_id, query_params)
+        else:
+            result = post_model.list(query_params)
         
         # Add like status for each post
+        statuses = like_model.bulk_status(user_id, [post['id'] for post in result['posts']])
         for post in result['posts']:
-            post['liked'] = like_model.check_status(user_id, post['id'])
+            post['liked'] = statuses[post['id']]
             
         return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f"Failed to get posts: {str(e)}"}), 500
 
@@ -228,6 +221,7 @@ def get_comments(user_id, post_id):
         query_params = {
             'limit': request.args.get('limit', 20),
             'offset': request.args.get('offset', 0),
+            'include_total': request.args.get('include_total'),
             'sort_by': request.args.get('sort_by', 'createdAt'),
             'sort_dir': request.args.get('sort_dir', 'asc')  # Show oldest first by default
         }
@@ -274,14 +268,17 @@ def get_followers(user_id, target_user_id):
     try:
         query_params = {
             'limit': request.args.get('limit', 20),
-            'offset': request.args.get('offset', 0)
+            'offset': request.args.get('offset', 0),
+            'include_total': request.args.get('include_total'),
+            'summary': request.args.get('summary')
         }
         
         result = follow_model.get_followers(target_user_id, query_params)
         
         # Add following status for each user
+        statuses = follow_model.bulk_status(user_id, [follower['id'] for follower in result['followers']])
         for follower in result['followers']:
-            follower['following'] = follow_model.check_status(user_id, follower['id'])
+            follower['following'] = statuses[follower['id']]
             
         return jsonify(result)
         
@@ -296,14 +293,17 @@ def get_following(user_id, target_user_id):
     try:
         query_params = {
             'limit': request.args.get('limit', 20),
-            'offset': request.args.get('offset', 0)
+            'offset': request.args.get('offset', 0),
+            'include_total': request.args.get('include_total'),
+            'summary': request.args.get('summary')
         }
         
         result = follow_model.get_following(target_user_id, query_params)
         
         # Add following status for each user
+        statuses = follow_model.bulk_status(user_id, [following_user['id'] for following_user in result['following']])
         for following_user in result['following']:
-            following_user['following'] = follow_model.check_status(user_id, following_user['id'])
+            following_user['following'] = statuses[following_user['id']]
             
         return jsonify(result)
         
@@ -318,7 +318,8 @@ def get_liked_posts(user_id):
     try:
         query_params = {
             'limit': request.args.get('limit', 20),
-            'offset': request.args.get('offset', 0)
+            'offset': request.args.get('offset', 0),
+            'include_total': request.args.get('include_total')
         }
         
         result = like_model.get_user_likes(user_id, query_params)
@@ -348,34 +349,13 @@ def check_follow_status(user_id, target_user_id):
 @social_bp.route('/trending/tags', methods=['GET'])
 @auth_required
 def get_trending_tags(user_id):
-    """Get trending tags from posts"""
+    """Get trending tags from recent posts"""
     try:
         # Get limit parameter
         limit = int(request.args.get('limit', 10))
         
-        # Create a Firestore reference
-        db = firebase_admin.firestore.client()
-        
-        # This would ideally be implemented with a proper analytics system
-        # For now, we'll use a simple approach based on recent posts
-        posts_ref = db.collection('posts')
-        recent_posts = posts_ref.order_by('createdAt', direction=firestore.Query.DESCENDING).limit(100).stream()
-        
-        # Count tag occurrences
-        tag_counts = {}
-        for post_doc in recent_posts:
-            post = post_doc.to_dict()
-            for tag in post.get('tags', []):
-                if tag in tag_counts:
-                    tag_counts[tag] += 1
-                else:
-                    tag_counts[tag] = 1
-                    
-        # Sort tags by count
-        sorted_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)
-        
-        # Return the top tags
-        trending_tags = [{'tag': tag, 'count': count} for tag, count in sorted_tags[:limit]]
+        # Served from the precomputed, time-decayed tag scores
+        trending_tags = post_model.trending.top(limit)
         
         return jsonify({'trending_tags': trending_tags})
         
@@ -0,0 +1,789 @@
+# social/services.py
+import os
+import math
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+import firebase_admin
+from firebase_admin import firestore
+from config import Config
+from utils.cache import cache
+from utils.pagination import encode_cursor, decode_cursor, get_page_params
+
+logger = logging.getLogger(__name__)
+
+# Firestore allows at most this many values in an 'in' filter
+IN_QUERY_LIMIT = 30
+
+# Writes per batch when fanning a post out to timelines
+FANOUT_BATCH_SIZE = 500
+
+# Timeline work not yet done, persisted so a restart doesn't lose it
+JOBS_COLLECTION = 'timeline_jobs'
+
+# Attempts after which a failing timeline job is dropped
+MAX_JOB_ATTEMPTS = 5
+
+# Cache key and lifetime for the list of authors whose posts are pulled
+PULL_AUTHORS_CACHE_KEY = 'timeline:pull_authors'
+PULL_AUTHORS_CACHE_TIMEOUT = 300
+
+# Post field recording that a post was not fanned out to followers
+PULLED_FIELD = 'timelinePulled'
+
+# User field marking authors who have published posts that weren't fanned out
+PULL_AUTHOR_FIELD = 'timeline_pulled_posts'
+
+# Hour bucket document IDs for trending tag counts (UTC)
+TRENDING_BUCKET_FORMAT = '%Y%m%d%H'
+
+# Cache key for the precomputed trending tags
+TRENDING_CACHE_KEY = 'trending:tags'
+
+# Trending refresher thread for this process, keyed by PID so forks start
+# their own, and a signal to rescore before its next scheduled check
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+_refresh_requested = threading.Event()
+
+# Timeline worker pool, queue slots and repair thread for this process,
+# keyed by PID so forks start their own
+_timeline_pool = None
+_timeline_slots = None
+_timeline_pid = None
+_timeline_lock = threading.Lock()
+
+
+class Timeline:
+    """Home timelines for the "following" feed
+
+    Posts are fanned out on write: a background job copies a reference to
+    each new post into timelines/{userId}/entries for the author and every
+    follower, so reading a feed is one indexed query. Authors with at least
+    TIMELINE_FANOUT_LIMIT followers are not fanned out; their posts are
+    pulled at read time and merged into the page instead.
+
+    The mode is decided per post, when it's published, and recorded on the
+    post (timelinePulled). An author crossing the limit in either direction
+    doesn't move existing posts: fanned-out posts stay in timelines, and
+    authors who ever published a pulled post are marked
+    (timeline_pulled_posts) and stay in the pull set, so their older pulled
+    posts are still read after they drop below the limit. Posts found by
+    both paths are merged once.
+
+    Fan-out, unfollow cleanup and post deletion run on a small worker pool
+    of their own (TIMELINE_WORKERS threads, at most TIMELINE_QUEUE_SIZE
+    queued), so long jobs elsewhere can't delay feeds. Each job is saved in
+    timeline_jobs before it is queued and deleted once done; jobs left
+    behind by a restart, a full queue or a failure are rerun by a repair
+    pass every TIMELINE_REPAIR_INTERVAL seconds. Every job is idempotent.
+    """
+
+    def __init__(self, db=None):
+        """Initialize the timeline service with database reference"""
+        self.db = db or firebase_admin.firestore.client()
+        self.fanout_limit = Config.TIMELINE_FANOUT_LIMIT
+        self.backfill_size = Config.TIMELINE_BACKFILL_SIZE
+
+    def entries(self, user_id: str):
+        """Get the timeline entries collection of a user
+
+        Args:
+            user_id: The ID of the timeline owner
+
+        Returns:
+            Firestore collection reference
+        """
+        return self.db.collection('timelines').document(user_id).collection('entries')
+
+    def is_pull_author(self, user: Dict[str, Any]) -> bool:
+        """Check whether an author's posts are pulled rather than fanned out
+
+        Args:
+            user: User profile data
+
+        Returns:
+            True if the author has too many followers to fan out to
+        """
+        return user.get('follower_count', 0) >= self.fanout_limit
+
+    def publish(self, author: Dict[str, Any], post_id: str, pulled: bool) -> str:
+        """Schedule fan-out of a new post
+
+        Args:
+            author: Profile data of the post author, including 'id'
+            post_id: The ID of the new post
+            pulled: Whether the post is pulled at read time instead of
+                fanned out to followers (as recorded on the post)
+
+        Returns:
+            Timeline job ID
+        """
+        if pulled and not author.get(PULL_AUTHOR_FIELD):
+            # Keep the author in the pull set even after they drop below the limit
+            self.db.collection('users').document(author['id']).update({PULL_AUTHOR_FIELD: True})
+            cache.delete(PULL_AUTHORS_CACHE_KEY)
+
+        # Pulled posts only go to the author's own timeline
+        return self.schedule(f"post_{post_id}", {
+            'type': 'fan_out',
+            'postId': post_id,
+            'authorId': author['id'],
+            'followers': not pulled
+        })
+
+    def unpublish(self, author_id: str, post_id: str, pulled: bool) -> str:
+        """Schedule removal of a deleted post from timelines
+
+        Args:
+            author_id: The ID of the post author
+            post_id: The ID of the deleted post
+            pulled: Whether the post was pulled rather than fanned out
+
+        Returns:
+            Timeline job ID
+        """
+        return self.schedule(f"unpost_{post_id}", {
+            'type': 'unfan',
+            'postId': post_id,
+            'authorId': author_id,
+            'followers': not pulled
+        })
+
+    def follow_changed(self, user_id: str, author_id: str, following: bool) -> str:
+        """Schedule a timeline update after a follow or unfollow
+
+        The job brings the timeline in line with whether the follow exists
+        when it runs, so a quick follow and unfollow can't be applied out
+        of order.
+
+        Args:
+            user_id: The ID of the follower
+            author_id: The ID of the followed user
+            following: Whether the user now follows the author
+
+        Returns:
+            Timeline job ID
+        """
+        return self.schedule(f"follow_{user_id}_{author_id}", {
+            'type': 'follow',
+            'userId': user_id,
+            'authorId': author_id,
+            'following': following
+        })
+
+    def schedule(self, job_id: str, job: Dict[str, Any]) -> str:
+        """Save a timeline job and queue it on the timeline workers
+
+        When the queue is full the job stays saved for the repair pass.
+
+        Args:
+            job_id: Job document ID; rescheduling the same work replaces it
+            job: Job data including its 'type'
+
+        Returns:
+            Timeline job ID
+        """
+        self.db.collection(JOBS_COLLECTION).document(job_id).set(
+            dict(job, attempts=0, createdAt=datetime.now(timezone.utc))
+        )
+
+        pool, slots = _get_timeline_pool()
+        if not slots.acquire(blocking=False):
+            logger.warning(f"Timeline queue is full; leaving job {job_id} for the repair pass")
+            return job_id
+
+        def run():
+            try:
+                self.run_job(job_id, job)
+            finally:
+                slots.release()
+
+        pool.submit(run)
+        return job_id
+
+    def run_job(self, job_id: str, job: Dict[str, Any]) -> bool:
+        """Run a timeline job and delete it once done
+
+        Failures are logged and counted on the job document, which the
+        repair pass retries until MAX_JOB_ATTEMPTS.
+
+        Args:
+            job_id: Job document ID
+            job: Job data
+
+        Returns:
+            True if the job succeeded
+        """
+        job_ref = self.db.collection(JOBS_COLLECTION).document(job_id)
+        try:
+            if job['type'] == 'fan_out':
+                self.fan_out(job['postId'], job['authorId'], job.get('followers', True))
+            elif job['type'] == 'unfan':
+                self.unfan(job['postId'], job['authorId'], job.get('followers', True))
+            elif job['type'] == 'follow':
+                self.sync_follow(job['userId'], job['authorId'])
+            else:
+                raise ValueError(f"Unknown timeline job type: {job['type']}")
+        except Exception as e:
+            attempts = job.get('attempts', 0) + 1
+            logger.error(f"Timeline job {job_id} failed (attempt {attempts}): {str(e)}")
+            try:
+                if attempts >= MAX_JOB_ATTEMPTS:
+                    job_ref.delete()
+                else:
+                    job_ref.update({'attempts': attempts})
+            except Exception as update_error:
+                logger.warning(f"Couldn't record failure of timeline job {job_id}: {str(update_error)}")
+            return False
+
+        job_ref.delete()
+        return True
+
+    def repair(self, older_than: float) -> int:
+        """Rerun timeline jobs that were saved but never finished
+
+        Args:
+            older_than: Seconds a job must have been waiting, so jobs still
+                queued in a live worker aren't run twice
+
+        Returns:
+            Number of jobs that succeeded
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than)
+        query = self.db.collection(JOBS_COLLECTION).where('createdAt', '<', cutoff)
+
+        succeeded = 0
+        for doc in query.limit(FANOUT_BATCH_SIZE).stream():
+            if self.run_job(doc.id, doc.to_dict()):
+                succeeded += 1
+        return succeeded
+
+    def fan_out(self, post_id: str, author_id: str, followers: bool = True) -> int:
+        """Write a post into its author's and followers' timelines
+
+        Args:
+            post_id: The ID of the post
+            author_id: The ID of the post author
+            followers: Whether to write to follower timelines as well
+
+        Returns:
+            Number of timeline entries written
+        """
+        post_doc = self.db.collection('posts').document(post_id).get()
+        if not post_doc.exists:
+            return 0
+
+        entry = self.build_entry(post_doc)
+        written = 0
+        batch = self.db.batch()
+        pending = 0
+
+        for user_id in self._fan_out_targets(author_id, followers):
+            batch.set(self.entries(user_id).document(post_id), entry)
+            pending += 1
+            if pending == FANOUT_BATCH_SIZE:
+                batch.commit()
+                written += pending
+                batch = self.db.batch()
+                pending = 0
+
+        if pending:
+            batch.commit()
+            written += pending
+
+        return written
+
+    def add_author(self, user_id: str, author_id: str) -> int:
+        """Backfill an author's recent posts after a follow
+
+        Only posts that were fanned out are copied, whatever the author's
+        follower count is now; pulled posts are read at request time.
+
+        Args:
+            user_id: The ID of the new follower
+            author_id: The ID of the followed user
+
+        Returns:
+            Number of timeline entries written
+        """
+        author_doc = self.db.collection('users').document(author_id).get()
+        if not author_doc.exists:
+            return 0
+
+        query = self.db.collection('posts').where('userId', '==', author_id)
+        query = query.order_by('createdAt', direction=firestore.Query.DESCENDING)
+
+        batch = self.db.batch()
+        written = 0
+        for post_doc in query.limit(self.backfill_size).stream():
+            if (post_doc.to_dict() or {}).get(PULLED_FIELD):
+                continue
+            batch.set(self.entries(user_id).document(post_doc.id), self.build_entry(post_doc))
+            written += 1
+
+        if written:
+            batch.commit()
+        return written
+
+    def sync_follow(self, user_id: str, author_id: str) -> int:
+        """Add or remove an author's posts to match the current follow state
+
+        Args:
+            user_id: The ID of the follower
+            author_id: The ID of the followed user
+
+        Returns:
+            Number of timeline entries written or removed
+        """
+        if self.db.collection('follows').document(f"{user_id}_{author_id}").get().exists:
+            return self.add_author(user_id, author_id)
+        return self.remove_author(user_id, author_id)
+
+    def unfan(self, post_id: str, author_id: str, followers: bool = True) -> int:
+        """Remove a deleted post from its author's and followers' timelines
+
+        Args:
+            post_id: The ID of the deleted post
+            author_id: The ID of the post author
+            followers: Whether the post was fanned out to followers
+
+        Returns:
+            Number of timeline entries deleted
+        """
+        removed = 0
+        batch = self.db.batch()
+        pending = 0
+
+        for user_id in self._fan_out_targets(author_id, followers):
+            batch.delete(self.entries(user_id).document(post_id))
+            pending += 1
+            if pending == FANOUT_BATCH_SIZE:
+                batch.commit()
+                removed += pending
+                batch = self.db.batch()
+                pending = 0
+
+        if pending:
+            batch.commit()
+            removed += pending
+
+        return removed
+
+    def remove_author(self, user_id: str, author_id: str) -> int:
+        """Remove an author's posts from a timeline after an unfollow
+
+        Args:
+            user_id: The ID of the former follower
+            author_id: The ID of the unfollowed user
+
+        Returns:
+            Number of timeline entries deleted
+        """
+        query = self.entries(user_id).where('authorId', '==', author_id)
+        removed = 0
+
+        while True:
+            docs = list(query.limit(FANOUT_BATCH_SIZE).stream())
+            if not docs:
+                return removed
+
+            batch = self.db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            removed += len(docs)
+
+    def read(self, user_id: str, query_params: Dict[str, Any]) -> Dict[str, Any]:
+        """Read a page of a user's home timeline
+
+        Args:
+            user_id: The ID of the timeline owner
+            query_params: Dict containing 'limit' and 'cursor'
+
+        Returns:
+            Dict containing posts and pagination info
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        limit, _, cursor = get_page_params(query_params)
+        position = decode_cursor(cursor) if cursor else None
+
+        # Fanned-out entries and pulled posts, each newest first with the
+        # document ID (the post ID in both) as tie-breaker
+        sources = [self._page(self.entries(user_id), 'postId', position, limit)]
+        for author_ids in self._chunks(self._followed_pull_authors(user_id)):
+            query = self.db.collection('posts').where('userId', 'in', author_ids)
+            sources.append(self._page(query, None, position, limit))
+
+        merged = []
+        seen = set()
+        for created_at, post_id in heapq.merge(*sources, key=lambda item: (item[0], item[1]), reverse=True):
+            if post_id not in seen:
+                seen.add(post_id)
+                merged.append((created_at, post_id))
+
+        has_more = len(merged) > limit
+        merged = merged[:limit]
+
+        post_ids = [post_id for _, post_id in merged]
+        posts = self._get_posts(post_ids)
+        if len(posts) < len(post_ids):
+            # Drop entries of posts deleted before their removal job ran
+            self._remove_entries(user_id, set(post_ids) - {post['id'] for post in posts})
+
+        next_cursor = None
+        if has_more and merged:
+            next_cursor = encode_cursor({'v': merged[-1][0], 'id': merged[-1][1]})
+
+        return {
+            'posts': posts,
+            'pagination': {
+                'total': None,
+                'limit': limit,
+                'next_cursor': next_cursor,
+                'has_more': has_more
+            }
+        }
+
+    def build_entry(self, post_doc) -> Dict[str, Any]:
+        """Build the timeline entry for a post
+
+        Args:
+            post_doc: Post document snapshot
+
+        Returns:
+            Dict containing the post ID, author ID and creation time
+        """
+        post = post_doc.to_dict()
+        return {
+            'postId': post_doc.id,
+            'authorId': post['userId'],
+            'createdAt': post['createdAt']
+        }
+
+    def _fan_out_targets(self, author_id: str, followers: bool):
+        """Yield the IDs of the timelines a post belongs in"""
+        yield author_id
+        if not followers:
+            return
+
+        query = self.db.collection('follows').where('followingId', '==', author_id)
+        query = query.order_by(firestore.FieldPath.document_id()).limit(FANOUT_BATCH_SIZE)
+        docs = list(query.stream())
+
+        while docs:
+            for doc in docs:
+                yield doc.to_dict()['followerId']
+            docs = list(query.start_after(docs[-1]).stream())
+
+    def _page(self, query, id_field: Optional[str], position: Optional[Dict[str, Any]],
+              limit: int) -> List[Tuple[Any, str]]:
+        """Read one page past a cursor position as (createdAt, post ID) pairs"""
+        query = query.order_by('createdAt', direction=firestore.Query.DESCENDING).order_by(
+            firestore.FieldPath.document_id(), direction=firestore.Query.DESCENDING
+        )
+        if position:
+            query = query.start_after({'createdAt': position['v'], '__name__': position['id']})
+
+        page = []
+        for doc in query.limit(limit + 1).stream():
+            data = doc.to_dict()
+            page.append((data['createdAt'], data[id_field] if id_field else doc.id))
+        return page
+
+    def _followed_pull_authors(self, user_id: str) -> List[str]:
+        """Get the pull authors a user follows"""
+        authors = cache.get(PULL_AUTHORS_CACHE_KEY)
+        if authors is None:
+            # Authors over the limit now, and authors with pulled posts from
+            # before they dropped below it
+            users = self.db.collection('users')
+            queries = [
+                users.where('follower_count', '>=', self.fanout_limit),
+                users.where(PULL_AUTHOR_FIELD, '==', True)
+            ]
+            authors = list(dict.fromkeys(doc.id for query in queries for doc in query.select([]).stream()))
+            cache.set(PULL_AUTHORS_CACHE_KEY, authors, timeout=PULL_AUTHORS_CACHE_TIMEOUT)
+
+        if not authors:
+            return []
+
+        refs = [self.db.collection('follows').document(f"{user_id}_{author_id}") for author_id in authors]
+        prefix_length = len(user_id) + 1
+        return [doc.id[prefix_length:] for doc in self.db.get_all(refs) if doc.exists]
+
+    def _remove_entries(self, user_id: str, post_ids: Iterable[str]):
+        """Delete timeline entries, logging rather than failing the read"""
+        try:
+            batch = self.db.batch()
+            for post_id in post_ids:
+                batch.delete(self.entries(user_id).document(post_id))
+            batch.commit()
+        except Exception as e:
+            logger.warning(f"Couldn't remove stale timeline entries for {user_id}: {str(e)}")
+
+    def _chunks(self, values: List[str]) -> List[List[str]]:
+        """Split values into groups that fit an 'in' filter"""
+        return [values[i:i + IN_QUERY_LIMIT] for i in range(0, len(values), IN_QUERY_LIMIT)]
+
+    def _get_posts(self, post_ids: List[str]) -> List[Dict[str, Any]]:
+        """Get posts in the given order, skipping deleted ones"""
+        if not post_ids:
+            return []
+
+        refs = [self.db.collection('posts').document(post_id) for post_id in post_ids]
+        found = {}
+        for doc in self.db.get_all(refs):
+            if doc.exists:
+                post = doc.to_dict()
+                post['id'] = doc.id
+                found[doc.id] = post
+        return [found[post_id] for post_id in post_ids if post_id in found]
+
+
+def normalize_tag(tag: Any) -> str:
+    """Normalize a tag for trending counts
+
+    Args:
+        tag: Tag as entered on a post
+
+    Returns:
+        Lowercase tag without a leading '#', or '' if nothing is left
+    """
+    if not isinstance(tag, str):
+        return ''
+    return tag.strip().lstrip('#').strip().lower()
+
+
+class TrendingTags:
+    """Trending tags from time-decayed, hour-bucketed tag counts
+
+    Post writes add their tag changes to trending_buckets/{YYYYMMDDHH}
+    documents in the same batch as the post itself. A background refresher
+    scores every tag over the last TRENDING_WINDOW_HOURS, halving a
+    bucket's weight every TRENDING_HALF_LIFE_HOURS, and stores the top tags
+    in trending/tags whenever that snapshot is older than
+    TRENDING_REFRESH_INTERVAL. Serving trending tags is then a single cached
+    read; a stale snapshot is still served while it's rescored.
+    """
+
+    def __init__(self, db=None):
+        """Initialize the trending service with database reference"""
+        self.db = db or firebase_admin.firestore.client()
+        self.window_hours = Config.TRENDING_WINDOW_HOURS
+        self.half_life_hours = Config.TRENDING_HALF_LIFE_HOURS
+        self.top_k = Config.TRENDING_TOP_K
+        self.cache_timeout = Config.TRENDING_CACHE_TIMEOUT
+        self.refresh_interval = Config.TRENDING_REFRESH_INTERVAL
+
+    def record(self, added: Iterable[str] = (), removed: Iterable[str] = (), at: Any = None, batch=None):
+        """Record tags added to or removed from a post
+
+        Args:
+            added: Tags the post gained
+            removed: Tags the post lost
+            at: When the post was created, so changes land in the same hour
+                as the original post (defaults to now)
+            batch: Optional write batch to add the write to, normally the one
+                writing the post; the caller commits it
+        """
+        changes = {}
+        for tags, delta in ((added, 1), (removed, -1)):
+            for tag in set(filter(None, map(normalize_tag, tags or ()))):
+                changes[tag] = changes.get(tag, 0) + delta
+
+        changes = {tag: delta for tag, delta in changes.items() if delta}
+        if not changes:
+            return
+
+        # Nested maps keep tags out of field path parsing
+        bucket_ref = self.db.collection('trending_buckets').document(self.bucket_for(at))
+        data = {'counts': {tag: firestore.Increment(delta) for tag, delta in changes.items()}}
+        if batch is not None:
+            batch.set(bucket_ref, data, merge=True)
+        else:
+            bucket_ref.set(data, merge=True)
+
+    def refresh(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Score tags over the window and store the top tags
+
+        Args:
+            now: Time to score at (defaults to now)
+
+        Returns:
+            List of the top tags with their scores and counts
+        """
+        now = now or datetime.now(timezone.utc)
+        current = now.replace(minute=0, second=0, microsecond=0)
+
+        # One read for every bucket in the window
+        refs = [
+            self.db.collection('trending_buckets').document(self.bucket_for(current - timedelta(hours=age)))
+            for age in range(self.window_hours)
+        ]
+
+        decay = math.log(2) / self.half_life_hours
+        scores = {}
+        counts = {}
+        for doc in self.db.get_all(refs):
+            if not doc.exists:
+                continue
+            bucket_time = datetime.strptime(doc.id, TRENDING_BUCKET_FORMAT).replace(tzinfo=timezone.utc)
+            weight = math.exp(-decay * (current - bucket_time).total_seconds() / 3600)
+            for tag, count in ((doc.to_dict() or {}).get('counts') or {}).items():
+                scores[tag] = scores.get(tag, 0) + count * weight
+                counts[tag] = counts.get(tag, 0) + count
+
+        ranked = sorted(
+            ((tag, score) for tag, score in scores.items() if score > 0),
+            key=lambda item: (-item[1], item[0])
+        )[:self.top_k]
+        tags = [{'tag': tag, 'score': round(score, 3), 'count': counts[tag]} for tag, score in ranked]
+
+        self.db.collection('trending').document('tags').set({
+            'tags': tags,
+            'updatedAt': now
+        })
+        cache.set(TRENDING_CACHE_KEY, tags, timeout=self.cache_timeout)
+        return tags
+
+    def refresh_if_stale(self) -> Optional[List[Dict[str, Any]]]:
+        """Rescore unless another process refreshed the snapshot recently
+
+        Returns:
+            The new top tags, or None if the snapshot was fresh
+        """
+        if self._is_stale(self._snapshot()):
+            return self.refresh()
+        return None
+
+    def top(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the current trending tags
+
+        A stale snapshot is served as is and rescored in the background.
+
+        Args:
+            limit: Maximum number of tags to return
+
+        Returns:
+            List of tags with their scores and counts, highest first
+        """
+        tags = cache.get(TRENDING_CACHE_KEY)
+        if tags is None:
+            snapshot = self._snapshot()
+            if self._is_stale(snapshot):
+                _request_refresh()
+            else:
+                _ensure_refresher()
+            tags = (snapshot or {}).get('tags', [])
+            cache.set(TRENDING_CACHE_KEY, tags, timeout=self.cache_timeout)
+
+        return tags[:limit]
+
+    def bucket_for(self, at: Any = None) -> str:
+        """Get the hour bucket document ID for a time
+
+        Args:
+            at: Datetime or stored timestamp (defaults to now)
+
+        Returns:
+            Bucket ID in YYYYMMDDHH format (UTC)
+        """
+        return self._as_datetime(at).astimezone(timezone.utc).strftime(TRENDING_BUCKET_FORMAT)
+
+    def _snapshot(self) -> Optional[Dict[str, Any]]:
+        """Read the stored top tags, or None if they haven't been scored yet"""
+        doc = self.db.collection('trending').document('tags').get()
+        return doc.to_dict() if doc.exists else None
+
+    def _is_stale(self, snapshot: Optional[Dict[str, Any]]) -> bool:
+        """Check whether a snapshot is missing or due to be rescored"""
+        if snapshot is None or not isinstance(snapshot.get('updatedAt'), datetime):
+            return True
+        age = datetime.now(timezone.utc) - self._as_datetime(snapshot['updatedAt'])
+        return age > timedelta(seconds=self.refresh_interval)
+
+    def _as_datetime(self, value: Any) -> datetime:
+        """Convert a stored timestamp to an aware datetime, defaulting to now"""
+        if isinstance(value, datetime):
+            return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc)
+
+
+def _refresh_loop(interval: float):
+    """Rescore trending tags when asked to, or when the snapshot gets stale"""
+    trending = None
+    while True:
+        _refresh_requested.wait(interval)
+        _refresh_requested.clear()
+        try:
+            trending = trending or TrendingTags()
+            trending.refresh_if_stale()
+        except Exception as e:
+            logger.error(f"Trending tag refresh failed: {str(e)}")
+
+
+def _request_refresh():
+    """Ask this process's refresher to rescore trending tags now"""
+    _ensure_refresher()
+    _refresh_requested.set()
+
+
+def _ensure_refresher():
+    """Start the trending refresher thread for this process if it isn't running"""
+    global _refresher_pid
+    if _refresher_pid == os.getpid():
+        return
+
+    with _refresher_lock:
+        if _refresher_pid == os.getpid():
+            return
+        _refresher_pid = os.getpid()
+
+    thread = threading.Thread(
+        target=_refresh_loop, args=(Config.TRENDING_REFRESH_INTERVAL,), daemon=True
+    )
+    thread.start()
+
+
+def _repair_loop(interval: float):
+    """Periodically rerun timeline jobs left behind"""
+    timeline = None
+    while True:
+        time.sleep(interval)
+        try:
+            timeline = timeline or Timeline()
+            timeline.repair(older_than=interval)
+        except Exception as e:
+            logger.error(f"Timeline repair failed: {str(e)}")
+
+
+def _get_timeline_pool():
+    """Get the timeline worker pool and its queue slots for this process
+
+    The first call in a process also starts the repair thread.
+    """
+    global _timeline_pool, _timeline_slots, _timeline_pid
+    if _timeline_pid == os.getpid():
+        return _timeline_pool, _timeline_slots
+
+    with _timeline_lock:
+        if _timeline_pid != os.getpid():
+            _timeline_pool = ThreadPoolExecutor(
+                max_workers=Config.TIMELINE_WORKERS, thread_name_prefix='timeline'
+            )
+            _timeline_slots = threading.BoundedSemaphore(Config.TIMELINE_QUEUE_SIZE)
+            _timeline_pid = os.getpid()
+
+            thread = threading.Thread(
+                target=_repair_loop, args=(Config.TIMELINE_REPAIR_INTERVAL,), daemon=True
+            )
+            thread.start()
+
+    return _timeline_pool, _timeline_slots
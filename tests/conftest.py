@@ -10,6 +10,9 @@ import firebase_admin
 # Add the parent directory to the path so we can import our app modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Keep USDA responses from being cached between tests
+os.environ.setdefault('USDA_CACHE_ENABLED', 'False')
+
 # Mock Firebase for testing
 @pytest.fixture(scope="session", autouse=True)
 def mock_firebase():
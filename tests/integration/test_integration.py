@@ -262,7 +262,7 @@ def test_recipe_nutrition_integration(client, mock_auth_middleware, mock_firesto
     }
     
     with patch('firebase_admin.firestore.client', return_value=mocks['db']), \
-         patch('requests.get', return_value=mock_usda_response):
+         patch('requests.Session.get', return_value=mock_usda_response):
         
         # Step 1: Analyze recipe nutrition
         analysis_data = {
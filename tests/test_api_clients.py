@@ -8,7 +8,8 @@ import requests
 # Add the parent directory to the path so we can import our app modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from utils.api_clients import USDAClient, BarcodeClient, NutritionLabelRecognizer
+import asyncio
+from utils.api_clients import USDAClient, BarcodeClient, NutritionLabelRecognizer, USDA_BATCH_SIZE
 
 
 class TestUSDAClient(unittest.TestCase):
@@ -103,7 +104,7 @@ class TestUSDAClient(unittest.TestCase):
             ]
         }
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_search_foods(self, mock_get):
         """Test searching for foods in the USDA database"""
         # Mock the API response
@@ -129,7 +130,7 @@ class TestUSDAClient(unittest.TestCase):
         self.assertEqual(len(result['foods']), 2)
         self.assertEqual(result['foods'][0]['description'], 'Apple, raw')
         
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_search_foods_error(self, mock_get):
         """Test handling API errors in search_foods"""
         # Mock a failed request
@@ -142,7 +143,7 @@ class TestUSDAClient(unittest.TestCase):
         self.assertIn('error', result)
         self.assertEqual(result['foods'], [])
         
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_food_details(self, mock_get):
         """Test getting food details from the USDA database"""
         # Mock the API response
@@ -167,7 +168,7 @@ class TestUSDAClient(unittest.TestCase):
         self.assertEqual(result['description'], 'Apple, raw')
         self.assertEqual(len(result['foodNutrients']), 4)
         
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_food_details_error(self, mock_get):
         """Test handling API errors in get_food_details"""
         # Mock a failed request
@@ -179,6 +180,127 @@ class TestUSDAClient(unittest.TestCase):
         # Verify error handling
         self.assertIn('error', result)
         
+    @patch('time.sleep')
+    @patch('requests.Session.get')
+    def test_retries_transient_errors(self, mock_get, mock_sleep):
+        """Test that transient failures are retried with backoff"""
+        unavailable = MagicMock()
+        unavailable.status_code = 503
+        unavailable.headers = {}
+        ok = MagicMock()
+        ok.status_code = 200
+        ok.json.return_value = self.sample_search_response
+        mock_get.side_effect = [requests.exceptions.ConnectionError("reset"), unavailable, ok]
+        
+        result = self.client.search_foods('apple')
+        
+        self.assertEqual(result['totalHits'], 2)
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        # Every attempt is bounded by a timeout
+        self.assertEqual(mock_get.call_args[1]['timeout'], self.client.timeout)
+        
+    @patch('time.sleep')
+    @patch('requests.Session.get')
+    def test_gives_up_after_max_retries(self, mock_get, mock_sleep):
+        """Test that retries stop after the configured limit"""
+        mock_get.side_effect = requests.exceptions.Timeout("slow")
+        
+        result = self.client.get_food_details('123456')
+        
+        self.assertIn('error', result)
+        self.assertEqual(mock_get.call_count, self.client.max_retries + 1)
+        
+    @patch('utils.api_clients.time.monotonic', return_value=100.0)
+    @patch('time.sleep')
+    @patch('requests.Session.get')
+    def test_deadline_caps_attempts(self, mock_get, mock_sleep, mock_monotonic):
+        """Test that a deadline cuts request timeouts and stops retries"""
+        mock_get.side_effect = requests.exceptions.Timeout("slow")
+        self.client.timeout = (3.05, 10)
+        
+        with patch.object(self.client, '_backoff', return_value=5):
+            result = self.client.search_foods('apple', deadline=102.0)
+        
+        self.assertIn('error', result)
+        # One attempt, bounded by the time left, and no retry past the deadline
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args[1]['timeout'], (2.0, 2.0))
+        mock_sleep.assert_not_called()
+        
+        # Nothing is sent once the deadline has passed
+        mock_get.reset_mock()
+        result = self.client.search_foods('pear', deadline=99.0)
+        self.assertIn('error', result)
+        mock_get.assert_not_called()
+        
+    @patch('time.sleep')
+    @patch('requests.Session.get')
+    def test_client_errors_not_retried(self, mock_get, mock_sleep):
+        """Test that non-transient HTTP errors fail immediately"""
+        not_found = MagicMock()
+        not_found.status_code = 404
+        not_found.raise_for_status.side_effect = requests.exceptions.HTTPError("404")
+        mock_get.return_value = not_found
+        
+        result = self.client.get_food_details('missing')
+        
+        self.assertIn('error', result)
+        mock_get.assert_called_once()
+        mock_sleep.assert_not_called()
+        
+    def test_backoff_honors_retry_after(self):
+        """Test jittered backoff bounds and Retry-After handling"""
+        for attempt in range(4):
+            delay = self.client._backoff(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, self.client.backoff_factor * (2 ** attempt))
+            
+        self.assertGreaterEqual(self.client._backoff(0, '5'), 5)
+        
+    @patch('requests.Session.post')
+    def test_get_foods_batches_ids(self, mock_post):
+        """Test that many details lookups use the batch endpoint"""
+        def respond(url, params=None, json=None, timeout=None):
+            response = MagicMock()
+            response.status_code = 200
+            response.json.return_value = [{'fdcId': int(fdc_id)} for fdc_id in json['fdcIds']]
+            return response
+        mock_post.side_effect = respond
+        
+        fdc_ids = list(range(1, USDA_BATCH_SIZE + 6)) + [1]
+        foods = self.client.get_foods(fdc_ids)
+        
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertTrue('/foods' in mock_post.call_args[0][0])
+        self.assertEqual(len(foods), USDA_BATCH_SIZE + 5)
+        self.assertEqual(foods['1']['fdcId'], 1)
+        
+    @patch('requests.Session.get')
+    def test_search_many(self, mock_get):
+        """Test concurrent searches keep query order"""
+        def respond(url, params=None, timeout=None):
+            response = MagicMock()
+            response.status_code = 200
+            response.json.return_value = {'foods': [{'description': params['query']}]}
+            return response
+        mock_get.side_effect = respond
+        
+        queries = ['apple', 'rice', 'egg', 'milk']
+        results = self.client.search_many(queries)
+        
+        self.assertEqual([r['foods'][0]['description'] for r in results], queries)
+        self.assertTrue(all(call[1]['params']['pageSize'] == 1 for call in mock_get.call_args_list))
+        
+        async_results = asyncio.run(self.client.search_many_async(queries))
+        self.assertEqual([r['foods'][0]['description'] for r in async_results], queries)
+        
+    def test_shared_session(self):
+        """Test that the client pools connections on one session"""
+        self.assertIsInstance(self.client.session, requests.Session)
+        adapter = self.client.session.get_adapter(self.base_url)
+        self.assertTrue(adapter._pool_block)
+        
     def test_format_nutrient_data(self):
         """Test formatting nutrient data from the USDA API"""
         # Test with detailed food endpoint format
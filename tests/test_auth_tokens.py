@@ -0,0 +1,164 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from utils import firebase_admin as firebase_auth
+from utils.firebase_admin import CertificateCache, get_current_user, auth_required
+
+
+def key_response(max_age):
+    """Build a mock signing key response"""
+    response = MagicMock()
+    response.status = 200
+    response.headers = {'Cache-Control': f'public, max-age={max_age}, must-revalidate'}
+    return response
+
+
+class TestTokenVerification(unittest.TestCase):
+    """Test cases for per-request and per-process token verification"""
+
+    def setUp(self):
+        """Set up an app and a clean token cache"""
+        self.app = Flask(__name__)
+        firebase_auth._verified_tokens.clear()
+        self.claims = {'uid': 'user-1', 'exp': time.time() + 3600}
+
+        patcher = patch('utils.firebase_admin._decode_id_token')
+        self.mock_decode = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_decode.return_value = self.claims
+
+    def request(self, token='token-1'):
+        """Create a request context with a bearer token"""
+        return self.app.test_request_context(headers={'Authorization': f'Bearer {token}'})
+
+    def test_verified_once_per_request(self):
+        """Test that every caller in a request shares one verification"""
+        @auth_required
+        def view(user_id):
+            return user_id
+
+        with self.request():
+            self.assertEqual(get_current_user(), self.claims)
+            self.assertEqual(get_current_user(), self.claims)
+            self.assertEqual(view(), 'user-1')
+
+        self.mock_decode.assert_called_once_with('token-1')
+
+    def test_verified_tokens_cached_across_requests(self):
+        """Test that a token verified once is reused until it expires"""
+        for _ in range(3):
+            with self.request():
+                get_current_user()
+        self.assertEqual(self.mock_decode.call_count, 1)
+
+        with self.request('token-2'):
+            get_current_user()
+        self.assertEqual(self.mock_decode.call_count, 2)
+
+    def test_expired_and_invalid_tokens_not_cached(self):
+        """Test that expired claims and failures are verified every time"""
+        self.mock_decode.return_value = {'uid': 'user-1', 'exp': time.time() - 1}
+        for _ in range(2):
+            with self.request():
+                get_current_user()
+        self.assertEqual(self.mock_decode.call_count, 2)
+
+        self.mock_decode.side_effect = ValueError("bad token")
+        with self.request('bad'):
+            self.assertIsNone(get_current_user())
+
+        with self.app.test_request_context():
+            self.assertIsNone(get_current_user())
+
+
+@patch.dict(os.environ, {'FIREBASE_AUTH_EMULATOR_HOST': ''})
+@patch('utils.firebase_admin.firebase_admin.get_app')
+@patch('utils.firebase_admin.google_id_token.verify_firebase_token')
+class TestDecodeIdToken(unittest.TestCase):
+    """Test cases for checking ID tokens with the public google-auth API"""
+
+    def test_valid_token(self, mock_verify, mock_get_app):
+        """Test that tokens are checked against the project with cached keys"""
+        mock_get_app.return_value.project_id = 'fitness-app'
+        mock_verify.return_value = {
+            'iss': 'https://securetoken.google.com/fitness-app', 'aud': 'fitness-app', 'sub': 'user-1'
+        }
+
+        claims = firebase_auth._decode_id_token('token-1')
+
+        self.assertEqual(claims['uid'], 'user-1')
+        mock_verify.assert_called_once_with('token-1', firebase_auth._certificates, audience='fitness-app')
+
+    def test_rejects_other_issuers_and_subjects(self, mock_verify, mock_get_app):
+        """Test that the Admin SDK's issuer and subject checks are kept"""
+        mock_get_app.return_value.project_id = 'fitness-app'
+        for claims in ({'iss': 'https://securetoken.google.com/other', 'sub': 'user-1'},
+                       {'iss': 'https://securetoken.google.com/fitness-app', 'sub': ''},
+                       {'iss': 'https://securetoken.google.com/fitness-app', 'sub': 'x' * 129}):
+            mock_verify.return_value = claims
+            with self.assertRaises(ValueError):
+                firebase_auth._decode_id_token('token-1')
+
+        mock_get_app.return_value.project_id = None
+        with self.assertRaises(ValueError):
+            firebase_auth._decode_id_token('token-1')
+
+
+class TestCertificateCache(unittest.TestCase):
+    """Test cases for the refresh-ahead signing key cache"""
+
+    def setUp(self):
+        """Set up a cache over a mock transport"""
+        self.cache = CertificateCache(refresh_ahead=60)
+        self.cache.transport = MagicMock(return_value=key_response(600))
+
+    @patch('utils.firebase_admin.time.time')
+    def test_keys_cached_for_max_age(self, mock_time):
+        """Test that keys are fetched once while fresh and again after expiry"""
+        mock_time.return_value = 1000
+        first = self.cache('https://keys')
+        mock_time.return_value = 1300
+        self.assertIs(self.cache('https://keys'), first)
+        self.assertEqual(self.cache.transport.call_count, 1)
+
+        mock_time.return_value = 1700
+        self.cache('https://keys')
+        self.assertEqual(self.cache.transport.call_count, 2)
+
+    @patch('utils.firebase_admin.threading.Thread')
+    @patch('utils.firebase_admin.time.time')
+    def test_refresh_ahead(self, mock_time, mock_thread):
+        """Test that keys near expiry are served while one refresh runs"""
+        mock_time.return_value = 1000
+        first = self.cache('https://keys')
+
+        mock_time.return_value = 1560
+        self.assertIs(self.cache('https://keys'), first)
+        self.assertIs(self.cache('https://keys'), first)
+        mock_thread.assert_called_once()
+
+        # Run the refresh the thread would have run
+        mock_thread.call_args[1]['target'](*mock_thread.call_args[1]['args'])
+        self.assertEqual(self.cache.transport.call_count, 2)
+        self.assertEqual(self.cache.refreshing, set())
+        self.assertEqual(self.cache.entries['https://keys'][1], 1560 + 600)
+
+    def test_errors_not_cached(self):
+        """Test that failed fetches are retried"""
+        error = MagicMock(status=503, headers={})
+        self.cache.transport.return_value = error
+
+        self.cache('https://keys')
+        self.cache('https://keys')
+        self.assertEqual(self.cache.transport.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
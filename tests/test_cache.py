@@ -0,0 +1,383 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import time
+import threading
+import redis
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.cache import CacheBackend, LRUCache, RedisCache, cache, cached, invalidate, invalidate_tags, estimate_size, create_cache
+
+
+class TestLRUCache(unittest.TestCase):
+    """Test cases for the bounded LRU/TTL cache"""
+
+    def setUp(self):
+        """Set up a small cache"""
+        self.cache = LRUCache(max_entries=3, max_bytes=10000, sweep_interval=60)
+
+    def test_lru_eviction_by_entries(self):
+        """Test that the least recently used entry is evicted first"""
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.set('c', 3)
+        self.cache.get('a')
+        self.cache.set('d', 4)
+
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.cache.stats()['entries'], 3)
+
+    def test_eviction_by_bytes(self):
+        """Test that the byte budget is enforced"""
+        value = 'x' * 4000
+        self.cache.set('a', value)
+        self.cache.set('b', value)
+        self.cache.set('c', value)
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertLessEqual(self.cache.stats()['bytes'], 10000)
+
+        # Values bigger than the whole cache are not stored
+        self.cache.set('huge', 'x' * 20000)
+        self.assertIsNone(self.cache.get('huge'))
+        self.assertEqual(self.cache.stats()['rejections'], 1)
+
+        # Overwriting replaces the old size
+        self.cache.set('c', 'small')
+        self.assertEqual(self.cache.stats()['bytes'], estimate_size(value) + estimate_size('small'))
+
+    @patch('utils.cache.time.time')
+    def test_expiry_and_sweep(self, mock_time):
+        """Test lazy expiry on read and the periodic sweep"""
+        mock_time.return_value = 1000
+        self.cache.set('short', 1, timeout=10)
+        self.cache.set('long', 2, timeout=100)
+        self.cache.set('forever', 3)
+
+        mock_time.return_value = 1011
+        self.assertIsNone(self.cache.get('short'))
+        self.assertEqual(self.cache.get('long'), 2)
+
+        # The sweep removes expired entries nobody reads
+        mock_time.return_value = 1200
+        self.assertEqual(self.cache.sweep(), 1)
+        self.assertEqual(self.cache.stats()['entries'], 1)
+        self.assertEqual(self.cache.stats()['expirations'], 2)
+
+        # Reads and writes trigger the sweep once the interval passes
+        self.cache.set('short', 1, timeout=10)
+        mock_time.return_value = 1300
+        self.cache.get('forever')
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+    def test_overwritten_entry_survives_old_expiry(self):
+        """Test that heap items from an overwritten key are ignored"""
+        with patch('utils.cache.time.time', return_value=1000):
+            self.cache.set('key', 'old', timeout=10)
+            self.cache.set('key', 'new', timeout=100)
+
+        with patch('utils.cache.time.time', return_value=1050):
+            self.assertEqual(self.cache.sweep(), 0)
+            self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_delete_prefix(self):
+        """Test prefix invalidation, including partial segments"""
+        big = LRUCache(max_entries=100)
+        for key in ['user:1:profile', 'user:1:meals', 'user:12:profile', 'users:count', 'recipe:1']:
+            big.set(key, key)
+
+        self.assertEqual(big.delete_prefix('user:1:'), 2)
+        self.assertEqual(big.get('user:12:profile'), 'user:12:profile')
+
+        self.assertEqual(big.delete_prefix('user'), 2)
+        self.assertEqual(big.stats()['entries'], 1)
+        self.assertEqual(big.delete_prefix('missing:'), 0)
+
+        # Everything matches the empty prefix
+        self.assertEqual(big.delete_prefix(''), 1)
+
+    def test_delete_tag(self):
+        """Test tag invalidation"""
+        self.cache.set('a', 1, tags=['user:1'])
+        self.cache.set('b', 2, tags=['user:1', 'feed'])
+        self.cache.set('c', 3, tags=['feed'])
+
+        self.assertEqual(self.cache.delete_tag('user:1'), 2)
+        self.assertEqual(self.cache.get('c'), 3)
+        self.assertEqual(self.cache.delete_tag('feed'), 1)
+        self.assertEqual(self.cache.tag_index, {})
+
+    def test_stats(self):
+        """Test hit and miss counters"""
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.get('b')
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_concurrent_writes_stay_bounded(self):
+        """Test that concurrent writers keep the limits intact"""
+        shared = LRUCache(max_entries=50)
+
+        def writer(offset):
+            for i in range(500):
+                shared.set(f'k:{offset}:{i}', i, timeout=60)
+                shared.get(f'k:{offset}:{i // 2}')
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = shared.stats()
+        self.assertEqual(stats['entries'], 50)
+        self.assertEqual(len(shared.prefix_index.find('k:')), 50)
+        self.assertEqual(stats['bytes'], sum(entry.size for entry in shared.entries.values()))
+
+
+class TestCreateCache(unittest.TestCase):
+    """Test cases for choosing the cache backend"""
+
+    @patch('utils.cache.redis', None)
+    def test_redis_backend_without_package(self):
+        """Test that a missing redis package falls back to the in-process cache"""
+        with patch('utils.cache.Config.CACHE_BACKEND', 'redis'), \
+                patch('utils.cache.Config.REDIS_URL', 'redis://localhost:6379/0'):
+            self.assertIsInstance(create_cache(), LRUCache)
+
+        with self.assertRaises(ImportError):
+            RedisCache(MagicMock())
+
+
+class TestCacheDecorators(unittest.TestCase):
+    """Test cases for the cached and invalidate decorators"""
+
+    def setUp(self):
+        """Start from an empty shared cache"""
+        cache.clear()
+
+    def test_cached_and_invalidate(self):
+        """Test that results are cached until their prefix is invalidated"""
+        calls = []
+
+        @cached(timeout=60, key_prefix='profile')
+        def get_profile(user_id):
+            calls.append(user_id)
+            return None
+
+        @invalidate('profile')
+        def update_profile():
+            return True
+
+        get_profile('u1')
+        get_profile('u1')
+        self.assertEqual(calls, ['u1'])
+
+        update_profile()
+        get_profile('u1')
+        self.assertEqual(calls, ['u1', 'u1'])
+
+    def test_long_keys_keep_prefix(self):
+        """Test that hashed keys can still be invalidated by prefix"""
+        calls = []
+
+        @cached(timeout=60, key_prefix='search', tags=['search'])
+        def search(query):
+            calls.append(query)
+            return [query]
+
+        search('q' * 300)
+        self.assertEqual(len(cache.prefix_index.find('search:')), 1)
+
+        cache.delete_prefix('search:')
+        search('q' * 300)
+        self.assertEqual(len(calls), 2)
+
+        @invalidate_tags('search')
+        def reindex():
+            return True
+
+        reindex()
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_concurrent_misses_compute_once(self):
+        """Test that concurrent misses for the same key share one call"""
+        calls = []
+        barrier = threading.Barrier(6)
+
+        @cached(timeout=60, key_prefix='stats')
+        def expensive(user_id):
+            calls.append(user_id)
+            time.sleep(0.1)
+            return {'total': 1}
+
+        def worker():
+            barrier.wait()
+            expensive('u1')
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, ['u1'])
+
+    def test_stale_while_revalidate(self):
+        """Test that stale results are served while one refresh runs"""
+        calls = []
+        release = threading.Event()
+
+        @cached(timeout=10, key_prefix='feed', stale_ttl=60)
+        def feed():
+            calls.append(1)
+            if len(calls) > 1:
+                release.wait(2)
+            return len(calls)
+
+        with patch('utils.cache.time.time', return_value=1000):
+            self.assertEqual(feed(), 1)
+
+        # Past the timeout but within the stale window
+        with patch('utils.cache.time.time', return_value=1015):
+            self.assertEqual(feed(), 1)
+            self.assertEqual(feed(), 1)
+            self.assertTrue(wait_for(lambda: len(calls) == 2))
+
+            release.set()
+            self.assertTrue(wait_for(lambda: feed() == 2))
+
+        self.assertEqual(len(calls), 2)
+
+
+def wait_for(condition, timeout=2):
+    """Poll until a condition holds or the timeout passes"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@unittest.skipUnless(fakeredis, "fakeredis is not installed")
+class TestRedisCache(unittest.TestCase):
+    """Test cases for the Redis backend with in-process L1 caches"""
+
+    def setUp(self):
+        """Set up two workers sharing one Redis server"""
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server)
+        self.worker_a = RedisCache(fakeredis.FakeRedis(server=server), l1=LRUCache(), l1_timeout=60)
+        self.worker_b = RedisCache(fakeredis.FakeRedis(server=server), l1=LRUCache(), l1_timeout=60)
+
+        # Wait for both invalidation listeners to subscribe
+        self.worker_a._ensure_listener()
+        self.worker_b._ensure_listener()
+        wait_for(lambda: self.redis.pubsub_numsub('cache:_invalidate')[0][1] == 2)
+
+    def tearDown(self):
+        """Stop the invalidation listeners"""
+        self.worker_a.close()
+        self.worker_b.close()
+
+    def test_values_shared_between_workers(self):
+        """Test that a value set by one worker is read by another"""
+        self.worker_a.set('meal:1', {'calories': 500, 'items': [1, 2]}, timeout=30)
+
+        self.assertEqual(self.worker_b.get('meal:1'), {'calories': 500, 'items': [1, 2]})
+        self.assertEqual(self.worker_b.stats()['l1']['entries'], 1)
+        self.assertIsNone(self.worker_b.get('meal:2'))
+        self.assertLessEqual(self.redis.pttl('cache:meal:1'), 30000)
+
+        # None is a cacheable value
+        self.worker_a.set('empty', None)
+        self.assertIsNone(self.worker_b.get('empty', 'default'))
+
+    def test_get_many_and_set_many(self):
+        """Test batched reads and writes"""
+        self.worker_a.set_many({'a': 1, 'b': 2}, timeout=30)
+
+        self.assertEqual(self.worker_b.get_many(['a', 'b', 'c', 'a']), {'a': 1, 'b': 2})
+        stats = self.worker_b.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_writes_invalidate_other_l1s(self):
+        """Test that overwrites and deletes reach other workers' L1"""
+        self.worker_a.set('profile:1', 'old')
+        self.assertEqual(self.worker_b.get('profile:1'), 'old')
+
+        self.worker_a.set('profile:1', 'new')
+        self.assertTrue(wait_for(lambda: self.worker_b.get('profile:1') == 'new'))
+
+        self.worker_a.delete('profile:1')
+        self.assertTrue(wait_for(lambda: self.worker_b.get('profile:1') is None))
+
+    def test_prefix_and_tag_invalidation(self):
+        """Test that prefix and tag invalidation clear Redis and every L1"""
+        self.worker_a.set('user:1:feed', 1, tags=['feed'])
+        self.worker_a.set('user:1:profile', 2)
+        self.worker_a.set('user:2:feed', 3, tags=['feed'])
+        self.worker_a.set('recipe:1', 4)
+        for key in ['user:1:feed', 'user:1:profile', 'user:2:feed', 'recipe:1']:
+            self.worker_b.get(key)
+
+        self.assertEqual(self.worker_a.delete_prefix('user:1:'), 2)
+        self.assertTrue(wait_for(lambda: self.worker_b.l1.get('user:1:profile') is None))
+        self.assertEqual(self.worker_b.get('user:2:feed'), 3)
+
+        self.assertEqual(self.worker_a.delete_tag('feed'), 1)
+        self.assertTrue(wait_for(lambda: self.worker_b.l1.get('user:2:feed') is None))
+        self.assertIsNone(self.worker_b.get('user:2:feed'))
+
+        self.worker_a.clear()
+        self.assertTrue(wait_for(lambda: self.worker_b.get('recipe:1') is None))
+        self.assertEqual(self.redis.zcard('cache:_index'), 0)
+
+    def test_undecodable_values_are_misses(self):
+        """Test that a value pickled by incompatible code is dropped, not raised"""
+        self.worker_a.set('good', 1)
+        # A class that no longer exists in this code
+        self.redis.set('cache:stale', b'cremoved_module\nThing\n.')
+        self.redis.set('cache:corrupt', b'not a pickle')
+
+        self.assertEqual(self.worker_b.get_many(['good', 'stale', 'corrupt']), {'good': 1})
+        self.assertEqual(self.worker_b.get('corrupt', 'default'), 'default')
+        self.assertEqual(self.worker_b.stats()['errors'], 2)
+        self.assertFalse(self.redis.exists('cache:stale', 'cache:corrupt'))
+
+    def test_backends_must_implement_interface(self):
+        """Test that a backend missing part of the interface can't be created"""
+        class Partial(CacheBackend):
+            def get(self, key, default=None):
+                return default
+
+        with self.assertRaises(TypeError):
+            Partial()
+
+    def test_redis_errors_fail_open(self):
+        """Test that Redis failures behave as cache misses"""
+        client = MagicMock()
+        client.pipeline.return_value.execute.side_effect = redis.exceptions.ConnectionError("down")
+        broken = RedisCache(client)
+
+        broken.set('key', 'value')
+        self.assertEqual(broken.get('key', 'default'), 'default')
+        self.assertEqual(broken.stats()['errors'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
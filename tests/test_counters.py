@@ -0,0 +1,220 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock firebase_admin before importing modules that use it
+import firebase_admin
+firebase_admin.initialize_app = MagicMock()
+firebase_admin.get_app = MagicMock()
+firebase_admin.delete_app = MagicMock()
+firebase_admin.firestore = MagicMock()
+firebase_admin.storage = MagicMock()
+firebase_admin.auth = MagicMock()
+
+from google.api_core.exceptions import FailedPrecondition
+
+# Now import the module we want to test
+from utils import counters
+from utils.counters import ShardedCounter
+from utils.cache import LRUCache
+
+
+class FakeRef:
+    """Document reference stand-in with a path and subcollections"""
+
+    def __init__(self, path, data=None):
+        self.path = path
+        self.parent = MagicMock(parent=self)
+        self.update = MagicMock()
+        self.set = MagicMock()
+        self.get = MagicMock(return_value=snapshot(self, data))
+        self.shards = {}
+
+    def collection(self, name):
+        return MagicMock(document=lambda doc_id: self.shards.setdefault(
+            doc_id, FakeRef(f"{self.path}/{name}/{doc_id}")
+        ))
+
+
+def snapshot(ref, data):
+    """Build a mock snapshot of a document reference"""
+    doc = MagicMock(exists=data is not None)
+    doc.reference = ref
+    doc.to_dict.return_value = data
+    return doc
+
+
+def shard_doc(parent, index, data, exists=True):
+    """Build a mock shard snapshot belonging to a parent reference"""
+    doc = MagicMock(exists=exists)
+    doc.id = str(index)
+    doc.reference.parent.parent = parent
+    doc.to_dict.return_value = data
+    return doc
+
+
+class TestShardedCounter(unittest.TestCase):
+    """Test cases for sharded counters"""
+
+    def setUp(self):
+        """Set up a counter with a private cache and no reconciler thread"""
+        self.mock_db = MagicMock()
+        self.counter = ShardedCounter(self.mock_db, num_shards=4)
+        self.post = FakeRef('posts/post_1')
+
+        self.patches = [
+            patch.object(counters, 'cache', LRUCache()),
+            patch('utils.counters._ensure_reconciler')
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        """Stop patches"""
+        for p in self.patches:
+            p.stop()
+
+    @patch('utils.counters.random.randrange', return_value=2)
+    def test_increment_writes_one_shard(self, mock_randrange):
+        """Test that an increment touches a random shard, not the parent"""
+        batch = MagicMock()
+        self.counter.increment(self.post, 'likes', 1, batch=batch)
+
+        shard_ref, data = batch.set.call_args[0]
+        self.assertEqual(shard_ref.path, 'posts/post_1/counter_shards/2')
+        self.assertIn('likes', data)
+        self.assertEqual(batch.set.call_args[1], {'merge': True})
+        mock_randrange.assert_called_once_with(4)
+        self.post.update.assert_not_called()
+        # The shard is marked dirty in the same write, for the reconciler
+        self.assertEqual(data['_dirty'], {'likes': True})
+        self.assertIn('_dirtyAt', data)
+
+    def test_get_many_sums_shards_in_one_read(self):
+        """Test that totals for several documents come from one get_all"""
+        other = FakeRef('posts/post_2')
+        legacy = FakeRef('posts/post_3')
+        self.mock_db.get_all.return_value = [
+            shard_doc(self.post, 0, {'likes': 3, 'comments': 1, '_seeded': {'likes': True, 'comments': True}}),
+            shard_doc(self.post, 1, {'likes': 2}),
+            shard_doc(self.post, 2, None, exists=False),
+            shard_doc(other, 3, {'likes': -1, 'comments': 4}),
+            # Parent read for the document without passed-in data
+            snapshot(other, {'likes': 10, 'comments': 0})
+        ]
+
+        totals = self.counter.get_many(
+            [self.post, other, legacy], ['likes', 'comments'],
+            [{'likes': 99}, None, {'likes': 7}]
+        )
+
+        self.assertEqual(self.mock_db.get_all.call_count, 1)
+        self.assertEqual(len(self.mock_db.get_all.call_args[0][0]), 13)
+        self.assertEqual(totals, {
+            # Seeded, so the shards hold the whole count
+            'posts/post_1': {'likes': 5, 'comments': 1},
+            # Not seeded, so increments add to the stored value
+            'posts/post_2': {'likes': 9, 'comments': 4},
+            'posts/post_3': {'likes': 7, 'comments': 0}
+        })
+
+    def test_reads_are_cached_until_incremented(self):
+        """Test that totals are cached and dropped by increments"""
+        self.mock_db.get_all.return_value = [shard_doc(self.post, 0, {'likes': 5})]
+
+        self.assertEqual(self.counter.get(self.post, ['likes']), {'likes': 5})
+        self.assertEqual(self.counter.get(self.post, ['likes']), {'likes': 5})
+        self.assertEqual(self.mock_db.get_all.call_count, 1)
+
+        self.counter.increment(self.post, 'likes', 1)
+        self.mock_db.get_all.return_value = [shard_doc(self.post, 0, {'likes': 6})]
+        self.assertEqual(self.counter.get(self.post, ['likes']), {'likes': 6})
+        self.assertEqual(self.mock_db.get_all.call_count, 2)
+
+    @patch('utils.counters.firestore')
+    def test_seed(self, mock_firestore):
+        """Test that seeding adds stored values to shard 0 once, in a transaction"""
+        mock_firestore.transactional.side_effect = lambda f: f
+        mock_firestore.Increment.side_effect = lambda amount: ('inc', amount)
+        post = FakeRef('posts/post_1', {'likes': 12, 'comments': 3})
+        shard = post.collection('counter_shards').document('0')
+        shard.get.return_value = snapshot(shard, {'likes': 2, '_seeded': {'comments': True}})
+        transaction = self.mock_db.transaction.return_value
+
+        self.assertEqual(self.counter.seed(post, ['likes', 'comments']), ['likes'])
+
+        # Reads go through the transaction, and only unseeded fields are added
+        shard.get.assert_called_once_with(transaction=transaction)
+        post.get.assert_called_once_with(transaction=transaction)
+        transaction.set.assert_called_once_with(
+            shard, {'likes': ('inc', 12), '_seeded': {'likes': True}}, merge=True
+        )
+
+        shard.get.return_value = snapshot(shard, {'_seeded': {'likes': True, 'comments': True}})
+        self.assertEqual(self.counter.seed(post, ['likes', 'comments']), [])
+        self.assertEqual(transaction.set.call_count, 1)
+
+    def test_reconcile_dirty(self):
+        """Test that dirty shards found in the database are rolled into their parents"""
+        deleted = FakeRef('posts/deleted')
+        failing = FakeRef('posts/failing')
+        failing.update.side_effect = RuntimeError('unavailable')
+        shards = {
+            ref.path: shard_doc(ref, 0, {
+                'likes': 4, 'comments': 2, '_seeded': {'likes': True, 'comments': True},
+                '_dirty': {'likes': True}, '_dirtyAt': object()
+            })
+            for ref in (self.post, deleted, failing)
+        }
+        query = self.mock_db.collection_group.return_value.order_by.return_value.limit.return_value
+        query.stream.return_value = list(shards.values())
+        # Shards are read along with their parent, which is last
+        self.mock_db.get_all.side_effect = lambda refs: [
+            shards[refs[-1].path], snapshot(refs[-1], None if refs[-1] is deleted else {})
+        ]
+        self.counter.seed = MagicMock()
+        self.counter.delete = MagicMock()
+
+        self.assertEqual(self.counter.reconcile_dirty(), 1)
+
+        self.mock_db.collection_group.assert_called_once_with('counter_shards')
+        # Fields are seeded before totals are written back
+        self.counter.seed.assert_any_call(self.post, ['likes'])
+        # Only the dirty fields are reconciled
+        self.post.update.assert_called_once_with({'likes': 4})
+        # The marks are cleared only if the shard hasn't changed since it was read
+        post_shard = shards['posts/post_1']
+        post_shard.reference.update.assert_called_once()
+        self.mock_db.write_option.assert_called_with(last_update_time=post_shard.update_time)
+        # Deleted parents lose their shards; failures stay dirty for the next run
+        self.counter.delete.assert_called_once_with(deleted)
+        shards['posts/failing'].reference.update.assert_not_called()
+
+    def test_changed_shards_stay_dirty(self):
+        """Test that marks survive increments during a reconcile and unwritten fields"""
+        self.counter.seed = MagicMock()
+        changed = shard_doc(self.post, 0, {'likes': 3, '_seeded': {'likes': True}, '_dirty': {'likes': True}})
+        changed.reference.update.side_effect = FailedPrecondition('updated since read')
+        unseeded = shard_doc(self.post, 1, {'comments': 1, '_dirty': {'comments': True}})
+        self.mock_db.get_all.return_value = [changed, unseeded, snapshot(self.post, {})]
+
+        self.assertEqual(self.counter.reconcile(self.post, ['likes', 'comments']), {'likes': 3})
+
+        changed.reference.update.assert_called_once()
+        unseeded.reference.update.assert_not_called()
+
+    def test_reconcile_skips_unseeded_fields(self):
+        """Test that shard sums never overwrite a stored count that wasn't seeded"""
+        self.counter.seed = MagicMock(return_value=[])
+        self.mock_db.get_all.return_value = [shard_doc(self.post, 0, {'likes': 1}), snapshot(self.post, {})]
+
+        self.assertEqual(self.counter.reconcile(self.post, ['likes']), {})
+        self.post.update.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+import base64
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock firebase_admin before importing modules that use it
+import firebase_admin
+firebase_admin.initialize_app = MagicMock()
+firebase_admin.get_app = MagicMock()
+firebase_admin.delete_app = MagicMock()
+firebase_admin.firestore = MagicMock()
+firebase_admin.storage = MagicMock()
+firebase_admin.auth = MagicMock()
+
+from PIL import Image
+
+# Now import the module we want to test
+from config import Config
+from utils import images
+
+
+def encode_image(format, size=(1200, 600), mode='RGB', color=(10, 120, 200)):
+    """Encode a solid image in a given format"""
+    output = io.BytesIO()
+    Image.new(mode, size, color).save(output, format=format)
+    return output.getvalue()
+
+
+def streamed_response(chunks, status_code=200, headers=None):
+    """Build a streamed download response"""
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.iter_content.return_value = chunks
+    return response
+
+
+class TestImages(unittest.TestCase):
+    """Test cases for the image ingestion pipeline"""
+
+    def setUp(self):
+        """Resize in-process unless a test asks for the pool"""
+        self.workers_patch = patch.object(Config, 'IMAGE_WORKERS', 0)
+        self.workers_patch.start()
+
+    def tearDown(self):
+        """Stop patches"""
+        self.workers_patch.stop()
+
+    def test_sniff_format(self):
+        """Test that formats are identified by their magic bytes"""
+        self.assertEqual(images.sniff_format(encode_image('JPEG')), 'jpeg')
+        self.assertEqual(images.sniff_format(encode_image('PNG')), 'png')
+        self.assertEqual(images.sniff_format(encode_image('GIF')), 'gif')
+        self.assertEqual(images.sniff_format(encode_image('WEBP')), 'webp')
+        self.assertIsNone(images.sniff_format(b'<svg xmlns="http://www.w3.org/2000/svg"/>'))
+
+    def test_read_base64_image(self):
+        """Test base64 decoding with data URLs and the size cap"""
+        data = encode_image('PNG', size=(10, 10))
+        encoded = base64.b64encode(data).decode()
+
+        self.assertEqual(images.read_base64_image(encoded), data)
+        self.assertEqual(images.read_base64_image(f"data:image/png;base64,{encoded}"), data)
+
+        # Rejected from its length, before decoding
+        with self.assertRaises(ValueError):
+            images.read_base64_image(encoded, max_bytes=10)
+        with self.assertRaises(ValueError):
+            images.read_base64_image('not base64!')
+
+    @patch('utils.images.requests.get')
+    def test_download_stops_at_cap(self, mock_get):
+        """Test that downloads past the byte cap are abandoned"""
+        chunks = [b'x' * 1024] * 10
+        mock_get.return_value = streamed_response(chunks)
+        with self.assertRaises(ValueError):
+            images.download_image('https://example.com/huge.jpg', max_bytes=4096)
+
+        # Declared sizes are rejected without reading the body
+        response = streamed_response(chunks, headers={'Content-Length': '999999'})
+        mock_get.return_value = response
+        with self.assertRaises(ValueError):
+            images.download_image('https://example.com/huge.jpg', max_bytes=4096)
+        response.iter_content.assert_not_called()
+
+        mock_get.return_value = streamed_response([b'ab', b'cd'])
+        self.assertEqual(images.download_image('https://example.com/small.jpg'), b'abcd')
+        self.assertTrue(mock_get.call_args[1]['stream'])
+
+    def test_render_variants(self):
+        """Test that images are bounded, converted to JPEG and resized"""
+        rendered = images.render_variants(encode_image('PNG', size=(3000, 1500)), 2048)
+
+        self.assertEqual(set(rendered), {'original', 'medium', 'thumbnail'})
+        self.assertEqual(rendered['original'][1:], (2048, 1024))
+        self.assertEqual(rendered['medium'][1:], (800, 400))
+        self.assertEqual(rendered['thumbnail'][1:], (200, 100))
+        for content, _, _ in rendered.values():
+            self.assertEqual(images.sniff_format(content), 'jpeg')
+
+    def test_transparency_is_flattened(self):
+        """Test that transparent pixels become white rather than black"""
+        data = encode_image('PNG', size=(50, 50), mode='RGBA', color=(0, 0, 0, 0))
+        content = images.render_variants(data, 2048)['original'][0]
+
+        pixel = Image.open(io.BytesIO(content)).getpixel((25, 25))
+        self.assertTrue(all(channel > 245 for channel in pixel))
+
+    def test_process_rejects_unsupported_data(self):
+        """Test that non-images and corrupt images are rejected"""
+        with self.assertRaises(ValueError):
+            images.process_image(b'%PDF-1.4 not an image')
+        with self.assertRaises(ValueError):
+            images.process_image(b'\x89PNG\r\n\x1a\n' + b'\x00' * 64)
+
+    def test_truncated_image_is_rejected(self):
+        """Test that an image cut off mid-file fails as undecodable"""
+        output = io.BytesIO()
+        Image.frombytes('RGB', (300, 300), os.urandom(300 * 300 * 3)).save(output, format='JPEG')
+        data = output.getvalue()
+
+        with self.assertRaises(ValueError):
+            images.render_variants(data[:len(data) // 2], 2048)
+
+    def test_process_timeout(self):
+        """Test that a slow resize is abandoned with a ValueError"""
+        future = MagicMock()
+        future.result.side_effect = images.FutureTimeoutError()
+        pool = MagicMock()
+        pool.submit.return_value = future
+
+        with patch('utils.images._get_pool', return_value=pool):
+            with self.assertRaises(ValueError):
+                images.process_image(encode_image('JPEG', size=(40, 40)))
+
+        future.cancel.assert_called_once()
+
+    def test_process_in_pool(self):
+        """Test that resizing runs in worker processes"""
+        with patch.object(Config, 'IMAGE_WORKERS', 1):
+            rendered = images.process_image(encode_image('JPEG', size=(400, 400)))
+            with self.assertRaises(ValueError):
+                images.process_image(b'\xff\xd8\xff' + b'\x00' * 64)
+
+        self.assertEqual(rendered['thumbnail'][1:], (200, 200))
+
+    def test_store_image(self):
+        """Test that the image and its variants are uploaded next to each other"""
+        bucket = MagicMock()
+        bucket.blob.side_effect = lambda path: MagicMock(public_url=f"https://storage/{path}")
+
+        stored = images.store_image(bucket, encode_image('WEBP'), 'recipes/u1/abc.jpg')
+
+        self.assertEqual(stored['path'], 'recipes/u1/abc.jpg')
+        self.assertEqual(stored['url'], 'https://storage/recipes/u1/abc.jpg')
+        self.assertEqual((stored['width'], stored['height']), (1200, 600))
+        self.assertEqual(stored['variants'], {
+            'medium': 'https://storage/recipes/u1/abc_medium.jpg',
+            'thumbnail': 'https://storage/recipes/u1/abc_thumbnail.jpg'
+        })
+        uploaded = [c[0][0] for c in bucket.blob.call_args_list]
+        self.assertEqual(len(uploaded), 3)
+
+    def test_copy_image_skips_missing_variants(self):
+        """Test that images stored before variants existed still copy"""
+        bucket = MagicMock()
+        bucket.blob.side_effect = lambda path: path
+
+        def copy_blob(source, destination_bucket, path):
+            if source.endswith('_medium.jpg'):
+                raise Exception('No such object')
+            return MagicMock(public_url=f"https://storage/{path}")
+        bucket.copy_blob.side_effect = copy_blob
+
+        stored = images.copy_image(bucket, 'recipe_images/abc.jpg', 'recipes/u1/xyz.jpg')
+
+        self.assertEqual(stored['url'], 'https://storage/recipes/u1/xyz.jpg')
+        self.assertEqual(stored['variants'], {'thumbnail': 'https://storage/recipes/u1/xyz_thumbnail.jpg'})
+
+    def test_delete_image(self):
+        """Test that variants are deleted with the image"""
+        bucket = MagicMock()
+        bucket.blob.return_value.delete.side_effect = [None, Exception('gone'), None]
+
+        images.delete_image(bucket, 'recipes/u1/abc.jpg')
+        images.delete_image(bucket, None)
+
+        self.assertEqual([c[0][0] for c in bucket.blob.call_args_list], [
+            'recipes/u1/abc.jpg', 'recipes/u1/abc_medium.jpg', 'recipes/u1/abc_thumbnail.jpg'
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock firebase_admin before importing modules that use it
+import firebase_admin
+firebase_admin.initialize_app = MagicMock()
+firebase_admin.get_app = MagicMock()
+firebase_admin.firestore = MagicMock()
+
+# Now import our app modules
+from nutrition.aggregation import NutritionMatrix, HAS_NUMPY, GROUP_NUMPY_MIN_RECORDS
+
+
+class TestNutritionMatrix(unittest.TestCase):
+    """Test cases for the nutrition aggregation kernel"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.meals = [
+            {'meal_type': 'lunch', 'nutrition': {'calories': 200.04, 'protein': 10, 'fat': 8}},
+            {'meal_type': 'dinner', 'nutrition': {'calories': 300, 'protein': 15.5, 'carbs': 30}},
+            {'meal_type': 'lunch', 'nutrition': {'calories': '100', 'sugar': 4}},
+            {'meal_type': 'snack'}
+        ]
+        # Exercise both backends when NumPy is installed
+        self.backends = [False, True] if HAS_NUMPY else [False]
+
+    def test_totals(self):
+        """Test totals over all records, with missing values as zero"""
+        for vectorized in self.backends:
+            totals = NutritionMatrix(self.meals, vectorized=vectorized).totals(ndigits=1)
+            self.assertEqual(totals['calories'], 600.0)
+            self.assertEqual(totals['protein'], 25.5)
+            self.assertEqual(totals['carbs'], 30)
+            self.assertEqual(totals['sodium'], 0)
+            self.assertIsInstance(totals['calories'], float)
+
+    def test_empty(self):
+        """Test that empty inputs aggregate to zeros"""
+        for vectorized in self.backends:
+            matrix = NutritionMatrix([], vectorized=vectorized)
+            self.assertEqual(matrix.totals()['calories'], 0)
+            self.assertEqual(matrix.mean()['calories'], 0)
+            self.assertEqual(matrix.columns(), [])
+            self.assertEqual(matrix.group([]), {})
+
+    def test_group(self):
+        """Test grouped totals and counts"""
+        labels = [meal['meal_type'] for meal in self.meals]
+
+        for vectorized in self.backends:
+            matrix = NutritionMatrix(self.meals, nutrients=['calories', 'protein'], vectorized=vectorized)
+            groups = matrix.group(labels, ndigits=1, count_key='count')
+
+            self.assertEqual(list(groups), ['lunch', 'dinner', 'snack'])
+            self.assertEqual(groups['lunch'], {'calories': 300.0, 'protein': 10.0, 'count': 2})
+            self.assertEqual(groups['snack']['count'], 1)
+
+            with self.assertRaises(ValueError):
+                matrix.group(labels[:2])
+
+    def test_columns_mean_and_select(self):
+        """Test per-record values, averages and row selection"""
+        for vectorized in self.backends:
+            matrix = NutritionMatrix(self.meals, vectorized=vectorized).select(['calories', 'fat'])
+
+            columns = matrix.columns(ndigits=1)
+            self.assertEqual(columns[0], {'calories': 200.0, 'fat': 8.0})
+            self.assertEqual(columns[3], {'calories': 0.0, 'fat': 0.0})
+            self.assertEqual(matrix.mean(ndigits=1), {'calories': 150.0, 'fat': 2.0})
+
+    def test_invalid_value(self):
+        """Test that non-numeric values are rejected"""
+        for vectorized in self.backends:
+            with self.assertRaises(ValueError):
+                NutritionMatrix([{'nutrition': {'calories': 'lots'}}], vectorized=vectorized)
+            with self.assertRaises(ValueError):
+                NutritionMatrix([{'nutrition': {'calories': None}}], vectorized=vectorized)
+
+    def test_numpy_only_for_large_groups(self):
+        """Test that NumPy is used by default only where it measured faster"""
+        self.assertFalse(NutritionMatrix(self.meals).vectorized)
+
+        meals = self.meals * (GROUP_NUMPY_MIN_RECORDS // len(self.meals) + 1)
+        self.assertEqual(NutritionMatrix(meals).vectorized, HAS_NUMPY)
+
+
+if __name__ == '__main__':
+    unittest.main()
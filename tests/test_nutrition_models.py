@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, ANY
 import json
 from datetime import datetime
 import sys
@@ -237,6 +237,20 @@ class TestFoodItem(unittest.TestCase):
         self.assertEqual(food_item['name'], 'Test Food')
         self.assertEqual(food_item['userId'], self.test_user_id)
         
+    def test_search_by_barcode_hides_index_fields(self):
+        """Test that barcode matches come back without the search index"""
+        stored = dict(self.test_food_data, barcode='0123', search_tokens=['t', 'te'])
+        doc = MagicMock(id=self.test_food_id)
+        doc.to_dict.return_value = stored
+        self.mock_collection.where.return_value.limit.return_value.stream.return_value = [doc]
+        
+        food_item = self.food_item.search_by_barcode('0123')
+        
+        self.assertEqual(food_item['id'], self.test_food_id)
+        self.assertNotIn('search_tokens', food_item)
+        # The stored data isn't modified
+        self.assertIn('search_tokens', stored)
+        
     def test_get_nonexistent_food_item(self):
         """Test getting a food item that doesn't exist"""
         # Mock document doesn't exist
@@ -296,6 +310,34 @@ class TestFoodItem(unittest.TestCase):
         # Original values should be preserved
         self.assertEqual(updated_item['brand'], 'Test Brand')
         
+    def test_get_many_food_items(self):
+        """Test batched retrieval of food items"""
+        def make_snapshot(doc_id, exists, data=None):
+            snapshot = MagicMock()
+            snapshot.id = doc_id
+            snapshot.exists = exists
+            snapshot.to_dict.return_value = data
+            return snapshot
+            
+        self.mock_db.get_all.return_value = [
+            make_snapshot('own', True, {'name': 'Own', 'userId': self.test_user_id}),
+            make_snapshot('public', True, {'name': 'Public', 'userId': 'other', 'is_public': True}),
+            make_snapshot('private', True, {'name': 'Private', 'userId': 'other'}),
+            make_snapshot('missing', False)
+        ]
+        
+        items = self.food_item.get_many(
+            ['own', 'public', 'own', 'private', 'missing', None], self.test_user_id
+        )
+        
+        # Duplicates and empty IDs are dropped before the single batched read
+        self.mock_db.get_all.assert_called_once()
+        self.assertEqual(len(self.mock_db.get_all.call_args[0][0]), 4)
+        
+        # Only existing, authorized items are returned
+        self.assertEqual(set(items.keys()), {'own', 'public'})
+        self.assertEqual(items['own']['id'], 'own')
+        
     def test_delete_food_item(self):
         """Test deleting a food item"""
         # Mock the document data
@@ -391,18 +433,26 @@ class TestMealLog(unittest.TestCase):
         self.mock_doc_ref.id = self.test_meal_id
         
         # Set up mock food item retrieval
-        self.mock_food_item.get.side_effect = [self.mock_food_1, self.mock_food_2]
+        self.mock_food_item.get_many.return_value = {
+            self.test_food_id_1: self.mock_food_1,
+            self.test_food_id_2: self.mock_food_2
+        }
         
         # Test creation of meal
         meal = self.meal_log.create(self.test_user_id, self.test_meal_data)
         
         # Verify Firestore was called correctly
-        self.mock_db.collection.assert_called_with("meals")
-        self.mock_collection.document.assert_called_once()
-        self.mock_doc_ref.set.assert_called_once()
-        
-        # Verify food items were retrieved
-        self.assertEqual(self.mock_food_item.get.call_count, 2)
+        self.mock_db.collection.assert_any_call("meals")
+        mock_batch = self.mock_db.batch.return_value
+        mock_batch.set.assert_any_call(self.mock_doc_ref, ANY)
+        mock_batch.commit.assert_called_once()
+        self.mock_doc_ref.set.assert_not_called()
+        
+        # Verify food items were retrieved in one batch
+        self.mock_food_item.get_many.assert_called_once_with(
+            [self.test_food_id_1, self.test_food_id_2], self.test_user_id
+        )
+        self.mock_food_item.get.assert_not_called()
         
         # Verify the returned meal has the right structure
         self.assertEqual(meal['id'], self.test_meal_id)
@@ -416,6 +466,40 @@ class TestMealLog(unittest.TestCase):
         self.assertEqual(meal['nutrition_totals']['carbs'], 85)      # 25 + (30 * 2)
         self.assertEqual(meal['nutrition_totals']['fat'], 32)        # 8 + (12 * 2)
         
+    @patch('firebase_admin.firestore.SERVER_TIMESTAMP')
+    def test_create_meal_skips_unresolved_items(self, mock_timestamp):
+        """Test that missing or unauthorized food items are skipped"""
+        self.mock_doc_ref.id = self.test_meal_id
+        
+        # Only the first food item resolves
+        self.mock_food_item.get_many.return_value = {self.test_food_id_1: self.mock_food_1}
+        
+        meal = self.meal_log.create(self.test_user_id, self.test_meal_data)
+        
+        self.assertEqual(len(meal['food_items']), 1)
+        self.assertEqual(meal['food_items'][0]['food_item_id'], self.test_food_id_1)
+        self.assertEqual(meal['nutrition_totals']['calories'], 200)
+        
+    @patch('firebase_admin.firestore.SERVER_TIMESTAMP')
+    def test_update_meal_food_items(self, mock_timestamp):
+        """Test that updating food items uses the batched pipeline"""
+        self.mock_doc.exists = True
+        self.mock_doc.to_dict.return_value = {
+            'userId': self.test_user_id,
+            'name': 'Test Meal',
+            'meal_type': 'lunch',
+            'food_items': []
+        }
+        self.mock_food_item.get_many.return_value = {self.test_food_id_2: self.mock_food_2}
+        
+        updated_meal = self.meal_log.update(self.test_meal_id, self.test_user_id, {
+            'food_items': [{'food_item_id': self.test_food_id_2, 'servings': 1.5}]
+        })
+        
+        self.mock_food_item.get_many.assert_called_once()
+        self.assertEqual(updated_meal['food_items'][0]['servings'], 1.5)
+        self.assertEqual(updated_meal['nutrition_totals']['calories'], 450)
+        
     def test_create_meal_validation_error(self):
         """Test validation error during meal creation"""
         # Test with missing required fields
@@ -459,7 +543,7 @@ class TestMealLog(unittest.TestCase):
         meal = self.meal_log.get(self.test_meal_id, self.test_user_id)
         
         # Verify Firestore was called correctly
-        self.mock_db.collection.assert_called_with("meals")
+        self.mock_db.collection.assert_any_call("meals")
         self.mock_collection.document.assert_called_with(self.test_meal_id)
         self.mock_doc_ref.get.assert_called_once()
         
@@ -521,9 +605,12 @@ class TestMealLog(unittest.TestCase):
         updated_meal = self.meal_log.update(self.test_meal_id, self.test_user_id, update_data)
         
         # Verify Firestore was called correctly
-        self.mock_db.collection.assert_called_with("meals")
-        self.mock_collection.document.assert_called_with(self.test_meal_id)
-        self.mock_doc_ref.update.assert_called_once()
+        self.mock_db.collection.assert_any_call("meals")
+        self.mock_collection.document.assert_any_call(self.test_meal_id)
+        mock_batch = self.mock_db.batch.return_value
+        mock_batch.update.assert_called_once()
+        self.assertEqual(mock_batch.update.call_args[0][0], self.mock_doc_ref)
+        mock_batch.commit.assert_called_once()
         
         # Verify the returned meal has the updated values
         self.assertEqual(updated_meal['name'], 'Updated Meal Name')
@@ -547,13 +634,50 @@ class TestMealLog(unittest.TestCase):
         result = self.meal_log.delete(self.test_meal_id, self.test_user_id)
         
         # Verify Firestore was called correctly
-        self.mock_db.collection.assert_called_with("meals")
-        self.mock_collection.document.assert_called_with(self.test_meal_id)
-        self.mock_doc_ref.delete.assert_called_once()
+        self.mock_db.collection.assert_any_call("meals")
+        self.mock_collection.document.assert_any_call(self.test_meal_id)
+        mock_batch = self.mock_db.batch.return_value
+        mock_batch.delete.assert_called_once()
+        self.assertEqual(mock_batch.delete.call_args[0][0], self.mock_doc_ref)
+        mock_batch.commit.assert_called_once()
         
         # Verify successful deletion
         self.assertTrue(result)
 
+        
+    def test_get_stats_reads_rollups(self):
+        """Test that stats are built from daily rollups"""
+        self.meal_log.rollups = MagicMock()
+        self.meal_log.rollups.get_range.return_value = {
+            '2024-01-01': {
+                'meal_count': 2,
+                'totals': {'calories': 700, 'protein': 30, 'carbs': 80, 'fat': 20},
+                'by_meal_type': {
+                    'lunch': {'count': 2, 'calories': 700, 'protein': 30, 'carbs': 80, 'fat': 20},
+                    'dinner': {'count': 0, 'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
+                }
+            },
+            '2024-01-02': {
+                'meal_count': 1,
+                'totals': {'calories': 500, 'protein': 10, 'carbs': 40, 'fat': 30},
+                'by_meal_type': {
+                    'breakfast': {'count': 1, 'calories': 500, 'protein': 10, 'carbs': 40, 'fat': 30}
+                }
+            }
+        }
+        
+        stats = self.meal_log.get_stats(self.test_user_id, datetime(2024, 1, 1), datetime(2024, 1, 7))
+        
+        # Verify meals were not scanned
+        self.mock_collection.where.assert_not_called()
+        
+        self.assertEqual(stats['total_meals'], 3)
+        self.assertEqual(stats['nutrition_totals']['calories'], 1200)
+        self.assertEqual(stats['average_daily']['calories'], 600)
+        self.assertEqual(stats['by_meal_type']['lunch']['count'], 2)
+        self.assertNotIn('dinner', stats['by_meal_type'])
+        self.assertEqual(stats['daily_totals']['2024-01-02']['meal_count'], 1)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta, timezone
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from nutrition.services import DailyRollup, meal_day, date_range
+
+
+class TestDailyRollup(unittest.TestCase):
+    """Test cases for the daily nutrition rollups"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.mock_db = MagicMock()
+        self.rollups = DailyRollup(self.mock_db)
+        self.test_user_id = "test_user_123"
+
+        self.lunch = {
+            'meal_type': 'lunch',
+            'meal_time': datetime(2024, 1, 31, 12, 30),
+            'nutrition_totals': {'calories': 600, 'protein': 30, 'carbs': 70, 'fat': 20, 'fiber': 5}
+        }
+
+    def test_meal_day(self):
+        """Test day keys for the supported meal time formats"""
+        self.assertEqual(meal_day(datetime(2024, 1, 31, 23, 59)), '2024-01-31')
+        self.assertEqual(meal_day('2024-02-01T08:00:00Z'), '2024-02-01')
+        self.assertEqual(meal_day(object()), datetime.now(timezone.utc).strftime('%Y-%m-%d'))
+
+    def test_meal_day_uses_utc(self):
+        """Test that meal times are placed on their UTC day"""
+        # 2024-01-31T23:30:00Z as a Firestore timestamp
+        timestamp = MagicMock(spec=['seconds'], seconds=1706743800)
+        self.assertEqual(meal_day(timestamp), '2024-01-31')
+
+        late_evening = datetime(2024, 1, 31, 20, 0, tzinfo=timezone(timedelta(hours=-5)))
+        self.assertEqual(meal_day(late_evening), '2024-02-01')
+        self.assertEqual(meal_day('2024-02-01T02:00:00+05:00'), '2024-01-31')
+
+    def test_date_range_uses_utc_days(self):
+        """Test that aware range bounds are converted to UTC days"""
+        start = datetime(2024, 1, 30, 22, 0, tzinfo=timezone(timedelta(hours=-3)))
+        end = datetime(2024, 2, 1, tzinfo=timezone.utc)
+        self.assertEqual(date_range(start, end), ['2024-01-31', '2024-02-01'])
+
+    def test_date_range_crosses_month(self):
+        """Test that date ranges roll over month boundaries"""
+        days = date_range(datetime(2024, 1, 30), datetime(2024, 2, 2))
+        self.assertEqual(days, ['2024-01-30', '2024-01-31', '2024-02-01', '2024-02-02'])
+
+    def test_diff_create_and_delete(self):
+        """Test deltas for adding and removing a meal"""
+        created = DailyRollup.diff(None, self.lunch)
+        self.assertEqual(created['2024-01-31']['meal_count'], 1)
+        self.assertEqual(created['2024-01-31']['totals']['calories'], 600)
+        self.assertEqual(created['2024-01-31']['by_meal_type']['lunch']['count'], 1)
+
+        deleted = DailyRollup.diff(self.lunch, None)
+        self.assertEqual(deleted['2024-01-31']['meal_count'], -1)
+        self.assertEqual(deleted['2024-01-31']['totals']['protein'], -30)
+
+    def test_diff_unchanged_meal_is_noop(self):
+        """Test that edits not touching nutrition produce no rollup writes"""
+        renamed = dict(self.lunch, name='Renamed')
+        self.assertEqual(DailyRollup.diff(self.lunch, renamed), {})
+
+    def test_diff_moved_meal(self):
+        """Test that moving a meal to another day and type updates both"""
+        moved = dict(self.lunch, meal_type='dinner', meal_time=datetime(2024, 2, 1, 19, 0))
+
+        deltas = DailyRollup.diff(self.lunch, moved)
+
+        self.assertEqual(deltas['2024-01-31']['meal_count'], -1)
+        self.assertEqual(deltas['2024-01-31']['by_meal_type']['lunch']['count'], -1)
+        self.assertEqual(deltas['2024-02-01']['meal_count'], 1)
+        self.assertEqual(deltas['2024-02-01']['by_meal_type']['dinner']['calories'], 600)
+
+    @patch('nutrition.services.firestore')
+    def test_record_adds_to_batch(self, mock_firestore):
+        """Test that rollup increments are merged into the caller's batch"""
+        batch = MagicMock()
+
+        self.rollups.record(batch, self.test_user_id, new_meal=self.lunch)
+
+        self.mock_db.collection.assert_called_with("nutrition_rollups")
+        self.mock_db.collection.return_value.document.assert_called_with("test_user_123_2024-01-31")
+        batch.set.assert_called_once()
+        self.assertEqual(batch.set.call_args[1], {'merge': True})
+        mock_firestore.Increment.assert_any_call(600.0)
+        batch.commit.assert_not_called()
+
+    def test_get_range_single_read(self):
+        """Test that a date range is read with one batched call"""
+        empty_doc = MagicMock()
+        empty_doc.exists = False
+        day_doc = MagicMock()
+        day_doc.exists = True
+        day_doc.to_dict.return_value = {'date': '2024-01-02', 'meal_count': 1}
+        zero_doc = MagicMock()
+        zero_doc.exists = True
+        zero_doc.to_dict.return_value = {'date': '2024-01-03', 'meal_count': 0}
+        self.mock_db.get_all.return_value = [empty_doc, day_doc, zero_doc]
+
+        rollups = self.rollups.get_range(self.test_user_id, datetime(2024, 1, 1), datetime(2024, 1, 3))
+
+        self.mock_db.get_all.assert_called_once()
+        self.assertEqual(len(self.mock_db.get_all.call_args[0][0]), 3)
+        self.assertEqual(list(rollups), ['2024-01-02'])
+
+    def test_build(self):
+        """Test building full rollup documents from meals"""
+        breakfast = {
+            'meal_type': 'breakfast',
+            'meal_time': datetime(2024, 1, 31, 8, 0),
+            'nutrition_totals': {'calories': 300}
+        }
+
+        rollups = DailyRollup.build(self.test_user_id, [self.lunch, breakfast])
+
+        day = rollups['2024-01-31']
+        self.assertEqual(day['userId'], self.test_user_id)
+        self.assertEqual(day['meal_count'], 2)
+        self.assertEqual(day['totals']['calories'], 900)
+        self.assertEqual(day['totals']['sodium'], 0)
+        self.assertEqual(set(day['by_meal_type']), {'lunch', 'breakfast'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from datetime import datetime
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.pagination import encode_cursor, decode_cursor, paginate_query, page_total, wants_total
+
+
+def make_doc(doc_id, data):
+    """Create a mock document snapshot"""
+    doc = MagicMock()
+    doc.id = doc_id
+    doc.to_dict.return_value = data
+    return doc
+
+
+class TestCursorEncoding(unittest.TestCase):
+    """Test cases for cursor encoding and decoding"""
+
+    def test_round_trip(self):
+        """Test that cursors decode to the encoded position"""
+        cursor = encode_cursor({'v': 'Banana', 'id': 'doc_1'})
+        self.assertEqual(decode_cursor(cursor), {'v': 'Banana', 'id': 'doc_1'})
+
+    def test_round_trip_datetime(self):
+        """Test that datetime sort values survive encoding"""
+        meal_time = datetime(2024, 3, 1, 12, 30)
+        position = decode_cursor(encode_cursor({'v': meal_time, 'id': 'meal_1'}))
+        self.assertEqual(position['v'], meal_time)
+        self.assertEqual(position['id'], 'meal_1')
+
+    def test_invalid_cursor(self):
+        """Test that malformed cursors raise ValueError"""
+        with self.assertRaises(ValueError) as context:
+            decode_cursor('not-a-cursor')
+
+        self.assertTrue('Invalid pagination cursor' in str(context.exception))
+
+
+class TestPaginateQuery(unittest.TestCase):
+    """Test cases for paginate_query"""
+
+    def setUp(self):
+        """Set up a mock query chain"""
+        self.query = MagicMock()
+        self.ordered = MagicMock()
+        self.query.order_by.return_value.order_by.return_value = self.ordered
+
+        count_result = MagicMock()
+        count_result.value = 3
+        self.query.count.return_value.get.return_value = [[count_result]]
+
+        self.docs = [
+            make_doc('a', {'name': 'A'}),
+            make_doc('b', {'name': 'B'}),
+            make_doc('c', {'name': 'C'})
+        ]
+
+    def test_first_page_with_more(self):
+        """Test the first page returns a cursor when more documents exist"""
+        self.ordered.limit.return_value.stream.return_value = self.docs
+
+        docs, pagination = paginate_query(self.query, {'limit': 2}, 'name', 'ASCENDING')
+
+        # Only page size + 1 documents are requested
+        self.ordered.limit.assert_called_with(3)
+        self.assertEqual([doc.id for doc in docs], ['a', 'b'])
+        self.assertTrue(pagination['has_more'])
+        self.assertEqual(pagination['total'], 3)
+        self.assertEqual(decode_cursor(pagination['next_cursor']), {'v': 'B', 'id': 'b'})
+
+    def test_cursor_page(self):
+        """Test that a cursor resumes with start_after"""
+        resumed = MagicMock()
+        self.ordered.start_after.return_value = resumed
+        resumed.limit.return_value.stream.return_value = self.docs[2:]
+
+        cursor = encode_cursor({'v': 'B', 'id': 'b'})
+        docs, pagination = paginate_query(self.query, {'limit': 2, 'cursor': cursor}, 'name', 'ASCENDING')
+
+        self.ordered.start_after.assert_called_with({'name': 'B', '__name__': 'b'})
+        self.ordered.offset.assert_not_called()
+        self.assertEqual([doc.id for doc in docs], ['c'])
+        self.assertFalse(pagination['has_more'])
+        self.assertIsNone(pagination['next_cursor'])
+
+    def test_offset_page(self):
+        """Test that offset requests skip on the server"""
+        skipped = MagicMock()
+        self.ordered.offset.return_value = skipped
+        skipped.limit.return_value.stream.return_value = self.docs[1:]
+
+        docs, pagination = paginate_query(self.query, {'limit': 5, 'offset': 1}, 'name', 'ASCENDING')
+
+        self.ordered.offset.assert_called_with(1)
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(pagination['offset'], 1)
+
+    def test_count_unavailable(self):
+        """Test that a failed count aggregation leaves total empty"""
+        self.query.count.side_effect = Exception('count not supported')
+        self.ordered.limit.return_value.stream.return_value = []
+
+        docs, pagination = paginate_query(self.query, {}, 'name', 'ASCENDING')
+
+        self.assertEqual(docs, [])
+        self.assertIsNone(pagination['total'])
+
+    def test_total_opt_out(self):
+        """Test that include_total=false skips the count aggregation"""
+        self.ordered.limit.return_value.stream.return_value = self.docs[:1]
+
+        docs, pagination = paginate_query(self.query, {'include_total': 'false'}, 'name', 'ASCENDING')
+
+        self.query.count.assert_not_called()
+        self.assertIsNone(pagination['total'])
+        self.assertEqual(len(docs), 1)
+
+    @patch('utils.pagination.FILTER_CHUNK_SIZE', 2)
+    def test_filtered_page_reads_until_full(self):
+        """Test that in-memory filters keep reading chunks to fill the page"""
+        docs = [make_doc(doc_id, {'name': doc_id.upper()}) for doc_id in 'abcdefg']
+        chunks = {None: docs[:3], 'c': docs[3:6], 'f': docs[6:]}
+        self.ordered.limit.return_value.stream.return_value = chunks[None]
+        self.ordered.start_after.side_effect = lambda doc: MagicMock(
+            limit=MagicMock(return_value=MagicMock(stream=MagicMock(return_value=chunks[doc.id])))
+        )
+
+        keep = lambda doc: doc.id in ('b', 'd', 'e', 'g')
+        page, pagination = paginate_query(self.query, {'limit': 2, 'offset': 1}, 'name', 'ASCENDING', keep=keep)
+
+        # The offset skips a matching document rather than a raw one
+        self.ordered.offset.assert_not_called()
+        self.assertEqual([doc.id for doc in page], ['d', 'e'])
+        self.assertTrue(pagination['has_more'])
+        self.assertEqual(decode_cursor(pagination['next_cursor']), {'v': 'E', 'id': 'e'})
+        # The aggregation would count documents the filter drops
+        self.query.count.assert_not_called()
+        self.assertIsNone(pagination['total'])
+
+    @patch('utils.pagination.MAX_FILTER_SCAN', 3)
+    @patch('utils.pagination.FILTER_CHUNK_SIZE', 3)
+    def test_filtered_scan_is_capped(self):
+        """Test that a rare term stops after the scan cap and resumes later"""
+        self.ordered.limit.return_value.stream.return_value = self.docs
+
+        page, pagination = paginate_query(self.query, {'limit': 2}, 'name', 'ASCENDING', keep=lambda doc: False)
+
+        self.assertEqual(page, [])
+        self.assertTrue(pagination['has_more'])
+        self.assertEqual(decode_cursor(pagination['next_cursor']), {'v': 'C', 'id': 'c'})
+
+
+class TestPageTotal(unittest.TestCase):
+    """Test cases for page totals"""
+
+    def setUp(self):
+        """Set up a query whose count aggregation returns 7"""
+        self.query = MagicMock()
+        count_result = MagicMock()
+        count_result.value = 7
+        self.query.count.return_value.get.return_value = [[count_result]]
+
+    def test_wants_total(self):
+        """Test parsing the include_total parameter"""
+        self.assertTrue(wants_total({}))
+        self.assertTrue(wants_total({'include_total': 'true'}))
+        self.assertFalse(wants_total({'include_total': 'False'}))
+        self.assertFalse(wants_total({'include_total': '0'}))
+        self.assertFalse(wants_total({'include_total': False}))
+
+    def test_aggregation(self):
+        """Test that the query is counted without streaming it"""
+        self.assertEqual(page_total(self.query, {}), 7)
+        self.query.stream.assert_not_called()
+
+    def test_maintained_counter(self):
+        """Test that a maintained counter replaces the aggregation"""
+        self.assertEqual(page_total(self.query, {}, counter=lambda: 12), 12)
+        self.query.count.assert_not_called()
+
+    def test_counter_failure_falls_back(self):
+        """Test that a failing counter falls back to the aggregation"""
+        def broken():
+            raise RuntimeError('unavailable')
+
+        self.assertEqual(page_total(self.query, {}, counter=broken), 7)
+
+    def test_opt_out(self):
+        """Test that no count is made when the total isn't wanted"""
+        counter = MagicMock()
+        self.assertIsNone(page_total(self.query, {'include_total': 'false'}, counter=counter))
+        counter.assert_not_called()
+        self.query.count.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import redis
+
+try:
+    import fakeredis
+    import lupa
+except ImportError:
+    fakeredis = None
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils import rate_limit
+from utils.rate_limit import (
+    InMemoryRateLimiter, RedisRateLimiter, check_rate_limit, TOKEN_BUCKET
+)
+
+
+class TestInMemoryRateLimiter(unittest.TestCase):
+    """Test cases for the in-memory limiter"""
+
+    def setUp(self):
+        """Set up a fresh limiter"""
+        self.limiter = InMemoryRateLimiter()
+
+    @patch('utils.rate_limit.time.time')
+    def test_sliding_window(self, mock_time):
+        """Test that the window slides instead of resetting all at once"""
+        for now in (100, 104, 108):
+            mock_time.return_value = now
+            self.assertTrue(self.limiter.check_rate_limit('client', 3, 10)[0])
+
+        mock_time.return_value = 109
+        is_allowed, remaining, reset_time = self.limiter.check_rate_limit('client', 3, 10)
+        self.assertFalse(is_allowed)
+        self.assertEqual(remaining, 0)
+        self.assertEqual(reset_time, 110)
+
+        # Only the request from t=100 has left the window
+        mock_time.return_value = 111
+        self.assertEqual(self.limiter.check_rate_limit('client', 3, 10)[:2], (True, 0))
+        self.assertFalse(self.limiter.check_rate_limit('client', 3, 10)[0])
+
+    @patch('utils.rate_limit.time.time')
+    def test_token_bucket(self, mock_time):
+        """Test bursts up to the bucket size and steady refill"""
+        mock_time.return_value = 100
+        results = [self.limiter.check_rate_limit('client', 5, 10, TOKEN_BUCKET) for _ in range(6)]
+
+        self.assertEqual([r[0] for r in results], [True] * 5 + [False])
+        self.assertEqual(results[0][1], 4)
+        # The next token arrives after period / limit seconds
+        self.assertAlmostEqual(results[-1][2], 102)
+
+        mock_time.return_value = 102
+        self.assertTrue(self.limiter.check_rate_limit('client', 5, 10, TOKEN_BUCKET)[0])
+        self.assertFalse(self.limiter.check_rate_limit('client', 5, 10, TOKEN_BUCKET)[0])
+
+    @patch('utils.rate_limit.time.time')
+    def test_expired_records_cleaned_up(self, mock_time):
+        """Test that idle keys are dropped and active keys rescheduled"""
+        mock_time.return_value = 100
+        for n in range(50):
+            self.limiter.check_rate_limit(f'idle-{n}', 10, 10)
+        self.limiter.check_rate_limit('active', 10, 10)
+
+        mock_time.return_value = 105
+        self.limiter.check_rate_limit('active', 10, 10)
+
+        mock_time.return_value = 111
+        self.limiter.check_rate_limit('other', 10, 10)
+
+        self.assertEqual(set(key for _, key in self.limiter.rate_limits), {'active', 'other'})
+        self.assertEqual(len(self.limiter.expiry_heap), 2)
+
+    def test_unknown_algorithm(self):
+        """Test that unknown algorithms are rejected"""
+        with self.assertRaises(ValueError):
+            check_rate_limit('client', 5, 10, 'leaky')
+
+
+@unittest.skipUnless(fakeredis, "fakeredis with Lua support is not installed")
+class TestRedisRateLimiter(unittest.TestCase):
+    """Test cases for the Redis limiter scripts"""
+
+    def setUp(self):
+        """Set up a limiter against a fake Redis server"""
+        self.redis = fakeredis.FakeRedis()
+        self.limiter = RedisRateLimiter(self.redis)
+
+    def test_sliding_window(self):
+        """Test that the limit is enforced and the key always has a TTL"""
+        results = [self.limiter.check_rate_limit('client', 3, 60) for _ in range(4)]
+
+        self.assertEqual([r[0] for r in results], [True, True, True, False])
+        self.assertEqual([r[1] for r in results], [2, 1, 0, 0])
+        self.assertGreater(self.redis.pttl('rate_limit:sliding_window:client'), 0)
+
+    def test_token_bucket(self):
+        """Test bursts up to the bucket size"""
+        results = [self.limiter.check_rate_limit('client', 3, 60, TOKEN_BUCKET) for _ in range(4)]
+
+        self.assertEqual([r[0] for r in results], [True, True, True, False])
+        self.assertEqual(results[0][1], 2)
+        self.assertGreater(self.redis.pttl('rate_limit:token_bucket:client'), 0)
+
+    def test_one_round_trip_per_check(self):
+        """Test that each check is a single script call"""
+        # The first call of each script loads it into Redis
+        self.limiter.check_rate_limit('client', 3, 60)
+        self.limiter.check_rate_limit('client', 3, 60, TOKEN_BUCKET)
+
+        with patch.object(self.redis, 'execute_command', wraps=self.redis.execute_command) as spy:
+            self.limiter.check_rate_limit('client', 3, 60)
+            self.limiter.check_rate_limit('client', 3, 60, TOKEN_BUCKET)
+
+        self.assertEqual([c[0][0] for c in spy.call_args_list], ['EVALSHA', 'EVALSHA'])
+
+
+class TestCheckRateLimit(unittest.TestCase):
+    """Test cases for choosing between the Redis and in-memory limiters"""
+
+    def test_redis_errors_fall_back_to_memory(self):
+        """Test that checks keep working when Redis is down"""
+        client = MagicMock()
+        client.register_script.return_value.side_effect = redis.exceptions.ConnectionError("down")
+
+        with patch('utils.rate_limit.get_redis_client', return_value=client), \
+                patch.object(rate_limit, 'memory_rate_limiter', InMemoryRateLimiter()):
+            is_allowed, remaining, _ = check_rate_limit('client', 2, 60)
+
+        self.assertTrue(is_allowed)
+        self.assertEqual(remaining, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
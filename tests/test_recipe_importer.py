@@ -0,0 +1,320 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+import json
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock firebase_admin before importing modules that use it
+import firebase_admin
+firebase_admin.initialize_app = MagicMock()
+firebase_admin.get_app = MagicMock()
+firebase_admin.firestore = MagicMock()
+firebase_admin.storage = MagicMock()
+
+# Now import our app modules
+from PIL import Image
+from recipe_scrapers import WebsiteNotImplementedError
+from config import Config
+from recipes import importer
+from utils.background_tasks import TASK_HANDLERS
+
+
+def mock_scraper():
+    """Build a recipe scraper stand-in"""
+    scraper = MagicMock()
+    scraper.title.return_value = "Imported Recipe"
+    scraper.image.return_value = "https://example.com/original.jpg"
+    scraper.total_time.return_value = 45
+    scraper.yields.return_value = "4 servings"
+    scraper.ingredients.return_value = ["Ingredient 1", "Ingredient 2"]
+    scraper.instructions_list.return_value = ["Step 1", "Step 2"]
+    scraper.nutrients.return_value = {"calories": "300 kcal"}
+    return scraper
+
+
+def jpeg_bytes(size=(40, 30)):
+    """Encode a small JPEG image"""
+    output = io.BytesIO()
+    Image.new('RGB', size, (200, 80, 40)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+IMAGE_DATA = jpeg_bytes()
+
+
+def image_response(status_code=200, content=IMAGE_DATA):
+    """Build a streamed image download response"""
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.status_code = status_code
+    response.headers = {'Content-Length': str(len(content))}
+    response.iter_content.return_value = [content]
+    return response
+
+
+class TestRecipeImporter(unittest.TestCase):
+    """Test cases for recipe import"""
+
+    def setUp(self):
+        """Set up mock Firestore and Storage"""
+        self.recipes = MagicMock()
+        self.recipes.document.return_value.id = 'imported-recipe-id'
+        self.scrapes = MagicMock()
+        self.scrapes.document.return_value.get.return_value.exists = False
+        collections = {'recipes': self.recipes, importer.SCRAPE_CACHE_COLLECTION: self.scrapes}
+        self.mock_db = MagicMock()
+        self.mock_db.collection.side_effect = lambda name: collections[name]
+
+        self.mock_bucket = MagicMock()
+        self.mock_bucket.blob.return_value.exists.return_value = False
+        self.mock_bucket.copy_blob.return_value.public_url = 'https://storage.example.com/image.jpg'
+
+        # Links resolve to themselves
+        self.head_patch = patch('recipes.importer.requests.head')
+        mock_head = self.head_patch.start()
+        mock_head.side_effect = lambda url, **kwargs: MagicMock(status_code=200, url=url)
+
+        # Resize in-process and don't space out requests
+        self.config_patches = [
+            patch.object(Config, 'IMAGE_WORKERS', 0),
+            patch.object(Config, 'RECIPE_IMPORT_DOMAIN_INTERVAL', 0)
+        ]
+        for p in self.config_patches:
+            p.start()
+
+    def tearDown(self):
+        """Stop patches"""
+        self.head_patch.stop()
+        for p in self.config_patches:
+            p.stop()
+
+    @patch('recipes.importer.requests.get')
+    @patch('recipes.importer.scrape_me')
+    def test_import_recipe(self, mock_scrape_me, mock_get):
+        """Test that a recipe is scraped, its image stored and the recipe saved"""
+        mock_scrape_me.return_value = mock_scraper()
+        mock_get.return_value = image_response()
+        progress = []
+
+        recipe = importer.import_recipe(
+            'https://example.com/recipe', 'user_1', db=self.mock_db,
+            bucket=self.mock_bucket, progress_callback=progress.append
+        )
+
+        self.assertEqual(recipe['id'], 'imported-recipe-id')
+        self.assertEqual(recipe['title'], 'Imported Recipe')
+        self.assertEqual(recipe['source'], 'web')
+        self.assertEqual(recipe['imageUrl'], 'https://storage.example.com/image.jpg')
+        self.assertTrue(recipe['imageStoragePath'].startswith('recipes/user_1/'))
+        self.recipes.document.return_value.set.assert_called_once()
+
+        # The image is stored once under its hash, with variants, and copied for the recipe
+        digest = importer.hashlib.sha256(IMAGE_DATA).hexdigest()
+        self.mock_bucket.blob.assert_any_call(f"recipe_images/{digest}.jpg")
+        self.mock_bucket.blob.assert_any_call(f"recipe_images/{digest}_thumbnail.jpg")
+        self.assertEqual(self.mock_bucket.blob.return_value.upload_from_string.call_count, 3)
+        self.assertEqual(self.mock_bucket.copy_blob.call_args_list[0][0][2], recipe['imageStoragePath'])
+        self.assertEqual(set(recipe['imageVariants']), {'medium', 'thumbnail'})
+
+        # The scrape is cached for other imports
+        cached = self.scrapes.document.return_value.set.call_args[0][0]
+        self.assertEqual(cached['url'], 'https://example.com/recipe')
+        self.assertEqual(cached['imagePath'], f"recipe_images/{digest}.jpg")
+        self.assertNotIn('userId', cached['recipe'])
+
+        # Progress only moves forward
+        self.assertEqual(progress, sorted(progress))
+        self.assertTrue(progress)
+
+    @patch('recipes.importer.requests.get')
+    @patch('recipes.importer.scrape_me')
+    def test_image_failure_still_saves(self, mock_scrape_me, mock_get):
+        """Test that a failed image download doesn't fail the import"""
+        mock_scrape_me.return_value = mock_scraper()
+        mock_get.side_effect = Exception("connection reset")
+
+        recipe = importer.import_recipe('https://example.com/recipe', 'user_1',
+                                        db=self.mock_db, bucket=self.mock_bucket)
+
+        self.assertNotIn('imageUrl', recipe)
+        self.mock_bucket.blob.assert_not_called()
+        self.mock_bucket.copy_blob.assert_not_called()
+        self.recipes.document.return_value.set.assert_called_once()
+
+    @patch('recipes.importer.scrape_me')
+    def test_unsupported_site(self, mock_scrape_me):
+        """Test that unsupported sites are reported as ValueError"""
+        mock_scrape_me.side_effect = WebsiteNotImplementedError('example.com')
+
+        with self.assertRaises(ValueError) as context:
+            importer.import_recipe('https://example.com/recipe', 'user_1',
+                                   db=self.mock_db, bucket=self.mock_bucket)
+
+        self.assertIn('not supported', str(context.exception))
+        self.recipes.document.return_value.set.assert_not_called()
+        self.scrapes.document.return_value.set.assert_not_called()
+
+    @patch('recipes.importer.requests.get')
+    @patch('recipes.importer.scrape_me')
+    def test_cached_scrape_is_reused(self, mock_scrape_me, mock_get):
+        """Test that a repeat import copies the cached scrape and image"""
+        cached_doc = self.scrapes.document.return_value.get.return_value
+        cached_doc.exists = True
+        cached_doc.to_dict.return_value = {
+            'recipe': {'title': 'Cached Recipe', 'source': 'web'},
+            'imagePath': 'recipe_images/abc.jpg',
+            'expiresAt': datetime.now(timezone.utc) + timedelta(days=1)
+        }
+
+        recipe = importer.import_recipe('https://Example.com/recipe/?utm_source=x#top', 'user_2',
+                                        db=self.mock_db, bucket=self.mock_bucket)
+
+        self.assertEqual(recipe['title'], 'Cached Recipe')
+        self.assertEqual(recipe['userId'], 'user_2')
+        mock_scrape_me.assert_not_called()
+        mock_get.assert_not_called()
+        self.mock_bucket.blob.return_value.upload_from_string.assert_not_called()
+        self.mock_bucket.blob.assert_any_call('recipe_images/abc.jpg')
+        self.mock_bucket.blob.assert_any_call('recipe_images/abc_medium.jpg')
+        self.assertEqual(self.mock_bucket.copy_blob.call_count, 3)
+
+        # Looked up under the canonical URL
+        key = importer.hashlib.sha256(b'https://example.com/recipe').hexdigest()
+        self.scrapes.document.assert_called_with(key)
+
+    @patch('recipes.importer.requests.get')
+    @patch('recipes.importer.scrape_me')
+    def test_expired_scrape_is_refreshed(self, mock_scrape_me, mock_get):
+        """Test that expired cache entries are scraped again"""
+        cached_doc = self.scrapes.document.return_value.get.return_value
+        cached_doc.exists = True
+        cached_doc.to_dict.return_value = {
+            'recipe': {'title': 'Stale Recipe'},
+            'imagePath': None,
+            'expiresAt': datetime.now(timezone.utc) - timedelta(days=1)
+        }
+        mock_scrape_me.return_value = mock_scraper()
+        mock_get.return_value = image_response()
+        # The image is already stored for another recipe
+        self.mock_bucket.blob.return_value.exists.return_value = True
+
+        recipe = importer.import_recipe('https://example.com/recipe', 'user_1',
+                                        db=self.mock_db, bucket=self.mock_bucket)
+
+        self.assertEqual(recipe['title'], 'Imported Recipe')
+        self.mock_bucket.blob.return_value.upload_from_string.assert_not_called()
+        self.assertEqual(self.mock_bucket.copy_blob.call_count, 3)
+        self.scrapes.document.return_value.set.assert_called_once()
+
+    def test_canonicalize_url(self):
+        """Test that equivalent links share a canonical URL"""
+        self.assertEqual(
+            importer.canonicalize_url('HTTPS://www.Example.com/recipes/pie/?utm_medium=social&b=2&a=1&fbclid=x#notes'),
+            'https://www.example.com/recipes/pie?a=1&b=2'
+        )
+        self.assertEqual(
+            importer.canonicalize_url('https://www.instagram.com/chef/p/abc123/?igsh=xyz'),
+            'https://www.instagram.com/chef/p/abc123'
+        )
+
+    @patch('recipes.importer.requests.head')
+    def test_resolve_url_follows_redirects(self, mock_head):
+        """Test that short links resolve to the page they redirect to"""
+        mock_head.return_value = MagicMock(status_code=200, url='https://example.com/recipe/?utm_source=short')
+        self.assertEqual(importer.resolve_url('https://bit.ly/abc'), 'https://example.com/recipe')
+
+        mock_head.side_effect = importer.requests.ConnectionError('offline')
+        self.assertEqual(importer.resolve_url('https://example.com/recipe/'), 'https://example.com/recipe')
+
+    @patch('recipes.importer.requests.get')
+    def test_instagram_recipe(self, mock_get):
+        """Test that Instagram captions are split into ingredients and steps"""
+        page = MagicMock(status_code=200)
+        page.text = (
+            '<meta property="og:title" content="Protein Oats">'
+            '<meta property="og:description" content="- 1 cup oats\n'
+            'Cook the oats slowly in milk for ten minutes">'
+        )
+        mock_get.return_value = page
+
+        recipe = importer.scrape_recipe('https://www.instagram.com/chef/p/abc123?igsh=xyz')
+
+        self.assertEqual(recipe['url'], 'https://www.instagram.com/chef/p/abc123')
+        self.assertEqual(recipe['title'], 'Protein Oats')
+        self.assertEqual(recipe['ingredients'], ['- 1 cup oats'])
+        self.assertEqual(len(recipe['instructions']), 1)
+        self.assertTrue(recipe['needsReview'])
+
+    @patch('recipes.importer.import_recipe')
+    def test_background_task(self, mock_import):
+        """Test the recipe_import task handler"""
+        mock_import.return_value = {
+            'id': 'imported-recipe-id',
+            'title': 'Imported Recipe',
+            'createdAt': object()
+        }
+        progress_callback = MagicMock()
+
+        handler = TASK_HANDLERS['recipe_import']
+        result = handler({'url': 'https://example.com/recipe', 'userId': 'user_1'}, progress_callback)
+
+        # Background imports share one limiter, so a batch's URLs are spaced out
+        mock_import.assert_called_once_with('https://example.com/recipe', 'user_1',
+                                            progress_callback=progress_callback,
+                                            limiter=importer.domain_limiter)
+        self.assertEqual(result['recipeId'], 'imported-recipe-id')
+        # Task results are stored as JSON
+        json.dumps(result)
+
+
+    @patch('recipes.importer.scrape_me')
+    def test_import_recipe_waits_for_limiter(self, mock_scrape_me):
+        """Test that imports sharing a limiter space out requests to one site"""
+        scraper = mock_scraper()
+        scraper.image.return_value = None
+        mock_scrape_me.return_value = scraper
+        sleeps = []
+        limiter = importer.DomainLimiter(per_domain=2, interval=0.5,
+                                         clock=lambda: 100.0, sleep=sleeps.append)
+
+        importer.import_recipe('https://a.com/one', 'user_1', db=self.mock_db,
+                               bucket=self.mock_bucket, limiter=limiter)
+        importer.import_recipe('https://a.com/two', 'user_1', db=self.mock_db,
+                               bucket=self.mock_bucket, limiter=limiter)
+
+        # Resolving and scraping each URL is one request, so three of the
+        # four had to wait their turn
+        self.assertEqual(sleeps, [0.5, 1.0, 1.5])
+        self.assertEqual(self.recipes.document.return_value.set.call_count, 2)
+
+    def test_domain_limiter(self):
+        """Test that requests to one site are capped and spaced out"""
+        now = [100.0]
+        sleeps = []
+        limiter = importer.DomainLimiter(per_domain=2, interval=0.5,
+                                         clock=lambda: now[0], sleep=sleeps.append)
+
+        with ExitStack() as stack:
+            stack.enter_context(limiter.limit('https://a.com/1'))
+            stack.enter_context(limiter.limit('https://a.com/2'))
+            # Both slots for a.com are taken, while other sites are unaffected
+            self.assertFalse(limiter._semaphores['a.com'].acquire(blocking=False))
+            stack.enter_context(limiter.limit('https://b.com/1'))
+
+        # Starts to a.com are spaced by the interval; b.com didn't wait
+        self.assertEqual(sleeps, [0.5])
+
+        now[0] += 2
+        with limiter.limit('https://a.com/3'):
+            pass
+        self.assertEqual(sleeps, [0.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
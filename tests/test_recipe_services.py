@@ -0,0 +1,123 @@
+import unittest
+from unittest.mock import MagicMock
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock firebase_admin before importing modules that use it
+import firebase_admin
+firebase_admin.initialize_app = MagicMock()
+firebase_admin.get_app = MagicMock()
+firebase_admin.firestore = MagicMock()
+firebase_admin.storage = MagicMock()
+
+# Now import our app modules
+from recipes.services import (
+    analyze_ingredients, ingredient_search_term, extract_search_nutrition,
+    STATUS_MATCHED, STATUS_NOT_FOUND, STATUS_ERROR, STATUS_TIMEOUT, STATUS_SKIPPED
+)
+
+
+class FakeUSDAClient:
+    """USDA client stand-in that answers searches from a dict"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.queries = []
+        self.deadlines = []
+        self.release = threading.Event()
+        self.release.set()
+        self.executor = ThreadPoolExecutor(max_workers=4)
+
+    def search_foods(self, query, page_size=25, deadline=None):
+        self.queries.append(query)
+        self.deadlines.append(deadline)
+        response = self.responses.get(query.lower(), {'foods': []})
+        if response == 'slow':
+            self.release.wait(5)
+            return {'foods': []}
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def submit(self, func, *args, **kwargs):
+        return self.executor.submit(func, *args, **kwargs)
+
+
+def usda_food(description, calories, protein=0):
+    """Build a USDA search result food"""
+    return {
+        'fdcId': len(description),
+        'description': description,
+        'foodNutrients': [
+            {'nutrientName': 'Energy', 'value': calories * 4.184, 'unitName': 'KJ'},
+            {'nutrientName': 'Energy', 'value': calories, 'unitName': 'KCAL'},
+            {'nutrientName': 'Protein', 'value': protein, 'unitName': 'G'}
+        ]
+    }
+
+
+class TestAnalyzeIngredients(unittest.TestCase):
+    """Test cases for concurrent recipe ingredient analysis"""
+
+    def test_ingredient_search_term(self):
+        """Test that amounts, units and notes are stripped"""
+        self.assertEqual(ingredient_search_term('2 cups flour (sifted)'), 'flour')
+        self.assertEqual(ingredient_search_term('salt'), 'salt')
+
+    def test_extract_search_nutrition(self):
+        """Test that energy is read in kcal and missing nutrients are zero"""
+        nutrition = extract_search_nutrition(usda_food('Rice', 130, 2.7))
+        self.assertEqual(nutrition['calories'], 130)
+        self.assertEqual(nutrition['protein'], 2.7)
+        self.assertEqual(nutrition['fiber'], 0)
+
+    def test_deduplicates_and_totals(self):
+        """Test that identical terms share one lookup and still count twice"""
+        client = FakeUSDAClient({
+            'chicken breast': {'foods': [usda_food('Chicken, breast', 165, 31)]},
+            'rice': {'foods': [usda_food('Rice', 130, 2.7)]}
+        })
+
+        totals, results = analyze_ingredients(
+            ['100 g chicken breast', '1 cup rice', '200 g Chicken  Breast', '2 pinches saffron'],
+            client, timeout=5
+        )
+
+        self.assertEqual(sorted(q.lower() for q in client.queries), ['chicken breast', 'rice', 'saffron'])
+        self.assertEqual([r['status'] for r in results],
+                         [STATUS_MATCHED, STATUS_MATCHED, STATUS_MATCHED, STATUS_NOT_FOUND])
+        self.assertEqual(results[2]['description'], 'Chicken, breast')
+        self.assertEqual(totals['calories'], 165 * 2 + 130)
+        self.assertEqual(totals['protein'], 31 * 2 + 2.7)
+
+    def test_partial_results(self):
+        """Test that failed and late lookups are reported per ingredient"""
+        client = FakeUSDAClient({
+            'rice': {'foods': [usda_food('Rice', 130)]},
+            'egg': {'error': 'API Error', 'foods': []},
+            'milk': RuntimeError('boom'),
+            'flour': 'slow'
+        })
+        client.release.clear()
+
+        try:
+            totals, results = analyze_ingredients(['rice', 'egg', 'milk', 'flour', '()'], client, timeout=0.5)
+        finally:
+            client.release.set()
+
+        self.assertEqual([r['status'] for r in results],
+                         [STATUS_MATCHED, STATUS_ERROR, STATUS_ERROR, STATUS_TIMEOUT, STATUS_SKIPPED])
+        # Every lookup shares the analysis deadline
+        self.assertEqual(len(set(client.deadlines)), 1)
+        self.assertIsNotNone(client.deadlines[0])
+        self.assertEqual(totals['calories'], 130)
+        self.assertNotIn('calories', results[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
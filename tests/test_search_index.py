@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.search_index import (
+    normalize_text, build_search_tokens, plan_search, matches, MAX_PREFIX_LENGTH
+)
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Test cases for the prefix search index helpers"""
+
+    def test_normalize_text(self):
+        """Test normalization of accents, case and punctuation"""
+        self.assertEqual(normalize_text('Crème Brûlée'), 'creme brulee')
+        self.assertEqual(normalize_text('  Chicken-Breast, (Grilled) '), 'chicken breast grilled')
+        self.assertEqual(normalize_text(None), '')
+
+    def test_build_search_tokens(self):
+        """Test that prefixes are indexed from every word boundary"""
+        tokens = build_search_tokens('Grilled Chicken Breast')
+
+        self.assertIn('g', tokens)
+        self.assertIn('grilled chicken brea', tokens)
+        self.assertIn('chick', tokens)
+        self.assertIn('chicken br', tokens)
+        self.assertIn('breast', tokens)
+        # Mid-word fragments are not indexed
+        self.assertNotIn('icken', tokens)
+        # Prefixes never end on a separator
+        self.assertFalse(any(token.endswith(' ') for token in tokens))
+
+    def test_build_search_tokens_caps_length(self):
+        """Test that indexed prefixes are capped"""
+        tokens = build_search_tokens('Supercalifragilisticexpialidocious Pie')
+        self.assertTrue(all(len(token) <= MAX_PREFIX_LENGTH for token in tokens))
+        self.assertEqual(build_search_tokens(''), [])
+
+    @patch('utils.search_index.firestore')
+    def test_plan_search(self, mock_firestore):
+        """Test that searches become a single array_contains filter"""
+        query = MagicMock()
+
+        filtered, residual = plan_search(query, 'Chicken  BR')
+
+        mock_firestore.FieldFilter.assert_called_with('search_tokens', 'array_contains', 'chicken br')
+        self.assertEqual(filtered, query.where.return_value)
+        self.assertIsNone(residual)
+
+    def test_plan_search_empty(self):
+        """Test that empty searches leave the query untouched"""
+        query = MagicMock()
+
+        filtered, residual = plan_search(query, '  ')
+
+        query.where.assert_not_called()
+        self.assertEqual(filtered, query)
+        self.assertIsNone(residual)
+
+    @patch('utils.search_index.firestore')
+    def test_plan_search_long_term(self, mock_firestore):
+        """Test that long terms are truncated and returned for re-checking"""
+        term = 'extra virgin olive oil cold pressed'
+
+        filtered, residual = plan_search(MagicMock(), term)
+
+        key = mock_firestore.FieldFilter.call_args[0][2]
+        self.assertEqual(key, term[:MAX_PREFIX_LENGTH].rstrip())
+        self.assertEqual(residual, term)
+        self.assertTrue(matches('Extra Virgin Olive Oil, cold-pressed', residual))
+        self.assertFalse(matches('Extra Virgin Olive Oil', residual))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import copy
+import threading
+import time
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.singleflight import SingleFlight
+from utils.api_clients import USDAClient, BarcodeClient
+
+
+def run_concurrently(func, count=8):
+    """Call func from several threads at once and collect the results"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+    errors = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = func()
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results, errors
+
+
+def slow_response(data, delay=0.1):
+    """Build a mock HTTP call that takes a while to return"""
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = data
+
+    def send(*args, **kwargs):
+        time.sleep(delay)
+        return response
+
+    return send
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for request coalescing"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that callers arriving during a call wait for its result"""
+        flights = SingleFlight('test')
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'value': 42}
+
+        results, errors = run_concurrently(lambda: flights.do('key', compute))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'value': 42}] * 8)
+        self.assertEqual(errors, [None] * 8)
+        self.assertFalse(flights.in_flight('key'))
+
+    def test_errors_reach_every_caller(self):
+        """Test that a failure is raised in all waiting callers, then forgotten"""
+        flights = SingleFlight('test')
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError("boom")
+
+        results, errors = run_concurrently(lambda: flights.do('key', fail), count=4)
+
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+        self.assertEqual(flights.do('key', lambda: 'recovered'), 'recovered')
+
+    def test_waiters_get_clones(self):
+        """Test that waiting callers get their own copy of the result"""
+        flights = SingleFlight('test', clone=copy.deepcopy)
+
+        results, _ = run_concurrently(lambda: flights.do('key', lambda: time.sleep(0.1) or {'items': []}), count=4)
+
+        self.assertEqual(len({id(result) for result in results}), 4)
+
+    def test_leader_changes_dont_reach_waiters(self):
+        """Test that waiters copy a snapshot the leader can't modify"""
+        mutated = threading.Event()
+        release = threading.Event()
+        leader_thread = []
+
+        def clone(value):
+            # Waiters copy only once the leader has changed its own result
+            if threading.current_thread() is not leader_thread[0]:
+                mutated.wait(1)
+            return copy.deepcopy(value)
+
+        flights = SingleFlight('test', clone=clone)
+        waiter_result = []
+
+        def compute():
+            release.wait(1)
+            return {'items': ['shared']}
+
+        def lead():
+            result = flights.do('key', compute)
+            result['items'].append('leader only')
+            mutated.set()
+
+        leader = threading.Thread(target=lead)
+        leader_thread.append(leader)
+        leader.start()
+        while not flights.in_flight('key'):
+            time.sleep(0.001)
+
+        waiter = threading.Thread(target=lambda: waiter_result.append(flights.do('key', compute)))
+        waiter.start()
+        while flights.calls.get('key') is not None and flights.calls['key'].waiters == 0:
+            time.sleep(0.001)
+        release.set()
+
+        leader.join()
+        waiter.join()
+        self.assertEqual(waiter_result, [{'items': ['shared']}])
+
+    @patch('requests.Session.get')
+    def test_usda_lookups_coalesce(self, mock_get):
+        """Test that identical concurrent USDA calls make one request"""
+        mock_get.side_effect = slow_response({'foods': [{'fdcId': 1}]})
+        client = USDAClient('test_api_key', 'https://api.nal.usda.gov/fdc/v1')
+
+        results, _ = run_concurrently(lambda: client.search_foods('banana'))
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertTrue(all(result['foods'][0]['fdcId'] == 1 for result in results))
+
+        mock_get.reset_mock()
+        run_concurrently(lambda: client.get_food_details('1'))
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('requests.get')
+    def test_barcode_lookups_coalesce(self, mock_get):
+        """Test that concurrent scans of one barcode make one request"""
+        mock_get.side_effect = slow_response({'status': 1, 'code': '123', 'product': {'product_name': 'Bar'}})
+
+        results, _ = run_concurrently(lambda: BarcodeClient().lookup_barcode('123'))
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertTrue(all(result['name'] == 'Bar' for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
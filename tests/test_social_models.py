@@ -18,7 +18,7 @@ firebase_admin.storage = MagicMock()
 firebase_admin.auth = MagicMock()
 
 # Now import the module we want to test
-from social.models import Post, Comment, Like, Follow
+from social.models import Post, Comment, Like, Follow, build_user_summary, schedule_summary_refresh
 
 
 class TestPostModel(unittest.TestCase):
@@ -46,6 +46,10 @@ class TestPostModel(unittest.TestCase):
         
         # Initialize model with mock db
         self.post_model = Post(self.mock_db)
+        self.post_model.timeline = MagicMock()
+        self.post_model.counters = MagicMock()
+        self.post_model.counters.get.return_value = {}
+        self.post_model.trending = MagicMock()
         
         # Test data
         self.test_user_id = "test_user_123"
@@ -77,7 +81,9 @@ class TestPostModel(unittest.TestCase):
         # Verify Firestore was called correctly
         self.mock_user_collection.document.assert_called_with(self.test_user_id)
         self.mock_collection.document.assert_called_once()
-        self.mock_doc_ref.set.assert_called_once()
+        batch = self.mock_db.batch.return_value
+        self.assertEqual(batch.set.call_args[0][0], self.mock_doc_ref)
+        batch.commit.assert_called_once()
         
         # Verify the returned post has the right structure
         self.assertEqual(post['id'], self.test_post_id)
@@ -88,6 +94,17 @@ class TestPostModel(unittest.TestCase):
         self.assertEqual(post['likes'], 0)
         self.assertEqual(post['comments'], 0)
         
+        # Verify the tags were recorded for trending in the same write
+        self.post_model.trending.record.assert_called_once_with(added=['fitness', 'food', 'test'], batch=batch)
+        
+        # Verify fan-out to home timelines was scheduled
+        author, post_id, pulled = self.post_model.timeline.publish.call_args[0]
+        self.assertEqual(author['id'], self.test_user_id)
+        self.assertEqual(post_id, self.test_post_id)
+        
+        # The fan-out mode is recorded on the post
+        self.assertEqual(post['timelinePulled'], pulled)
+        
     def test_create_post_missing_content(self):
         """Test validation error during post creation"""
         # Test with missing required field
@@ -150,6 +167,31 @@ class TestPostModel(unittest.TestCase):
         
         self.assertTrue('Post not found' in str(context.exception))
         
+    def test_get_post_uses_sharded_counts(self):
+        """Test that counts come from the counter shards"""
+        self.mock_doc.exists = True
+        self.mock_doc.id = self.test_post_id
+        self.mock_doc.to_dict.return_value = {'content': 'Test post', 'likes': 3, 'comments': 1}
+        self.post_model.counters.get.return_value = {'likes': 42, 'comments': 1}
+        
+        post = self.post_model.get(self.test_post_id)
+        
+        self.assertEqual(post['likes'], 42)
+        self.assertEqual(self.post_model.counters.get.call_args[0][1], ['likes', 'comments'])
+        
+    def test_get_many_posts(self):
+        """Test getting several posts in one batched read"""
+        found = MagicMock(id='post_1', exists=True)
+        found.to_dict.return_value = {'content': 'Test post'}
+        missing = MagicMock(id='post_2', exists=False)
+        self.mock_db.get_all.return_value = [found, missing]
+        
+        posts = self.post_model.get_many(['post_1', 'post_2', 'post_1'])
+        
+        self.mock_db.get_all.assert_called_once()
+        self.assertEqual(len(self.mock_db.get_all.call_args[0][0]), 2)
+        self.assertEqual(posts, {'post_1': {'content': 'Test post', 'id': 'post_1'}})
+        
     def test_update_post(self):
         """Test updating a post"""
         # Mock post data
@@ -175,12 +217,19 @@ class TestPostModel(unittest.TestCase):
         
         # Verify Firestore was called correctly
         self.mock_collection.document.assert_called_with(self.test_post_id)
-        self.mock_doc_ref.update.assert_called_once()
+        batch = self.mock_db.batch.return_value
+        self.assertEqual(batch.update.call_args[0][0], self.mock_doc_ref)
+        batch.commit.assert_called_once()
         
         # Verify the returned post has the updated values
         self.assertEqual(updated_post['content'], 'Updated post content')
         self.assertEqual(updated_post['tags'], ['fitness', 'updated'])
         
+        # Verify only the changed tags moved in trending counts
+        self.post_model.trending.record.assert_called_once_with(
+            added={'updated'}, removed={'food', 'test'}, at=None, batch=batch
+        )
+        
     def test_update_unauthorized_post(self):
         """Test unauthorized post update"""
         # Mock post owned by a different user
@@ -225,7 +274,10 @@ class TestPostModel(unittest.TestCase):
         
         # Verify Firestore was called correctly
         self.mock_collection.document.assert_called_with(self.test_post_id)
-        self.mock_doc_ref.delete.assert_called_once()
+        self.mock_db.batch.return_value.delete.assert_called_once_with(self.mock_doc_ref)
+        
+        # The post is removed from home timelines
+        self.post_model.timeline.unpublish.assert_called_once_with(self.test_user_id, self.test_post_id, False)
         
         # Verify successful deletion
         self.assertTrue(result)
@@ -250,6 +302,7 @@ class TestCommentModel(unittest.TestCase):
         # Initialize model
         self.comment_model = Comment(self.mock_db)
         self.comment_model.post_model = self.mock_post_model
+        self.comment_model.counters = MagicMock()
         
         # Mock post data
         self.mock_post = {
@@ -303,6 +356,9 @@ class TestCommentModel(unittest.TestCase):
         
         # Verify post comment count was updated
         mock_post_collection.document.assert_called_with(self.test_post_id)
+        self.comment_model.counters.increment.assert_called_once_with(
+            mock_post_collection.document.return_value, 'comments', 1
+        )
         
         # Verify comment data
         self.assertEqual(comment['postId'], self.test_post_id)
@@ -341,6 +397,7 @@ class TestLikeModel(unittest.TestCase):
         # Initialize model
         self.like_model = Like(self.mock_db)
         self.like_model.post_model = self.mock_post_model
+        self.like_model.counters = MagicMock()
         
         # Mock post data
         self.mock_post = {
@@ -372,6 +429,7 @@ class TestLikeModel(unittest.TestCase):
         
         # Verify post was updated
         self.mock_db.collection().document.assert_called_with(self.test_post_id)
+        self.assertEqual(self.like_model.counters.increment.call_args[0][1:], ('likes', 1))
         
         # Verify result
         self.assertTrue(result['liked'])
@@ -400,6 +458,7 @@ class TestLikeModel(unittest.TestCase):
         
         # Verify post was updated
         self.mock_db.collection().document.assert_called_with(self.test_post_id)
+        self.assertEqual(self.like_model.counters.increment.call_args[0][1:], ('likes', -1))
         
         # Verify result
         self.assertFalse(result['liked'])
@@ -422,6 +481,54 @@ class TestLikeModel(unittest.TestCase):
         
         # Verify result
         self.assertTrue(result)
+        
+    def test_bulk_status(self):
+        """Test checking like status for a page of posts in one read"""
+        post_ids = ['post_1', 'post_2', 'post_3', 'post_1']
+        
+        # Only post_2 is liked
+        def like_doc(post_id, exists):
+            doc = MagicMock()
+            doc.id = f"{self.test_user_id}_{post_id}"
+            doc.exists = exists
+            return doc
+        
+        self.mock_db.get_all.return_value = [
+            like_doc('post_1', False), like_doc('post_2', True), like_doc('post_3', False)
+        ]
+        
+        result = self.like_model.bulk_status(self.test_user_id, post_ids)
+        
+        # Verify one batched read covered every distinct post
+        self.mock_db.get_all.assert_called_once()
+        self.assertEqual(len(self.mock_db.get_all.call_args[0][0]), 3)
+        self.mock_db.collection().document.assert_any_call(f"{self.test_user_id}_post_3")
+        
+        self.assertEqual(result, {'post_1': False, 'post_2': True, 'post_3': False})
+        
+    def test_bulk_status_empty(self):
+        """Test that an empty page needs no read"""
+        self.assertEqual(self.like_model.bulk_status(self.test_user_id, []), {})
+        self.mock_db.get_all.assert_not_called()
+        
+    def test_get_user_likes_batches_posts(self):
+        """Test that liked posts are fetched in one batch, skipping deleted posts"""
+        like_docs = []
+        for post_id in ['post_1', 'post_2', 'post_3']:
+            doc = MagicMock()
+            doc.to_dict.return_value = {'userId': self.test_user_id, 'postId': post_id}
+            like_docs.append(doc)
+        query = self.mock_db.collection().where().order_by().limit().offset()
+        query.stream.return_value = like_docs
+        self.mock_post_model.get_many.return_value = {
+            'post_3': {'id': 'post_3'}, 'post_1': {'id': 'post_1'}
+        }
+        
+        result = self.like_model.get_user_likes(self.test_user_id, {})
+        
+        self.mock_post_model.get_many.assert_called_once_with(['post_1', 'post_2', 'post_3'])
+        self.mock_post_model.get.assert_not_called()
+        self.assertEqual([post['id'] for post in result['posts']], ['post_1', 'post_3'])
 
 
 class TestFollowModel(unittest.TestCase):
@@ -439,6 +546,8 @@ class TestFollowModel(unittest.TestCase):
         
         # Initialize model
         self.follow_model = Follow(self.mock_db)
+        self.follow_model.timeline = MagicMock()
+        self.follow_model.counters = MagicMock()
         
         # Mock user documents
         self.mock_follower_doc = MagicMock()
@@ -468,7 +577,10 @@ class TestFollowModel(unittest.TestCase):
         self.mock_db.collection().document.assert_called_with(self.follow_id)
         
         # Verify user counts were updated
-        self.mock_db.collection().document().update.assert_called()
+        self.assertEqual(
+            [c[0][1:] for c in self.follow_model.counters.increment.call_args_list],
+            [('following_count', 1), ('follower_count', 1)]
+        )
         
         # Verify result
         self.assertTrue(result['following'])
@@ -496,11 +608,17 @@ class TestFollowModel(unittest.TestCase):
         self.mock_db.collection().document().delete.assert_called_once()
         
         # Verify user counts were updated
-        self.mock_db.collection().document().update.assert_called()
+        self.assertEqual(
+            [c[0][1:] for c in self.follow_model.counters.increment.call_args_list],
+            [('following_count', -1), ('follower_count', -1)]
+        )
         
         # Verify result
         self.assertFalse(result['following'])
         self.assertEqual(result['followingId'], self.following_id)
+        self.follow_model.timeline.follow_changed.assert_called_once_with(
+            self.follower_id, self.following_id, False
+        )
         
     def test_self_follow(self):
         """Test attempt to follow oneself"""
@@ -526,6 +644,148 @@ class TestFollowModel(unittest.TestCase):
         
         # Verify result
         self.assertTrue(result)
+        
+    def test_bulk_follow_status(self):
+        """Test checking follow status for a page of users in one read"""
+        followed = MagicMock(id=f"{self.follower_id}_user_2", exists=True)
+        not_followed = MagicMock(id=f"{self.follower_id}_user_1", exists=False)
+        self.mock_db.get_all.return_value = [not_followed, followed]
+        
+        result = self.follow_model.bulk_status(self.follower_id, ['user_1', 'user_2'])
+        
+        self.mock_db.get_all.assert_called_once()
+        self.assertEqual(result, {'user_1': False, 'user_2': True})
+        
+    def _mock_follows(self, follows):
+        """Make the follows query return the given follow documents"""
+        docs = []
+        for follow_data in follows:
+            doc = MagicMock()
+            doc.to_dict.return_value = follow_data
+            docs.append(doc)
+        query = self.mock_db.collection().where().order_by().limit().offset()
+        query.stream.return_value = docs
+        
+    def _mock_user(self, user_id, exists=True):
+        """Build a mock user document"""
+        doc = MagicMock(id=user_id, exists=exists)
+        doc.to_dict.return_value = {'name': f"Name {user_id}"}
+        return doc
+        
+    def test_get_followers_batches_profiles(self):
+        """Test that follower profiles are fetched in one batch, in follow order"""
+        self._mock_follows([
+            {'followerId': 'user_2', 'followingId': self.following_id},
+            {'followerId': 'user_1', 'followingId': self.following_id},
+            {'followerId': 'user_3', 'followingId': self.following_id}
+        ])
+        self.mock_db.get_all.return_value = [
+            self._mock_user('user_1'), self._mock_user('user_2'), self._mock_user('user_3', exists=False)
+        ]
+        
+        result = self.follow_model.get_followers(self.following_id, {})
+        
+        self.mock_db.get_all.assert_called_once()
+        self.assertEqual([user['id'] for user in result['followers']], ['user_2', 'user_1'])
+        self.assertEqual(result['followers'][0]['name'], 'Name user_2')
+        
+    def test_follower_total_from_counter(self):
+        """Test that the follower total is read from the maintained counter"""
+        self._mock_follows([])
+        self.follow_model.counters.get.return_value = {'follower_count': 250}
+        
+        result = self.follow_model.get_followers(self.following_id, {})
+        
+        self.assertEqual(result['pagination']['total'], 250)
+        self.assertEqual(self.follow_model.counters.get.call_args[0][1], ['follower_count'])
+        
+        # Totals can be skipped entirely
+        self.follow_model.counters.get.reset_mock()
+        result = self.follow_model.get_followers(self.following_id, {'include_total': 'false'})
+        self.assertIsNone(result['pagination']['total'])
+        self.follow_model.counters.get.assert_not_called()
+        
+    def test_get_following_uses_summaries(self):
+        """Test that stored summaries replace profile reads when requested"""
+        self._mock_follows([
+            {'followerId': self.follower_id, 'followingId': 'user_1',
+             'followingSummary': {'name': 'Stored', 'profile_image_url': None}},
+            {'followerId': self.follower_id, 'followingId': 'user_2'}
+        ])
+        self.mock_db.get_all.return_value = [self._mock_user('user_2')]
+        
+        result = self.follow_model.get_following(self.follower_id, {'summary': 'true'})
+        
+        # Only the follow document without a summary needs a profile read
+        refs = self.mock_db.get_all.call_args[0][0]
+        self.assertEqual(len(refs), 1)
+        self.assertEqual(result['following'], [
+            {'name': 'Stored', 'profile_image_url': None, 'id': 'user_1'},
+            {'name': 'Name user_2', 'id': 'user_2'}
+        ])
+        
+    def test_toggle_follow_stores_summaries(self):
+        """Test that new follow documents carry both user summaries"""
+        follower = self._mock_user(self.follower_id)
+        following = self._mock_user(self.following_id)
+        follow_doc = MagicMock(exists=False)
+        follow_ref = MagicMock()
+        follow_ref.get.return_value = follow_doc
+        self.mock_db.collection().document.side_effect = lambda doc_id: {
+            self.follower_id: MagicMock(get=MagicMock(return_value=follower)),
+            self.following_id: MagicMock(get=MagicMock(return_value=following))
+        }.get(doc_id, follow_ref)
+        
+        self.follow_model.toggle(self.follower_id, self.following_id)
+        
+        follow_data = follow_ref.set.call_args[0][0]
+        self.assertEqual(follow_data['followerSummary'],
+                         {'name': f"Name {self.follower_id}", 'profile_image_url': None})
+        self.assertEqual(follow_data['followingSummary']['name'], f"Name {self.following_id}")
+        
+    def test_summary_prefers_thumbnail(self):
+        """Test that summaries use the profile thumbnail when there is one"""
+        summary = build_user_summary({
+            'name': 'Chef',
+            'profile_image_url': 'https://example.com/profile.jpg',
+            'profile_image_thumbnail_url': 'https://example.com/profile_thumbnail.jpg'
+        })
+        
+        self.assertEqual(summary['profile_image_url'], 'https://example.com/profile_thumbnail.jpg')
+        
+    def test_refresh_summaries(self):
+        """Test that a changed profile is rewritten onto both sides of its follows"""
+        self.mock_db.collection('users').document().get.return_value = self._mock_user('user_1')
+        current = {'name': 'Name user_1', 'profile_image_url': None}
+        as_follower = [MagicMock(), MagicMock()]
+        as_follower[0].to_dict.return_value = {'followerSummary': {'name': 'Old name'}}
+        as_follower[1].to_dict.return_value = {'followerSummary': current}
+        as_following = [MagicMock()]
+        as_following[0].to_dict.return_value = {}
+        queries = {'followerId': as_follower, 'followingId': as_following}
+        self.mock_db.collection('follows').where.side_effect = lambda field, op, value: MagicMock(
+            limit=MagicMock(return_value=MagicMock(stream=MagicMock(return_value=queries[field])))
+        )
+        
+        self.assertEqual(self.follow_model.refresh_summaries('user_1'), 2)
+        
+        # Documents already holding the current summary aren't rewritten
+        batch = self.mock_db.batch.return_value
+        batch.update.assert_any_call(as_follower[0].reference, {'followerSummary': current})
+        batch.update.assert_any_call(as_following[0].reference, {'followingSummary': current})
+        self.assertEqual(batch.update.call_count, 2)
+        
+    @patch('social.models.enqueue_task')
+    def test_summary_refresh_only_for_changed_profiles(self, mock_enqueue):
+        """Test that profile writes queue a refresh only when the summary changed"""
+        profile = {'name': 'Chef', 'profile_image_url': 'https://example.com/a.jpg'}
+        
+        self.assertIsNone(schedule_summary_refresh('user_1', None, profile))
+        self.assertIsNone(schedule_summary_refresh('user_1', profile, dict(profile, bio='New bio')))
+        mock_enqueue.assert_not_called()
+        
+        schedule_summary_refresh('user_1', profile, dict(profile, name='Head Chef'))
+        mock_enqueue.assert_called_once_with('follow_summary_refresh', {'userId': 'user_1'}, user_id='user_1')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,384 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta
+import threading
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock firebase_admin before importing modules that use it
+import firebase_admin
+firebase_admin.initialize_app = MagicMock()
+firebase_admin.get_app = MagicMock()
+firebase_admin.delete_app = MagicMock()
+firebase_admin.firestore = MagicMock()
+firebase_admin.storage = MagicMock()
+firebase_admin.auth = MagicMock()
+
+# Now import the module we want to test
+from social.services import Timeline, PULL_AUTHORS_CACHE_KEY
+from utils.pagination import decode_cursor
+
+
+def make_doc(doc_id, data=None, exists=True):
+    """Build a mock document snapshot"""
+    doc = MagicMock(id=doc_id, exists=exists)
+    doc.to_dict.return_value = data
+    return doc
+
+
+class FakeQuery:
+    """Query stand-in that records calls and returns canned pages"""
+
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.filters = []
+        self.start_positions = []
+        self.limits = []
+
+    def where(self, *args):
+        self.filters.append(args)
+        return self
+
+    def order_by(self, *args, **kwargs):
+        return self
+
+    def select(self, fields):
+        return self
+
+    def start_after(self, position):
+        self.start_positions.append(position)
+        return self
+
+    def limit(self, count):
+        self.limits.append(count)
+        return self
+
+    def stream(self):
+        return iter(self.pages.pop(0) if self.pages else [])
+
+
+class TestTimeline(unittest.TestCase):
+    """Test cases for fan-out-on-write home timelines"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.mock_db = MagicMock()
+        self.timeline = Timeline(self.mock_db)
+        self.timeline.fanout_limit = 1000
+
+        self.now = datetime(2024, 1, 10, 12, 0)
+        self.entry_collections = {}
+        self.posts_query = FakeQuery([])
+        self.follows_query = FakeQuery([])
+        self.users_query = FakeQuery([])
+        self.jobs = MagicMock()
+
+        # Route collection lookups to per-test fakes
+        timelines = MagicMock()
+        timelines.document.side_effect = lambda user_id: MagicMock(
+            collection=MagicMock(return_value=self._entries(user_id))
+        )
+        collections = {
+            'timelines': timelines,
+            'posts': MagicMock(where=self.posts_query.where),
+            'follows': MagicMock(where=self.follows_query.where),
+            'users': MagicMock(where=self.users_query.where),
+            'timeline_jobs': self.jobs
+        }
+        self.mock_db.collection.side_effect = lambda name: collections[name]
+
+        self.cache_patch = patch('social.services.cache')
+        self.mock_cache = self.cache_patch.start()
+        self.mock_cache.get.return_value = []
+
+    def tearDown(self):
+        """Stop patches"""
+        self.cache_patch.stop()
+
+    def _entries(self, user_id):
+        """Get the fake entries collection of a user"""
+        if user_id not in self.entry_collections:
+            collection = MagicMock()
+            collection.query = FakeQuery([])
+            collection.where = collection.query.where
+            collection.order_by = collection.query.order_by
+            self.entry_collections[user_id] = collection
+        return self.entry_collections[user_id]
+
+    def _at(self, minutes):
+        """Get a creation time some minutes before now"""
+        return self.now - timedelta(minutes=minutes)
+
+    def test_fan_out_writes_author_and_followers(self):
+        """Test that a post reaches the author and every follower in batches"""
+        post_doc = make_doc('post_1', {'userId': 'author', 'createdAt': self.now})
+        posts = MagicMock()
+        posts.document.return_value.get.return_value = post_doc
+        follows = FakeQuery([
+            [make_doc(f"f{n}_author", {'followerId': f"f{n}"}) for n in range(500)],
+            [make_doc('f500_author', {'followerId': 'f500'})]
+        ])
+        self.mock_db.collection.side_effect = lambda name: {
+            'posts': posts, 'follows': follows
+        }.get(name, MagicMock())
+
+        written = self.timeline.fan_out('post_1', 'author')
+
+        # Author plus 501 followers, committed as 500 + 2
+        self.assertEqual(written, 502)
+        self.assertEqual(self.mock_db.batch.return_value.commit.call_count, 2)
+        self.assertEqual(self.mock_db.batch.return_value.set.call_args[0][1], {
+            'postId': 'post_1', 'authorId': 'author', 'createdAt': self.now
+        })
+        self.assertEqual(len(follows.start_positions), 2)
+
+    def test_fan_out_skips_followers_of_pull_authors(self):
+        """Test that pull authors' posts only go to their own timeline"""
+        posts = MagicMock()
+        posts.document.return_value.get.return_value = make_doc(
+            'post_1', {'userId': 'author', 'createdAt': self.now}
+        )
+        self.mock_db.collection.side_effect = lambda name: posts if name == 'posts' else MagicMock()
+
+        self.assertEqual(self.timeline.fan_out('post_1', 'author', followers=False), 1)
+
+    def test_is_pull_author(self):
+        """Test that authors at the fan-out limit are pulled"""
+        self.assertFalse(self.timeline.is_pull_author({'follower_count': 10}))
+        self.assertTrue(self.timeline.is_pull_author({'follower_count': 1000}))
+
+    def test_publish_marks_pull_authors(self):
+        """Test that pulled posts skip followers and keep their author in the pull set"""
+        users = MagicMock()
+        self.mock_db.collection.side_effect = lambda name: users
+
+        with patch.object(self.timeline, 'schedule') as mock_schedule:
+            self.timeline.publish({'id': 'author', 'follower_count': 10}, 'post_1', False)
+            self.timeline.publish({'id': 'star', 'follower_count': 5000}, 'post_2', True)
+            self.timeline.publish({'id': 'star', 'timeline_pulled_posts': True}, 'post_3', True)
+
+        self.assertEqual(mock_schedule.call_args_list[0][0][0], 'post_post_1')
+        self.assertTrue(mock_schedule.call_args_list[0][0][1]['followers'])
+        self.assertFalse(mock_schedule.call_args_list[1][0][1]['followers'])
+        # The marker is written once and the cached pull set dropped
+        users.document.assert_called_once_with('star')
+        users.document.return_value.update.assert_called_once_with({'timeline_pulled_posts': True})
+        self.mock_cache.delete.assert_called_once_with(PULL_AUTHORS_CACHE_KEY)
+
+    @patch('social.services._get_timeline_pool')
+    def test_schedule_saves_job_and_runs_it_on_timeline_pool(self, mock_get_pool):
+        """Test that jobs are persisted, run on their own pool and deleted when done"""
+        pool = MagicMock()
+        pool.submit.side_effect = lambda run: run()
+        slots = threading.BoundedSemaphore(1)
+        mock_get_pool.return_value = (pool, slots)
+        job = {'type': 'follow', 'userId': 'reader', 'authorId': 'author', 'following': True}
+
+        with patch.object(self.timeline, 'sync_follow') as mock_sync:
+            self.timeline.schedule('follow_reader_author', job)
+
+        self.jobs.document.assert_called_with('follow_reader_author')
+        self.assertEqual(self.jobs.document.return_value.set.call_args[0][0]['type'], 'follow')
+        mock_sync.assert_called_once_with('reader', 'author')
+        self.jobs.document.return_value.delete.assert_called_once()
+        # The queue slot is handed back
+        self.assertTrue(slots.acquire(blocking=False))
+
+        # With the queue full the job is only saved, for the repair pass
+        pool.reset_mock()
+        self.timeline.schedule('post_p1', {'type': 'fan_out', 'postId': 'p1', 'authorId': 'author'})
+        pool.submit.assert_not_called()
+        self.assertEqual(self.jobs.document.return_value.set.call_count, 2)
+
+    def test_failed_jobs_are_kept_for_retry(self):
+        """Test that failures are counted until the attempt limit"""
+        job_ref = self.jobs.document.return_value
+        job = {'type': 'unfan', 'postId': 'p1', 'authorId': 'author', 'attempts': 0}
+
+        with patch.object(self.timeline, 'unfan', side_effect=RuntimeError('unavailable')):
+            self.assertFalse(self.timeline.run_job('unpost_p1', job))
+            job_ref.update.assert_called_once_with({'attempts': 1})
+            job_ref.delete.assert_not_called()
+
+            self.assertFalse(self.timeline.run_job('unpost_p1', dict(job, attempts=4)))
+            job_ref.delete.assert_called_once()
+
+    def test_repair_reruns_unfinished_jobs(self):
+        """Test that jobs left by a restart are run again"""
+        stale = make_doc('post_p1', {'type': 'fan_out', 'postId': 'p1', 'authorId': 'author'})
+        self.jobs.where.return_value.limit.return_value.stream.return_value = [stale]
+
+        with patch.object(self.timeline, 'fan_out') as mock_fan_out:
+            self.assertEqual(self.timeline.repair(older_than=300), 1)
+
+        self.assertEqual(self.jobs.where.call_args[0][:2], ('createdAt', '<'))
+        mock_fan_out.assert_called_once_with('p1', 'author', True)
+
+    def test_sync_follow_uses_current_state(self):
+        """Test that follow jobs apply whatever the follow state is when they run"""
+        follows = MagicMock()
+        self.mock_db.collection.side_effect = lambda name: follows
+        with patch.object(self.timeline, 'add_author', return_value=3) as mock_add, \
+                patch.object(self.timeline, 'remove_author', return_value=2) as mock_remove:
+            follows.document.return_value.get.return_value = make_doc('reader_author', exists=False)
+            self.assertEqual(self.timeline.sync_follow('reader', 'author'), 2)
+            follows.document.assert_called_with('reader_author')
+
+            follows.document.return_value.get.return_value = make_doc('reader_author')
+            self.assertEqual(self.timeline.sync_follow('reader', 'author'), 3)
+
+        mock_add.assert_called_once_with('reader', 'author')
+        mock_remove.assert_called_once_with('reader', 'author')
+
+    def test_unfan_removes_post_everywhere(self):
+        """Test that a deleted post leaves the author's and followers' timelines"""
+        follows = FakeQuery([[make_doc('f1_author', {'followerId': 'f1'})]])
+        self.mock_db.collection.side_effect = lambda name: {
+            'follows': follows, 'timelines': MagicMock()
+        }[name]
+
+        self.assertEqual(self.timeline.unfan('p1', 'author'), 2)
+        self.assertEqual(self.mock_db.batch.return_value.delete.call_count, 2)
+
+    def test_read_single_query(self):
+        """Test reading a timeline with no pull authors"""
+        self._entries('reader').query.pages = [[
+            make_doc('p3', {'postId': 'p3', 'createdAt': self._at(1)}),
+            make_doc('p2', {'postId': 'p2', 'createdAt': self._at(2)}),
+            make_doc('p1', {'postId': 'p1', 'createdAt': self._at(3)})
+        ]]
+        self.mock_db.get_all.return_value = [
+            make_doc('p2', {'content': 'two'}), make_doc('p3', {'content': 'three'})
+        ]
+
+        result = self.timeline.read('reader', {'limit': 2})
+
+        self.assertEqual([post['id'] for post in result['posts']], ['p3', 'p2'])
+        self.assertTrue(result['pagination']['has_more'])
+        self.mock_db.batch.assert_not_called()
+        self.assertEqual(decode_cursor(result['pagination']['next_cursor'])['id'], 'p2')
+        self.assertEqual(self.mock_db.get_all.call_count, 1)
+
+    def test_read_drops_deleted_posts(self):
+        """Test that entries of deleted posts are skipped and cleaned up"""
+        self._entries('reader').query.pages = [[
+            make_doc('p2', {'postId': 'p2', 'createdAt': self._at(1)}),
+            make_doc('p1', {'postId': 'p1', 'createdAt': self._at(2)})
+        ]]
+        self.mock_db.get_all.return_value = [make_doc('p2', {}), make_doc('p1', exists=False)]
+
+        result = self.timeline.read('reader', {'limit': 5})
+
+        self.assertEqual([post['id'] for post in result['posts']], ['p2'])
+        self._entries('reader').document.assert_called_with('p1')
+        self.mock_db.batch.return_value.delete.assert_called_once()
+
+    def test_read_merges_pull_authors(self):
+        """Test that followed pull authors' posts are merged in time order"""
+        self.mock_cache.get.return_value = ['star', 'other_star']
+        self._entries('reader').query.pages = [[
+            make_doc('p3', {'postId': 'p3', 'createdAt': self._at(1)}),
+            make_doc('p1', {'postId': 'p1', 'createdAt': self._at(5)})
+        ]]
+        self.posts_query.pages = [[
+            make_doc('s1', {'createdAt': self._at(2)}),
+            # Posted before the author crossed the limit, so also fanned out
+            make_doc('p1', {'createdAt': self._at(5)})
+        ]]
+        self.mock_db.get_all.side_effect = [
+            # Follow status of the pull authors
+            [make_doc('reader_star', exists=True), make_doc('reader_other_star', exists=False)],
+            # Post hydration
+            [make_doc(post_id, {}) for post_id in ('p1', 's1', 'p3')]
+        ]
+
+        result = self.timeline.read('reader', {'limit': 10})
+
+        self.assertEqual([post['id'] for post in result['posts']], ['p3', 's1', 'p1'])
+        self.assertEqual(self.posts_query.filters, [('userId', 'in', ['star'])])
+        self.assertFalse(result['pagination']['has_more'])
+
+    def test_read_resumes_from_cursor(self):
+        """Test that the cursor position is applied to every source"""
+        first = self.timeline.read('reader', {'limit': 1})
+        self.assertIsNone(first['pagination']['next_cursor'])
+
+        self._entries('reader').query.pages = [[
+            make_doc('p2', {'postId': 'p2', 'createdAt': self._at(2)}),
+            make_doc('p1', {'postId': 'p1', 'createdAt': self._at(3)})
+        ]]
+        self.mock_db.get_all.return_value = [make_doc('p2', {})]
+        cursor = self.timeline.read('reader', {'limit': 1})['pagination']['next_cursor']
+
+        self._entries('reader').query.pages = [[make_doc('p1', {'postId': 'p1', 'createdAt': self._at(3)})]]
+        self.mock_db.get_all.return_value = [make_doc('p1', {})]
+        result = self.timeline.read('reader', {'limit': 1, 'cursor': cursor})
+
+        self.assertEqual([post['id'] for post in result['posts']], ['p1'])
+        self.assertEqual(self._entries('reader').query.start_positions[-1],
+                         {'createdAt': self._at(2), '__name__': 'p2'})
+
+    def test_read_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        with self.assertRaises(ValueError):
+            self.timeline.read('reader', {'cursor': 'not-a-cursor'})
+
+    def test_read_caches_pull_authors(self):
+        """Test that the pull author list is loaded once and cached"""
+        self.mock_cache.get.return_value = None
+        # Over the limit now, and marked from earlier pulled posts
+        self.users_query.pages = [[make_doc('star')], [make_doc('star'), make_doc('former_star')]]
+        self.mock_db.get_all.return_value = []
+
+        self.timeline.read('reader', {})
+
+        self.assertEqual(self.users_query.filters, [
+            ('follower_count', '>=', 1000), ('timeline_pulled_posts', '==', True)
+        ])
+        self.mock_cache.set.assert_called_once_with(PULL_AUTHORS_CACHE_KEY, ['star', 'former_star'], timeout=300)
+
+    def test_add_author_backfills_recent_posts(self):
+        """Test that following someone copies their recent posts"""
+        users = MagicMock()
+        users.document.return_value.get.return_value = make_doc('author', {'follower_count': 3})
+        self.posts_query.pages = [[
+            make_doc('p2', {'userId': 'author', 'createdAt': self._at(1)}),
+            make_doc('p1', {'userId': 'author', 'createdAt': self._at(2)})
+        ]]
+        collections = {'posts': MagicMock(where=self.posts_query.where), 'users': users}
+        self.mock_db.collection.side_effect = lambda name: collections.get(name, MagicMock())
+
+        self.assertEqual(self.timeline.add_author('reader', 'author'), 2)
+        self.assertEqual(self.posts_query.limits, [self.timeline.backfill_size])
+
+    def test_add_author_skips_pulled_posts(self):
+        """Test that backfill follows each post's mode rather than the author's current one"""
+        users = MagicMock()
+        # Dropped below the limit since posting p2
+        users.document.return_value.get.return_value = make_doc('author', {'follower_count': 3})
+        self.posts_query.pages = [[
+            make_doc('p3', {'userId': 'author', 'createdAt': self._at(1), 'timelinePulled': False}),
+            make_doc('p2', {'userId': 'author', 'createdAt': self._at(2), 'timelinePulled': True}),
+            make_doc('p1', {'userId': 'author', 'createdAt': self._at(3)})
+        ]]
+        collections = {'posts': MagicMock(where=self.posts_query.where), 'users': users}
+        self.mock_db.collection.side_effect = lambda name: collections.get(name, MagicMock())
+
+        self.assertEqual(self.timeline.add_author('reader', 'author'), 2)
+        written = [c[0][0] for c in self.mock_db.batch.return_value.set.call_args_list]
+        self.assertEqual(len(written), 2)
+
+    def test_remove_author(self):
+        """Test that unfollowing removes the author's entries"""
+        self._entries('reader').query.pages = [[make_doc('p1'), make_doc('p2')], []]
+
+        self.assertEqual(self.timeline.remove_author('reader', 'author'), 2)
+        self.assertEqual(self._entries('reader').query.filters, [('authorId', '==', 'author')])
+        self.assertEqual(self.mock_db.batch.return_value.delete.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta, timezone
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock firebase_admin before importing modules that use it
+import firebase_admin
+firebase_admin.initialize_app = MagicMock()
+firebase_admin.get_app = MagicMock()
+firebase_admin.delete_app = MagicMock()
+firebase_admin.firestore = MagicMock()
+firebase_admin.storage = MagicMock()
+firebase_admin.auth = MagicMock()
+
+# Now import the module we want to test
+from social import services
+from social.services import TrendingTags, TRENDING_CACHE_KEY, normalize_tag
+from utils.cache import LRUCache
+
+
+def make_bucket(bucket_id, counts):
+    """Build a mock hour bucket snapshot"""
+    doc = MagicMock(id=bucket_id, exists=True)
+    doc.to_dict.return_value = {'counts': counts}
+    return doc
+
+
+class TestTrendingTags(unittest.TestCase):
+    """Test cases for the trending tags engine"""
+
+    def setUp(self):
+        """Set up the service with a private cache and no refresher thread"""
+        self.mock_db = MagicMock()
+        self.trending = TrendingTags(self.mock_db)
+        self.trending.half_life_hours = 6
+
+        self.cache = LRUCache()
+        self.patches = [
+            patch.object(services, 'cache', self.cache),
+            patch('social.services._ensure_refresher')
+        ]
+        for p in self.patches:
+            p.start()
+
+        self.now = datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc)
+
+    def tearDown(self):
+        """Stop patches"""
+        for p in self.patches:
+            p.stop()
+
+    def test_normalize_tag(self):
+        """Test that tags are compared case-insensitively without '#'"""
+        self.assertEqual(normalize_tag(' #Fitness '), 'fitness')
+        self.assertEqual(normalize_tag('#'), '')
+        self.assertEqual(normalize_tag(None), '')
+
+    @patch('social.services.firestore')
+    def test_record_writes_bucket_increments(self, mock_firestore):
+        """Test that tag changes become increments on the post's hour bucket"""
+        mock_firestore.Increment.side_effect = lambda amount: ('inc', amount)
+        batch = MagicMock()
+        created = datetime(2024, 3, 1, 9, 15, tzinfo=timezone.utc)
+
+        self.trending.record(added=['Fitness', '#fitness', 'food'], removed=['old'], at=created, batch=batch)
+
+        self.mock_db.collection.assert_called_with('trending_buckets')
+        self.mock_db.collection.return_value.document.assert_called_with('2024030109')
+        batch.set.assert_called_once_with(
+            self.mock_db.collection.return_value.document.return_value,
+            {'counts': {'fitness': ('inc', 1), 'food': ('inc', 1), 'old': ('inc', -1)}},
+            merge=True
+        )
+
+    def test_record_skips_unchanged_tags(self):
+        """Test that renaming a tag's case is not a change"""
+        batch = MagicMock()
+        self.trending.record(added=['Vegan'], removed=['vegan'], batch=batch)
+        self.trending.record(added=[], batch=batch)
+
+        batch.set.assert_not_called()
+
+    def test_refresh_decays_older_buckets(self):
+        """Test that recent tags outrank larger but older ones"""
+        self.mock_db.get_all.return_value = [
+            make_bucket('2024030112', {'smoothie': 3, 'food': 1}),
+            # Two half-lives old: each count is worth a quarter
+            make_bucket('2024030100', {'food': 10, 'gone': -1})
+        ]
+
+        tags = self.trending.refresh(now=self.now)
+
+        self.assertEqual(len(self.mock_db.get_all.call_args[0][0]), self.trending.window_hours)
+        self.assertEqual(tags, [
+            {'tag': 'food', 'score': 3.5, 'count': 11},
+            {'tag': 'smoothie', 'score': 3.0, 'count': 3}
+        ])
+        self.mock_db.collection('trending').document('tags').set.assert_called_once_with({
+            'tags': tags, 'updatedAt': self.now
+        })
+        self.assertEqual(self.cache.get(TRENDING_CACHE_KEY), tags)
+
+    def test_top_serves_snapshot(self):
+        """Test that trending tags are one read, then cached"""
+        snapshot = MagicMock(exists=True)
+        snapshot.to_dict.return_value = {
+            'tags': [{'tag': 'food', 'score': 2.0, 'count': 2}, {'tag': 'fitness', 'score': 1.0, 'count': 1}],
+            'updatedAt': datetime.now(timezone.utc) - timedelta(seconds=30)
+        }
+        self.mock_db.collection.return_value.document.return_value.get.return_value = snapshot
+
+        self.assertEqual([t['tag'] for t in self.trending.top(1)], ['food'])
+        self.assertEqual(len(self.trending.top(10)), 2)
+
+        self.assertEqual(self.mock_db.collection.return_value.document.return_value.get.call_count, 1)
+        self.mock_db.get_all.assert_not_called()
+
+    @patch('social.services._request_refresh')
+    def test_top_serves_stale_snapshot_while_rescoring(self, mock_request_refresh):
+        """Test that an old snapshot is served and rescored in the background"""
+        snapshot = MagicMock(exists=True)
+        snapshot.to_dict.return_value = {
+            'tags': [{'tag': 'old', 'score': 1.0, 'count': 1}],
+            'updatedAt': datetime.now(timezone.utc) - timedelta(hours=3)
+        }
+        self.mock_db.collection.return_value.document.return_value.get.return_value = snapshot
+
+        self.assertEqual([t['tag'] for t in self.trending.top()], ['old'])
+        mock_request_refresh.assert_called_once()
+        self.mock_db.get_all.assert_not_called()
+
+    def test_refresh_if_stale(self):
+        """Test that the refresher only rescores snapshots past the interval"""
+        snapshot = MagicMock(exists=True)
+        snapshot.to_dict.return_value = {'tags': [], 'updatedAt': datetime.now(timezone.utc)}
+        self.mock_db.collection.return_value.document.return_value.get.return_value = snapshot
+        self.mock_db.get_all.return_value = []
+
+        self.assertIsNone(self.trending.refresh_if_stale())
+        self.mock_db.get_all.assert_not_called()
+
+        snapshot.exists = False
+        self.assertEqual(self.trending.refresh_if_stale(), [])
+        self.mock_db.get_all.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
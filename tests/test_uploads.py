@@ -0,0 +1,327 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+from datetime import datetime, timedelta, timezone
+import sys
+import os
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Mock firebase_admin before importing modules that use it
+import firebase_admin
+firebase_admin.initialize_app = MagicMock()
+firebase_admin.get_app = MagicMock()
+firebase_admin.delete_app = MagicMock()
+firebase_admin.firestore = MagicMock()
+firebase_admin.storage = MagicMock()
+firebase_admin.auth = MagicMock()
+
+from flask import Flask
+from google.api_core.exceptions import NotFound
+from PIL import Image
+
+# Now import the modules we want to test
+from config import Config
+from uploads import routes
+from uploads.services import UploadSessions
+
+
+def jpeg_bytes(size=(300, 200)):
+    """Encode a small JPEG image"""
+    output = io.BytesIO()
+    Image.new('RGB', size, (30, 160, 90)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+class FakeBlob:
+    """Storage object stand-in backed by the fake bucket's dict"""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.size = None
+        self.public_url = f"https://storage.local/{name}"
+
+    def generate_signed_url(self, **kwargs):
+        self.bucket.signed.append((self.name, kwargs))
+        return f"https://storage.local/signed/{self.name}"
+
+    def reload(self):
+        if self.name not in self.bucket.objects:
+            raise NotFound(self.name)
+        self.size = len(self.bucket.objects[self.name])
+
+    def download_as_bytes(self):
+        return self.bucket.objects[self.name]
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket.objects[self.name] = data
+
+    def delete(self):
+        if self.name not in self.bucket.objects:
+            raise NotFound(self.name)
+        del self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    """Local storage emulator stand-in that keeps objects in memory"""
+
+    def __init__(self):
+        self.name = 'test-bucket'
+        self.objects = {}
+        self.signed = []
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+class FakeDocs:
+    """Firestore stand-in holding documents in a dict per collection"""
+
+    def __init__(self):
+        self.data = {}
+
+    def transaction(self):
+        """Transaction stand-in that applies updates immediately"""
+        return MagicMock(update=MagicMock(side_effect=lambda ref, data: ref.update(data)))
+
+    def collection(self, name):
+        docs = self.data.setdefault(name, {})
+        collection = MagicMock()
+        collection.document.side_effect = lambda doc_id: self._document(docs, doc_id)
+        return collection
+
+    def _document(self, docs, doc_id):
+        ref = MagicMock()
+        ref.get.side_effect = lambda transaction=None: MagicMock(
+            exists=doc_id in docs, to_dict=MagicMock(return_value=dict(docs.get(doc_id, {})))
+        )
+        ref.set.side_effect = lambda data: docs.__setitem__(doc_id, dict(data))
+        ref.update.side_effect = lambda data: docs[doc_id].update(data)
+        return ref
+
+
+class TestUploadSessions(unittest.TestCase):
+    """Test cases for direct-to-storage upload sessions"""
+
+    def setUp(self):
+        """Set up fake Firestore and Storage with an existing recipe"""
+        self.db = FakeDocs()
+        self.bucket = FakeBucket()
+        self.sessions = UploadSessions(self.db, self.bucket)
+        self.sessions.emulator_host = None
+
+        self.db.data['recipes'] = {'recipe_1': {'userId': 'user_1', 'imageStoragePath': 'recipes/user_1/old.jpg'}}
+        self.db.data['users'] = {'user_1': {'name': 'Chef'}}
+        self.bucket.objects['recipes/user_1/old.jpg'] = b'old'
+
+        self.workers_patch = patch.object(Config, 'IMAGE_WORKERS', 0)
+        self.workers_patch.start()
+        self.transactional_patch = patch('uploads.services.firestore.transactional', side_effect=lambda f: f)
+        self.transactional_patch.start()
+
+    def tearDown(self):
+        """Stop patches"""
+        self.workers_patch.stop()
+        self.transactional_patch.stop()
+
+    def _open(self, target='recipe', **data):
+        """Open a session for the test user"""
+        data.setdefault('contentType', 'image/jpeg')
+        if target == 'recipe':
+            data.setdefault('recipeId', 'recipe_1')
+        return self.sessions.create('user_1', dict(data, target=target))
+
+    def test_create_returns_signed_url(self):
+        """Test that sessions hand out a signed PUT URL with a size limit"""
+        session = self._open(size=1024)
+
+        self.assertEqual(session['method'], 'PUT')
+        path, kwargs = self.bucket.signed[0]
+        self.assertEqual(path, f"uploads/user_1/{session['upload_id']}")
+        self.assertEqual(kwargs['method'], 'PUT')
+        self.assertEqual(kwargs['content_type'], 'image/jpeg')
+        self.assertEqual(session['headers']['x-goog-content-length-range'], f"0,{Config.IMAGE_MAX_BYTES}")
+        self.assertEqual(self.db.data['upload_sessions'][session['upload_id']]['status'], 'pending')
+
+    def test_create_with_emulator(self):
+        """Test that the Storage emulator gets a media upload URL"""
+        self.sessions.emulator_host = 'localhost:9199'
+        session = self._open(target='profile')
+
+        self.assertEqual(session['method'], 'POST')
+        self.assertTrue(session['upload_url'].startswith(
+            'http://localhost:9199/upload/storage/v1/b/test-bucket/o?uploadType=media&name=uploads%2Fuser_1%2F'
+        ))
+        self.assertEqual(self.bucket.signed, [])
+
+    def test_create_validates(self):
+        """Test that bad targets, types, sizes and other users' recipes are rejected"""
+        self.db.data['recipes']['recipe_2'] = {'userId': 'someone_else'}
+        invalid = [
+            {'target': 'post'},
+            {'target': 'recipe', 'recipeId': None},
+            {'target': 'recipe', 'recipeId': 'recipe_2'},
+            {'target': 'recipe', 'recipeId': 'missing'},
+            {'target': 'profile', 'contentType': 'image/svg+xml'},
+            {'target': 'profile', 'size': Config.IMAGE_MAX_BYTES + 1}
+        ]
+        for data in invalid:
+            with self.subTest(data=data):
+                with self.assertRaises(ValueError):
+                    self._open(**data)
+
+    def test_complete_attaches_recipe_image(self):
+        """Test that the staged file is processed and replaces the recipe image"""
+        session = self._open()
+        staged_path = f"uploads/user_1/{session['upload_id']}"
+        self.bucket.objects[staged_path] = jpeg_bytes()
+
+        result = self.sessions.complete('user_1', session['upload_id'])
+
+        recipe = self.db.data['recipes']['recipe_1']
+        self.assertEqual(result['imageUrl'], recipe['imageUrl'])
+        self.assertEqual(set(recipe['imageVariants']), {'medium', 'thumbnail'})
+        self.assertIn(recipe['imageStoragePath'], self.bucket.objects)
+        # Old image and staged original are gone
+        self.assertNotIn('recipes/user_1/old.jpg', self.bucket.objects)
+        self.assertNotIn(staged_path, self.bucket.objects)
+
+        # Completing again returns the same result without reprocessing
+        self.assertEqual(self.sessions.complete('user_1', session['upload_id']), result)
+
+    @patch('uploads.services.schedule_summary_refresh')
+    def test_complete_attaches_profile_image(self, mock_refresh):
+        """Test that profile uploads set the image and its thumbnail"""
+        session = self._open(target='profile')
+
+        result = self.sessions.complete('user_1', session['upload_id'], data=jpeg_bytes())
+
+        user = self.db.data['users']['user_1']
+        self.assertEqual(user['profile_image_url'], result['imageUrl'])
+        self.assertEqual(user['profile_image_thumbnail_url'], result['imageVariants']['thumbnail'])
+        self.assertTrue(user['profile_image_path'].startswith('profiles/user_1/'))
+
+        # Follower lists pick up the new picture
+        user_id, before, after = mock_refresh.call_args[0]
+        self.assertEqual(user_id, 'user_1')
+        self.assertEqual(after['profile_image_thumbnail_url'], result['imageVariants']['thumbnail'])
+
+    def test_complete_rejects_bad_uploads(self):
+        """Test missing files, non-images, other users and expired sessions"""
+        session = self._open()
+        upload_id = session['upload_id']
+
+        with self.assertRaises(ValueError):
+            self.sessions.complete('user_1', upload_id)
+        with self.assertRaises(ValueError):
+            self.sessions.complete('user_1', upload_id, data=b'<html>not an image</html>')
+        with self.assertRaises(ValueError):
+            self.sessions.complete('user_2', upload_id, data=jpeg_bytes())
+
+        self.db.data['upload_sessions'][upload_id]['expiresAt'] = datetime.now(timezone.utc) - timedelta(seconds=1)
+        with self.assertRaises(ValueError) as context:
+            self.sessions.complete('user_1', upload_id, data=jpeg_bytes())
+        self.assertIn('expired', str(context.exception))
+
+        # The recipe keeps its image
+        self.assertEqual(self.db.data['recipes']['recipe_1']['imageStoragePath'], 'recipes/user_1/old.jpg')
+
+    def test_complete_claims_session(self):
+        """Test that a session being processed can't be completed concurrently"""
+        session = self._open()
+        upload_id = session['upload_id']
+        stored = self.db.data['upload_sessions'][upload_id]
+
+        # Another request claimed the session and is still working
+        stored.update(status='processing', processingAt=datetime.now(timezone.utc))
+        with self.assertRaises(ValueError) as context:
+            self.sessions.complete('user_1', upload_id, data=jpeg_bytes())
+        self.assertIn('already being processed', str(context.exception))
+        self.assertEqual(self.db.data['recipes']['recipe_1']['imageStoragePath'], 'recipes/user_1/old.jpg')
+
+        # An abandoned claim can be taken over
+        stored['processingAt'] = datetime.now(timezone.utc) - timedelta(hours=1)
+        result = self.sessions.complete('user_1', upload_id, data=jpeg_bytes())
+        self.assertEqual(stored['status'], 'completed')
+        self.assertEqual(stored['result'], result)
+
+    def test_failed_completion_releases_claim(self):
+        """Test that a failed attempt leaves the session pending for a retry"""
+        session = self._open()
+        upload_id = session['upload_id']
+
+        with self.assertRaises(ValueError):
+            self.sessions.complete('user_1', upload_id, data=b'not an image')
+        self.assertEqual(self.db.data['upload_sessions'][upload_id]['status'], 'pending')
+
+        self.sessions.complete('user_1', upload_id, data=jpeg_bytes())
+        self.assertEqual(self.db.data['upload_sessions'][upload_id]['status'], 'completed')
+
+
+class TestUploadRoutes(unittest.TestCase):
+    """Test cases for the upload content fallback"""
+
+    def setUp(self):
+        """Set up a test client with a stubbed service and signed-in user"""
+        app = Flask(__name__)
+        app.register_blueprint(routes.uploads_bp, url_prefix='/api/uploads')
+        self.client = app.test_client()
+
+        self.patches = [
+            patch('uploads.routes.upload_sessions'),
+            patch('utils.firebase_admin.get_current_user', return_value={'uid': 'user_1'})
+        ]
+        self.mock_sessions = self.patches[0].start()
+        self.mock_sessions.complete.return_value = {'imageUrl': 'https://storage.local/image.jpg'}
+        for p in self.patches[1:]:
+            p.start()
+
+    def tearDown(self):
+        """Stop patches"""
+        for p in self.patches:
+            p.stop()
+
+    def test_multipart_upload(self):
+        """Test that multipart files are completed without JSON parsing"""
+        image = jpeg_bytes()
+        response = self.client.put(
+            '/api/uploads/upload_1/content',
+            data={'file': (io.BytesIO(image), 'photo.jpg')},
+            content_type='multipart/form-data'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.mock_sessions.complete.assert_called_once_with('user_1', 'upload_1', data=image)
+
+    def test_raw_body_upload(self):
+        """Test that a raw image body is accepted"""
+        image = jpeg_bytes()
+        response = self.client.put('/api/uploads/upload_1/content', data=image,
+                                   content_type='image/jpeg')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.mock_sessions.complete.call_args[1]['data'], image)
+
+    def test_oversized_upload(self):
+        """Test that bodies over the cap are refused before reading"""
+        with patch.object(Config, 'IMAGE_MAX_BYTES', 1024):
+            response = self.client.put('/api/uploads/upload_1/content', data=b'x' * 20000,
+                                       content_type='image/jpeg')
+
+        self.assertEqual(response.status_code, 413)
+        self.mock_sessions.complete.assert_not_called()
+
+    def test_upload_errors(self):
+        """Test that session errors map to 400"""
+        self.mock_sessions.complete.side_effect = ValueError("Upload session has expired")
+        response = self.client.put('/api/uploads/upload_1/content', data=jpeg_bytes(),
+                                   content_type='image/jpeg')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['error'], "Upload session has expired")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import tempfile
+import time
+import requests
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.api_clients import USDAClient
+from utils.usda_cache import USDACache, MemoryLRU
+from utils.monitoring import metrics
+
+
+def json_response(data, status_code=200):
+    """Build a mock HTTP response"""
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    if status_code >= 400:
+        error = requests.exceptions.HTTPError(f"{status_code} Error")
+        error.response = response
+        response.raise_for_status.side_effect = error
+    return response
+
+
+class TestUSDACache(unittest.TestCase):
+    """Test cases for the two-tier USDA cache"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'usda.sqlite3')
+        self.cache = USDACache(path=self.path, memory_entries=2)
+        self.client = USDAClient('test_api_key', 'https://api.nal.usda.gov/fdc/v1', cache=self.cache)
+        metrics.reset()
+
+    def tearDown(self):
+        """Clean up the on-disk store"""
+        self.cache.disk.close()
+        self.tmpdir.cleanup()
+
+    def metric_count(self, name, **tags):
+        """Sum a metric's count across matching tags"""
+        return sum(
+            m['count'] for m in metrics.get_metrics()
+            if m['name'] == name and all(m['tags'].get(k) == v for k, v in tags.items())
+        )
+
+    @patch('requests.Session.get')
+    def test_search_cached_by_normalized_query(self, mock_get):
+        """Test that equivalent searches are served from the cache"""
+        mock_get.return_value = json_response({'foods': [{'description': 'Banana, raw'}]})
+
+        first = self.client.search_foods('Banana')
+        second = self.client.search_foods('  banana ')
+        second['foods'].append('mutated')
+        third = self.client.search_foods('BANANA')
+
+        mock_get.assert_called_once()
+        self.assertEqual(first['foods'][0]['description'], 'Banana, raw')
+        self.assertEqual(len(third['foods']), 1)
+        self.assertEqual(self.metric_count('cache.usda.hit', tier='memory'), 2)
+        self.assertEqual(self.metric_count('cache.usda.miss'), 1)
+
+        # Different parameters are a different entry
+        self.client.search_foods('banana', page_size=1)
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('requests.Session.get')
+    def test_shared_disk_tier(self, mock_get):
+        """Test that another process's cache sees entries on disk"""
+        mock_get.return_value = json_response({'fdcId': 123, 'description': 'Apple'})
+        self.client.get_food_details('123')
+
+        # A second worker has its own memory tier but shares the file
+        other_cache = USDACache(path=self.path)
+        other = USDAClient('test_api_key', 'https://api.nal.usda.gov/fdc/v1', cache=other_cache)
+        food = other.get_food_details('123')
+        other_cache.disk.close()
+
+        mock_get.assert_called_once()
+        self.assertEqual(food['description'], 'Apple')
+        self.assertEqual(self.metric_count('cache.usda.hit', tier='disk'), 1)
+
+    @patch('requests.Session.get')
+    def test_negative_caching(self, mock_get):
+        """Test that misses are cached but transient errors are not"""
+        mock_get.return_value = json_response({'foods': []})
+        self.client.search_foods('unobtainium')
+        result = self.client.search_foods('unobtainium')
+        self.assertEqual(result['foods'], [])
+        self.assertEqual(mock_get.call_count, 1)
+
+        mock_get.reset_mock()
+        mock_get.return_value = json_response({}, status_code=404)
+        self.assertIn('error', self.client.get_food_details('999'))
+        self.assertIn('error', self.client.get_food_details('999'))
+        self.assertEqual(mock_get.call_count, 1)
+
+        mock_get.reset_mock()
+        mock_get.side_effect = requests.exceptions.RequestException("API Error")
+        self.client.get_food_details('555')
+        self.client.get_food_details('555')
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('requests.Session.post')
+    def test_get_foods_uses_cache(self, mock_post):
+        """Test that batch lookups only fetch uncached IDs"""
+        self.cache.store(USDACache.food_key('1'), {'fdcId': 1})
+        mock_post.return_value = json_response([{'fdcId': 2}])
+
+        foods = self.client.get_foods([1, 2, 3])
+
+        self.assertEqual(mock_post.call_args[1]['json'], {'fdcIds': ['2', '3']})
+        self.assertEqual(sorted(foods), ['1', '2'])
+
+        # ID 3 was not returned, so it is now a cached miss
+        foods = self.client.get_foods([2, 3])
+        mock_post.assert_called_once()
+        self.assertEqual(list(foods), ['2'])
+
+    def test_ttl_expiry(self):
+        """Test that expired entries are ignored in both tiers"""
+        cache = USDACache(path=self.path, ttl=60)
+        cache.store('food:1', {'fdcId': 1})
+
+        with patch('time.time', return_value=time.time() + 120):
+            self.assertIs(cache.lookup('food', 'food:1'), USDACache.MISSING)
+        cache.disk.close()
+
+    def test_memory_lru_eviction(self):
+        """Test that the memory tier evicts least recently used entries"""
+        lru = MemoryLRU(max_entries=2)
+        expires_at = time.time() + 60
+        lru.set('a', 1, expires_at)
+        lru.set('b', 2, expires_at)
+        lru.get('a')
+        lru.set('c', 3, expires_at)
+
+        self.assertIsNotNone(lru.get('a'))
+        self.assertIsNone(lru.get('b'))
+        self.assertIsNotNone(lru.get('c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
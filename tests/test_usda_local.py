@@ -0,0 +1,281 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+import os
+import sys
+import json
+import tempfile
+
+# Add the parent directory to the path so we can import our app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+from utils import api_clients
+from utils.api_clients import USDAClient, get_usda_client
+from utils.usda_local import (
+    FoodStoreBuilder, LocalFoodStore, iter_json_foods, normalize_gtin, import_bulk_export
+)
+
+
+def bulk_food(fdc_id, description, gtin=None, calories=100):
+    """Build a food in the bulk export format"""
+    food = {
+        'fdcId': fdc_id,
+        'dataType': 'Branded',
+        'description': description,
+        'brandedFoodCategory': 'Snacks',
+        'foodNutrients': [
+            {'type': 'FoodNutrient', 'nutrient': {'id': 1008, 'number': '208', 'name': 'Energy', 'unitName': 'kcal', 'rank': 300}, 'amount': calories},
+            {'type': 'FoodNutrient', 'nutrient': {'id': 1003, 'number': '203', 'name': 'Protein', 'unitName': 'g', 'rank': 600}, 'amount': 5}
+        ],
+        'foodAttributes': [{'id': 1, 'value': 'unused'}]
+    }
+    if gtin:
+        food['gtinUpc'] = gtin
+    return food
+
+
+class TestJSONStreaming(unittest.TestCase):
+    """Test cases for streaming foods out of a bulk JSON export"""
+
+    def test_iter_json_foods_small_chunks(self):
+        """Test that foods split across reads are decoded whole"""
+        foods = [bulk_food(i, f'Food {i}') for i in range(1, 6)]
+        text = json.dumps({'BrandedFoods': foods}, indent=2)
+
+        streamed = list(iter_json_foods(io.StringIO(text), chunk_size=16))
+
+        self.assertEqual(streamed, foods)
+
+    def test_iter_json_foods_empty_and_truncated(self):
+        """Test empty exports and exports cut off mid-food"""
+        self.assertEqual(list(iter_json_foods(io.StringIO('{"FoundationFoods": []}'))), [])
+
+        text = json.dumps({'BrandedFoods': [bulk_food(1, 'Whole'), bulk_food(2, 'Cut off')]})
+        with self.assertRaises(ValueError):
+            list(iter_json_foods(io.StringIO(text[:-40]), chunk_size=32))
+
+
+class TestLocalFoodStore(unittest.TestCase):
+    """Test cases for building and querying the local store"""
+
+    def setUp(self):
+        """Build a small store"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'foods.sqlite3')
+
+        foods = [
+            bulk_food(1, 'Cheddar cheese, sharp', gtin='012345678905'),
+            bulk_food(2, 'Cheese crackers', gtin='00049000028911'),
+            bulk_food(3, 'Cheddar cheese', calories=400),
+            bulk_food(4, 'Apple juice')
+        ]
+        builder = FoodStoreBuilder(self.path, batch_size=2)
+        builder.import_json(io.StringIO(json.dumps({'BrandedFoods': foods})))
+        builder.finish()
+
+        self.store = LocalFoodStore(self.path)
+
+    def tearDown(self):
+        """Clean up the store"""
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_get_compacts_food(self):
+        """Test lookups by FDC ID return compact food details"""
+        food = self.store.get('3')
+
+        self.assertEqual(food['description'], 'Cheddar cheese')
+        self.assertEqual(food['foodCategory'], {'description': 'Snacks'})
+        self.assertEqual(food['foodNutrients'][0], {
+            'nutrient': {'id': 1008, 'number': '208', 'name': 'Energy', 'unitName': 'kcal'},
+            'amount': 400
+        })
+        self.assertNotIn('foodAttributes', food)
+
+        self.assertIsNone(self.store.get(99))
+        self.assertIsNone(self.store.get('not-an-id'))
+        self.assertEqual(set(self.store.get_many(['1', 4, 99])), {'1', '4'})
+
+    def test_search(self):
+        """Test description search with prefix matching on the last word"""
+        results = self.store.search('CHEDDAR chee')
+
+        # Shorter descriptions rank first
+        self.assertEqual([food['fdcId'] for food in results['foods']], [3, 1])
+        self.assertEqual(results['totalHits'], 2)
+        self.assertEqual(results['foods'][0]['foodNutrients'][0]['nutrientName'], 'Energy')
+        self.assertEqual(results['foods'][0]['foodNutrients'][0]['unitName'], 'KCAL')
+
+        # Earlier words must match whole words
+        self.assertIsNone(self.store.search('ched cheese'))
+        self.assertIsNone(self.store.search('pizza'))
+        self.assertIsNone(self.store.search('  '))
+
+        page = self.store.search('chee', page_size=2, page_number=2)
+        self.assertEqual(page['totalHits'], 3)
+        self.assertEqual(page['totalPages'], 2)
+        self.assertEqual(len(page['foods']), 1)
+
+    def test_get_by_gtin(self):
+        """Test barcode lookups across UPC/EAN/GTIN forms"""
+        self.assertEqual(normalize_gtin('0 12345-678905'), '12345678905')
+
+        self.assertEqual(self.store.get_by_gtin('0012345678905')['fdcId'], 1)
+        self.assertEqual(self.store.get_by_gtin('049000028911')['fdcId'], 2)
+        self.assertIsNone(self.store.get_by_gtin('999'))
+        self.assertIsNone(self.store.get_by_gtin(''))
+
+    def test_rebuild_replaces_store(self):
+        """Test that a failed import leaves the existing store in place"""
+        with self.assertRaises(ValueError):
+            import_bulk_export(os.path.join(self.tmpdir.name, 'foods.txt'), self.path)
+
+        self.assertFalse(os.path.exists(f"{self.path}.building"))
+        self.assertIsNotNone(LocalFoodStore(self.path).get(1))
+
+
+class TestCSVImport(unittest.TestCase):
+    """Test cases for importing the bulk CSV export"""
+
+    def test_import_csv_directory(self):
+        """Test that foods are joined with their nutrients and branded details"""
+        files = {
+            'food.csv': 'fdc_id,data_type,description,food_category_id\n'
+                        '20,sr_legacy_food,"Bananas, raw",9\n'
+                        '10,branded_food,Peanut butter,\n',
+            'nutrient.csv': 'id,name,unit_name,nutrient_nbr\n1008,Energy,KCAL,208\n1003,Protein,G,203\n',
+            'food_category.csv': 'id,code,description\n9,0900,Fruits and Fruit Juices\n',
+            'branded_food.csv': 'fdc_id,brand_owner,gtin_upc,serving_size,serving_size_unit,branded_food_category\n'
+                                '10,Acme,051500255162,32,g,Nut Butters\n',
+            'food_nutrient.csv': 'id,fdc_id,nutrient_id,amount\n'
+                                 '1,20,1008,89\n2,10,1008,588\n3,20,1003,1.09\n4,10,9999,1\n'
+        }
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = os.path.join(tmpdir, 'csv')
+            os.makedirs(source)
+            for name, content in files.items():
+                with open(os.path.join(source, name), 'w') as f:
+                    f.write(content)
+
+            path = os.path.join(tmpdir, 'foods.sqlite3')
+            self.assertEqual(import_bulk_export(source, path), 2)
+
+            store = LocalFoodStore(path)
+            banana = store.get(20)
+            peanut_butter = store.get_by_gtin('51500255162')
+            store.close()
+
+        self.assertEqual(banana['foodCategory'], {'description': 'Fruits and Fruit Juices'})
+        self.assertEqual([(n['nutrient']['name'], n['amount']) for n in banana['foodNutrients']],
+                         [('Energy', 89), ('Protein', 1.09)])
+
+        self.assertEqual(peanut_butter['fdcId'], 10)
+        self.assertEqual(peanut_butter['brandOwner'], 'Acme')
+        self.assertEqual(peanut_butter['servingSize'], 32)
+        self.assertEqual(peanut_butter['foodCategory'], {'description': 'Nut Butters'})
+        # Nutrients missing from nutrient.csv are skipped
+        self.assertEqual(len(peanut_butter['foodNutrients']), 1)
+
+
+class TestLocalFirstClient(unittest.TestCase):
+    """Test cases for serving USDA lookups from the local store"""
+
+    def setUp(self):
+        """Set up a client backed by a small store"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, 'foods.sqlite3')
+        builder = FoodStoreBuilder(path)
+        builder.add_food(bulk_food(1, 'Banana, raw', gtin='000000001234'))
+        builder.finish()
+
+        self.store = LocalFoodStore(path)
+        self.client = USDAClient('test_api_key', 'https://api.nal.usda.gov/fdc/v1', local_store=self.store)
+
+    def tearDown(self):
+        """Clean up the store"""
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    @patch('requests.Session.get')
+    def test_local_hits_skip_api(self, mock_get):
+        """Test that foods in the store never reach the API"""
+        self.assertEqual(self.client.search_foods('banana')['foods'][0]['fdcId'], 1)
+        self.assertEqual(self.client.get_food_details('1')['description'], 'Banana, raw')
+        self.assertEqual(self.client.get_food_by_gtin('1234')['fdcId'], 1)
+        mock_get.assert_not_called()
+
+    @patch('requests.Session.get')
+    def test_misses_fall_back_to_api(self, mock_get):
+        """Test that misses and filtered searches go to the API"""
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {'foods': [{'fdcId': 2, 'description': 'Pizza'}]}
+        mock_get.return_value = response
+
+        self.assertEqual(self.client.search_foods('pizza')['foods'][0]['fdcId'], 2)
+        self.client.search_foods('banana', additional_filters={'dataType': 'Foundation'})
+        self.assertEqual(mock_get.call_count, 2)
+
+        self.client.get_food_details('2')
+        self.assertTrue(mock_get.call_args[0][0].endswith('/food/2'))
+
+    @patch('requests.Session.post')
+    def test_get_foods_fetches_only_missing(self, mock_post):
+        """Test that batch lookups only request foods missing locally"""
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = [{'fdcId': 2, 'description': 'Pizza'}]
+        mock_post.return_value = response
+
+        foods = self.client.get_foods([1, 2])
+
+        self.assertEqual(set(foods), {'1', '2'})
+        self.assertEqual(mock_post.call_args[1]['json'], {'fdcIds': ['2']})
+
+
+class TestClientFactory(unittest.TestCase):
+    """Test cases for building the shared client"""
+
+    def setUp(self):
+        """Start from no shared client"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'foods.sqlite3')
+        self.patches = [
+            patch.object(api_clients, '_usda_client', None),
+            patch.object(Config, 'USDA_CACHE_ENABLED', False)
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        """Stop patches and clean up"""
+        client = api_clients._usda_client
+        if client is not None and client.local_store is not None:
+            client.local_store.close()
+        for p in self.patches:
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def test_uses_built_store(self):
+        """Test that the shared client serves from the configured store"""
+        builder = FoodStoreBuilder(self.path)
+        builder.add_food(bulk_food(1, 'Banana, raw'))
+        builder.finish()
+
+        with patch.object(Config, 'USDA_LOCAL_STORE_PATH', self.path):
+            client = get_usda_client()
+
+        self.assertIsInstance(client.local_store, LocalFoodStore)
+        self.assertEqual(client.get_food_details('1')['description'], 'Banana, raw')
+        self.assertIs(get_usda_client(), client)
+
+    def test_without_store(self):
+        """Test that a missing store file leaves the client API-only"""
+        with patch.object(Config, 'USDA_LOCAL_STORE_PATH', self.path):
+            self.assertIsNone(get_usda_client().local_store)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -329,7 +329,7 @@ def test_favorite_food_item(client, mock_auth_middleware, mock_db, sample_food_i
 def test_search_food_database(client, mock_auth_middleware):
     """Test searching for food items in USDA database"""
     # Mock the USDA API response
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         # Set up mock API response
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -386,7 +386,7 @@ def test_search_food_database(client, mock_auth_middleware):
 def test_food_details(client, mock_auth_middleware):
     """Test getting detailed food information from USDA database"""
     # Mock the USDA API response
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         # Set up mock API response
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -437,7 +437,7 @@ def test_food_details(client, mock_auth_middleware):
 def test_import_food_from_usda(client, mock_auth_middleware, mock_db):
     """Test importing a food item from USDA database"""
     # Mock the USDA API response and Firestore
-    with patch('requests.get') as mock_get, \
+    with patch('requests.Session.get') as mock_get, \
          patch('firebase_admin.firestore.client', return_value=mock_db):
         
         # Set up mock API response
@@ -512,6 +512,7 @@ def test_create_meal(client, mock_auth_middleware, mock_db, sample_food_item):
     
     # Configure get to return food item
     mock_db.collection.return_value.document.return_value.get.return_value = food_doc
+    mock_db.get_all.return_value = [food_doc]
     
     # Test request data
     data = {
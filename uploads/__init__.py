@@ -0,0 +1,3 @@
+from flask import Blueprint
+uploads_bp = Blueprint('uploads', __name__)
+from uploads import routes
\ No newline at end of file
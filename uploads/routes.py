@@ -0,0 +1,79 @@
+from flask import Blueprint, jsonify, request
+from utils.firebase_admin import auth_required
+from utils import images
+from uploads.services import UploadSessions
+from config import Config
+
+# Create blueprint
+uploads_bp = Blueprint('uploads', __name__)
+
+# Initialize service instance
+upload_sessions = UploadSessions()
+
+# Allowance for multipart boundaries and part headers on top of the file
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+@uploads_bp.route('', methods=['POST'])
+@auth_required
+def create_upload(user_id):
+    """Open an upload session and return where to send the file"""
+    try:
+        data = request.get_json() or {}
+        session = upload_sessions.create(user_id, data)
+        return jsonify(session), 201
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f"Failed to create upload: {str(e)}"}), 500
+
+
+@uploads_bp.route('/<upload_id>/complete', methods=['POST'])
+@auth_required
+def complete_upload(user_id, upload_id):
+    """Process the uploaded file and attach it to the session's target"""
+    try:
+        result = upload_sessions.complete(user_id, upload_id)
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f"Failed to complete upload: {str(e)}"}), 500
+
+
+@uploads_bp.route('/<upload_id>/content', methods=['PUT', 'POST'])
+@auth_required
+def upload_content(user_id, upload_id):
+    """Receive the file through the API for clients that can't use the signed URL
+
+    Accepts multipart form data with a 'file' field or the raw image as the
+    request body. Either way the body is streamed and capped rather than
+    parsed as JSON.
+    """
+    max_bytes = Config.IMAGE_MAX_BYTES
+    if request.content_length and request.content_length > max_bytes + MULTIPART_OVERHEAD:
+        return jsonify({'error': f"Image is larger than {max_bytes // (1024 * 1024)} MB"}), 413
+
+    try:
+        if request.mimetype == 'multipart/form-data':
+            # Werkzeug spools large parts to a temporary file
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({'error': "Multipart uploads need a 'file' field"}), 400
+            stream = upload.stream
+        else:
+            stream = request.stream
+
+        data = images.read_capped(iter(lambda: stream.read(images.CHUNK_SIZE), b''), max_bytes)
+        if not data:
+            return jsonify({'error': 'No file was sent'}), 400
+
+        result = upload_sessions.complete(user_id, upload_id, data=data)
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f"Failed to upload image: {str(e)}"}), 500
@@ -0,0 +1,339 @@
+# uploads/services.py
+"""Direct-to-storage image uploads
+
+Clients open an upload session for a target (a recipe's image or their
+profile picture), PUT the file straight to Storage with the signed URL it
+returns, then complete the session. Completion runs the staged file
+through the image pipeline and attaches the result to the target, so the
+image never travels inside a JSON body.
+
+Clients that can't upload to Storage directly may send the file to the
+session's content endpoint instead, as multipart form data or a raw body.
+"""
+import uuid
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+import firebase_admin
+from firebase_admin import firestore
+from google.api_core.exceptions import NotFound
+from config import Config
+from utils import images
+from social.models import schedule_summary_refresh
+
+logger = logging.getLogger(__name__)
+
+# Upload session documents
+SESSIONS_COLLECTION = 'upload_sessions'
+
+# Storage prefix for files waiting to be completed
+STAGING_PREFIX = 'uploads'
+
+# Content types a session may be opened for
+ALLOWED_CONTENT_TYPES = frozenset({'image/jpeg', 'image/png', 'image/gif', 'image/webp'})
+
+# What an upload can be attached to
+TARGET_RECIPE = 'recipe'
+TARGET_PROFILE = 'profile'
+
+STATUS_PENDING = 'pending'
+STATUS_PROCESSING = 'processing'
+STATUS_COMPLETED = 'completed'
+
+# Seconds after which a processing claim is treated as abandoned (e.g. the
+# worker died) and the session may be completed again
+PROCESSING_TIMEOUT = 120
+
+
+class UploadSessions:
+    """Upload sessions for recipe images and profile pictures"""
+
+    def __init__(self, db=None, bucket=None):
+        """Initialize the service with database and storage references
+
+        Args:
+            db: Firestore client
+            bucket: Storage bucket
+        """
+        self.db = db or firebase_admin.firestore.client()
+        self.bucket = bucket or firebase_admin.storage.bucket()
+        self.url_expiry = timedelta(seconds=Config.UPLOAD_URL_EXPIRY)
+        self.emulator_host = Config.STORAGE_EMULATOR_HOST
+
+    def create(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Open an upload session
+
+        Args:
+            user_id: The ID of the uploading user
+            data: Dict containing 'target' ('recipe' or 'profile'),
+                'recipeId' for recipe images, 'contentType' and optionally
+                the file 'size' in bytes
+
+        Returns:
+            Dict containing the 'upload_id' and the 'upload_url', 'method'
+            and 'headers' to send the file with
+
+        Raises:
+            ValueError: If the target, content type or size is invalid
+        """
+        target = data.get('target')
+        recipe_id = data.get('recipeId')
+        if target == TARGET_RECIPE:
+            if not recipe_id:
+                raise ValueError("recipeId is required for recipe images")
+            self._get_recipe(user_id, recipe_id)
+        elif target != TARGET_PROFILE:
+            raise ValueError("target must be 'recipe' or 'profile'")
+
+        content_type = data.get('contentType')
+        if content_type not in ALLOWED_CONTENT_TYPES:
+            raise ValueError("contentType must be one of: " + ', '.join(sorted(ALLOWED_CONTENT_TYPES)))
+
+        max_bytes = Config.IMAGE_MAX_BYTES
+        size = data.get('size')
+        if size is not None and (not isinstance(size, int) or size <= 0 or size > max_bytes):
+            raise ValueError(f"size must be between 1 and {max_bytes} bytes")
+
+        upload_id = str(uuid.uuid4())
+        path = f"{STAGING_PREFIX}/{user_id}/{upload_id}"
+        expires_at = datetime.now(timezone.utc) + self.url_expiry
+
+        self.db.collection(SESSIONS_COLLECTION).document(upload_id).set({
+            'userId': user_id,
+            'target': target,
+            'recipeId': recipe_id if target == TARGET_RECIPE else None,
+            'contentType': content_type,
+            'maxBytes': max_bytes,
+            'path': path,
+            'status': STATUS_PENDING,
+            'createdAt': firestore.SERVER_TIMESTAMP,
+            'expiresAt': expires_at
+        })
+
+        method, url, headers = self.upload_url(path, content_type, max_bytes)
+        return {
+            'upload_id': upload_id,
+            'upload_url': url,
+            'method': method,
+            'headers': headers,
+            'max_bytes': max_bytes,
+            'expires_at': expires_at.isoformat(),
+            'content_url': f"/api/uploads/{upload_id}/content",
+            'complete_url': f"/api/uploads/{upload_id}/complete"
+        }
+
+    def upload_url(self, path: str, content_type: str, max_bytes: int):
+        """Build the URL a client sends a file to
+
+        Against the Storage emulator (STORAGE_EMULATOR_HOST) this is the
+        emulator's media upload endpoint, since emulator credentials can't
+        sign URLs.
+
+        Args:
+            path: Staging path of the file
+            content_type: Content type the client will send
+            max_bytes: Largest accepted file
+
+        Returns:
+            Tuple of (HTTP method, URL, headers the client must send)
+        """
+        if self.emulator_host:
+            host = self.emulator_host if '://' in self.emulator_host else f"http://{self.emulator_host}"
+            url = (f"{host.rstrip('/')}/upload/storage/v1/b/{self.bucket.name}/o"
+                   f"?uploadType=media&name={quote(path, safe='')}")
+            return 'POST', url, {'Content-Type': content_type}
+
+        # Storage rejects bodies outside the signed length range
+        headers = {'Content-Type': content_type, 'x-goog-content-length-range': f"0,{max_bytes}"}
+        url = self.bucket.blob(path).generate_signed_url(
+            version='v4',
+            expiration=self.url_expiry,
+            method='PUT',
+            content_type=content_type,
+            headers={'x-goog-content-length-range': headers['x-goog-content-length-range']}
+        )
+        return 'PUT', url, headers
+
+    def complete(self, user_id: str, upload_id: str, data: Optional[bytes] = None) -> Dict[str, Any]:
+        """Process an uploaded file and attach it to the session's target
+
+        The session is claimed in a transaction (pending -> processing)
+        before the file is processed, so concurrent completions can't both
+        attach an image. Completing a session twice returns the first
+        result; a failed attempt releases the claim so the client can retry.
+
+        Args:
+            user_id: The ID of the uploading user
+            upload_id: The upload session ID
+            data: File bytes sent through the API instead of to Storage
+
+        Returns:
+            Dict containing the 'target', 'recipeId' and the stored
+            'imageUrl' and 'imageVariants'
+
+        Raises:
+            ValueError: If the session is unknown, expired or already being
+                processed, or the file is missing, too large or not a
+                supported image
+        """
+        session_ref = self.db.collection(SESSIONS_COLLECTION).document(upload_id)
+        session = self._claim_session(user_id, session_ref)
+        if session['status'] == STATUS_COMPLETED:
+            return session['result']
+
+        try:
+            result = self._process(user_id, session, data)
+        except Exception:
+            # Release the claim so the upload can be retried
+            session_ref.update({'status': STATUS_PENDING, 'processingAt': None})
+            raise
+
+        session_ref.update({
+            'status': STATUS_COMPLETED,
+            'result': result,
+            'completedAt': firestore.SERVER_TIMESTAMP
+        })
+
+        # The processed copies are stored; the staged original isn't needed
+        try:
+            self.bucket.blob(session['path']).delete()
+        except NotFound:
+            pass
+        except Exception as e:
+            logger.warning(f"Couldn't delete staged upload {session['path']}: {str(e)}")
+
+        return result
+
+    def _claim_session(self, user_id: str, session_ref) -> Dict[str, Any]:
+        """Move a pending session to processing in a transaction
+
+        Returns:
+            The session as read; completed sessions are returned unclaimed
+
+        Raises:
+            ValueError: If the session can't be loaded or another request is
+                processing it
+        """
+        def claim_in_transaction(transaction):
+            session = self._get_session(user_id, session_ref, transaction)
+            if session['status'] == STATUS_COMPLETED:
+                return session
+
+            if session['status'] == STATUS_PROCESSING:
+                started = session.get('processingAt')
+                if isinstance(started, datetime) and (
+                        datetime.now(timezone.utc) - started).total_seconds() < PROCESSING_TIMEOUT:
+                    raise ValueError("Upload is already being processed")
+
+            transaction.update(session_ref, {
+                'status': STATUS_PROCESSING,
+                'processingAt': datetime.now(timezone.utc)
+            })
+            return session
+
+        return firestore.transactional(claim_in_transaction)(self.db.transaction())
+
+    def _process(self, user_id: str, session: Dict[str, Any], data: Optional[bytes]) -> Dict[str, Any]:
+        """Read a claimed session's file and attach it to the target"""
+        staged = self.bucket.blob(session['path'])
+        if data is None:
+            try:
+                staged.reload()
+            except NotFound:
+                raise ValueError("No file has been uploaded for this session")
+            if staged.size is not None and staged.size > session['maxBytes']:
+                images.delete_image(self.bucket, session['path'])
+                raise ValueError(f"Image is larger than {session['maxBytes'] // (1024 * 1024)} MB")
+            data = staged.download_as_bytes()
+        elif len(data) > session['maxBytes']:
+            raise ValueError(f"Image is larger than {session['maxBytes'] // (1024 * 1024)} MB")
+
+        if session['target'] == TARGET_RECIPE:
+            return self._attach_recipe_image(user_id, session['recipeId'], data)
+        return self._attach_profile_image(user_id, data)
+
+    def _get_session(self, user_id: str, session_ref, transaction=None) -> Dict[str, Any]:
+        """Load an upload session owned by a user
+
+        Raises:
+            ValueError: If the session doesn't exist, belongs to someone
+                else or has expired
+        """
+        doc = session_ref.get(transaction=transaction)
+        if not doc.exists:
+            raise ValueError("Upload session not found")
+
+        session = doc.to_dict()
+        if session.get('userId') != user_id:
+            raise ValueError("Upload session not found")
+
+        expires_at = session.get('expiresAt')
+        if session.get('status') != STATUS_COMPLETED and (
+                not isinstance(expires_at, datetime) or expires_at <= datetime.now(timezone.utc)):
+            raise ValueError("Upload session has expired")
+
+        return session
+
+    def _get_recipe(self, user_id: str, recipe_id: str) -> Dict[str, Any]:
+        """Load a recipe owned by a user
+
+        Raises:
+            ValueError: If the recipe doesn't exist or belongs to someone else
+        """
+        doc = self.db.collection('recipes').document(recipe_id).get()
+        if not doc.exists:
+            raise ValueError("Recipe not found")
+
+        recipe = doc.to_dict()
+        if recipe.get('userId') != user_id:
+            raise ValueError("Unauthorized to update this recipe")
+        return recipe
+
+    def _attach_recipe_image(self, user_id: str, recipe_id: str, data: bytes) -> Dict[str, Any]:
+        """Store an image and make it a recipe's image, replacing the old one"""
+        recipe = self._get_recipe(user_id, recipe_id)
+
+        stored = images.store_image(self.bucket, data, f"recipes/{user_id}/{uuid.uuid4()}.jpg")
+        self.db.collection('recipes').document(recipe_id).update({
+            'imageStoragePath': stored['path'],
+            'imageUrl': stored['url'],
+            'imageVariants': stored['variants'],
+            'updatedAt': firestore.SERVER_TIMESTAMP
+        })
+        images.delete_image(self.bucket, recipe.get('imageStoragePath'))
+
+        return {
+            'target': TARGET_RECIPE,
+            'recipeId': recipe_id,
+            'imageUrl': stored['url'],
+            'imageVariants': stored['variants']
+        }
+
+    def _attach_profile_image(self, user_id: str, data: bytes) -> Dict[str, Any]:
+        """Store an image and make it a user's profile picture, replacing the old one"""
+        user_ref = self.db.collection('users').document(user_id)
+        user_doc = user_ref.get()
+        if not user_doc.exists:
+            raise ValueError("User not found")
+
+        stored = images.store_image(self.bucket, data, f"profiles/{user_id}/{uuid.uuid4()}.jpg")
+        update = {
+            'profile_image_url': stored['url'],
+            'profile_image_thumbnail_url': stored['variants'].get('thumbnail'),
+            'profile_image_path': stored['path'],
+            'updated_at': datetime.utcnow()
+        }
+        user_ref.update(update)
+        user = user_doc.to_dict() or {}
+        images.delete_image(self.bucket, user.get('profile_image_path'))
+
+        # Show the new picture in follower lists too
+        schedule_summary_refresh(user_id, user, dict(user, **update))
+
+        return {
+            'target': TARGET_PROFILE,
+            'recipeId': None,
+            'imageUrl': stored['url'],
+            'imageVariants': stored['variants']
+        }
@@ -1,26 +1,191 @@
+import asyncio
+import copy
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import requests
-from typing import Dict, List, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Any, Optional, Callable, Iterable
 import logging
-from urllib.parse import urljoin
 import json
+from utils.usda_cache import USDACache
+from utils.usda_local import LocalFoodStore, open_local_store
+from utils.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# Response codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Upper bound on a single retry delay, in seconds
+MAX_BACKOFF = 30
+
+# Most FDC IDs the USDA /foods endpoint accepts in one call
+USDA_BATCH_SIZE = 20
+
+def create_session(max_connections: int = 10) -> requests.Session:
+    """Create an HTTP session backed by a keep-alive connection pool
+    
+    Connections (and their TLS handshakes) are reused across requests. Each
+    host gets its own pool of at most max_connections connections; callers
+    beyond that wait for a free connection instead of opening new ones.
+    
+    Args:
+        max_connections (int, optional): Connection limit per host. Defaults to 10.
+        
+    Returns:
+        requests.Session: Configured session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 class USDAClient:
-    """Client for interacting with the USDA FoodData Central API"""
+    """Client for interacting with the USDA FoodData Central API
+    
+    A single client should be shared by the whole process (see
+    get_usda_client) so every call reuses the same connection pool. The
+    client is safe to use from multiple threads.
+    """
     
-    def __init__(self, api_key: str, base_url: str):
+    def __init__(self, api_key: str, base_url: str, timeout: Any = (3.05, 10),
+                 max_connections: int = 10, max_retries: int = 3, backoff_factor: float = 0.5,
+                 max_workers: Optional[int] = None, session: Optional[requests.Session] = None,
+                 cache: Optional[USDACache] = None, local_store: Optional[LocalFoodStore] = None):
         """Initialize the USDA API client
         
         Args:
             api_key (str): USDA API key
             base_url (str): Base URL for USDA API
+            timeout (Any, optional): Requests timeout, in seconds or as a
+                (connect, read) tuple. Defaults to (3.05, 10).
+            max_connections (int, optional): Connection limit per host. Defaults to 10.
+            max_retries (int, optional): Retries for transient failures. Defaults to 3.
+            backoff_factor (float, optional): Base retry delay in seconds. Defaults to 0.5.
+            max_workers (int, optional): Concurrent lookups for batch calls.
+                Defaults to max_connections.
+            session (requests.Session, optional): Session to use instead of a new pooled one
+            cache (USDACache, optional): Cache consulted before calling the API
+            local_store (LocalFoodStore, optional): Offline copy of FoodData
+                Central served before the cache and the API
         """
         self.api_key = api_key
-        self.base_url = base_url
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_workers = max_workers or max_connections
+        self.session = session or create_session(max_connections)
+        self.cache = cache
+        self.local_store = local_store
+        self._flights = SingleFlight('usda', clone=copy.deepcopy)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        
+    def _send(self, send: Callable[[Any], requests.Response],
+              deadline: Optional[float] = None) -> requests.Response:
+        """Send a request, retrying transient failures with jittered backoff
+        
+        Args:
+            send (Callable): Function issuing one attempt of the request with
+                the given requests timeout
+            deadline (float, optional): time.monotonic() value after which no
+                attempt is started; each attempt's timeout is cut to fit it
+            
+        Returns:
+            requests.Response: Successful response
+            
+        Raises:
+            requests.exceptions.RequestException: If the request ultimately fails
+        """
+        for attempt in range(self.max_retries + 1):
+            retries_left = attempt < self.max_retries
+            try:
+                response = send(self._attempt_timeout(deadline))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                delay = self._backoff(attempt)
+                if not retries_left or not self._fits(delay, deadline):
+                    raise
+            else:
+                if response.status_code in RETRY_STATUS_CODES and retries_left:
+                    delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                    retrying = self._fits(delay, deadline)
+                else:
+                    retrying = False
+                if not retrying:
+                    response.raise_for_status()  # Raise an exception for HTTP errors
+                    return response
+                
+            time.sleep(delay)
+            
+    def _attempt_timeout(self, deadline: Optional[float]) -> Any:
+        """Get the requests timeout for an attempt, cut to fit a deadline
+        
+        Raises:
+            requests.exceptions.Timeout: If the deadline has passed
+        """
+        if deadline is None:
+            return self.timeout
+            
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout("Lookup deadline passed")
+        if isinstance(self.timeout, tuple):
+            return tuple(min(part, remaining) for part in self.timeout)
+        return min(self.timeout, remaining)
+        
+    @staticmethod
+    def _fits(delay: float, deadline: Optional[float]) -> bool:
+        """Check whether a retry after a delay would start before a deadline"""
+        return deadline is None or time.monotonic() + delay < deadline
+        
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Get the delay before a retry
+        
+        Uses full jitter so concurrent callers don't retry in lockstep, and
+        honors the server's Retry-After hint when it asks for longer.
+        
+        Args:
+            attempt (int): Zero-based attempt that just failed
+            retry_after (str, optional): Retry-After header value
+            
+        Returns:
+            float: Delay in seconds
+        """
+        delay = random.uniform(0, min(MAX_BACKOFF, self.backoff_factor * (2 ** attempt)))
+        
+        if retry_after:
+            try:
+                delay = max(delay, min(MAX_BACKOFF, float(retry_after)))
+            except (TypeError, ValueError):
+                pass
+                
+        return delay
+        
+    def _get(self, path: str, params: Optional[Dict[str, Any]] = None,
+             deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Issue a GET request against the API and decode the response"""
+        url = f"{self.base_url}{path}"
+        params = dict(params or {}, api_key=self.api_key)
+        
+        response = self._send(lambda timeout: self.session.get(url, params=params, timeout=timeout), deadline)
+        return response.json()
+        
+    def _post(self, path: str, body: Dict[str, Any]) -> Any:
+        """Issue a POST request against the API and decode the response"""
+        url = f"{self.base_url}{path}"
+        params = {'api_key': self.api_key}
+        
+        response = self._send(lambda timeout: self.session.post(url, params=params, json=body, timeout=timeout))
+        return response.json()
         
     def search_foods(self, query: str, page_size: int = 25, page_number: int = 1, 
-                    additional_filters: Dict[str, Any] = None) -> Dict[str, Any]:
+                    additional_filters: Dict[str, Any] = None,
+                    deadline: Optional[float] = None) -> Dict[str, Any]:
         """Search for foods in the USDA database
         
         Args:
@@ -28,13 +193,13 @@ class USDAClient:
             page_size (int, optional): Number of results per page. Defaults to 25.
             page_number (int, optional): Page number. Defaults to 1.
             additional_filters (Dict[str, Any], optional): Additional search parameters
+            deadline (float, optional): time.monotonic() value by which API
+                attempts and retries must stop
             
         Returns:
             Dict[str, Any]: Search results
         """
-        url = urljoin(self.base_url, "/foods/search")
         params = {
-            'api_key': self.api_key,
             'query': query,
             'pageSize': page_size,
             'pageNumber': page_number
@@ -43,14 +208,34 @@ class USDAClient:
         # Add any additional filters
         if additional_filters:
             params.update(additional_filters)
+            
+        # The local store only handles plain description searches
+        if self.local_store is not None and not additional_filters:
+            local = self.local_store.search(query, page_size, page_number)
+            if local is not None:
+                return local
+            
+        cache_key = USDACache.search_key(query, {k: v for k, v in params.items() if k != 'query'})
+        if self.cache is not None:
+            cached = self.cache.lookup('search', cache_key)
+            if cached is not USDACache.MISSING:
+                return cached if cached is not None else {"foods": [], "totalHits": 0}
         
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"USDA API search error: {str(e)}")
-            return {"error": str(e), "foods": []}
+        def fetch():
+            try:
+                results = self._get("/foods/search", params, deadline)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"USDA API search error: {str(e)}")
+                return {"error": str(e), "foods": []}
+                
+            if self.cache is not None:
+                # Searches without results are cached as misses
+                self.cache.store(cache_key, results if results.get('foods') else None)
+                
+            return results
+            
+        # Concurrent identical searches share one API call
+        return self._flights.do(cache_key, fetch)
     
     def get_food_details(self, fdc_id: str) -> Dict[str, Any]:
         """Get detailed information for a specific food
@@ -61,18 +246,175 @@ class USDAClient:
         Returns:
             Dict[str, Any]: Food details
         """
-        url = urljoin(self.base_url, f"/food/{fdc_id}")
-        params = {
-            'api_key': self.api_key
-        }
+        if self.local_store is not None:
+            food = self.local_store.get(fdc_id)
+            if food is not None:
+                return food
+            
+        cache_key = USDACache.food_key(fdc_id)
+        if self.cache is not None:
+            cached = self.cache.lookup('food', cache_key)
+            if cached is not USDACache.MISSING:
+                return cached if cached is not None else {"error": f"Food {fdc_id} not found"}
         
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"USDA API food details error: {str(e)}")
-            return {"error": str(e)}
+        def fetch():
+            try:
+                food = self._get(f"/food/{fdc_id}")
+            except requests.exceptions.RequestException as e:
+                logger.error(f"USDA API food details error: {str(e)}")
+                
+                # Remember foods that don't exist, but not transient failures
+                not_found = getattr(getattr(e, 'response', None), 'status_code', None) == 404
+                if self.cache is not None and not_found:
+                    self.cache.store(cache_key, None)
+                    
+                return {"error": str(e)}
+                
+            if self.cache is not None:
+                self.cache.store(cache_key, food)
+                
+            return food
+            
+        # Concurrent requests for the same food share one API call
+        return self._flights.do(cache_key, fetch)
+            
+    def get_foods(self, fdc_ids: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+        """Get detailed information for many foods
+        
+        IDs are sent to the batch endpoint in chunks, and the chunks are
+        fetched concurrently.
+        
+        Args:
+            fdc_ids (Iterable[Any]): FDC IDs of the foods
+            
+        Returns:
+            Dict[str, Dict[str, Any]]: Food details keyed by FDC ID (as a
+                string). Foods that could not be fetched are left out.
+        """
+        unique_ids = list(dict.fromkeys(str(fdc_id) for fdc_id in fdc_ids if fdc_id))
+        
+        foods = self.local_store.get_many(unique_ids) if self.local_store is not None else {}
+        missing_ids = []
+        for fdc_id in unique_ids:
+            if fdc_id in foods:
+                continue
+
+            cached = self.cache.lookup('food', self.cache.food_key(fdc_id)) if self.cache is not None else USDACache.MISSING
+            if cached is USDACache.MISSING:
+                missing_ids.append(fdc_id)
+            elif cached is not None:
+                foods[fdc_id] = cached
+                
+        chunks = [missing_ids[i:i + USDA_BATCH_SIZE] for i in range(0, len(missing_ids), USDA_BATCH_SIZE)]
+        
+        def fetch(chunk):
+            try:
+                return self._post("/foods", {'fdcIds': chunk})
+            except requests.exceptions.RequestException as e:
+                logger.error(f"USDA API batch details error: {str(e)}")
+                return None
+                
+        for chunk, results in zip(chunks, self.map(fetch, chunks)):
+            if results is None:
+                continue
+                
+            fetched = {str(food.get('fdcId')): food for food in results}
+            foods.update(fetched)
+            
+            if self.cache is not None:
+                # IDs the API didn't return are cached as misses
+                for fdc_id in chunk:
+                    self.cache.store(self.cache.food_key(fdc_id), fetched.get(fdc_id))
+                
+        return foods
+        
+    def get_food_by_gtin(self, gtin: str) -> Optional[Dict[str, Any]]:
+        """Get a branded food's details by barcode from the local store
+        
+        The API can't look foods up by GTIN/UPC, so this only answers from
+        the local store.
+        
+        Args:
+            gtin (str): Barcode digits
+            
+        Returns:
+            Optional[Dict[str, Any]]: Food details, or None if not found
+        """
+        if self.local_store is None:
+            return None
+            
+        return self.local_store.get_by_gtin(gtin)
+        
+    def search_many(self, queries: Iterable[str], page_size: int = 1) -> List[Dict[str, Any]]:
+        """Run many searches concurrently
+        
+        Args:
+            queries (Iterable[str]): Search queries
+            page_size (int, optional): Number of results per query. Defaults to 1.
+            
+        Returns:
+            List[Dict[str, Any]]: Search results in query order, with failed
+                searches reported the same way as search_foods
+        """
+        return self.map(lambda query: self.search_foods(query, page_size=page_size), queries)
+        
+    def map(self, func: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        """Apply a function to items on the client's worker pool
+        
+        Args:
+            func (Callable): Function issuing API calls for one item
+            items (Iterable[Any]): Items to process
+            
+        Returns:
+            List[Any]: Results in item order
+        """
+        items = list(items)
+        if len(items) <= 1:
+            return [func(item) for item in items]
+            
+        return list(self._get_executor().map(func, items))
+        
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """Schedule a function on the client's worker pool
+        
+        Args:
+            func (Callable): Function issuing API calls
+            
+        Returns:
+            Future: Future for the function's result
+        """
+        return self._get_executor().submit(func, *args, **kwargs)
+        
+    async def search_foods_async(self, query: str, **kwargs) -> Dict[str, Any]:
+        """Search for foods without blocking the event loop (see search_foods)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), lambda: self.search_foods(query, **kwargs))
+        
+    async def get_food_details_async(self, fdc_id: str) -> Dict[str, Any]:
+        """Get food details without blocking the event loop (see get_food_details)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self.get_food_details, fdc_id)
+        
+    async def search_many_async(self, queries: Iterable[str], page_size: int = 1) -> List[Dict[str, Any]]:
+        """Run many searches concurrently from async code (see search_many)"""
+        return await asyncio.gather(*(
+            self.search_foods_async(query, page_size=page_size) for query in queries
+        ))
+        
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Get the worker pool, creating it on first use"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='usda')
+        return self._executor
+        
+    def close(self):
+        """Release pooled connections and worker threads"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.session.close()
     
     def format_nutrient_data(self, nutrients: List[Dict[str, Any]]) -> Dict[str, float]:
         """Format nutrient data from USDA API to a simplified format
@@ -180,6 +522,9 @@ class USDAClient:
 class BarcodeClient:
     """Client for barcode lookup services"""
     
+    # Shared by all instances so concurrent lookups of a barcode coalesce
+    _flights = SingleFlight('barcode', clone=copy.deepcopy)
+    
     def __init__(self, api_key: Optional[str] = None):
         """Initialize the barcode client
         
@@ -195,6 +540,18 @@ class BarcodeClient:
     def lookup_barcode(self, barcode: str) -> Dict[str, Any]:
         """Look up product information by barcode
         
+        Args:
+            barcode (str): Product barcode (UPC, EAN, etc.)
+            
+        Returns:
+            Dict[str, Any]: Product information
+        """
+        # Concurrent lookups of the same barcode share one set of API calls
+        return self._flights.do(barcode, self._lookup_barcode, barcode)
+        
+    def _lookup_barcode(self, barcode: str) -> Dict[str, Any]:
+        """Look up product information from the barcode services
+        
         Args:
             barcode (str): Product barcode (UPC, EAN, etc.)
             
@@ -423,4 +780,47 @@ class NutritionLabelRecognizer:
             # Similar patterns for other nutrients
             # ...
         
-        return nutrition
\ No newline at end of file
+        return nutrition
+
+
+# Process-wide USDA client, created on first use so each worker process
+# (e.g. after a gunicorn fork) builds its own connection pool
+_usda_client = None
+_usda_client_lock = threading.Lock()
+
+def get_usda_client() -> USDAClient:
+    """Get the shared USDA client configured from application settings
+    
+    Returns:
+        USDAClient: Shared client
+    """
+    global _usda_client
+    
+    if _usda_client is None:
+        with _usda_client_lock:
+            if _usda_client is None:
+                from config import Config
+                
+                cache = None
+                if Config.USDA_CACHE_ENABLED:
+                    cache = USDACache(
+                        path=Config.USDA_CACHE_PATH,
+                        memory_entries=Config.USDA_CACHE_MEMORY_ENTRIES,
+                        ttl=Config.USDA_CACHE_TTL,
+                        negative_ttl=Config.USDA_CACHE_NEGATIVE_TTL
+                    )
+                    
+                # Offline FoodData Central copy, once `manage.py import-usda` has built it
+                local_store = open_local_store(Config.USDA_LOCAL_STORE_PATH)
+                    
+                _usda_client = USDAClient(
+                    Config.USDA_API_KEY,
+                    Config.USDA_API_BASE_URL,
+                    timeout=(Config.USDA_CONNECT_TIMEOUT, Config.USDA_READ_TIMEOUT),
+                    max_connections=Config.USDA_MAX_CONNECTIONS,
+                    max_retries=Config.USDA_MAX_RETRIES,
+                    cache=cache,
+                    local_store=local_store
+                )
+                
+    return _usda_client
@@ -53,6 +53,7 @@ class APIDocumentation:
         self.spec.tag({"name": "recipes", "description": "Recipe management endpoints"})
         self.spec.tag({"name": "nutrition", "description": "Nutrition tracking endpoints"})
         self.spec.tag({"name": "social", "description": "Social features endpoints"})
+        self.spec.tag({"name": "uploads", "description": "Image upload endpoints"})
         
         # Tracked endpoints
         self.endpoints = []
@@ -394,6 +395,7 @@ USER_SCHEMA = {
         "id": {"type": "string"},
         "name": {"type": "string"},
         "profile_image_url": {"type": "string", "nullable": True},
+        "profile_image_thumbnail_url": {"type": "string", "nullable": True},
         "created_at": {"type": "string", "format": "date-time"},
         "updated_at": {"type": "string", "format": "date-time"}
     }
@@ -402,8 +404,10 @@ USER_SCHEMA = {
 PAGINATION_SCHEMA = {
     "type": "object",
     "properties": {
-        "total": {"type": "integer"},
+        "total": {"type": "integer", "nullable": True},
         "limit": {"type": "integer"},
-        "offset": {"type": "integer"}
+        "offset": {"type": "integer"},
+        "next_cursor": {"type": "string", "nullable": True},
+        "has_more": {"type": "boolean"}
     }
 }
\ No newline at end of file
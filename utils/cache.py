@@ -1,77 +1,915 @@
-"""Simple caching utility for improving performance"""
+"""Caching utility for improving performance"""
+import os
+import sys
+import json
 import time
+import uuid
+import heapq
+import pickle
+import logging
 import functools
-import json
 import hashlib
-from flask import current_app
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+from config import Config
+from utils.singleflight import SingleFlight
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Sentinel for missing keys, so cached None values can be told apart
+_MISSING = object()
+
+# Pickle protocol for values stored in Redis (out-of-band buffers, compact framing)
+PICKLE_PROTOCOL = 5
+
+# Expired keys are pruned from the Redis key index once every this many writes
+INDEX_PURGE_INTERVAL = 100
+
+# Errors from unpickling a Redis value written by an incompatible version of
+# the code (a renamed class, a removed module) or corrupted in storage
+UNPICKLE_ERRORS = (pickle.UnpicklingError, AttributeError, ImportError, EOFError, ValueError, TypeError)
+
+def estimate_size(value, depth=0):
+    """Estimate the memory used by a value and its contents
+
+    Args:
+        value: Value to measure
+        depth: Current nesting depth (contents deeper than 8 levels are not counted)
+
+    Returns:
+        Approximate size in bytes
+    """
+    size = sys.getsizeof(value)
+    if depth >= 8:
+        return size
+
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, depth + 1) + estimate_size(v, depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, depth + 1) for item in value)
+
+    return size
+
+class _CacheEntry:
+    """Cached value with its bookkeeping"""
+
+    __slots__ = ('value', 'expires_at', 'size', 'tags')
+
+    def __init__(self, value, expires_at, size, tags):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.tags = tags
+
+class _PrefixIndex:
+    """Trie of cache keys split on ':' for prefix lookups
+
+    Finding the keys under a prefix walks the prefix's segments, then only
+    the subtrees that match, so it costs O(matches) rather than a scan of
+    every key.
+    """
 
-# Simple in-memory cache
-class SimpleCache:
-    """Simple in-memory cache implementation"""
-    
     def __init__(self):
-        self.cache = {}
-        
-    def get(self, key):
+        self.root = {'children': {}, 'keys': set()}
+
+    def add(self, key):
+        """Index a key"""
+        node = self.root
+        for segment in key.split(':'):
+            node = node['children'].setdefault(segment, {'children': {}, 'keys': set()})
+        node['keys'].add(key)
+
+    def remove(self, key):
+        """Remove a key, pruning nodes left empty"""
+        path = [self.root]
+        segments = key.split(':')
+        for segment in segments:
+            node = path[-1]['children'].get(segment)
+            if node is None:
+                return
+            path.append(node)
+
+        path[-1]['keys'].discard(key)
+
+        for depth in range(len(segments), 0, -1):
+            node = path[depth]
+            if node['keys'] or node['children']:
+                break
+            del path[depth - 1]['children'][segments[depth - 1]]
+
+    def find(self, prefix):
+        """Get all indexed keys starting with a prefix
+
+        Args:
+            prefix: Key prefix
+
+        Returns:
+            List of matching keys
+        """
+        *segments, partial = prefix.split(':')
+
+        node = self.root
+        for segment in segments:
+            node = node['children'].get(segment)
+            if node is None:
+                return []
+
+        # The last segment may be incomplete
+        stack = [child for segment, child in node['children'].items() if segment.startswith(partial)]
+        keys = []
+        while stack:
+            node = stack.pop()
+            keys.extend(node['keys'])
+            stack.extend(node['children'].values())
+
+        return keys
+
+    def clear(self):
+        """Remove all keys"""
+        self.root = {'children': {}, 'keys': set()}
+
+class CacheBackend(ABC):
+    """Interface shared by cache backends
+
+    Backends store arbitrary picklable values under string keys, with an
+    optional timeout and tags, and support invalidation by key, key prefix
+    and tag.
+    """
+
+    @abstractmethod
+    def get(self, key, default=None):
+        """Get a value, or default if it is missing or expired"""
+
+    def get_many(self, keys):
+        """Get several values
+
+        Args:
+            keys: Cache keys
+
+        Returns:
+            Dictionary of the keys found and their values
+        """
+        values = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                values[key] = value
+        return values
+
+    @abstractmethod
+    def set(self, key, value, timeout=None, tags=None):
+        """Store a value, optionally expiring after timeout seconds"""
+
+    def set_many(self, mapping, timeout=None, tags=None):
+        """Store several values with the same timeout and tags
+
+        Args:
+            mapping: Dictionary of keys and values
+            timeout: Cache timeout in seconds (None for no expiration)
+            tags: Tags to invalidate the entries by (optional)
+        """
+        for key, value in mapping.items():
+            self.set(key, value, timeout=timeout, tags=tags)
+
+    @abstractmethod
+    def delete(self, key):
+        """Delete a value"""
+
+    @abstractmethod
+    def delete_prefix(self, prefix):
+        """Delete all values whose keys start with a prefix, returning the count"""
+
+    @abstractmethod
+    def delete_tag(self, tag):
+        """Delete all values stored with a tag, returning the count"""
+
+    @abstractmethod
+    def clear(self):
+        """Delete all values"""
+
+    @abstractmethod
+    def stats(self):
+        """Get cache statistics"""
+
+class LRUCache(CacheBackend):
+    """Bounded, thread-safe in-memory cache with LRU eviction and expiry
+
+    The cache holds at most max_entries entries and roughly max_bytes bytes
+    of values, evicting the least recently used entries beyond either
+    limit. Expired entries are removed when read and by a periodic sweep
+    that runs during reads and writes, so they don't linger in idle keys.
+    Entries can be invalidated by key prefix or by tag.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, sweep_interval=30):
+        """Initialize the cache
+
+        Args:
+            max_entries: Maximum number of entries
+            max_bytes: Approximate maximum size of cached values, in bytes
+            sweep_interval: Seconds between sweeps for expired entries
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+
+        self.entries = OrderedDict()
+        self.expiry_heap = []
+        self.prefix_index = _PrefixIndex()
+        self.tag_index = {}
+        self.size = 0
+        self.last_sweep = time.time()
+        self.lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+
+    def get(self, key, default=None):
         """Get a value from the cache
-        
+
         Args:
             key: Cache key
-            
+            default: Value returned when the key is missing or expired
+
         Returns:
-            Cached value or None if not found or expired
-        """
-        if key not in self.cache:
-            return None
-            
-        item = self.cache[key]
-        
-        # Check if expired
-        if item['expires_at'] and time.time() > item['expires_at']:
-            # Remove expired item
-            del self.cache[key]
-            return None
-            
-        return item['value']
-        
-    def set(self, key, value, timeout=None):
+            Cached value or default if not found or expired
+        """
+        now = time.time()
+
+        with self.lock:
+            self._maybe_sweep(now)
+
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            if entry.expires_at is not None and entry.expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def set(self, key, value, timeout=None, tags=None):
         """Set a value in the cache
-        
+
         Args:
             key: Cache key
             value: Value to cache
             timeout: Cache timeout in seconds (None for no expiration)
+            tags: Tags to invalidate the entry by (optional)
         """
-        expires_at = time.time() + timeout if timeout else None
-        
-        self.cache[key] = {
-            'value': value,
-            'expires_at': expires_at
-        }
-        
+        now = time.time()
+        expires_at = now + timeout if timeout else None
+        size = estimate_size(value)
+
+        with self.lock:
+            self._maybe_sweep(now)
+
+            if key in self.entries:
+                self._remove(key)
+
+            # A value larger than the whole cache would just evict everything
+            if size > self.max_bytes:
+                self.rejections += 1
+                return
+
+            entry = _CacheEntry(value, expires_at, size, frozenset(tags or ()))
+            self.entries[key] = entry
+            self.size += size
+            self.prefix_index.add(key)
+            for tag in entry.tags:
+                self.tag_index.setdefault(tag, set()).add(key)
+
+            if expires_at is not None:
+                heapq.heappush(self.expiry_heap, (expires_at, key))
+
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
     def delete(self, key):
         """Delete a value from the cache
-        
+
         Args:
             key: Cache key
         """
-        if key in self.cache:
-            del self.cache[key]
-            
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def delete_prefix(self, prefix):
+        """Delete all values whose keys start with a prefix
+
+        Args:
+            prefix: Key prefix
+
+        Returns:
+            Number of entries deleted
+        """
+        with self.lock:
+            keys = self.prefix_index.find(prefix)
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def delete_tag(self, tag):
+        """Delete all values stored with a tag
+
+        Args:
+            tag: Tag given when the values were set
+
+        Returns:
+            Number of entries deleted
+        """
+        with self.lock:
+            keys = list(self.tag_index.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
     def clear(self):
         """Clear all values from the cache"""
-        self.cache.clear()
+        with self.lock:
+            self.entries.clear()
+            self.expiry_heap = []
+            self.prefix_index.clear()
+            self.tag_index = {}
+            self.size = 0
+
+    def sweep(self):
+        """Remove all expired entries
+
+        Returns:
+            Number of entries removed
+        """
+        now = time.time()
+        removed = 0
+
+        with self.lock:
+            self.last_sweep = now
+
+            while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                expires_at, key = heapq.heappop(self.expiry_heap)
+
+                # Skip heap items left behind by overwritten or deleted keys
+                entry = self.entries.get(key)
+                if entry is not None and entry.expires_at == expires_at:
+                    self._remove(key)
+                    removed += 1
+
+            # Drop stale heap items once they outnumber live entries
+            if len(self.expiry_heap) > 2 * len(self.entries) + 64:
+                self.expiry_heap = [
+                    (entry.expires_at, key) for key, entry in self.entries.items()
+                    if entry.expires_at is not None
+                ]
+                heapq.heapify(self.expiry_heap)
+
+            self.expirations += removed
+
+        return removed
+
+    def stats(self):
+        """Get cache statistics
+
+        Returns:
+            Dictionary of counters and current usage
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'rejections': self.rejections
+            }
+
+    def _maybe_sweep(self, now):
+        """Sweep for expired entries if the sweep interval has passed"""
+        if now - self.last_sweep >= self.sweep_interval:
+            self.sweep()
+
+    def _remove(self, key):
+        """Remove an entry and its index references (lock must be held)"""
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+        self.prefix_index.remove(key)
+
+        for tag in entry.tags:
+            keys = self.tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_index[tag]
+
+class RedisCache(CacheBackend):
+    """Cache shared by all worker processes through Redis
+
+    Values are pickled with their tags and written with pipelined
+    commands. A sorted set of keys (for prefix lookups by range) and one
+    set per tag let prefix and tag invalidation touch only matching keys.
+
+    Each process can keep a small in-memory L1 cache in front of Redis.
+    Every write or invalidation is published on a channel; a listener
+    thread in each process applies it to that process's L1, so L1 entries
+    are at most l1_timeout seconds stale even if a message is lost.
+
+    Redis failures are logged and treated as misses, so the application
+    keeps working (uncached) while Redis is down.
+    """
+
+    def __init__(self, client, namespace='cache', l1=None, l1_timeout=5):
+        """Initialize the cache
+
+        Args:
+            client: redis.Redis client
+            namespace: Prefix for every Redis key used by the cache
+            l1: In-process LRUCache kept in front of Redis (optional)
+            l1_timeout: Maximum seconds an entry is served from L1
+
+        Raises:
+            ImportError: If the redis package is not installed
+        """
+        if redis is None:
+            raise ImportError("RedisCache requires the redis package")
+
+        self.client = client
+        self.namespace = namespace
+        self.l1 = l1
+        self.l1_timeout = l1_timeout
+
+        self.channel = f"{namespace}:_invalidate"
+        self.index_key = f"{namespace}:_index"
+        self.expiry_key = f"{namespace}:_expiry"
+        self.origin = uuid.uuid4().hex
+
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        self._listener_pid = None
+        self._pubsub = None
+        self._closed = False
+
+    def get(self, key, default=None):
+        """Get a value from L1 or Redis
+
+        Args:
+            key: Cache key
+            default: Value returned when the key is missing or expired
+
+        Returns:
+            Cached value or default
+        """
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        """Get several values with one Redis round trip
+
+        Args:
+            keys: Cache keys
+
+        Returns:
+            Dictionary of the keys found and their values
+        """
+        self._ensure_listener()
+
+        keys = list(dict.fromkeys(keys))
+        values = {}
+        remote_keys = []
+        for key in keys:
+            value = self.l1.get(key, _MISSING) if self.l1 is not None else _MISSING
+            if value is _MISSING:
+                remote_keys.append(key)
+            else:
+                values[key] = value
+
+        if remote_keys:
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                for key in remote_keys:
+                    pipe.get(self._key(key))
+                    pipe.pttl(self._key(key))
+                replies = pipe.execute()
+            except redis.exceptions.RedisError as e:
+                self._record_error('read', e)
+                replies = [None, -2] * len(remote_keys)
+
+            undecodable = []
+            for key, data, ttl_ms in zip(remote_keys, replies[::2], replies[1::2]):
+                if data is None:
+                    continue
+
+                try:
+                    value, tags = pickle.loads(data)
+                except UNPICKLE_ERRORS as e:
+                    # Treat it as a miss; the caller's next set replaces it
+                    self._record_error(f"decode of {key}", e)
+                    undecodable.append(key)
+                    continue
+                values[key] = value
+                self._fill_l1(key, value, tags, ttl_ms / 1000 if ttl_ms > 0 else None)
+
+            if undecodable:
+                self._delete_keys(undecodable)
+
+        with self.lock:
+            self.hits += len(values)
+            self.misses += len(keys) - len(values)
+
+        return values
+
+    def set(self, key, value, timeout=None, tags=None):
+        """Store a value in Redis and L1
+
+        Args:
+            key: Cache key
+            value: Picklable value
+            timeout: Cache timeout in seconds (None for no expiration)
+            tags: Tags to invalidate the entry by (optional)
+        """
+        self.set_many({key: value}, timeout=timeout, tags=tags)
+
+    def set_many(self, mapping, timeout=None, tags=None):
+        """Store several values with one Redis round trip
+
+        Args:
+            mapping: Dictionary of keys and values
+            timeout: Cache timeout in seconds (None for no expiration)
+            tags: Tags to invalidate the entries by (optional)
+        """
+        if not mapping:
+            return
+
+        self._ensure_listener()
+        tags = tuple(tags or ())
+        expires_at = time.time() + timeout if timeout else float('inf')
+
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in mapping.items():
+                data = pickle.dumps((value, tags), protocol=PICKLE_PROTOCOL)
+                pipe.set(self._key(key), data, px=int(timeout * 1000) if timeout else None)
+                for tag in tags:
+                    pipe.sadd(self._tag_key(tag), key)
+            pipe.zadd(self.index_key, {key: 0 for key in mapping})
+            pipe.zadd(self.expiry_key, {key: expires_at for key in mapping})
+            pipe.publish(self.channel, self._message('delete', list(mapping)))
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            self._record_error('write', e)
+            return
+
+        for key, value in mapping.items():
+            self._fill_l1(key, value, tags, timeout)
+
+        with self.lock:
+            self.writes += 1
+            purge = self.writes % INDEX_PURGE_INTERVAL == 0
+        if purge:
+            self._purge_index()
+
+    def delete(self, key):
+        """Delete a value everywhere
+
+        Args:
+            key: Cache key
+        """
+        self._delete_keys([key])
+        self._broadcast('delete', [key])
+
+    def delete_prefix(self, prefix):
+        """Delete all values whose keys start with a prefix
+
+        Args:
+            prefix: Key prefix
+
+        Returns:
+            Number of entries deleted from Redis
+        """
+        if prefix:
+            start, end = b'[' + prefix.encode(), b'[' + prefix.encode() + b'\xff'
+        else:
+            start, end = '-', '+'
+
+        try:
+            keys = [key.decode() for key in self.client.zrangebylex(self.index_key, start, end)]
+        except redis.exceptions.RedisError as e:
+            self._record_error('invalidate', e)
+            keys = []
+
+        deleted = self._delete_keys(keys)
+        if self.l1 is not None:
+            self.l1.delete_prefix(prefix)
+        self._broadcast('prefix', prefix)
+        return deleted
+
+    def delete_tag(self, tag):
+        """Delete all values stored with a tag
+
+        Args:
+            tag: Tag given when the values were set
+
+        Returns:
+            Number of entries deleted from Redis
+        """
+        try:
+            keys = [key.decode() for key in self.client.smembers(self._tag_key(tag))]
+            self.client.delete(self._tag_key(tag))
+        except redis.exceptions.RedisError as e:
+            self._record_error('invalidate', e)
+            keys = []
+
+        deleted = self._delete_keys(keys)
+        if self.l1 is not None:
+            self.l1.delete_tag(tag)
+        self._broadcast('tag', tag)
+        return deleted
+
+    def clear(self):
+        """Delete all values in the namespace"""
+        try:
+            keys = [key.decode() for key in self.client.zrange(self.index_key, 0, -1)]
+            self._delete_keys(keys)
+            tag_keys = list(self.client.scan_iter(match=self._tag_key('*')))
+            if tag_keys:
+                self.client.delete(*tag_keys)
+        except redis.exceptions.RedisError as e:
+            self._record_error('invalidate', e)
+
+        if self.l1 is not None:
+            self.l1.clear()
+        self._broadcast('clear', None)
+
+    def stats(self):
+        """Get cache statistics
+
+        Returns:
+            Dictionary of counters, including the L1's statistics
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'backend': 'redis',
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'errors': self.errors
+            }
+
+        if self.l1 is not None:
+            stats['l1'] = self.l1.stats()
+        return stats
+
+    def close(self):
+        """Stop the invalidation listener"""
+        self._closed = True
+        if self._pubsub is not None:
+            try:
+                self._pubsub.close()
+            except Exception:
+                pass
+
+    def _key(self, key):
+        """Redis key for a cache key"""
+        return f"{self.namespace}:{key}"
+
+    def _tag_key(self, tag):
+        """Redis key of the set of cache keys stored with a tag"""
+        return f"{self.namespace}:_tag:{tag}"
+
+    def _fill_l1(self, key, value, tags, timeout):
+        """Keep a value in L1 for at most l1_timeout seconds"""
+        if self.l1 is None:
+            return
+
+        l1_timeout = self.l1_timeout if timeout is None else min(self.l1_timeout, timeout)
+        if l1_timeout > 0:
+            self.l1.set(key, value, timeout=l1_timeout, tags=tags)
+
+    def _delete_keys(self, keys):
+        """Delete keys from Redis, the key index and L1
+
+        Returns:
+            Number of keys that existed in Redis
+        """
+        if self.l1 is not None:
+            for key in keys:
+                self.l1.delete(key)
+
+        deleted = 0
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                pipe.delete(*[self._key(key) for key in chunk])
+                pipe.zrem(self.index_key, *chunk)
+                pipe.zrem(self.expiry_key, *chunk)
+                deleted += pipe.execute()[0]
+            except redis.exceptions.RedisError as e:
+                self._record_error('invalidate', e)
+
+        return deleted
+
+    def _purge_index(self):
+        """Drop keys that have expired in Redis from the key index"""
+        try:
+            expired = self.client.zrangebyscore(self.expiry_key, '-inf', time.time(), start=0, num=1000)
+            if expired:
+                pipe = self.client.pipeline(transaction=False)
+                pipe.zrem(self.index_key, *expired)
+                pipe.zrem(self.expiry_key, *expired)
+                pipe.execute()
+        except redis.exceptions.RedisError as e:
+            self._record_error('purge', e)
+
+    def _message(self, op, arg):
+        """Encode an invalidation message"""
+        return json.dumps({'origin': self.origin, 'op': op, 'arg': arg})
+
+    def _broadcast(self, op, arg):
+        """Tell other processes to apply an invalidation to their L1"""
+        try:
+            self.client.publish(self.channel, self._message(op, arg))
+        except redis.exceptions.RedisError as e:
+            self._record_error('publish', e)
+
+    def _handle_message(self, data):
+        """Apply an invalidation message from another process to L1"""
+        if self.l1 is None or data is None:
+            return
+
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+
+        if message.get('origin') == self.origin:
+            return
+
+        op, arg = message.get('op'), message.get('arg')
+        if op == 'delete':
+            for key in arg:
+                self.l1.delete(key)
+        elif op == 'prefix':
+            self.l1.delete_prefix(arg)
+        elif op == 'tag':
+            self.l1.delete_tag(arg)
+        elif op == 'clear':
+            self.l1.clear()
+
+    def _ensure_listener(self):
+        """Start the invalidation listener in this process if needed
+
+        The check is per process ID, so each forked worker starts its own.
+        """
+        if self.l1 is None or self._closed or self._listener_pid == os.getpid():
+            return
+
+        with self.lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+
+        # Anything inherited from the parent process may already be stale
+        self.l1.clear()
+        threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def _listen(self):
+        """Apply invalidation messages to L1 until closed, reconnecting on errors"""
+        while not self._closed:
+            try:
+                self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(self.channel)
+                for message in self._pubsub.listen():
+                    if self._closed:
+                        return
+                    self._handle_message(message.get('data'))
+            except Exception as e:
+                if self._closed:
+                    return
+                self._record_error('subscribe', e)
+
+                # Messages sent while disconnected are lost, so start over
+                self.l1.clear()
+                time.sleep(1)
+
+    def _record_error(self, operation, error):
+        """Log a Redis failure"""
+        with self.lock:
+            self.errors += 1
+        logger.warning(f"Redis cache {operation} failed: {str(error)}")
+
+def create_cache():
+    """Create the cache backend selected by the CACHE_BACKEND setting
+
+    Returns:
+        RedisCache (with an in-process L1) when CACHE_BACKEND is 'redis' and
+        REDIS_URL is set, otherwise an in-process LRUCache
+    """
+    local = LRUCache(
+        max_entries=Config.CACHE_MAX_ENTRIES,
+        max_bytes=Config.CACHE_MAX_BYTES,
+        sweep_interval=Config.CACHE_SWEEP_INTERVAL
+    )
+
+    if Config.CACHE_BACKEND == 'redis':
+        if redis is None:
+            logger.warning("CACHE_BACKEND is 'redis' but the redis package is not installed; using in-process cache")
+        elif Config.REDIS_URL:
+            return RedisCache(
+                redis.from_url(Config.REDIS_URL),
+                namespace=Config.CACHE_REDIS_NAMESPACE,
+                l1=local,
+                l1_timeout=Config.CACHE_L1_TIMEOUT
+            )
+        else:
+            logger.warning("CACHE_BACKEND is 'redis' but REDIS_URL is not set; using in-process cache")
+
+    return local
 
 # Create singleton cache instance
-cache = SimpleCache()
+cache = create_cache()
+
+# Coalesces concurrent computations of the same cold key
+_flights = SingleFlight('cached')
+
+# Runs stale-while-revalidate refreshes, created on first use
+_refresh_executor = None
+_refresh_executor_lock = threading.Lock()
+
+def _refresh_in_background(cache_key, compute):
+    """Recompute a stale entry on a background thread
+
+    Does nothing if the key is already being computed.
+
+    Args:
+        cache_key: Cache key of the stale entry
+        compute: Function recomputing and storing the entry
+    """
+    global _refresh_executor
 
-def cached(timeout=None, key_prefix=''):
+    if _flights.in_flight(cache_key):
+        return
+
+    with _refresh_executor_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='cache-refresh')
+
+    # Cached functions may read app config, so keep the app context
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def refresh():
+        try:
+            if app is not None:
+                with app.app_context():
+                    _flights.do(cache_key, compute)
+            else:
+                _flights.do(cache_key, compute)
+        except Exception as e:
+            logger.warning(f"Background refresh of {cache_key} failed: {str(e)}")
+
+    _refresh_executor.submit(refresh)
+
+def cached(timeout=None, key_prefix='', tags=None, stale_ttl=0):
     """Decorator to cache function results
-    
+
+    Concurrent calls that miss the cache for the same arguments share one
+    call of the function. With stale_ttl, results past their timeout are
+    still returned for up to stale_ttl more seconds while a single
+    background call refreshes them.
+
     Args:
         timeout: Cache timeout in seconds (defaults to DEFAULT_CACHE_TIMEOUT config)
         key_prefix: Prefix for cache key
-        
+        tags: Tags to store the results with, for invalidate_tags (optional)
+        stale_ttl: Seconds an expired result may be served while it is refreshed
+
     Returns:
         Decorated function
     """
@@ -83,33 +921,39 @@ def cached(timeout=None, key_prefix=''):
                 cache_timeout = current_app.config.get('DEFAULT_CACHE_TIMEOUT', 300)
             else:
                 cache_timeout = timeout
-                
+
             # Skip caching if timeout is 0
             if cache_timeout == 0:
                 return f(*args, **kwargs)
-                
+
             # Generate cache key
             cache_key = _make_cache_key(f, key_prefix, args, kwargs)
-            
+
+            def compute():
+                # Call the function and cache the result with its freshness deadline
+                value = f(*args, **kwargs)
+                fresh_until = time.time() + cache_timeout if stale_ttl else None
+                cache.set(cache_key, (value, fresh_until), timeout=cache_timeout + stale_ttl, tags=tags)
+                return value
+
             # Try to get from cache
-            value = cache.get(cache_key)
-            if value is not None:
+            entry = cache.get(cache_key, _MISSING)
+            if entry is not _MISSING:
+                value, fresh_until = entry
+                if fresh_until is not None and time.time() >= fresh_until:
+                    _refresh_in_background(cache_key, compute)
                 return value
-                
-            # Call the function and cache the result
-            value = f(*args, **kwargs)
-            cache.set(cache_key, value, timeout=cache_timeout)
-            
-            return value
+
+            return _flights.do(cache_key, compute)
         return decorated_function
     return decorator
 
 def invalidate(key_prefix):
     """Decorator to invalidate cache entries
-    
+
     Args:
         key_prefix: Prefix of cache keys to invalidate
-        
+
     Returns:
         Decorated function
     """
@@ -118,47 +962,64 @@ def invalidate(key_prefix):
         def decorated_function(*args, **kwargs):
             # Call the function
             result = f(*args, **kwargs)
-            
+
             # Invalidate cache entries with the given prefix
-            keys_to_delete = []
-            for key in cache.cache.keys():
-                if key.startswith(key_prefix):
-                    keys_to_delete.append(key)
-                    
-            for key in keys_to_delete:
-                cache.delete(key)
-                
+            cache.delete_prefix(key_prefix)
+
+            return result
+        return decorated_function
+    return decorator
+
+def invalidate_tags(*tags):
+    """Decorator to invalidate cache entries stored with any of the given tags
+
+    Args:
+        tags: Tags to invalidate
+
+    Returns:
+        Decorated function
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            result = f(*args, **kwargs)
+
+            for tag in tags:
+                cache.delete_tag(tag)
+
             return result
         return decorated_function
     return decorator
 
 def _make_cache_key(f, key_prefix, args, kwargs):
     """Generate a cache key for a function call
-    
+
     Args:
         f: Function being called
         key_prefix: Prefix for the cache key
         args: Positional arguments
         kwargs: Keyword arguments
-        
+
     Returns:
         Cache key string
     """
     # Start with prefix and function name
     key_parts = [key_prefix, f.__module__, f.__name__]
-    
+
     # Add stringified args and kwargs
     for arg in args:
         key_parts.append(str(arg))
-        
+
     for k, v in sorted(kwargs.items()):
         key_parts.append(f"{k}:{v}")
-        
+
     # Join with colons
     key = ':'.join(key_parts)
-    
-    # Hash if the key is too long
+
+    # Hash the arguments if the key is too long, keeping the prefix so
+    # prefix invalidation still finds it
     if len(key) > 250:
-        key = hashlib.md5(key.encode()).hexdigest()
-        
-    return key
\ No newline at end of file
+        digest = hashlib.md5(':'.join(key_parts[3:]).encode()).hexdigest()
+        key = ':'.join(key_parts[:3] + [digest])
+
+    return key
@@ -0,0 +1,368 @@
+"""Sharded counters for frequently updated document fields
+
+Firestore sustains roughly one write per second on a single document, so
+counters that many users bump at once (likes on a viral post, a popular
+user's followers) are spread over shard documents in a counter_shards
+subcollection. Each increment lands on a random shard; reads sum the
+shards in one batched get_all and are cached briefly.
+
+The parent document keeps a copy of each total for queries that sort or
+filter on it. Each increment also marks its shard dirty (the _dirty map of
+changed fields and a _dirtyAt timestamp), in the same write. A background
+reconciler finds dirty shards with a collection group query on _dirtyAt,
+rolls their sums into the parent fields and clears the marks, so totals
+still reach the parent if the process that incremented them exits first.
+A mark is only cleared if its shard hasn't changed since it was summed.
+The query needs the collection group index on counter_shards._dirtyAt.
+
+Shards only hold increments until a field is seeded: seeding adds the
+parent's stored value onto shard 0 and marks the field in that shard's
+_seeded map, in one transaction. Until then a field's total is the
+parent's value plus the shard sums, so counts stored before sharding are
+kept whether or not migration 006 has run yet. The reconciler seeds a
+field before it first writes a total back to the parent.
+"""
+import os
+import time
+import random
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+import firebase_admin
+from firebase_admin import firestore
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from config import Config
+from utils.cache import cache
+from utils.monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+# Subcollection holding the shards of a document's counters
+SHARDS_COLLECTION = 'counter_shards'
+
+# Map on shard 0 of the fields whose parent value has been added to the shards
+SEEDED_FIELD = '_seeded'
+
+# Map on each shard of the fields incremented since the last reconcile, and
+# when the shard was last incremented
+DIRTY_FIELD = '_dirty'
+DIRTY_AT_FIELD = '_dirtyAt'
+
+# Dirty shards read per query page by the reconciler
+RECONCILE_PAGE_SIZE = 500
+
+# Reconciler thread for this process, keyed by PID so forks start their own
+_reconciler_pid = None
+_reconciler_lock = threading.Lock()
+
+
+class ShardedCounter:
+    """Counter fields spread over shard documents
+
+    The shard count may be raised but never lowered: shards beyond the
+    configured count are not read.
+    """
+
+    def __init__(self, db=None, num_shards: Optional[int] = None):
+        """Initialize the counter with database reference
+
+        Args:
+            db: Firestore client
+            num_shards: Shards per document (defaults to COUNTER_SHARDS)
+        """
+        self.db = db or firebase_admin.firestore.client()
+        self.num_shards = num_shards or Config.COUNTER_SHARDS
+        self.cache_timeout = Config.COUNTER_CACHE_TIMEOUT
+
+    def shard_refs(self, doc_ref) -> List[Any]:
+        """Get the shard document references of a document
+
+        Args:
+            doc_ref: Parent document reference
+
+        Returns:
+            List of shard document references
+        """
+        shards = doc_ref.collection(SHARDS_COLLECTION)
+        return [shards.document(str(index)) for index in range(self.num_shards)]
+
+    def increment(self, doc_ref, field: str, amount: int = 1, batch=None):
+        """Add to a counter on a random shard
+
+        Args:
+            doc_ref: Parent document reference
+            field: Counter field name
+            amount: Amount to add (negative to subtract)
+            batch: Optional write batch to add the write to; the caller commits it
+        """
+        shard_ref = doc_ref.collection(SHARDS_COLLECTION).document(str(random.randrange(self.num_shards)))
+        data = {
+            field: firestore.Increment(amount),
+            DIRTY_FIELD: {field: True},
+            DIRTY_AT_FIELD: firestore.SERVER_TIMESTAMP
+        }
+
+        if batch is not None:
+            batch.set(shard_ref, data, merge=True)
+        else:
+            shard_ref.set(data, merge=True)
+
+        cache.delete(self._cache_key(doc_ref))
+        _ensure_reconciler()
+
+    def get(self, doc_ref, fields: Iterable[str], fallback: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+        """Read counter totals for a document
+
+        Args:
+            doc_ref: Parent document reference
+            fields: Counter field names
+            fallback: Parent document data, used as the base of counters that
+                haven't been seeded; read from the database if not given
+
+        Returns:
+            Dict mapping each field to its total
+        """
+        return self.get_many([doc_ref], fields, [fallback])[doc_ref.path]
+
+    def get_many(self, doc_refs: List[Any], fields: Iterable[str],
+                 fallbacks: Optional[List[Optional[Dict[str, Any]]]] = None) -> Dict[str, Dict[str, int]]:
+        """Read counter totals for several documents in one batched read
+
+        Args:
+            doc_refs: Parent document references
+            fields: Counter field names
+            fallbacks: Parent document data for each reference, used as the
+                base of counters that haven't been seeded; documents without
+                one are read in the same batch
+
+        Returns:
+            Dict mapping each document path to a dict of field totals
+        """
+        fields = list(fields)
+        fallbacks = fallbacks or [None] * len(doc_refs)
+
+        totals = {}
+        missing = {}
+        for doc_ref, fallback in zip(doc_refs, fallbacks):
+            if doc_ref.path in totals or doc_ref.path in missing:
+                continue
+            cached = cache.get(self._cache_key(doc_ref))
+            if cached is not None and all(field in cached for field in fields):
+                totals[doc_ref.path] = {field: cached[field] for field in fields}
+            else:
+                missing[doc_ref.path] = (doc_ref, fallback)
+
+        metrics.record('counters.cache.hit', len(totals))
+        if not missing:
+            return totals
+
+        # Sum every shard of every uncached document in one read, along with
+        # the parents whose data wasn't passed in
+        sums = {path: {} for path in missing}
+        seeded = {path: set() for path in missing}
+        bases = {path: fallback for path, (_, fallback) in missing.items()}
+        refs = [shard_ref for doc_ref, _ in missing.values() for shard_ref in self.shard_refs(doc_ref)]
+        refs += [doc_ref for doc_ref, fallback in missing.values() if fallback is None]
+        for doc in self.db.get_all(refs):
+            if not doc.exists:
+                continue
+            if doc.reference.path in missing:
+                bases[doc.reference.path] = doc.to_dict() or {}
+                continue
+            parent_path = doc.reference.parent.parent.path
+            self._add_shard(doc.to_dict(), sums[parent_path], seeded[parent_path])
+
+        for path, (doc_ref, _) in missing.items():
+            result = {
+                field: sums[path].get(field, 0) + (
+                    0 if field in seeded[path] else int((bases[path] or {}).get(field) or 0)
+                )
+                for field in fields
+            }
+            totals[path] = result
+            cache.set(self._cache_key(doc_ref), result, timeout=self.cache_timeout)
+
+        return totals
+
+    def seed(self, doc_ref, fields: Iterable[str]) -> List[str]:
+        """Add the parent's stored values onto the shards
+
+        Runs in a transaction that reads shard 0 and the parent, so it is
+        safe alongside concurrent increments and adds each value only once.
+        Seeding again leaves the totals unchanged.
+
+        Args:
+            doc_ref: Parent document reference
+            fields: Counter field names
+
+        Returns:
+            Fields seeded by this call
+        """
+        fields = list(fields)
+        shard_ref = self.shard_refs(doc_ref)[0]
+
+        def seed_in_transaction(transaction):
+            shard = shard_ref.get(transaction=transaction)
+            done = (shard.to_dict() or {}).get(SEEDED_FIELD, {}) if shard.exists else {}
+            pending = [field for field in fields if not done.get(field)]
+            if not pending:
+                return []
+
+            parent = doc_ref.get(transaction=transaction)
+            if not parent.exists:
+                return []
+            data = parent.to_dict() or {}
+
+            values = {field: firestore.Increment(int(data.get(field) or 0)) for field in pending}
+            values[SEEDED_FIELD] = {field: True for field in pending}
+            transaction.set(shard_ref, values, merge=True)
+            return pending
+
+        seeded = firestore.transactional(seed_in_transaction)(self.db.transaction())
+        if seeded:
+            cache.delete(self._cache_key(doc_ref))
+        return seeded
+
+    def delete(self, doc_ref):
+        """Delete a document's shards
+
+        Args:
+            doc_ref: Parent document reference
+        """
+        batch = self.db.batch()
+        for shard_ref in self.shard_refs(doc_ref):
+            batch.delete(shard_ref)
+        batch.commit()
+        cache.delete(self._cache_key(doc_ref))
+
+    def reconcile(self, doc_ref, fields: Iterable[str]) -> Dict[str, int]:
+        """Copy shard totals into the parent document's fields
+
+        Fields are seeded first, so the parent's stored value is carried
+        into the total rather than overwritten. Afterwards the dirty marks
+        of shards whose changed fields were all written are cleared.
+
+        Args:
+            doc_ref: Parent document reference
+            fields: Counter field names
+
+        Returns:
+            Dict mapping each reconciled field to its total
+
+        Raises:
+            NotFound: If the parent document doesn't exist
+        """
+        fields = list(fields)
+        self.seed(doc_ref, fields)
+
+        sums = {}
+        seeded = set()
+        shard_docs = []
+        parent_exists = False
+        for doc in self.db.get_all(self.shard_refs(doc_ref) + [doc_ref]):
+            if doc.reference.path == doc_ref.path:
+                parent_exists = doc.exists
+            elif doc.exists:
+                shard_docs.append(doc)
+                self._add_shard(doc.to_dict(), sums, seeded)
+        if not parent_exists:
+            raise NotFound(f"{doc_ref.path} was deleted")
+
+        # Only write totals that include the parent's original value
+        sums = {field: sums.get(field, 0) for field in fields if field in seeded}
+        if sums:
+            doc_ref.update(sums)
+
+        for shard_doc in shard_docs:
+            dirty = {name for name, changed in ((shard_doc.to_dict() or {}).get(DIRTY_FIELD) or {}).items() if changed}
+            if dirty and dirty <= set(sums):
+                self._clear_dirty(shard_doc)
+        return sums
+
+    def reconcile_dirty(self) -> int:
+        """Reconcile every document with dirty shards
+
+        Returns:
+            Number of documents reconciled
+        """
+        pending = {}
+        query = self.db.collection_group(SHARDS_COLLECTION).order_by(DIRTY_AT_FIELD).limit(RECONCILE_PAGE_SIZE)
+        last = None
+        while True:
+            page = list((query.start_after(last) if last is not None else query).stream())
+            for shard_doc in page:
+                doc_ref = shard_doc.reference.parent.parent
+                dirty = (shard_doc.to_dict() or {}).get(DIRTY_FIELD) or {}
+                _, fields = pending.setdefault(doc_ref.path, (doc_ref, set()))
+                fields.update(name for name, changed in dirty.items() if changed)
+            if len(page) < RECONCILE_PAGE_SIZE:
+                break
+            last = page[-1]
+
+        reconciled = 0
+        for path, (doc_ref, fields) in pending.items():
+            try:
+                self.reconcile(doc_ref, fields)
+                reconciled += 1
+            except NotFound:
+                # The parent document was deleted; drop its orphaned shards
+                self.delete(doc_ref)
+            except Exception as e:
+                # The shards stay dirty and are retried on the next run
+                logger.warning(f"Reconciling counters for {path} failed: {str(e)}")
+
+        metrics.record('counters.reconciled', reconciled)
+        return reconciled
+
+    def _clear_dirty(self, shard_doc):
+        """Clear a shard's dirty marks unless it changed after it was read"""
+        try:
+            shard_doc.reference.update(
+                {DIRTY_FIELD: firestore.DELETE_FIELD, DIRTY_AT_FIELD: firestore.DELETE_FIELD},
+                option=self.db.write_option(last_update_time=shard_doc.update_time)
+            )
+        except (FailedPrecondition, NotFound):
+            # Incremented (or deleted) since; the next run picks it up
+            pass
+
+    @staticmethod
+    def _add_shard(data: Optional[Dict[str, Any]], sums: Dict[str, int], seeded: set):
+        """Add a shard's values to running sums and collect its seeded fields"""
+        for field, value in (data or {}).items():
+            if field == SEEDED_FIELD:
+                seeded.update(name for name, done in value.items() if done)
+            elif field not in (DIRTY_FIELD, DIRTY_AT_FIELD):
+                sums[field] = sums.get(field, 0) + value
+
+    def _cache_key(self, doc_ref) -> str:
+        """Get the cache key for a document's counter totals"""
+        return f"counters:{doc_ref.path}"
+
+
+def _reconcile_loop(interval: float):
+    """Periodically reconcile dirty counters"""
+    counter = None
+    while True:
+        time.sleep(interval)
+        try:
+            counter = counter or ShardedCounter()
+            counter.reconcile_dirty()
+        except Exception as e:
+            logger.error(f"Counter reconciler failed: {str(e)}")
+
+
+def _ensure_reconciler():
+    """Start the reconciler thread for this process if it isn't running"""
+    global _reconciler_pid
+    if _reconciler_pid == os.getpid():
+        return
+
+    with _reconciler_lock:
+        if _reconciler_pid == os.getpid():
+            return
+        _reconciler_pid = os.getpid()
+
+    thread = threading.Thread(
+        target=_reconcile_loop, args=(Config.COUNTER_RECONCILE_INTERVAL,), daemon=True
+    )
+    thread.start()
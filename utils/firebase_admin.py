@@ -1,19 +1,203 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from email.utils import parsedate_to_datetime
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, g, has_request_context
 import firebase_admin
 from firebase_admin import auth
+from google.auth.transport import requests as google_requests
+from google.oauth2 import id_token as google_id_token
+from config import Config
+from utils.cache import LRUCache
+from utils.monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+# Verified token claims keyed by token hash, each kept until the token expires
+_verified_tokens = LRUCache(max_entries=Config.AUTH_TOKEN_CACHE_SIZE)
+
+# Firebase ID tokens are issued by this prefix followed by the project ID
+ID_TOKEN_ISSUER_PREFIX = 'https://securetoken.google.com/'
+
+# Seconds to wait for Google's signing keys
+CERTIFICATE_FETCH_TIMEOUT = 10
+
+class CertificateCache:
+    """google-auth transport that caches Google's public signing keys
+
+    Responses for the key URLs are kept for their Cache-Control max-age.
+    Shortly before they expire, one background fetch refreshes them, so
+    token verification doesn't wait on Google when the keys rotate.
+    """
+
+    def __init__(self, timeout=None, refresh_ahead=300, default_max_age=3600):
+        """Initialize the cache
+
+        Args:
+            timeout: HTTP timeout for fetching keys, in seconds
+            refresh_ahead: Seconds before expiry to start a background refresh
+            default_max_age: Seconds to keep keys served without a max-age
+        """
+        self.transport = google_requests.Request()
+        self.timeout = timeout
+        self.refresh_ahead = refresh_ahead
+        self.default_max_age = default_max_age
+        self.entries = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def __call__(self, url, method='GET', body=None, headers=None, timeout=None, **kwargs):
+        """Make a request, serving key fetches from the cache"""
+        timeout = timeout or self.timeout
+        if method != 'GET' or body is not None:
+            return self.transport(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(url)
+            refresh = (entry is not None and entry[1] - now <= self.refresh_ahead
+                       and url not in self.refreshing)
+            if refresh:
+                self.refreshing.add(url)
+
+        if entry is None or entry[1] <= now:
+            return self._fetch(url, timeout)
+
+        if refresh:
+            threading.Thread(target=self._refresh, args=(url, timeout), daemon=True).start()
+
+        return entry[0]
+
+    def _fetch(self, url, timeout):
+        """Fetch keys and cache successful responses"""
+        response = self.transport(url, method='GET', timeout=timeout)
+
+        if response.status == 200:
+            with self.lock:
+                self.entries[url] = (response, time.time() + self._max_age(response.headers))
+
+        return response
+
+    def _refresh(self, url, timeout):
+        """Refresh keys in the background, keeping the old ones on failure"""
+        try:
+            self._fetch(url, timeout)
+        except Exception as e:
+            logger.warning(f"Refreshing signing keys from {url} failed: {str(e)}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(url)
+
+    def _max_age(self, headers):
+        """Get the lifetime of a response from its caching headers"""
+        for directive in headers.get('Cache-Control', '').split(','):
+            name, _, value = directive.strip().partition('=')
+            if name.lower() == 'max-age' and value.isdigit():
+                return int(value)
+
+        expires = headers.get('Expires')
+        if expires:
+            try:
+                return max(0, parsedate_to_datetime(expires).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+        return self.default_max_age
+
+# Signing keys shared by every token verification in this process
+_certificates = CertificateCache(timeout=CERTIFICATE_FETCH_TIMEOUT)
+
+def _decode_id_token(id_token):
+    """Check a Firebase ID token's signature and claims
+
+    Uses google-auth's public verify_firebase_token with the caching
+    transport, plus the issuer and subject checks the Admin SDK makes.
+    Tokens from the Auth emulator aren't signed, so with
+    FIREBASE_AUTH_EMULATOR_HOST set the Admin SDK verifies them instead.
+
+    Args:
+        id_token: Encoded ID token
+
+    Returns:
+        Decoded token claims, with the user ID as 'uid'
+
+    Raises:
+        ValueError: If the token is invalid or expired, or Firebase has no
+            project ID
+    """
+    if os.environ.get('FIREBASE_AUTH_EMULATOR_HOST'):
+        return auth.verify_id_token(id_token)
+
+    project_id = firebase_admin.get_app().project_id
+    if not project_id:
+        raise ValueError("A Firebase project ID is required to verify ID tokens")
+
+    claims = google_id_token.verify_firebase_token(id_token, _certificates, audience=project_id)
+    if claims.get('iss') != ID_TOKEN_ISSUER_PREFIX + project_id:
+        raise ValueError("ID token has an incorrect issuer")
+
+    subject = claims.get('sub')
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise ValueError("ID token has an invalid subject")
+
+    claims['uid'] = subject
+    return claims
+
+def verify_token(id_token):
+    """Verify a Firebase ID token, reusing earlier verifications
+
+    Args:
+        id_token: Encoded ID token
+
+    Returns:
+        Decoded token claims, or None if the token is invalid
+    """
+    token_hash = hashlib.sha256(id_token.encode()).hexdigest()
+
+    claims = _verified_tokens.get(token_hash)
+    if claims is not None:
+        metrics.record('auth.token_cache.hit', 1)
+        return claims
+
+    metrics.record('auth.token_cache.miss', 1)
 
-def get_current_user():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return None
-    id_token = auth_header.split(' ')[1]
     try:
-        decoded_token = auth.verify_id_token(id_token)
-        return decoded_token
+        claims = _decode_id_token(id_token)
     except Exception:
         return None
 
+    # Keep the claims until the token expires
+    lifetime = claims.get('exp', 0) - time.time()
+    if lifetime > 0:
+        _verified_tokens.set(token_hash, claims, timeout=lifetime)
+
+    return claims
+
+def get_current_user():
+    """Get the verified user for the current request
+
+    The token is verified at most once per request; the result is kept on
+    flask.g for every later caller (user identification, rate limiting,
+    logging, auth_required).
+
+    Returns:
+        Decoded token claims, or None if the request isn't authenticated
+    """
+    if has_request_context() and '_auth_principal' in g:
+        return g._auth_principal
+
+    user = None
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        user = verify_token(auth_header.split(' ')[1])
+
+    if has_request_context():
+        g._auth_principal = user
+    return user
+
 def auth_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -22,4 +206,4 @@ def auth_required(f):
             return jsonify({'error': 'Unauthorized'}), 401
         kwargs['user_id'] = user['uid']
         return f(*args, **kwargs)
-    return decorated
\ No newline at end of file
+    return decorated
@@ -0,0 +1,354 @@
+"""Image ingestion for recipe and profile pictures
+
+Images arrive as URLs (recipe imports), upload sessions or base64 strings
+(older clients). Each one is read with a byte cap, identified by its magic
+bytes rather than its extension or Content-Type, and re-encoded as a JPEG
+no larger than IMAGE_MAX_DIMENSION on its longest side, along with medium
+and thumbnail variants so lists and feeds don't download multi-megabyte
+originals.
+
+Decoding and resizing run in a small process pool so they don't hold the
+GIL in request threads. The pool uses spawned processes, since forking a
+worker that has gRPC (Firestore) threads running can deadlock.
+"""
+import os
+import io
+import base64
+import binascii
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Optional, Tuple
+import requests
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each variant stored next to the main image
+VARIANTS = {
+    'medium': 800,
+    'thumbnail': 200
+}
+
+JPEG_QUALITY = 85
+CONTENT_TYPE = 'image/jpeg'
+
+# Stored paths never change content, so clients may cache them indefinitely
+CACHE_CONTROL = 'public, max-age=31536000'
+
+# Images with more pixels than this are rejected before decoding
+MAX_PIXELS = 50_000_000
+
+# Seconds to wait for an image download
+DOWNLOAD_TIMEOUT = 15
+
+# Bytes read at a time from downloads and request bodies
+CHUNK_SIZE = 64 * 1024
+
+# Seconds to wait for a worker to resize an image
+PROCESS_TIMEOUT = 30
+
+# Resize pool for this process, keyed by PID so forks start their own
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """Identify an image format from its first bytes
+
+    Args:
+        data: Image bytes
+
+    Returns:
+        'jpeg', 'png', 'gif' or 'webp', or None if not a supported image
+    """
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def read_base64_image(value: str, max_bytes: Optional[int] = None) -> bytes:
+    """Decode a base64 image upload, rejecting oversized ones before decoding
+
+    Args:
+        value: Base64 string, optionally a data URL
+        max_bytes: Largest accepted image (defaults to IMAGE_MAX_BYTES)
+
+    Returns:
+        Image bytes
+
+    Raises:
+        ValueError: If the data is too large or not valid base64
+    """
+    max_bytes = max_bytes or Config.IMAGE_MAX_BYTES
+
+    # Handle data URLs (e.g. data:image/jpeg;base64,/9j/4AAQ...)
+    if value.startswith('data:') and ',' in value:
+        value = value.split(',', 1)[1]
+
+    if len(value) * 3 // 4 > max_bytes + 2:
+        raise ValueError(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Image is not valid base64 encoded data")
+
+
+def download_image(url: str, max_bytes: Optional[int] = None) -> bytes:
+    """Download an image, stopping once it passes the byte cap
+
+    Args:
+        url: Image URL
+        max_bytes: Largest accepted image (defaults to IMAGE_MAX_BYTES)
+
+    Returns:
+        Image bytes
+
+    Raises:
+        ValueError: If the download fails or the image is too large
+    """
+    max_bytes = max_bytes or Config.IMAGE_MAX_BYTES
+
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code != 200:
+            raise ValueError(f"Image download failed with status {response.status_code}")
+
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ValueError(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+
+        return read_capped(response.iter_content(chunk_size=CHUNK_SIZE), max_bytes)
+
+
+def read_capped(chunks: Iterable[bytes], max_bytes: Optional[int] = None) -> bytes:
+    """Collect streamed chunks, stopping once they pass the byte cap
+
+    Args:
+        chunks: Iterable of byte chunks (a download or request body)
+        max_bytes: Largest accepted image (defaults to IMAGE_MAX_BYTES)
+
+    Returns:
+        Image bytes
+
+    Raises:
+        ValueError: If the image is too large
+    """
+    max_bytes = max_bytes or Config.IMAGE_MAX_BYTES
+
+    buffer = io.BytesIO()
+    for chunk in chunks:
+        buffer.write(chunk)
+        if buffer.tell() > max_bytes:
+            raise ValueError(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+
+    return buffer.getvalue()
+
+
+def render_variants(data: bytes, max_dimension: int) -> Dict[str, Tuple[bytes, int, int]]:
+    """Decode an image and encode the main image and its variants as JPEG
+
+    Runs in the resize pool, so it only uses its arguments.
+
+    Args:
+        data: Source image bytes
+        max_dimension: Longest side of the main image
+
+    Returns:
+        Dict mapping 'original' and each variant name to (JPEG bytes, width, height)
+
+    Raises:
+        ValueError: If the image can't be decoded or is too large
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_PIXELS:
+            raise ValueError("Image dimensions are too large")
+
+        # Let JPEG decode at a reduced scale when the image will be shrunk anyway
+        image.draft('RGB', (max_dimension, max_dimension))
+        # Decode now, so truncated data fails here rather than while resizing
+        image.load()
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ValueError("Image could not be decoded")
+
+    # Flatten transparency onto white, since JPEG has no alpha channel
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    sizes = dict(VARIANTS, original=max_dimension)
+    rendered = {}
+    for name, size in sizes.items():
+        variant = image.copy()
+        variant.thumbnail((size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        variant.save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        rendered[name] = (output.getvalue(), variant.width, variant.height)
+
+    return rendered
+
+
+def process_image(data: bytes) -> Dict[str, Tuple[bytes, int, int]]:
+    """Check an image's format and render its stored sizes
+
+    Args:
+        data: Source image bytes
+
+    Returns:
+        Dict mapping 'original' and each variant name to (JPEG bytes, width, height)
+
+    Raises:
+        ValueError: If the image is not a supported format, can't be decoded
+            or takes longer than PROCESS_TIMEOUT seconds
+    """
+    if sniff_format(data) is None:
+        raise ValueError("Unsupported image format; use JPEG, PNG, GIF or WebP")
+
+    pool = _get_pool()
+    if pool is None:
+        return render_variants(data, Config.IMAGE_MAX_DIMENSION)
+
+    future = pool.submit(render_variants, data, Config.IMAGE_MAX_DIMENSION)
+    try:
+        return future.result(timeout=PROCESS_TIMEOUT)
+    except FutureTimeoutError:
+        # Drop it if it hasn't started; a running worker finishes on its own
+        future.cancel()
+        raise ValueError("Image took too long to process")
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool next time
+        _reset_pool()
+        raise
+
+
+def variant_path(path: str, name: str) -> str:
+    """Get the storage path of an image variant
+
+    Args:
+        path: Storage path of the main image
+        name: Variant name
+
+    Returns:
+        Variant storage path (e.g. 'recipes/u1/abc_thumbnail.jpg')
+    """
+    base, extension = os.path.splitext(path)
+    return f"{base}_{name}{extension}"
+
+
+def store_image(bucket, data: bytes, path: str) -> Dict[str, Any]:
+    """Process an image and upload it with its variants
+
+    Args:
+        bucket: Storage bucket
+        data: Source image bytes
+        path: Storage path of the main image; variants go next to it
+
+    Returns:
+        Dict with the main image 'path', 'url', 'width' and 'height', and
+        'variants' mapping each variant name to its URL
+
+    Raises:
+        ValueError: If the image is not a supported format or can't be decoded
+    """
+    rendered = process_image(data)
+
+    stored = {'path': path, 'variants': {}}
+    for name, (content, width, height) in rendered.items():
+        blob = bucket.blob(path if name == 'original' else variant_path(path, name))
+        blob.cache_control = CACHE_CONTROL
+        blob.upload_from_string(content, content_type=CONTENT_TYPE)
+        if name == 'original':
+            stored.update(url=blob.public_url, width=width, height=height)
+        else:
+            stored['variants'][name] = blob.public_url
+
+    return stored
+
+
+def copy_image(bucket, source_path: str, path: str) -> Dict[str, Any]:
+    """Copy a stored image and its variants inside Storage
+
+    Variants missing from the source (images stored before variants
+    existed) are skipped.
+
+    Args:
+        bucket: Storage bucket
+        source_path: Storage path of the main image to copy
+        path: Storage path of the copy
+
+    Returns:
+        Dict with the copy's 'path', 'url' and 'variants' mapping each
+        variant name to its URL
+    """
+    blob = bucket.copy_blob(bucket.blob(source_path), bucket, path)
+    stored = {'path': path, 'url': blob.public_url, 'variants': {}}
+
+    for name in VARIANTS:
+        try:
+            variant = bucket.copy_blob(bucket.blob(variant_path(source_path, name)), bucket, variant_path(path, name))
+            stored['variants'][name] = variant.public_url
+        except Exception as e:
+            logger.info(f"Skipping {name} variant of {source_path}: {str(e)}")
+
+    return stored
+
+
+def delete_image(bucket, path: Optional[str]):
+    """Delete a stored image and its variants
+
+    Failures are logged, so a missing blob doesn't stop the caller.
+
+    Args:
+        bucket: Storage bucket
+        path: Storage path of the main image
+    """
+    if not path:
+        return
+
+    for blob_path in [path] + [variant_path(path, name) for name in VARIANTS]:
+        try:
+            bucket.blob(blob_path).delete()
+        except Exception as e:
+            logger.info(f"Couldn't delete image {blob_path}: {str(e)}")
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    """Get the resize pool for this process, or None to resize in-process"""
+    global _pool, _pool_pid
+    if Config.IMAGE_WORKERS <= 0:
+        return None
+    if _pool_pid == os.getpid():
+        return _pool
+
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def _reset_pool():
+    """Drop a broken resize pool"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        _pool = None
+        _pool_pid = None
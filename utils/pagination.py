@@ -0,0 +1,236 @@
+"""Cursor-based pagination helpers for Firestore queries"""
+import base64
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from firebase_admin import firestore
+
+# Configure logging
+logger = logging.getLogger('pagination')
+
+DEFAULT_PAGE_SIZE = 20
+
+# Documents read per chunk, and at most per request, when a page is filtered in memory
+FILTER_CHUNK_SIZE = 100
+MAX_FILTER_SCAN = 1000
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Encode a page position as an opaque cursor string
+
+    Args:
+        position: Dict with the sort field value ('v') and document ID ('id')
+
+    Returns:
+        URL-safe cursor string
+    """
+    value = position.get('v')
+    if isinstance(value, datetime):
+        value = {'$dt': value.isoformat()}
+
+    payload = json.dumps({'v': value, 'id': position.get('id')}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor string produced by encode_cursor
+
+    Args:
+        cursor: Opaque cursor string
+
+    Returns:
+        Dict with the sort field value ('v') and document ID ('id')
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        value = position['v']
+        if isinstance(value, dict) and '$dt' in value:
+            value = datetime.fromisoformat(value['$dt'])
+        return {'v': value, 'id': str(position['id'])}
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid pagination cursor")
+
+def get_page_params(query_params: Dict[str, Any]) -> Tuple[int, int, Optional[str]]:
+    """Extract pagination parameters from query parameters
+
+    Args:
+        query_params: Dict containing 'limit', 'offset' and 'cursor' values
+
+    Returns:
+        Tuple of (limit, offset, cursor)
+    """
+    limit = int(query_params.get('limit', DEFAULT_PAGE_SIZE))
+    offset = int(query_params.get('offset', 0))
+    cursor = query_params.get('cursor') or None
+    return limit, offset, cursor
+
+def count_query(query) -> Optional[int]:
+    """Count the documents matching a query with a server-side aggregation
+
+    Args:
+        query: Firestore query (filters only, ordering is ignored)
+
+    Returns:
+        Number of matching documents or None if the count is unavailable
+    """
+    try:
+        results = query.count(alias='total').get()
+        return int(results[0][0].value)
+    except Exception as e:
+        logger.warning(f"Count aggregation failed: {str(e)}")
+        return None
+
+def wants_total(query_params: Dict[str, Any]) -> bool:
+    """Check whether a page response should include a total count
+
+    Totals are included unless the client passes include_total=false.
+
+    Args:
+        query_params: Dict containing an optional 'include_total' value
+
+    Returns:
+        True if the total should be computed
+    """
+    value = query_params.get('include_total')
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() not in ('false', '0', 'no')
+    return bool(value)
+
+def page_total(query, query_params: Dict[str, Any],
+               counter: Optional[Callable[[], int]] = None) -> Optional[int]:
+    """Get the total count for a page response
+
+    A maintained counter is used when one tracks the query's total; otherwise
+    the query is counted with an aggregation, which reads one index entry per
+    thousand documents instead of every document.
+
+    Args:
+        query: Filtered Firestore query to count
+        query_params: Dict containing an optional 'include_total' value
+        counter: Function returning the maintained total, if there is one
+
+    Returns:
+        Total count, or None if not requested or unavailable
+    """
+    if not wants_total(query_params):
+        return None
+
+    if counter is not None:
+        try:
+            return counter()
+        except Exception as e:
+            logger.warning(f"Reading maintained count failed: {str(e)}")
+
+    return count_query(query)
+
+def paginate_query(query, query_params: Dict[str, Any], sort_by: str,
+                   direction: str,
+                   keep: Optional[Callable[[Any], bool]] = None) -> Tuple[List[Any], Dict[str, Any]]:
+    """Fetch a single page of documents from a Firestore query
+
+    Cursor requests resume with start_after from the position encoded in the
+    cursor; offset requests skip on the server. Either way only the page
+    (plus one look-ahead document) is read.
+
+    With a keep filter (checks the query can't express, like search terms
+    longer than the index), documents are read in chunks until a full page
+    passes the filter, and offsets are skipped in memory. The total is None
+    then, since the aggregation would count documents the filter drops.
+
+    Args:
+        query: Filtered Firestore query without ordering applied
+        query_params: Dict containing pagination parameters
+        sort_by: Field to order results by
+        direction: Firestore sort direction
+        keep: Function deciding whether a document snapshot belongs in the results
+
+    Returns:
+        Tuple of (document snapshots, pagination info)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    limit, offset, cursor = get_page_params(query_params)
+
+    # Total comes from an aggregation query rather than streaming every document
+    total = page_total(query, query_params) if keep is None else None
+
+    # Order by document ID as a tie-breaker so cursors are stable
+    query = query.order_by(sort_by, direction=direction).order_by(
+        firestore.FieldPath.document_id(), direction=direction
+    )
+
+    if cursor:
+        position = decode_cursor(cursor)
+        query = query.start_after({sort_by: position['v'], '__name__': position['id']})
+    elif offset and keep is None:
+        query = query.offset(offset)
+
+    if keep is None:
+        # Read one extra document to know whether another page exists
+        docs = list(query.limit(limit + 1).stream())
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        last_doc = docs[-1] if docs else None
+    else:
+        docs, has_more, last_doc = _scan_filtered(query, keep, limit, 0 if cursor else offset)
+
+    next_cursor = None
+    if has_more and last_doc is not None:
+        next_cursor = encode_cursor({
+            'v': (last_doc.to_dict() or {}).get(sort_by),
+            'id': last_doc.id
+        })
+
+    pagination = {
+        'total': total,
+        'limit': limit,
+        'offset': offset,
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    }
+
+    return docs, pagination
+
+def _scan_filtered(query, keep: Callable[[Any], bool], limit: int,
+                   skip: int) -> Tuple[List[Any], bool, Optional[Any]]:
+    """Read an ordered query in chunks until a page of documents passes a filter
+
+    Stops after MAX_FILTER_SCAN documents so a rare term can't read a whole
+    collection in one request; the cursor then resumes after the last
+    document read.
+
+    Returns:
+        Tuple of (kept documents, whether more may follow, document to
+        resume after)
+    """
+    chunk_size = max(limit + 1, FILTER_CHUNK_SIZE)
+    kept = []
+    scanned = 0
+    last_read = None
+
+    while True:
+        chunk_query = query.start_after(last_read) if last_read is not None else query
+        chunk = list(chunk_query.limit(chunk_size).stream())
+        for doc in chunk:
+            scanned += 1
+            last_read = doc
+            if not keep(doc):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            kept.append(doc)
+            if len(kept) > limit:
+                # The look-ahead document passed, so another page exists
+                return kept[:limit], True, kept[limit - 1] if limit else None
+
+        if len(chunk) < chunk_size:
+            return kept, False, None
+        if scanned >= MAX_FILTER_SCAN:
+            return kept, True, last_read
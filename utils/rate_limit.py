@@ -1,10 +1,17 @@
 """Rate limiting utilities for API protection"""
 import time
+import uuid
+import heapq
+import logging
+import threading
+from collections import deque
 from functools import wraps
 from flask import request, jsonify, current_app
 import redis
 import hashlib
 
+logger = logging.getLogger(__name__)
+
 # Optional Redis connection - can be configured in production
 redis_client = None
 
@@ -25,98 +32,253 @@ def get_redis_client():
             return None
     return redis_client
 
+# Rate limiting algorithms
+SLIDING_WINDOW = 'sliding_window'
+TOKEN_BUCKET = 'token_bucket'
+ALGORITHMS = (SLIDING_WINDOW, TOKEN_BUCKET)
+
+# Sliding window log: drop requests older than the window, then admit the
+# request if fewer than `limit` remain. Uses Redis server time so workers
+# with skewed clocks agree. Returns {allowed, remaining, reset_ms}.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local member = ARGV[3]
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+local allowed = 0
+if count < limit then
+    redis.call('ZADD', key, now, member)
+    count = count + 1
+    allowed = 1
+end
+
+local reset = now + window
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+if oldest[2] then
+    reset = tonumber(oldest[2]) + window
+end
+redis.call('PEXPIRE', key, window)
+
+return {allowed, limit - count, reset}
+"""
+
+# Token bucket: the bucket holds up to `limit` tokens and refills at
+# limit/period; each request takes one token. Returns {allowed, remaining,
+# reset_ms}, where reset is when the next token (if denied) or a full
+# bucket (if allowed) will be available.
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local period = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local rate = capacity / period
+
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local reset
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+    reset = now + (capacity - tokens) / rate
+else
+    reset = now + (1 - tokens) / rate
+end
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', key, math.max(1, math.ceil((capacity - tokens) / rate)))
+
+return {allowed, math.floor(tokens), math.ceil(reset)}
+"""
+
+class RedisRateLimiter:
+    """Rate limiter shared by all workers, one atomic script call per check"""
+    
+    def __init__(self, client):
+        """Initialize the limiter
+        
+        Args:
+            client: redis.Redis client
+        """
+        self.client = client
+        self.scripts = {
+            SLIDING_WINDOW: client.register_script(SLIDING_WINDOW_SCRIPT),
+            TOKEN_BUCKET: client.register_script(TOKEN_BUCKET_SCRIPT)
+        }
+    
+    def check_rate_limit(self, key, limit, period, algorithm=SLIDING_WINDOW):
+        """Check if a key is rate limited, counting this request if allowed
+        
+        Args:
+            key: Unique identifier for the client
+            limit: Maximum number of requests allowed in the period
+            period: Time period in seconds
+            algorithm: SLIDING_WINDOW or TOKEN_BUCKET
+        
+        Returns:
+            Tuple of (is_allowed, remaining, reset_time)
+        
+        Raises:
+            redis.exceptions.RedisError: If Redis can't be reached
+        """
+        period_ms = max(1, int(period * 1000))
+        
+        if algorithm == TOKEN_BUCKET:
+            args = [period_ms, limit]
+        else:
+            # Members must be unique even for requests in the same millisecond
+            args = [period_ms, limit, uuid.uuid4().hex]
+        
+        allowed, remaining, reset_ms = self.scripts[algorithm](keys=[f"rate_limit:{algorithm}:{key}"], args=args)
+        return bool(allowed), max(0, int(remaining)), int(reset_ms) / 1000
+
 # Fallback in-memory rate limiting when Redis is not available
 class InMemoryRateLimiter:
-    """Simple in-memory rate limiter for development or small deployments"""
+    """In-memory rate limiter for development or small deployments
+    
+    Each key's state is scheduled once in an expiry heap. Cleanup pops only
+    keys that are due, rescheduling those still active, so a check costs
+    O(log n) amortized instead of a scan of every key.
+    """
     
     def __init__(self):
         self.rate_limits = {}
-        
-    def check_rate_limit(self, key, limit, period):
-        """Check if a key is rate limited
+        self.expiry_heap = []
+        self.lock = threading.Lock()
+    
+    def check_rate_limit(self, key, limit, period, algorithm=SLIDING_WINDOW):
+        """Check if a key is rate limited, counting this request if allowed
         
         Args:
             key: Unique identifier for the client
             limit: Maximum number of requests allowed in the period
             period: Time period in seconds
-            
+            algorithm: SLIDING_WINDOW or TOKEN_BUCKET
+        
         Returns:
             Tuple of (is_allowed, remaining, reset_time)
         """
         current_time = time.time()
+        state_key = (algorithm, key)
         
-        # Clean up expired entries
-        self._cleanup()
-        
-        # Get/create record for this key
-        if key not in self.rate_limits:
-            self.rate_limits[key] = {
-                'count': 0,
-                'reset_at': current_time + period
-            }
+        with self.lock:
+            # Clean up expired entries
+            self._cleanup(current_time)
             
-        record = self.rate_limits[key]
-        
-        # Reset if period has expired
-        if current_time > record['reset_at']:
-            record['count'] = 0
-            record['reset_at'] = current_time + period
+            record = self.rate_limits.get(state_key)
+            if record is None:
+                record = self.rate_limits[state_key] = {'expires_at': current_time}
+                heapq.heappush(self.expiry_heap, (current_time + period, state_key))
             
+            if algorithm == TOKEN_BUCKET:
+                result = self._token_bucket(record, limit, period, current_time)
+            else:
+                result = self._sliding_window(record, limit, period, current_time)
+        
+        return result
+    
+    def _sliding_window(self, record, limit, period, current_time):
+        """Admit a request if fewer than limit were admitted in the last period"""
+        log = record.setdefault('log', deque())
+        while log and log[0] <= current_time - period:
+            log.popleft()
+        
         # Check limit
-        is_allowed = record['count'] < limit
+        is_allowed = len(log) < limit
         
-        # Increment counter if allowed
+        # Record the request if allowed
         if is_allowed:
-            record['count'] += 1
-            
-        remaining = max(0, limit - record['count'])
-        reset_time = record['reset_at']
+            log.append(current_time)
+        
+        remaining = max(0, limit - len(log))
+        reset_time = log[0] + period if log else current_time + period
+        record['expires_at'] = log[-1] + period if log else current_time
         
         return is_allowed, remaining, reset_time
+    
+    def _token_bucket(self, record, limit, period, current_time):
+        """Admit a request if the bucket holds a token, refilling at limit/period"""
+        rate = limit / period
+        tokens = min(limit, record.get('tokens', limit) + (current_time - record.get('ts', current_time)) * rate)
         
-    def _cleanup(self):
-        """Remove expired rate limit records"""
-        current_time = time.time()
-        # Use a list to avoid modifying dictionary during iteration
-        expired_keys = [k for k, v in self.rate_limits.items() if current_time > v['reset_at']]
-        for key in expired_keys:
-            del self.rate_limits[key]
+        is_allowed = tokens >= 1
+        if is_allowed:
+            tokens -= 1
+            reset_time = current_time + (limit - tokens) / rate
+        else:
+            reset_time = current_time + (1 - tokens) / rate
+        
+        record['tokens'] = tokens
+        record['ts'] = current_time
+        # A full bucket is the same as no record
+        record['expires_at'] = current_time + (limit - tokens) / rate
+        
+        return is_allowed, int(tokens), reset_time
+    
+    def _cleanup(self, current_time):
+        """Remove rate limit records that have expired (lock must be held)"""
+        while self.expiry_heap and self.expiry_heap[0][0] <= current_time:
+            _, state_key = heapq.heappop(self.expiry_heap)
+            
+            record = self.rate_limits.get(state_key)
+            if record is None:
+                continue
+            
+            # Still active: reschedule for when it actually expires
+            if record['expires_at'] > current_time:
+                heapq.heappush(self.expiry_heap, (record['expires_at'], state_key))
+            else:
+                del self.rate_limits[state_key]
 
 # Singleton in-memory rate limiter
 memory_rate_limiter = InMemoryRateLimiter()
 
-def check_rate_limit(key, limit, period):
+# Redis-backed limiter, created with the Redis client
+redis_rate_limiter = None
+
+def check_rate_limit(key, limit, period, algorithm=SLIDING_WINDOW):
     """Check if a request is within rate limits
     
     Args:
         key: Unique identifier for the client
         limit: Maximum number of requests allowed in the period
         period: Time period in seconds
-        
+        algorithm: SLIDING_WINDOW or TOKEN_BUCKET
+    
     Returns:
         Tuple of (is_allowed, remaining, reset_time)
+    
+    Raises:
+        ValueError: If the algorithm is unknown
     """
+    global redis_rate_limiter
+    
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+    
     redis_client = get_redis_client()
     
     if redis_client:
         # Use Redis-based rate limiting
-        redis_key = f"rate_limit:{key}"
-        count = redis_client.incr(redis_key)
-        
-        # Set expiry if this is the first request in the period
-        if count == 1:
-            redis_client.expire(redis_key, period)
-            
-        # Check if request is within the limit
-        ttl = redis_client.ttl(redis_key)
-        reset_time = time.time() + ttl
-        is_allowed = count <= limit
-        remaining = max(0, limit - count)
+        if redis_rate_limiter is None or redis_rate_limiter.client is not redis_client:
+            redis_rate_limiter = RedisRateLimiter(redis_client)
         
-        return is_allowed, remaining, reset_time
-    else:
-        # Fall back to in-memory rate limiting
-        return memory_rate_limiter.check_rate_limit(key, limit, period)
+        try:
+            return redis_rate_limiter.check_rate_limit(key, limit, period, algorithm)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Redis rate limiting failed, using in-memory limits: {str(e)}")
+    
+    # Fall back to in-memory rate limiting
+    return memory_rate_limiter.check_rate_limit(key, limit, period, algorithm)
 
 def get_request_identifier():
     """Generate a unique identifier for the current request
@@ -140,13 +302,14 @@ def get_request_identifier():
     # Hash the key for privacy
     return hashlib.md5(key.encode()).hexdigest()
 
-def rate_limit(limit=100, period=60, by_endpoint=True):
+def rate_limit(limit=100, period=60, by_endpoint=True, algorithm=None):
     """Decorator to apply rate limiting to API endpoints
     
     Args:
         limit: Maximum number of requests allowed in the period
         period: Time period in seconds
         by_endpoint: Whether to apply rate limit per endpoint (True) or globally (False)
+        algorithm: SLIDING_WINDOW or TOKEN_BUCKET (defaults to RATE_LIMIT_ALGORITHM config)
         
     Returns:
         Decorated function
@@ -163,7 +326,8 @@ def rate_limit(limit=100, period=60, by_endpoint=True):
                 key = base_key
                 
             # Check rate limit
-            is_allowed, remaining, reset_time = check_rate_limit(key, limit, period)
+            limit_algorithm = algorithm or current_app.config.get('RATE_LIMIT_ALGORITHM', SLIDING_WINDOW)
+            is_allowed, remaining, reset_time = check_rate_limit(key, limit, period, limit_algorithm)
             
             # Set rate limit headers
             response_headers = {
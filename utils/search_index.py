@@ -0,0 +1,99 @@
+"""Prefix search index helpers for Firestore documents
+
+Firestore has no native text search, so searchable documents carry a
+'search_tokens' array holding every prefix of the normalized text starting at
+each word boundary. A search is then a single array_contains filter, which
+matches any phrase that starts at a word in the indexed text.
+"""
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+from firebase_admin import firestore
+
+# Field holding the indexed tokens on each document
+SEARCH_TOKENS_FIELD = 'search_tokens'
+
+# Longest prefix stored in the index; longer search terms are truncated for
+# the index lookup and re-checked in memory
+MAX_PREFIX_LENGTH = 20
+
+def normalize_text(text: Optional[str]) -> str:
+    """Normalize text for indexing and searching
+
+    Lowercases, strips accents and collapses punctuation and whitespace.
+
+    Args:
+        text: Raw text
+
+    Returns:
+        Normalized text with single spaces between words
+    """
+    if not text:
+        return ''
+
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^a-z0-9]+', ' ', text.lower())
+    return text.strip()
+
+def build_search_tokens(text: Optional[str]) -> List[str]:
+    """Build the search tokens for a piece of text
+
+    Args:
+        text: Text to index (e.g. a food item name)
+
+    Returns:
+        Sorted list of unique prefixes, one set per word boundary
+    """
+    normalized = normalize_text(text)
+    if not normalized:
+        return []
+
+    tokens = set()
+    words = normalized.split(' ')
+
+    for i in range(len(words)):
+        phrase = ' '.join(words[i:])[:MAX_PREFIX_LENGTH].rstrip()
+        for end in range(1, len(phrase) + 1):
+            # Skip prefixes that end on the separator between words
+            if phrase[end - 1] != ' ':
+                tokens.add(phrase[:end])
+
+    return sorted(tokens)
+
+def plan_search(query, search_term: Optional[str]) -> Tuple[object, Optional[str]]:
+    """Apply a search term to a Firestore query
+
+    Args:
+        query: Firestore query to filter
+        search_term: Raw search term from the client
+
+    Returns:
+        Tuple of (filtered query, residual term). The residual term is the
+        normalized search term when the index lookup was truncated and
+        results must be re-checked in memory, otherwise None.
+    """
+    normalized = normalize_text(search_term)
+    if not normalized:
+        return query, None
+
+    key = normalized[:MAX_PREFIX_LENGTH].rstrip()
+    query = query.where(
+        filter=firestore.FieldFilter(SEARCH_TOKENS_FIELD, "array_contains", key)
+    )
+
+    residual = normalized if len(normalized) > MAX_PREFIX_LENGTH else None
+    return query, residual
+
+def matches(text: Optional[str], normalized_term: str) -> bool:
+    """Check whether text contains a normalized phrase at a word boundary
+
+    Args:
+        text: Raw text to check
+        normalized_term: Search term already passed through normalize_text
+
+    Returns:
+        Boolean indicating a match
+    """
+    normalized = normalize_text(text)
+    return normalized.startswith(normalized_term) or f" {normalized_term}" in normalized
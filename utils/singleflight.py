@@ -0,0 +1,99 @@
+"""Request coalescing for expensive lookups
+
+When a popular key goes cold, every concurrent request would otherwise
+recompute it at once. SingleFlight lets the first caller for a key do the
+work while later callers wait for and share its result.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+from utils.monitoring import metrics
+
+
+class _Call:
+    """An in-flight computation and its outcome"""
+
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution
+
+    Coalescing is per process: each worker still computes a cold key once.
+    """
+
+    def __init__(self, name: str, clone: Optional[Callable[[Any], Any]] = None):
+        """Initialize the group
+
+        Args:
+            name: Name used to tag metrics
+            clone: Function applied to the result handed to each waiting
+                caller (e.g. copy.deepcopy when callers modify results); the
+                leader's result is cloned once before waiters are woken and
+                each waiter gets its own copy of that snapshot
+        """
+        self.name = name
+        self.clone = clone
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run func for a key, or wait for the run already in flight
+
+        Args:
+            key: Key identifying the computation
+            func: Function computing the result
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            Result of func
+
+        Raises:
+            Exception: Whatever func raised, in every waiting caller
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            metrics.record('singleflight.coalesced', 1, {'name': self.name})
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return self.clone(call.result) if self.clone else call.result
+
+        try:
+            result = func(*args, **kwargs)
+            # Waiters copy from a snapshot taken before the leader returns,
+            # so the leader may modify its result while they are copying
+            call.result = self.clone(result) if self.clone else result
+            return result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Check whether a computation for a key is running
+
+        Args:
+            key: Key identifying the computation
+
+        Returns:
+            True if a caller is computing the key
+        """
+        with self.lock:
+            return key in self.calls
@@ -0,0 +1,257 @@
+"""Two-tier cache for USDA FoodData Central responses
+
+Lookups first check a small in-process LRU, then an on-disk SQLite store
+shared by every worker process on the host. Entries expire after a TTL;
+lookups that found nothing are cached too (for a shorter time) so repeated
+misses don't reach the API either.
+"""
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from utils.monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+# Default time-to-live for cached responses, in seconds
+DEFAULT_TTL = 7 * 24 * 3600
+
+# Default time-to-live for cached misses, in seconds
+DEFAULT_NEGATIVE_TTL = 3600
+
+# Expired rows are purged from disk once every this many writes
+PURGE_INTERVAL = 500
+
+class MemoryLRU:
+    """Thread-safe in-process LRU of (value, expires_at) entries"""
+
+    def __init__(self, max_entries: int = 1024):
+        """Initialize the LRU
+
+        Args:
+            max_entries: Maximum number of entries kept
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Get a live entry and mark it as recently used
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Tuple of (value, expires_at), or None if missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[1] <= time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, expires_at: float):
+        """Store an entry, evicting the least recently used if full
+
+        Args:
+            key: Cache key
+            value: Value to store
+            expires_at: Expiry time as a Unix timestamp
+        """
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries"""
+        with self.lock:
+            self.entries.clear()
+
+class SQLiteStore:
+    """On-disk key/value store with expiry, safe to share across processes"""
+
+    def __init__(self, path: str):
+        """Open (and create if needed) the store
+
+        Args:
+            path: Path to the SQLite database file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.writes = 0
+
+        self.conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        # WAL lets readers in other workers proceed while one worker writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS usda_cache ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[Tuple[Optional[str], float]]:
+        """Get a live entry
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Tuple of (serialized value, expires_at), or None if missing or expired
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM usda_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+
+        return tuple(row) if row else None
+
+    def set(self, key: str, value: Optional[str], expires_at: float):
+        """Store an entry
+
+        Args:
+            key: Cache key
+            value: Serialized value (None for a cached miss)
+            expires_at: Expiry time as a Unix timestamp
+        """
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO usda_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+
+            self.writes += 1
+            if self.writes % PURGE_INTERVAL == 0:
+                self.conn.execute("DELETE FROM usda_cache WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self):
+        """Remove all entries"""
+        with self.lock:
+            self.conn.execute("DELETE FROM usda_cache")
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.conn.close()
+
+class USDACache:
+    """In-process LRU in front of a shared on-disk store
+
+    Values are stored as JSON text, so every hit returns a fresh copy that
+    callers are free to modify. A cached value of None records a miss.
+    """
+
+    # Returned by lookup when nothing is cached
+    MISSING = object()
+
+    def __init__(self, path: Optional[str] = None, memory_entries: int = 1024,
+                 ttl: int = DEFAULT_TTL, negative_ttl: int = DEFAULT_NEGATIVE_TTL):
+        """Initialize the cache
+
+        Args:
+            path: Path to the SQLite file shared by workers (None for memory only)
+            memory_entries: Maximum entries in the in-process LRU
+            ttl: Time-to-live for cached responses, in seconds
+            negative_ttl: Time-to-live for cached misses, in seconds
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = MemoryLRU(memory_entries)
+        self.disk = None
+
+        if path:
+            try:
+                self.disk = SQLiteStore(path)
+            except sqlite3.Error as e:
+                logger.warning(f"USDA disk cache unavailable at {path}: {str(e)}")
+
+    def lookup(self, kind: str, key: str) -> Any:
+        """Look up a cached value
+
+        Args:
+            kind: Kind of lookup, used to tag metrics (e.g. 'search', 'food')
+            key: Cache key
+
+        Returns:
+            Cached value, None for a cached miss, or USDACache.MISSING
+        """
+        entry = self.memory.get(key)
+        if entry is not None:
+            metrics.record('cache.usda.hit', 1, {'kind': kind, 'tier': 'memory'})
+            return self._decode(entry[0])
+
+        if self.disk is not None:
+            try:
+                entry = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"USDA disk cache read failed: {str(e)}")
+                entry = None
+
+            if entry is not None:
+                # Promote to memory for the rest of its lifetime
+                self.memory.set(key, entry[0], entry[1])
+                metrics.record('cache.usda.hit', 1, {'kind': kind, 'tier': 'disk'})
+                return self._decode(entry[0])
+
+        metrics.record('cache.usda.miss', 1, {'kind': kind})
+        return self.MISSING
+
+    def store(self, key: str, value: Optional[Dict[str, Any]]):
+        """Cache a value, or a miss when value is None
+
+        Args:
+            key: Cache key
+            value: JSON-serializable value, or None to record a miss
+        """
+        ttl = self.negative_ttl if value is None else self.ttl
+        expires_at = time.time() + ttl
+        serialized = None if value is None else json.dumps(value)
+
+        self.memory.set(key, serialized, expires_at)
+
+        if self.disk is not None:
+            try:
+                self.disk.set(key, serialized, expires_at)
+            except sqlite3.Error as e:
+                logger.warning(f"USDA disk cache write failed: {str(e)}")
+
+    def clear(self):
+        """Remove all cached entries from both tiers"""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    @staticmethod
+    def search_key(query: str, params: Dict[str, Any]) -> str:
+        """Build the cache key for a search
+
+        Args:
+            query: Search query
+            params: Other search parameters (page size, filters, ...)
+
+        Returns:
+            Cache key
+        """
+        normalized = ' '.join(str(query).lower().split())
+        return f"search:{normalized}:{json.dumps(params, sort_keys=True, default=str)}"
+
+    @staticmethod
+    def food_key(fdc_id: Any) -> str:
+        """Build the cache key for a food's details"""
+        return f"food:{fdc_id}"
+
+    @staticmethod
+    def _decode(serialized: Optional[str]) -> Any:
+        """Decode a stored value"""
+        return None if serialized is None else json.loads(serialized)
@@ -0,0 +1,620 @@
+"""Local FoodData Central store built from the USDA bulk downloads
+
+The store is a read-only SQLite file holding one compact JSON document per
+food (in the API's food details format), indexed by fdcId, description
+token and GTIN/UPC. FoodStoreBuilder streams the bulk JSON or CSV exports
+into a new file and swaps it into place when done, so running workers keep
+serving from the previous version until they reopen it.
+"""
+import io
+import os
+import csv
+import json
+import re
+import sqlite3
+import logging
+import threading
+import zipfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+from utils.search_index import normalize_text
+from utils.monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+# Food fields kept from the bulk export
+FOOD_FIELDS = ['fdcId', 'dataType', 'description', 'brandOwner', 'brandName', 'gtinUpc',
+               'ingredients', 'servingSize', 'servingSizeUnit', 'foodCategory']
+
+# Nutrient fields kept from the bulk export
+NUTRIENT_FIELDS = ['id', 'number', 'name', 'unitName']
+
+# Characters allowed between JSON array items
+_SEPARATORS = re.compile(r'[\s,]*')
+
+def normalize_gtin(gtin: Any) -> str:
+    """Normalize a GTIN/UPC/EAN code for lookups
+
+    UPC-A, EAN-13 and GTIN-14 forms of the same code differ only by leading
+    zeros, so those are dropped along with any non-digits.
+
+    Args:
+        gtin: Raw code
+
+    Returns:
+        Normalized code (empty if there are no digits)
+    """
+    return re.sub(r'\D', '', str(gtin or '')).lstrip('0')
+
+def compact_food(food: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a bulk export food to the fields the application uses
+
+    Args:
+        food: Food from the bulk export (API food details format)
+
+    Returns:
+        Compact food in the same format
+    """
+    compact = {key: food[key] for key in FOOD_FIELDS if food.get(key) not in (None, '')}
+
+    # Branded foods carry their category as a plain string
+    if 'foodCategory' not in compact and food.get('brandedFoodCategory'):
+        compact['foodCategory'] = {'description': food['brandedFoodCategory']}
+    elif isinstance(compact.get('foodCategory'), dict):
+        compact['foodCategory'] = {'description': compact['foodCategory'].get('description', '')}
+
+    compact['foodNutrients'] = [
+        {
+            'nutrient': {key: entry['nutrient'].get(key) for key in NUTRIENT_FIELDS},
+            'amount': entry.get('amount', 0)
+        }
+        for entry in food.get('foodNutrients', [])
+        if isinstance(entry.get('nutrient'), dict) and entry.get('amount') is not None
+    ]
+
+    return compact
+
+def to_search_result(food: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a stored food to the API's search result format
+
+    Args:
+        food: Stored food (food details format)
+
+    Returns:
+        Food in search result format
+    """
+    result = {key: food[key] for key in FOOD_FIELDS if key in food and key != 'foodCategory'}
+    result['foodNutrients'] = [
+        {
+            'nutrientId': entry['nutrient'].get('id'),
+            'nutrientName': entry['nutrient'].get('name'),
+            'nutrientNumber': entry['nutrient'].get('number'),
+            'unitName': (entry['nutrient'].get('unitName') or '').upper(),
+            'value': entry.get('amount', 0)
+        }
+        for entry in food.get('foodNutrients', [])
+    ]
+    return result
+
+def iter_json_foods(fp: TextIO, chunk_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """Stream foods from a bulk JSON export without loading it whole
+
+    The exports are a single object holding one array of foods (e.g.
+    {"FoundationFoods": [...]}); foods are decoded one at a time.
+
+    Args:
+        fp: Text file positioned at the start of the export
+        chunk_size: Characters read per chunk
+
+    Yields:
+        Foods from the export
+
+    Raises:
+        ValueError: If the file ends in the middle of a food
+    """
+    decoder = json.JSONDecoder()
+
+    # Skip ahead to the foods array
+    buffer = ''
+    while '[' not in buffer:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        buffer = chunk
+    pos = buffer.index('[') + 1
+    eof = False
+
+    while True:
+        pos = _SEPARATORS.match(buffer, pos).end()
+
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+
+        try:
+            if pos >= len(buffer):
+                raise json.JSONDecodeError("Need more data", buffer, pos)
+            food, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                if pos >= len(buffer):
+                    return
+                raise ValueError("FoodData Central export ends in the middle of a food")
+
+            # Keep the unparsed tail and read more
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        yield food
+
+class FoodStoreBuilder:
+    """Streams bulk export foods into a new local store file"""
+
+    def __init__(self, path: str, batch_size: int = 1000):
+        """Start building a store
+
+        Args:
+            path: Final path of the store; it is replaced when finish() is called
+            batch_size: Foods written per transaction
+        """
+        self.path = path
+        self.tmp_path = f"{path}.building"
+        self.batch_size = batch_size
+        self.count = 0
+        self.pending = []
+
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+        self.conn = sqlite3.connect(self.tmp_path, isolation_level=None)
+        # The file isn't live until finish(), so durability can wait until then
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE foods (fdc_id INTEGER PRIMARY KEY, description TEXT NOT NULL, "
+            "gtin TEXT, data TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE food_tokens (token TEXT NOT NULL, fdc_id INTEGER NOT NULL)")
+        self.conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def add_food(self, food: Dict[str, Any]):
+        """Queue a food for writing
+
+        Args:
+            food: Food in the bulk export / API details format
+        """
+        if not food.get('fdcId'):
+            return
+
+        self.pending.append(compact_food(food))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write queued foods in one transaction"""
+        if not self.pending:
+            return
+
+        food_rows = []
+        token_rows = []
+        for food in self.pending:
+            fdc_id = int(food['fdcId'])
+            description = food.get('description', '')
+            food_rows.append((fdc_id, description, normalize_gtin(food.get('gtinUpc')) or None,
+                              json.dumps(food, separators=(',', ':'))))
+            token_rows.extend((token, fdc_id) for token in set(normalize_text(description).split()))
+
+        self.conn.execute("BEGIN")
+        self.conn.executemany("INSERT OR REPLACE INTO foods VALUES (?, ?, ?, ?)", food_rows)
+        self.conn.executemany("INSERT INTO food_tokens VALUES (?, ?)", token_rows)
+        self.conn.execute("COMMIT")
+
+        self.count += len(self.pending)
+        self.pending = []
+
+    def import_json(self, fp: TextIO) -> int:
+        """Stream a bulk JSON export into the store
+
+        Args:
+            fp: Text file of the export
+
+        Returns:
+            Number of foods imported so far
+        """
+        for food in iter_json_foods(fp):
+            self.add_food(food)
+            if self.count and self.count % (self.batch_size * 100) == 0 and not self.pending:
+                logger.info(f"Imported {self.count} foods")
+
+        self.flush()
+        return self.count
+
+    def import_csv(self, open_member: Callable[[str], Optional[TextIO]]) -> int:
+        """Stream a bulk CSV export into the store
+
+        The CSV export spreads foods over several files, so rows are staged
+        in on-disk tables and joined in fdc_id order rather than in memory.
+
+        Args:
+            open_member: Function opening an export file by name (e.g.
+                'food.csv'), returning None if the file is absent
+
+        Returns:
+            Number of foods imported so far
+        """
+        nutrients = {}
+        for row in self._read_csv(open_member, 'nutrient.csv'):
+            nutrients[row['id']] = {
+                'id': _number(row['id']),
+                'number': row.get('nutrient_nbr'),
+                'name': row.get('name'),
+                'unitName': row.get('unit_name')
+            }
+
+        categories = {
+            row['id']: row.get('description', '')
+            for row in self._read_csv(open_member, 'food_category.csv')
+        }
+
+        self.conn.execute(
+            "CREATE TEMP TABLE csv_food (fdc_id INTEGER PRIMARY KEY, data_type TEXT, "
+            "description TEXT, category TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TEMP TABLE csv_branded (fdc_id INTEGER PRIMARY KEY, brand_owner TEXT, brand_name TEXT, "
+            "gtin TEXT, ingredients TEXT, serving_size REAL, serving_unit TEXT, category TEXT)"
+        )
+        self.conn.execute("CREATE TEMP TABLE csv_nutrient (fdc_id INTEGER, nutrient_id TEXT, amount REAL)")
+
+        self._stage(open_member, 'food.csv', "INSERT OR REPLACE INTO csv_food VALUES (?, ?, ?, ?)", lambda row: (
+            int(row['fdc_id']), row.get('data_type'), row.get('description', ''),
+            categories.get(row.get('food_category_id'), row.get('food_category_id') or '')
+        ))
+        self._stage(open_member, 'branded_food.csv', "INSERT OR REPLACE INTO csv_branded VALUES (?, ?, ?, ?, ?, ?, ?, ?)", lambda row: (
+            int(row['fdc_id']), row.get('brand_owner'), row.get('brand_name'), row.get('gtin_upc'),
+            row.get('ingredients'), _number(row.get('serving_size')), row.get('serving_size_unit'),
+            row.get('branded_food_category')
+        ))
+        self._stage(open_member, 'food_nutrient.csv', "INSERT INTO csv_nutrient VALUES (?, ?, ?)", lambda row: (
+            int(row['fdc_id']), row['nutrient_id'], _number(row.get('amount'))
+        ))
+        self.conn.execute("CREATE INDEX temp.csv_nutrient_fdc ON csv_nutrient (fdc_id)")
+
+        # Merge foods with their nutrients, both in fdc_id order
+        food_rows = self.conn.execute(
+            "SELECT f.fdc_id, f.data_type, f.description, f.category, b.brand_owner, b.brand_name, "
+            "b.gtin, b.ingredients, b.serving_size, b.serving_unit, b.category "
+            "FROM csv_food f LEFT JOIN csv_branded b ON b.fdc_id = f.fdc_id ORDER BY f.fdc_id"
+        )
+        nutrient_rows = self.conn.cursor().execute(
+            "SELECT fdc_id, nutrient_id, amount FROM csv_nutrient ORDER BY fdc_id"
+        )
+        next_nutrient = nutrient_rows.fetchone()
+
+        foods = []
+        for (fdc_id, data_type, description, category, brand_owner, brand_name,
+             gtin, ingredients, serving_size, serving_unit, branded_category) in food_rows:
+            food_nutrients = []
+            while next_nutrient is not None and next_nutrient[0] <= fdc_id:
+                if next_nutrient[0] == fdc_id and next_nutrient[1] in nutrients and next_nutrient[2] is not None:
+                    food_nutrients.append({'nutrient': nutrients[next_nutrient[1]], 'amount': next_nutrient[2]})
+                next_nutrient = nutrient_rows.fetchone()
+
+            foods.append({
+                'fdcId': fdc_id,
+                'dataType': data_type,
+                'description': description,
+                'brandOwner': brand_owner,
+                'brandName': brand_name,
+                'gtinUpc': gtin,
+                'ingredients': ingredients,
+                'servingSize': serving_size,
+                'servingSizeUnit': serving_unit,
+                'foodCategory': {'description': branded_category or category} if (branded_category or category) else None,
+                'foodNutrients': food_nutrients
+            })
+
+            # Write outside the read cursors' iteration in batches
+            if len(foods) >= self.batch_size:
+                for food in foods:
+                    self.add_food(food)
+                foods = []
+
+        for food in foods:
+            self.add_food(food)
+        self.flush()
+
+        for table in ('csv_food', 'csv_branded', 'csv_nutrient'):
+            self.conn.execute(f"DROP TABLE temp.{table}")
+
+        return self.count
+
+    def finish(self, source: str = '') -> int:
+        """Index the imported foods and swap the new store into place
+
+        Args:
+            source: Description of the import source, stored as metadata
+
+        Returns:
+            Number of foods imported
+        """
+        self.flush()
+
+        logger.info("Building indexes")
+        self.conn.execute("CREATE INDEX food_tokens_token ON food_tokens (token, fdc_id)")
+        self.conn.execute("CREATE INDEX foods_gtin ON foods (gtin) WHERE gtin IS NOT NULL")
+        self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+            ('source', source),
+            ('food_count', str(self.count))
+        ])
+        self.conn.execute("ANALYZE")
+        self.conn.execute("VACUUM")
+        self.conn.close()
+
+        os.replace(self.tmp_path, self.path)
+        return self.count
+
+    def abort(self):
+        """Discard the partially built store"""
+        self.conn.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def _read_csv(self, open_member: Callable[[str], Optional[TextIO]], name: str) -> Iterator[Dict[str, str]]:
+        """Stream rows of one export file (nothing if it is absent)"""
+        fp = open_member(name)
+        if fp is None:
+            return
+
+        with fp:
+            yield from csv.DictReader(fp)
+
+    def _stage(self, open_member: Callable[[str], Optional[TextIO]], name: str, sql: str,
+               convert: Callable[[Dict[str, str]], tuple]):
+        """Copy one export file into a staging table in batches"""
+        batch = []
+        for row in self._read_csv(open_member, name):
+            try:
+                batch.append(convert(row))
+            except (KeyError, ValueError):
+                continue
+
+            if len(batch) >= self.batch_size * 10:
+                self._insert_batch(sql, batch)
+                batch = []
+
+        self._insert_batch(sql, batch)
+
+    def _insert_batch(self, sql: str, rows: List[tuple]):
+        """Insert rows in one transaction"""
+        if rows:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(sql, rows)
+            self.conn.execute("COMMIT")
+
+def _number(value: Any) -> Optional[float]:
+    """Parse a CSV number, returning None for blanks"""
+    if value in (None, ''):
+        return None
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+def import_bulk_export(source: str, path: str, batch_size: int = 1000) -> int:
+    """Build a local store from a FoodData Central bulk download
+
+    Args:
+        source: Path to a JSON export, a directory of CSV files, or a
+            downloaded .zip of either
+        path: Path of the store to build (replaced when the import succeeds)
+        batch_size: Foods written per transaction
+
+    Returns:
+        Number of foods imported
+
+    Raises:
+        ValueError: If the source isn't a recognizable export
+    """
+    builder = FoodStoreBuilder(path, batch_size=batch_size)
+
+    try:
+        if zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                members = {os.path.basename(name): name for name in archive.namelist()}
+
+                def open_member(name):
+                    if name not in members:
+                        return None
+                    return io.TextIOWrapper(archive.open(members[name]), encoding='utf-8', newline='')
+
+                if 'food.csv' in members:
+                    builder.import_csv(open_member)
+                else:
+                    json_members = [name for name in members if name.endswith('.json')]
+                    if not json_members:
+                        raise ValueError(f"No FoodData Central export found in {source}")
+                    for name in json_members:
+                        with open_member(name) as fp:
+                            builder.import_json(fp)
+
+        elif os.path.isdir(source):
+            def open_member(name):
+                member_path = os.path.join(source, name)
+                if not os.path.exists(member_path):
+                    return None
+                return open(member_path, encoding='utf-8', newline='')
+
+            if not os.path.exists(os.path.join(source, 'food.csv')):
+                raise ValueError(f"No food.csv found in {source}")
+            builder.import_csv(open_member)
+
+        elif source.endswith('.json'):
+            with open(source, encoding='utf-8') as fp:
+                builder.import_json(fp)
+
+        else:
+            raise ValueError(f"Unrecognized FoodData Central export: {source}")
+
+    except BaseException:
+        builder.abort()
+        raise
+
+    return builder.finish(source=os.path.basename(source.rstrip('/')))
+
+class LocalFoodStore:
+    """Read-only lookups against a local store file"""
+
+    def __init__(self, path: str):
+        """Open a store
+
+        Args:
+            path: Path to a store built by FoodStoreBuilder
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def get(self, fdc_id: Any) -> Optional[Dict[str, Any]]:
+        """Get a food's details by FDC ID
+
+        Args:
+            fdc_id: FDC ID
+
+        Returns:
+            Food details, or None if the food isn't in the store
+        """
+        try:
+            fdc_id = int(fdc_id)
+        except (TypeError, ValueError):
+            return None
+
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM foods WHERE fdc_id = ?", (fdc_id,)).fetchone()
+
+        return self._record(row[0] if row else None, 'food')
+
+    def get_many(self, fdc_ids: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+        """Get the details of several foods
+
+        Args:
+            fdc_ids: FDC IDs
+
+        Returns:
+            Food details keyed by FDC ID (as a string), for foods in the store
+        """
+        ids = []
+        for fdc_id in fdc_ids:
+            try:
+                ids.append(int(fdc_id))
+            except (TypeError, ValueError):
+                continue
+
+        foods = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT fdc_id, data FROM foods WHERE fdc_id IN ({placeholders})", chunk
+                ).fetchall()
+            foods.update((str(fdc_id), json.loads(data)) for fdc_id, data in rows)
+
+        return foods
+
+    def get_by_gtin(self, gtin: Any) -> Optional[Dict[str, Any]]:
+        """Get a branded food's details by GTIN/UPC
+
+        Args:
+            gtin: Barcode digits in any GTIN form
+
+        Returns:
+            Food details, or None if no food has that code
+        """
+        normalized = normalize_gtin(gtin)
+        if not normalized:
+            return None
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM foods WHERE gtin = ? ORDER BY fdc_id DESC LIMIT 1", (normalized,)
+            ).fetchone()
+
+        return self._record(row[0] if row else None, 'gtin')
+
+    def search(self, query: str, page_size: int = 25, page_number: int = 1) -> Optional[Dict[str, Any]]:
+        """Search foods by description
+
+        Every word of the query must start a word of the description; all
+        but the last must match whole words. Shorter (more generic)
+        descriptions rank first.
+
+        Args:
+            query: Search query
+            page_size: Number of results per page
+            page_number: Page number (1-based)
+
+        Returns:
+            Results in the API's search response format, or None if nothing
+            matched
+        """
+        words = normalize_text(query).split()
+        if not words:
+            return None
+
+        clauses = ["SELECT fdc_id FROM food_tokens WHERE token = ?" for _ in words[:-1]]
+        clauses.append("SELECT fdc_id FROM food_tokens WHERE token >= ? AND token < ?")
+        params = words[:-1] + [words[-1], words[-1] + '\uffff']
+        matching = " INTERSECT ".join(clauses)
+
+        page_size = max(1, int(page_size))
+        page_number = max(1, int(page_number))
+
+        with self.lock:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM ({matching})", params).fetchone()[0]
+            rows = self.conn.execute(
+                f"SELECT data FROM foods WHERE fdc_id IN ({matching}) "
+                "ORDER BY length(description), fdc_id LIMIT ? OFFSET ?",
+                params + [page_size, (page_number - 1) * page_size]
+            ).fetchall() if total else []
+
+        if not total:
+            metrics.record('usda.local.miss', 1, {'kind': 'search'})
+            return None
+
+        metrics.record('usda.local.hit', 1, {'kind': 'search'})
+        return {
+            'totalHits': total,
+            'currentPage': page_number,
+            'totalPages': (total + page_size - 1) // page_size,
+            'foods': [to_search_result(json.loads(data)) for (data,) in rows],
+            'source': 'local'
+        }
+
+    def close(self):
+        """Close the store"""
+        with self.lock:
+            self.conn.close()
+
+    @staticmethod
+    def _record(data: Optional[str], kind: str) -> Optional[Dict[str, Any]]:
+        """Decode a stored food and record the lookup outcome"""
+        if data is None:
+            metrics.record('usda.local.miss', 1, {'kind': kind})
+            return None
+
+        metrics.record('usda.local.hit', 1, {'kind': kind})
+        return json.loads(data)
+
+
+def open_local_store(path: Optional[str]) -> Optional[LocalFoodStore]:
+    """Open the local store if one has been built
+
+    Args:
+        path: Configured store path (USDA_LOCAL_STORE_PATH)
+
+    Returns:
+        The opened store, or None if no path is set or the file doesn't exist
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    return LocalFoodStore(path)